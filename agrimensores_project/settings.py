@@ -4,6 +4,8 @@ from decouple import config
 import dj_database_url
 
 import os
+import sys
+import tempfile
 from dotenv import load_dotenv
 
 # Cargar variables desde .env
@@ -45,12 +47,13 @@ INSTALLED_APPS = [
 # ====================
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Whitenoise para estáticos
+    'planos.middleware.WhiteNoiseAsyncMiddleware',  # Whitenoise para estáticos (también bajo ASGI)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'planos.middleware.PerfiladoMiddleware',  # Solo con PERFILADO_HABILITADO
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -113,7 +116,76 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / 'static']
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+
+# ====================
+# STORAGES
+# ====================
+# STATICFILES_STORAGE ya no existe en Django 5.1+; "staticfiles" conserva el
+# backend por defecto con el que se sirve hoy. "planos" guarda los PDF
+# subidos por SHA-256 en subdirectorios, con conteo de referencias;
+# "artefactos" guarda memorias y demás archivos generados.
+#
+# ALMACENAMIENTO: "local" (MEDIA_ROOT), "s3" (compatible con S3, requiere
+# boto3) u "objetos_local" (directorio con semántica de almacén de objetos,
+# para probar sin S3). Con "s3" los workers pueden correr en otros nodos.
+ALMACENAMIENTO = config('ALMACENAMIENTO', default='local')
+if ALMACENAMIENTO == 'local':
+    _PLANOS_STORAGE = {"BACKEND": "planos.storage.AlmacenamientoContenido"}
+    _ARTEFACTOS_STORAGE = {"BACKEND": "django.core.files.storage.FileSystemStorage"}
+else:
+    if ALMACENAMIENTO == 's3':
+        _OPCIONES_OBJETOS = {
+            "bucket": config('S3_BUCKET', default=''),
+            "endpoint_url": config('S3_ENDPOINT_URL', default=''),
+            "region": config('S3_REGION', default=''),
+            "access_key": config('S3_ACCESS_KEY', default=''),
+            "secret_key": config('S3_SECRET_KEY', default=''),
+        }
+    else:
+        _OPCIONES_OBJETOS = {"directorio": config('OBJETOS_LOCAL_DIR', default=str(BASE_DIR / 'objetos'))}
+    _PLANOS_STORAGE = {"BACKEND": "planos.storage.AlmacenamientoContenidoObjetos", "OPTIONS": _OPCIONES_OBJETOS}
+    _ARTEFACTOS_STORAGE = {"BACKEND": "planos.storage.AlmacenamientoObjetos", "OPTIONS": _OPCIONES_OBJETOS}
+
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "planos": _PLANOS_STORAGE,
+    "artefactos": _ARTEFACTOS_STORAGE,
+}
+
+# Copias locales de archivos remotos para leerlos con pdfplumber/LibreOffice
+CACHE_ARCHIVOS_DIR = config('CACHE_ARCHIVOS_DIR', default=None)
+CACHE_ARCHIVOS_MAX_BYTES = config('CACHE_ARCHIVOS_MAX_BYTES', default=2 * 1024 ** 3, cast=int)
+
+# ====================
+# CACHÉ
+# ====================
+# planos.cache_niveles pone un LRU por proceso (L1) delante de este alias
+# "default" (L2), compartido por todos los workers: Redis si hay REDIS_URL o,
+# como reemplazo local, un FileBasedCache ("archivo"). "memoria" es LocMem
+# (por proceso, solo desarrollo). El incr de FileBasedCache no es atómico:
+# sin Redis el limitador de solicitudes cuenta en memoria.
+REDIS_URL = config('REDIS_URL', default='')
+CACHE_BACKEND = config('CACHE_BACKEND', default='redis' if REDIS_URL else 'archivo')
+if CACHE_BACKEND == 'redis':
+    _CACHE_DEFAULT = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}
+elif CACHE_BACKEND == 'archivo':
+    _CACHE_DEFAULT = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'agrimensores_cache_l2')),
+        'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int)},
+    }
+else:
+    _CACHE_DEFAULT = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+CACHES = {'default': _CACHE_DEFAULT}
+CACHE_L1_MAX = config('CACHE_L1_MAX', default=1000, cast=int)
+# Segundos que un proceso puede servir un valor (o una versión) desde su L1
+CACHE_L1_TTL = config('CACHE_L1_TTL', default=5.0, cast=float)
+# Vencimiento del bloqueo de cálculo en el L2 (se renueva mientras se calcula)
+# y espera por defecto al cálculo de otro proceso
+CACHE_ESPERA = config('CACHE_ESPERA', default=10.0, cast=float)
+# Datos extraídos de cada PDF, por SHA-256 del archivo
+CACHE_EXTRACCION_TTL = config('CACHE_EXTRACCION_TTL', default=7 * 24 * 3600, cast=int)
 
 # ====================
 # ARCHIVOS MEDIA
@@ -121,6 +193,81 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# MEDIA_URL y las descargas pasan por planos.descargas: Django autoriza y el
+# proxy transfiere. "nginx" responde con X-Accel-Redirect hacia ubicaciones
+# internal bajo ARCHIVOS_ACCEL_PREFIJO ("media/" es MEDIA_ROOT y "cache/"
+# CACHE_ARCHIVOS_DIR); "sendfile" con X-Sendfile (Apache/lighttpd). Vacío:
+# se sirve desde Python, con rangos y GET condicional.
+ARCHIVOS_OFFLOAD = config('ARCHIVOS_OFFLOAD', default='')
+ARCHIVOS_ACCEL_PREFIJO = config('ARCHIVOS_ACCEL_PREFIJO', default='/_protegido/')
+
+# ====================
+# CONVERSIÓN A PDF (LibreOffice headless)
+# ====================
+# Procesos persistentes por UNO o, sin UNO en el virtualenv, por unoserver
+# (pip install unoserver en el Python del sistema que trae python3-uno).
+# PDF_CONVERTER_PERMITIR_CLI acepta un soffice por conversión (desarrollo).
+LIBREOFFICE_PATH = config('LIBREOFFICE_PATH', default=None)
+UNOSERVER_PATH = config('UNOSERVER_PATH', default=None)
+PDF_CONVERTER_PERMITIR_CLI = config('PDF_CONVERTER_PERMITIR_CLI', default=False, cast=bool)
+PDF_CONVERTER_WORKERS = config('PDF_CONVERTER_WORKERS', default=2, cast=int)
+PDF_CONVERTER_TIMEOUT = config('PDF_CONVERTER_TIMEOUT', default=60, cast=int)
+PDF_CONVERTER_MAX_COLA = config('PDF_CONVERTER_MAX_COLA', default=8, cast=int)
+PDF_CONVERTER_ESPERA_COLA = config('PDF_CONVERTER_ESPERA_COLA', default=30, cast=int)
+
+# Hilos que preparan memorias faltantes durante la exportación en ZIP
+EXPORTACION_WORKERS = config('EXPORTACION_WORKERS', default=4, cast=int)
+# Filas leídas por lote en la exportación NDJSON/CSV de la API
+EXPORTACION_CHUNK_SIZE = config('EXPORTACION_CHUNK_SIZE', default=500, cast=int)
+
+# Sondeo del estado de un plano (/panel/estado/<id>/): bajo ASGI la vista
+# espera hasta ESTADO_ESPERA_MAX segundos a que el estado cambie
+ESTADO_ESPERA_MAX = config('ESTADO_ESPERA_MAX', default=25.0, cast=float)
+ESTADO_INTERVALO = config('ESTADO_INTERVALO', default=1.0, cast=float)
+
+# Tamaño de página del listado de planos
+LISTA_PLANOS_POR_PAGINA = config('LISTA_PLANOS_POR_PAGINA', default=50, cast=int)
+BUSQUEDA_POR_PAGINA = config('BUSQUEDA_POR_PAGINA', default=20, cast=int)
+
+# ====================
+# CARGA MASIVA Y COLA DE PROCESAMIENTO
+# ====================
+PLANO_MAX_BYTES = config('PLANO_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+CARGA_MASIVA_MAX_ARCHIVOS = config('CARGA_MASIVA_MAX_ARCHIVOS', default=500, cast=int)
+DATA_UPLOAD_MAX_NUMBER_FILES = CARGA_MASIVA_MAX_ARCHIVOS
+# Sin worker aparte (desarrollo), un hilo del proceso web vacía la cola
+COLA_EJECUCION_LOCAL = config('COLA_EJECUCION_LOCAL', default=DEBUG, cast=bool)
+COLA_MAX_INTENTOS = config('COLA_MAX_INTENTOS', default=2, cast=int)
+# Segundos tras los que un trabajo en curso se considera abandonado
+COLA_VENCIMIENTO = config('COLA_VENCIMIENTO', default=1800, cast=int)
+COLA_INTERVALO = config('COLA_INTERVALO', default=2.0, cast=float)
+
+# Presupuesto por trabajo (planos.recursos). 0 deshabilita cada límite.
+PDF_MAX_PAGINAS = config('PDF_MAX_PAGINAS', default=200, cast=int)
+OCR_DPI = config('OCR_DPI', default=200, cast=int)
+# Las páginas más grandes se renderizan a menos dpi, nunca por debajo de OCR_DPI_MIN
+OCR_DPI_MIN = config('OCR_DPI_MIN', default=100, cast=int)
+OCR_MAX_PIXELES_PAGINA = config('OCR_MAX_PIXELES_PAGINA', default=60_000_000, cast=int)
+# Crecimiento del RSS permitido a un trabajo antes de cortarlo
+MEMORIA_MAX_TRABAJO_MB = config('MEMORIA_MAX_TRABAJO_MB', default=1536, cast=int)
+MEMORIA_MUESTREO = config('MEMORIA_MUESTREO', default=0.2, cast=float)
+MEMORIA_TRACEMALLOC = config('MEMORIA_TRACEMALLOC', default=False, cast=bool)
+# El worker de la cola termina tras un trabajo que lo deja por encima de este RSS
+COLA_RECICLAR_RSS_MB = config('COLA_RECICLAR_RSS_MB', default=1024, cast=int)
+
+# Tiempo límite por etapa (segundos, 0 = sin límite). La extracción corre en
+# un proceso aparte que se mata al vencer o al cancelar el trabajo
+# (planos.aislamiento); la conversión a PDF usa PDF_CONVERTER_TIMEOUT.
+EXTRACCION_AISLADA = config('EXTRACCION_AISLADA', default=True, cast=bool)
+EXTRACCION_TIMEOUT = config('EXTRACCION_TIMEOUT', default=300, cast=int)
+OCR_TIMEOUT_PAGINA = config('OCR_TIMEOUT_PAGINA', default=120, cast=int)
+
+# Subidas reanudables por partes (/api/cargas/): el archivo va a disco por
+# bloques, así el límite puede ser mucho mayor que el de una subida simple
+CARGA_REANUDABLE_MAX_BYTES = config('CARGA_REANUDABLE_MAX_BYTES', default=500 * 1024 * 1024, cast=int)
+# Segundos sin actividad tras los que se descarta una carga incompleta
+CARGA_REANUDABLE_VENCIMIENTO = config('CARGA_REANUDABLE_VENCIMIENTO', default=24 * 3600, cast=int)
+
 # ====================
 # AUTENTICACIÓN
 # ====================
@@ -136,12 +283,26 @@ SESSION_COOKIE_SECURE = config('SESSION_COOKIE_SECURE', default=False, cast=bool
 CSRF_COOKIE_SECURE = config('CSRF_COOKIE_SECURE', default=False, cast=bool)
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
+# Límite de solicitudes (planos.limitador): "redis" comparte el conteo entre
+# todos los workers y nodos; "cache" usa un alias de CACHES; "memoria" cuenta
+# por proceso (desarrollo). Se aplica con @rate_limit a los POST del login y
+# de la carga de planos; RATE_LIMIT_PER_MINUTE es el límite por IP de
+# planos.middleware.SecurityMiddleware, que no está en MIDDLEWARE (es solo
+# síncrono y bajo ASGI atendería de a una las vistas async).
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_PER_MINUTE = config('RATE_LIMIT_PER_MINUTE', default=100, cast=int)
+RATE_LIMIT_LOGIN_PER_MINUTE = config('RATE_LIMIT_LOGIN_PER_MINUTE', default=10, cast=int)
+RATE_LIMIT_UPLOAD_PER_MINUTE = config('RATE_LIMIT_UPLOAD_PER_MINUTE', default=20, cast=int)
+RATE_LIMIT_REDIS_URL = config('RATE_LIMIT_REDIS_URL', default=REDIS_URL)
+RATE_LIMIT_BACKEND = config('RATE_LIMIT_BACKEND', default='redis' if RATE_LIMIT_REDIS_URL else 'memoria')
+RATE_LIMIT_CACHE = config('RATE_LIMIT_CACHE', default='default')
+
 # ====================
 # REST FRAMEWORK
 # ====================
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticatedOrReadOnly'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'planos.paginacion.PlanoCursorPagination',
     'PAGE_SIZE': 10,
 }
 
@@ -159,13 +320,59 @@ CORS_ALLOW_CREDENTIALS = True
 # ====================
 # LOGGING
 # ====================
+# Los handlers encolan y un hilo escribe por lotes (planos.bitacora): la
+# latencia de las solicitudes no depende del disco. Una línea JSON por
+# registro; los accesos se muestrean con LOG_MUESTREO_ACCESOS (0 a 1), la
+# auditoría nunca.
+# Los tests escriben en un directorio temporal, no en los logs versionados
+_EN_TESTS = sys.argv[1:2] == ['test']
+LOGS_DIR = config(
+    'LOGS_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'agrimensores_logs_test') if _EN_TESTS else str(BASE_DIR / 'logs'),
+)
+LOG_MUESTREO_ACCESOS = config('LOG_MUESTREO_ACCESOS', default=1.0, cast=float)
+LOG_LOTE = config('LOG_LOTE', default=200, cast=int)
+LOG_INTERVALO = config('LOG_INTERVALO', default=1.0, cast=float)
+
+_LOG_ASINCRONO = {'()': 'planos.bitacora.ManejadorAsincrono', 'lote': LOG_LOTE, 'intervalo': LOG_INTERVALO}
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'handlers': {'console': {'class': 'logging.StreamHandler'}},
-    'root': {'handlers': ['console'], 'level': 'INFO'},
+    'formatters': {'json': {'()': 'planos.bitacora.FormateadorJSON'}},
+    'handlers': {
+        'console': {**_LOG_ASINCRONO, 'formatter': 'json'},
+        'app': {**_LOG_ASINCRONO, 'archivo': os.path.join(LOGS_DIR, 'app.log'), 'formatter': 'json'},
+        'security': {**_LOG_ASINCRONO, 'archivo': os.path.join(LOGS_DIR, 'security.log'), 'formatter': 'json'},
+    },
+    'loggers': {
+        'django.security': {'handlers': ['console', 'security'], 'level': 'INFO', 'propagate': False},
+    },
+    'root': {'handlers': ['console', 'app'], 'level': 'INFO'},
 }
 
+# ====================
+# PERFILADO
+# ====================
+# cProfile a pedido de un superusuario (?perfilar=1 o X-Perfilar: 1) y en los
+# trabajos marcados para perfilar (planos.perfilado). Deshabilitado, el
+# middleware no se instala. Se conservan los PERFILES_MAX_ARCHIVOS perfiles
+# más recientes, hasta PERFILES_MAX_BYTES en total.
+PERFILADO_HABILITADO = config('PERFILADO_HABILITADO', default=False, cast=bool)
+PERFILES_DIR = config('PERFILES_DIR', default=os.path.join(LOGS_DIR, 'perfiles'))
+PERFILES_MAX_ARCHIVOS = config('PERFILES_MAX_ARCHIVOS', default=50, cast=int)
+PERFILES_MAX_BYTES = config('PERFILES_MAX_BYTES', default=200 * 1024 ** 2, cast=int)
+
+# ====================
+# MÉTRICAS
+# ====================
+# /metrics en formato Prometheus (planos.metricas). Cada proceso publica sus
+# valores en METRICAS_DIR (vacío: solo los del proceso que responde) cada
+# METRICAS_INTERVALO segundos. El scraper se identifica con
+# "Authorization: Bearer <METRICAS_TOKEN>"; sin token solo superusuarios.
+METRICAS_DIR = config('METRICAS_DIR', default=os.path.join(tempfile.gettempdir(), 'agrimensores_metricas'))
+METRICAS_INTERVALO = config('METRICAS_INTERVALO', default=1.0, cast=float)
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ====================
@@ -0,0 +1,36 @@
+"""
+Perfil de despliegue ASGI (workers uvicorn).
+
+    gunicorn -c gunicorn_asgi.py agrimensores_project.asgi:application
+
+Las descargas, las llamadas a Gemini y el sondeo de estado son vistas async:
+mientras esperan disco, LibreOffice o la API no ocupan el worker, así que un
+proceso atiende cientos de solicitudes lentas a la vez. El trabajo de CPU
+(procesar PDF) corre en el worker de la cola (``procesar_cola``): la carga,
+la API y el reproceso solo encolan el plano.
+"""
+
+import glob
+import multiprocessing
+import os
+import tempfile
+
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Las descargas largas y el long polling (ESTADO_ESPERA_MAX) no deben cortarse
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Reciclar workers de a poco acota el crecimiento de memoria
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = 200
+
+
+def on_starting(server):
+    # Los contadores de /metrics empiezan de cero en cada despliegue (planos.metricas)
+    directorio = os.environ.get("METRICAS_DIR", os.path.join(tempfile.gettempdir(), "agrimensores_metricas"))
+    for ruta in glob.glob(os.path.join(directorio, "*.json")) if directorio else ():
+        os.remove(ruta)
@@ -0,0 +1,172 @@
+"""
+Extracción del PDF (pdfplumber, OCR y parseo) en un proceso aparte.
+
+Un PDF malformado o un Tesseract trabado pueden colgar la extracción para
+siempre, y desde el mismo proceso no hay forma segura de cortarla. Con
+``EXTRACCION_AISLADA`` cada extracción corre en un proceso hijo con su propio
+grupo de procesos; el padre espera el resultado y, si se supera
+``EXTRACCION_TIMEOUT`` segundos o el trabajo se cancela (``cancelado()``
+devuelve verdadero), mata al grupo entero, incluidos los ``pdftoppm`` y
+``tesseract`` que el hijo haya lanzado.
+
+Los hijos salen de un forkserver con las bibliotecas ya importadas, así que
+arrancar uno cuesta poco. Las etapas y conteos medidos en el hijo se suman a
+la medición del plano en el padre (``metricas.incorporar``) y el pico de
+memoria del hijo queda en ``Plano.metricas["memoria_extraccion"]``. El hijo
+aplica los mismos límites (``planos.recursos``) que el padre y, si el padre
+está perfilando (``planos.perfilado``), perfila la extracción por su cuenta.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from contextlib import nullcontext
+
+from django.conf import settings
+
+from . import metricas, perfilado, recursos
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto el padre revisa la cancelación mientras espera
+INTERVALO_ESPERA = 0.5
+
+# Ajustes que el hijo toma del padre (pueden haber cambiado en tiempo de ejecución)
+AJUSTES_HIJO = (
+    "PDF_MAX_PAGINAS", "OCR_DPI", "OCR_DPI_MIN", "OCR_MAX_PIXELES_PAGINA", "OCR_TIMEOUT_PAGINA",
+    "MEMORIA_MAX_TRABAJO_MB", "MEMORIA_MUESTREO", "MEMORIA_TRACEMALLOC", "METRICAS_DIR", "METRICAS_INTERVALO",
+    "PERFILES_DIR", "PERFILES_MAX_ARCHIVOS", "PERFILES_MAX_BYTES", "PERFILES_TOP",
+)
+
+_PRECARGA = ["django", "pdfplumber", "pdf2image", "pytesseract"]
+
+
+class Cancelado(Exception):
+    """Se canceló el trabajo mientras se procesaba"""
+
+
+_contexto = None
+
+
+def _contexto_procesos():
+    global _contexto
+    if _contexto is None:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            _contexto = multiprocessing.get_context("forkserver")
+            _contexto.set_forkserver_preload(_PRECARGA)
+        else:
+            _contexto = multiprocessing.get_context("spawn")
+    return _contexto
+
+
+# -------------------------
+# Proceso hijo
+# -------------------------
+def _extraer_en_hijo(conexion, ruta, ajustes, perfil):
+    # Grupo propio: matarlo se lleva también a pdftoppm y tesseract
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    resultado_perfil = None
+    try:
+        import django
+        from django.apps import apps
+
+        if not apps.ready:
+            django.setup()
+        for nombre, valor in ajustes.items():
+            setattr(settings, nombre, valor)
+        # Aunque herede METRICAS_DIR, el hijo no publica: el padre suma sus valores con metricas.incorporar
+        settings.METRICAS_DIR = ""
+
+        from .utils.pdf_processor import PDFProcessor
+
+        perfilador = perfilado.perfilar(f"{perfil}-extraccion") if perfil else nullcontext()
+        with metricas.medir_plano() as medicion, recursos.medir() as memoria:
+            with perfilador as resultado_perfil:
+                datos = PDFProcessor(ruta).extract_data()
+        medicion["memoria"] = memoria.resumen()
+        medicion["perfil"] = resultado_perfil and resultado_perfil["ruta"]
+        conexion.send(("ok", datos, medicion))
+    except Exception as e:
+        # El perfil también se guarda si la extracción falló
+        extra = {"perfil": resultado_perfil and resultado_perfil["ruta"]}
+        try:
+            conexion.send(("error", e, extra))
+        except Exception:
+            # La excepción no se puede serializar
+            conexion.send(("error", RuntimeError(f"{type(e).__name__}: {e}"), extra))
+    finally:
+        conexion.close()
+        logging.shutdown()
+
+
+# -------------------------
+# Proceso padre
+# -------------------------
+def _terminar(proceso, gracia=0):
+    # Con resultado se le da tiempo al hijo de vaciar sus logs y salir solo
+    proceso.join(gracia)
+    if proceso.is_alive():
+        try:
+            os.killpg(proceso.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            # Windows, o el hijo todavía no creó su grupo
+            proceso.kill()
+    proceso.join(5)
+
+
+def _esperar(proceso, receptor, limite, cancelado):
+    vence = time.monotonic() + limite if limite else None
+    while True:
+        espera = INTERVALO_ESPERA if vence is None else max(0.0, min(INTERVALO_ESPERA, vence - time.monotonic()))
+        if receptor.poll(espera):
+            try:
+                return receptor.recv()
+            except EOFError:
+                proceso.join(5)
+                raise RuntimeError(f"El proceso de extracción terminó sin resultado (código {proceso.exitcode})")
+        if vence is not None and time.monotonic() >= vence:
+            raise recursos.TiempoAgotado(f"La extracción superó {limite} s")
+        if cancelado is not None and cancelado():
+            raise Cancelado("Procesamiento cancelado")
+
+
+def extraer(ruta, cancelado=None):
+    """
+    Datos de ``PDFProcessor(ruta).extract_data()``. Lanza
+    ``recursos.TiempoAgotado`` si se supera ``EXTRACCION_TIMEOUT`` y
+    ``Cancelado`` si ``cancelado()`` se vuelve verdadero; en ambos casos el
+    proceso hijo ya está muerto al volver.
+    """
+    if not getattr(settings, "EXTRACCION_AISLADA", True):
+        from .utils.pdf_processor import PDFProcessor
+
+        return PDFProcessor(ruta).extract_data()
+
+    contexto = _contexto_procesos()
+    receptor, emisor = contexto.Pipe(duplex=False)
+    ajustes = {nombre: getattr(settings, nombre) for nombre in AJUSTES_HIJO if hasattr(settings, nombre)}
+    proceso = contexto.Process(
+        target=_extraer_en_hijo, args=(emisor, ruta, ajustes, perfilado.en_curso()),
+        name="extraccion-pdf", daemon=True,
+    )
+    proceso.start()
+    emisor.close()
+    resultado = None
+    try:
+        resultado, valor, medicion = _esperar(
+            proceso, receptor, getattr(settings, "EXTRACCION_TIMEOUT", 300), cancelado
+        )
+    finally:
+        _terminar(proceso, gracia=5 if resultado else 0)
+        receptor.close()
+
+    ruta_perfil = medicion.pop("perfil", None)
+    if ruta_perfil:
+        perfilado.anotar("extraccion", ruta_perfil)
+    if resultado == "error":
+        raise valor
+    metricas.incorporar(medicion)
+    return valor
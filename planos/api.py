@@ -1,15 +1,102 @@
 # planos/api.py
-from rest_framework import viewsets
-from .models import Plano
-from .serializers import PlanoSerializer, PlanoListSerializer, PlanoCreateSerializer, PlanoUpdateSerializer
-from .services import procesar_pdf
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from . import carga_reanudable, cola, descargas
+from .busqueda import buscar
+from .carga_masiva import crear_lote
+from .exportacion import iter_csv, iter_ndjson, planos_para_datos
+from .models import CargaReanudable, LoteCarga, Plano, TrabajoProcesamiento
+from .paginacion import IdCursorPagination
+from .serializers import (
+    PlanoSerializer, PlanoListSerializer, PlanoCreateSerializer, PlanoUpdateSerializer,
+    RegistrosPlanoSerializer, LoteCargaSerializer, TrabajoSerializer,
+)
+from .utils.artifact_store import ArtifactStore
+from .utils.registros import normalizar_documento, normalizar_matricula, normalizar_padron
+
+# Parámetro de búsqueda → (lookup indexado, normalización)
+BUSQUEDAS_REGISTRO = {
+    'dni': ('propietarios__dni', normalizar_documento),
+    'cuil': ('propietarios__cuil', normalizar_documento),
+    'padron': ('padrones__numero', normalizar_padron),
+    'matricula': ('dominios__matricula', normalizar_matricula),
+}
+
+def _validador(request, *partes):
+    """ETag de una respuesta: depende de la URL completa (filtros, cursor, campos) y del estado"""
+    return quote_etag(ArtifactStore.compute_key([request.get_full_path(), *map(str, partes)], "1", tipo="api"))
+
+
+def _respuesta_condicional(request, etag, ultima):
+    """304/412 si el cliente ya tiene la versión vigente; ``None`` si hay que responder"""
+    last_modified = int(ultima.timestamp()) if ultima else None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def _con_validadores(response, etag, ultima):
+    response['ETag'] = etag
+    if ultima:
+        response['Last-Modified'] = http_date(ultima.timestamp())
+    # Se puede guardar, pero siempre se revalida
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 
 class PlanoViewSet(viewsets.ModelViewSet):
     queryset = Plano.objects.all()
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if self.request.method == 'GET' and hasattr(serializer_class, 'columnas'):
+            # Solo se leen las columnas de los campos pedidos
+            columnas, relaciones = serializer_class.columnas(self.request)
+            queryset = queryset.select_related(*relaciones).only(*columnas)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        resumen = queryset.order_by().aggregate(ultima=Max('fecha_actualizacion'), total=Count('id'))
+        etag = _validador(request, resumen['ultima'], resumen['total'])
+        respuesta = _respuesta_condicional(request, etag, resumen['ultima'])
+        if respuesta is not None:
+            return _con_validadores(respuesta, etag, resumen['ultima'])
+        return _con_validadores(super().list(request, *args, **kwargs), etag, resumen['ultima'])
+
+    def retrieve(self, request, *args, **kwargs):
+        # La revalidación solo lee fecha_actualizacion
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        ultima = (
+            self.filter_queryset(Plano.objects.all())
+            .filter(**{self.lookup_field: kwargs[lookup]})
+            .values_list('fecha_actualizacion', flat=True)
+            .first()
+        )
+        if ultima is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = _validador(request, ultima)
+        respuesta = _respuesta_condicional(request, etag, ultima)
+        if respuesta is not None:
+            return _con_validadores(respuesta, etag, ultima)
+        return _con_validadores(super().retrieve(request, *args, **kwargs), etag, ultima)
+
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in ['list', 'buscar']:
             return PlanoListSerializer
+        elif self.action == 'registros':
+            return RegistrosPlanoSerializer
         elif self.action == 'create':
             return PlanoCreateSerializer
         elif self.action in ['update', 'partial_update']:
@@ -17,5 +104,296 @@ class PlanoViewSet(viewsets.ModelViewSet):
         return PlanoSerializer
 
     def perform_create(self, serializer):
-        plano = serializer.save(estado="procesando")
-        procesar_pdf(plano)
+        # Responde enseguida; el procesamiento lo hace la cola (estado en el detalle)
+        with transaction.atomic():
+            plano = serializer.save(estado="pendiente")
+            cola.encolar([plano])
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def buscar(self, request):
+        """
+        Planos por DNI, CUIL, padrón o matrícula (``?dni=20.123.456``).
+        Varios parámetros se combinan con AND. Requiere usuario autenticado:
+        si no, cualquiera podría averiguar qué propiedades tiene un DNI.
+        """
+        filtros = {}
+        for param, (lookup, normalizar) in BUSQUEDAS_REGISTRO.items():
+            if request.query_params.get(param):
+                valor = normalizar(request.query_params[param])
+                if not valor:
+                    raise ValidationError({param: 'Valor inválido.'})
+                filtros[lookup] = valor
+        if not filtros:
+            raise ValidationError(f"Indique al menos uno de: {', '.join(BUSQUEDAS_REGISTRO)}")
+
+        ids = Plano.objects.filter(**filtros).values('id')
+        planos = Plano.objects.filter(id__in=ids).select_related('usuario').order_by('-fecha_carga', '-id')
+        pagina = self.paginate_queryset(planos)
+        serializer = self.get_serializer(pagina, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def registros(self, request, pk=None):
+        """
+        Propietarios, padrones, dominios, lados y coordenadas normalizados.
+        Requiere usuario autenticado, como ``buscar``: incluye DNI y CUIL.
+        """
+        plano = self.get_object()
+        return Response(self.get_serializer(plano).data)
+
+    @action(detail=True, methods=['post'])
+    def cancelar(self, request, pk=None):
+        """Cancela el procesamiento en cola o en curso del plano (``cola.cancelar``)"""
+        cancelados = cola.cancelar(self.get_object())
+        if not cancelados:
+            return Response(
+                {'detail': 'El plano no tiene procesamiento pendiente ni en curso.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response({'estado': 'cancelado', 'trabajos': cancelados})
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def texto(self, request):
+        """
+        Búsqueda de texto completo (``?q=lindero moreno``), ordenada por
+        relevancia, con fragmentos resaltados con ``<mark>``. Requiere
+        usuario autenticado: el texto OCR incluye DNI y CUIL.
+        """
+        consulta = request.query_params.get('q', '').strip()
+        if not consulta:
+            raise ValidationError({'q': 'Indique el texto a buscar.'})
+        try:
+            pagina = max(1, int(request.query_params.get('page', 1)))
+        except ValueError:
+            pagina = 1
+        por_pagina = api_settings.PAGE_SIZE or 10
+
+        total, resultados = buscar(consulta, limite=por_pagina, desplazamiento=(pagina - 1) * por_pagina)
+        url = request.build_absolute_uri()
+        siguiente = replace_query_param(url, 'page', pagina + 1) if pagina * por_pagina < total else None
+        if pagina > 2:
+            anterior = replace_query_param(url, 'page', pagina - 1)
+        else:
+            anterior = remove_query_param(url, 'page') if pagina == 2 else None
+
+        return Response({
+            'count': total,
+            'next': siguiente,
+            'previous': anterior,
+            'results': [
+                {
+                    'id': r.plano.id,
+                    'titulo': r.plano.titulo,
+                    'estado': r.plano.estado,
+                    'fecha_carga': r.plano.fecha_carga,
+                    'rango': r.rango,
+                    'fragmento': r.fragmento_html,
+                }
+                for r in resultados
+            ],
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def exportar(self, request):
+        """
+        Todos los planos con sus datos extraídos, en streaming. Requiere
+        usuario autenticado: incluye DNI y CUIL de los propietarios.
+
+        ``?formato=ndjson`` (por defecto) o ``csv``; ``?since=<ISO 8601>``
+        exporta solo lo modificado después de esa fecha; ``?texto=1`` incluye
+        el texto completo. El encabezado ``X-Export-Until`` es el ``since``
+        de la próxima exportación incremental.
+        """
+        formato = request.query_params.get('formato', 'ndjson')
+        if formato not in ('ndjson', 'csv'):
+            raise ValidationError({'formato': 'Use ndjson o csv.'})
+        desde = None
+        if request.query_params.get('since'):
+            desde = parse_datetime(request.query_params['since'])
+            if desde is None:
+                raise ValidationError({'since': 'Fecha inválida, use ISO 8601.'})
+            if timezone.is_naive(desde):
+                desde = timezone.make_aware(desde)
+
+        hasta = Plano.objects.aggregate(ultima=Max('fecha_actualizacion'))['ultima']
+        planos = planos_para_datos(desde, hasta)
+        chunk_size = getattr(settings, 'EXPORTACION_CHUNK_SIZE', 500)
+        if formato == 'csv':
+            contenido, content_type = iter_csv(planos, chunk_size), 'text/csv; charset=utf-8'
+        else:
+            con_texto = request.query_params.get('texto') in ('1', 'true')
+            contenido = iter_ndjson(planos, con_texto, chunk_size)
+            content_type = 'application/x-ndjson; charset=utf-8'
+
+        response = descargas.respuesta_streaming(request._request, contenido, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="planos_{timezone.localtime().strftime("%Y%m%d_%H%M%S")}.{formato}"'
+        )
+        response['X-Export-Until'] = (hasta or desde or timezone.now()).isoformat()
+        return response
+
+
+class LoteCargaViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Carga masiva: ``POST /api/lotes/`` con muchos ``archivos`` (PDF o ZIP de
+    PDF) responde 202 con un trabajo por plano; el procesamiento lo hace la
+    cola. ``GET /api/lotes/<id>/`` informa el avance.
+    """
+
+    serializer_class = LoteCargaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        queryset = LoteCarga.objects.prefetch_related('trabajos__plano')
+        if not self.request.user.is_superuser:
+            queryset = queryset.filter(usuario=self.request.user)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        archivos = request.FILES.getlist('archivos')
+        if not archivos:
+            raise ValidationError({'archivos': 'Adjunte uno o más PDF o ZIP.'})
+        lote, trabajos = crear_lote(archivos, usuario=request.user)
+        return Response(
+            {
+                'lote': lote.id,
+                'estado_url': reverse('lote-detail', args=[lote.id], request=request),
+                'trabajos': [
+                    {'id': t.id, 'plano': t.plano.id, 'archivo': t.plano.archivo_pdf.name}
+                    for t in trabajos
+                ],
+                'rechazados': lote.rechazados,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class TrabajoViewSet(viewsets.ReadOnlyModelViewSet):
+    """Estado de un trabajo de procesamiento (``GET /api/trabajos/<id>/``)"""
+
+    serializer_class = TrabajoSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        queryset = TrabajoProcesamiento.objects.select_related('plano')
+        if not self.request.user.is_superuser:
+            queryset = queryset.filter(plano__usuario=self.request.user)
+        return queryset
+
+    @action(detail=True, methods=['post'])
+    def perfilar(self, request, pk=None):
+        """
+        Reencola el plano del trabajo con cProfile (``planos.perfilado``);
+        solo superusuarios y con ``PERFILADO_HABILITADO``.
+        """
+        if not request.user.is_superuser:
+            return Response({'detail': 'Solo superusuarios.'}, status=status.HTTP_403_FORBIDDEN)
+        if not getattr(settings, 'PERFILADO_HABILITADO', False):
+            return Response({'detail': 'El perfilado está deshabilitado.'}, status=status.HTTP_400_BAD_REQUEST)
+        trabajo, = cola.encolar([self.get_object().plano], perfilar=True)
+        return Response(self.get_serializer(trabajo).data, status=status.HTTP_201_CREATED)
+
+
+class CargaReanudableViewSet(viewsets.GenericViewSet):
+    """
+    Subidas reanudables tipo tus 1.0 (extensiones creation, termination):
+
+    - ``POST /api/cargas/`` con ``Upload-Length`` y ``Upload-Metadata``
+      (``filename``, opcionales ``titulo`` y ``sha256``) → 201 y ``Location``.
+    - ``HEAD /api/cargas/<id>/`` → ``Upload-Offset`` para retomar.
+    - ``PATCH /api/cargas/<id>/`` con ``Upload-Offset`` y el cuerpo
+      ``application/offset+octet-stream`` → 204 y el nuevo ``Upload-Offset``.
+    - ``DELETE /api/cargas/<id>/`` descarta la carga.
+
+    Al recibir el último byte se crea el plano y se encola su procesamiento;
+    ``GET /api/cargas/<id>/`` informa el plano, el trabajo y el SHA-256.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return CargaReanudable.objects.filter(usuario=self.request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        response['Tus-Resumable'] = carga_reanudable.VERSION_TUS
+        return response
+
+    def handle_exception(self, exc):
+        if isinstance(exc, carga_reanudable.CargaError):
+            return Response({'detail': str(exc)}, status=exc.status)
+        return super().handle_exception(exc)
+
+    def _entero(self, request, cabecera):
+        try:
+            valor = int(request.headers.get(cabecera, ''))
+        except ValueError:
+            raise ValidationError({cabecera: 'Se requiere un entero.'})
+        if valor < 0:
+            raise ValidationError({cabecera: 'No puede ser negativo.'})
+        return valor
+
+    def _con_desplazamiento(self, response, carga):
+        response['Upload-Offset'] = str(carga.desplazamiento)
+        response['Upload-Length'] = str(carga.tamanio)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def options(self, request, *args, **kwargs):
+        response = Response(status=status.HTTP_204_NO_CONTENT)
+        response['Tus-Version'] = carga_reanudable.VERSION_TUS
+        response['Tus-Extension'] = 'creation,termination'
+        response['Tus-Max-Size'] = str(carga_reanudable.max_bytes())
+        return response
+
+    def create(self, request):
+        carga = carga_reanudable.crear_carga(
+            request.user,
+            self._entero(request, 'Upload-Length'),
+            carga_reanudable.parsear_metadatos(request.headers.get('Upload-Metadata')),
+        )
+        response = Response(status=status.HTTP_201_CREATED)
+        response['Location'] = reverse('carga-detail', args=[carga.pk], request=request)
+        return self._con_desplazamiento(response, carga)
+
+    def retrieve(self, request, pk=None):
+        carga = self.get_object()
+        trabajo = carga.plano.trabajos.order_by('-id').first() if carga.plano_id else None
+        response = Response({
+            'id': str(carga.pk),
+            'nombre': carga.nombre,
+            'tamanio': carga.tamanio,
+            'desplazamiento': carga.desplazamiento,
+            'sha256': carga.sha256 or None,
+            'plano': carga.plano_id,
+            'trabajo': trabajo.id if trabajo else None,
+        })
+        return self._con_desplazamiento(response, carga)
+
+    def partial_update(self, request, pk=None):
+        if request.content_type != 'application/offset+octet-stream':
+            return Response(
+                {'detail': 'Content-Type debe ser application/offset+octet-stream.'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        carga = self.get_object()
+        carga = carga_reanudable.recibir_parte(
+            carga,
+            self._entero(request, 'Upload-Offset'),
+            # El cuerpo se lee por bloques desde el socket, sin pasar por los parsers
+            request._request,
+            self._entero(request, 'Content-Length'),
+        )
+        response = Response(status=status.HTTP_204_NO_CONTENT)
+        if carga.plano_id:
+            response['X-Plano-Id'] = str(carga.plano_id)
+        return self._con_desplazamiento(response, carga)
+
+    def destroy(self, request, pk=None):
+        carga = self.get_object()
+        if carga.plano_id:
+            raise ValidationError('La carga ya está completa.')
+        carga_reanudable.cancelar(carga)
+        return Response(status=status.HTTP_204_NO_CONTENT)
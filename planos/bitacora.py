@@ -0,0 +1,230 @@
+"""
+Registro asíncrono y estructurado.
+
+Los handlers de archivo y consola no escriben en el hilo de la solicitud:
+``ManejadorAsincrono`` (un ``QueueHandler``) solo encola el registro y un
+``QueueListener`` propio lo pasa a un destino que junta las líneas y las
+escribe por lotes (cada ``lote`` registros o ``intervalo`` segundos). Se
+configura desde ``LOGGING`` como cualquier handler, sin depender del soporte
+de colas de ``dictConfig`` de Python 3.12.
+
+Los registros se escriben como una línea JSON. Los accesos comunes pasan por
+``acceso()``, que aplica el muestreo de ``LOG_MUESTREO_ACCESOS``; los eventos
+de ``auditoria()`` se registran siempre y, si la cola está llena, esperan
+lugar en vez de descartarse.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+# Atributos propios de LogRecord: el resto llegó por ``extra``
+_ATRIBUTOS_BASE = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "datos"}
+
+
+class FormateadorJSON(logging.Formatter):
+    """Una línea JSON por registro; ``extra={"datos": {...}}`` se agrega al objeto"""
+
+    def format(self, record):
+        objeto = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+            "proceso": record.process,
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_BASE:
+                objeto[clave] = valor
+        objeto.update(getattr(record, "datos", None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            objeto["excepcion"] = record.exc_text
+        return json.dumps(objeto, ensure_ascii=False, default=str)
+
+
+class _DestinoLotes(logging.Handler):
+    """
+    Acumula líneas formateadas y las escribe juntas; corre en el hilo del
+    listener. Cada lote va al archivo con un solo ``os.write`` sobre un
+    descriptor ``O_APPEND``: los workers web y de la cola comparten el
+    archivo y sus lotes no se mezclan a mitad de línea.
+    """
+
+    def __init__(self, archivo=None, lote=200, intervalo=1.0):
+        super().__init__()
+        self.archivo = archivo
+        self.lote = lote
+        self.intervalo = intervalo
+        self._pendientes = []
+        self._ultima = time.monotonic()
+        self._fd = None
+
+    def _abrir(self):
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.archivo) or ".", exist_ok=True)
+            self._fd = os.open(self.archivo, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _escribir(self, texto):
+        if not self.archivo:
+            sys.stderr.write(texto)
+            sys.stderr.flush()
+            return
+        datos = memoryview(texto.encode("utf-8"))
+        fd = self._abrir()
+        # Un archivo local acepta el lote entero; el resto solo queda con el disco lleno
+        while datos:
+            datos = datos[os.write(fd, datos):]
+
+    def emit(self, record):
+        try:
+            self._pendientes.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._pendientes) >= self.lote or time.monotonic() - self._ultima >= self.intervalo:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._ultima = time.monotonic()
+            if not self._pendientes:
+                return
+            lineas, self._pendientes = self._pendientes, []
+            self._escribir("\n".join(lineas) + "\n")
+        except OSError:
+            # Sin disco no se frena la aplicación: el lote se pierde y se avisa por stderr
+            sys.stderr.write(f"bitacora: no se pudo escribir {self.archivo}\n")
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+        super().close()
+
+
+class _Escucha(QueueListener):
+    """``QueueListener`` que vacía los lotes cuando la cola queda quieta"""
+
+    def __init__(self, cola, destino):
+        super().__init__(cola, destino, respect_handler_level=False)
+        self.destino = destino
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.destino.intervalo)
+            except queue.Empty:
+                if not block:
+                    raise
+                self.destino.flush()
+
+
+class ManejadorAsincrono(QueueHandler):
+    """
+    Handler para ``LOGGING``: encola y escribe en segundo plano.
+
+    ``archivo`` es la ruta de destino (``None`` para stderr). Si la cola llega
+    a ``max_cola`` los registros comunes se descartan y se cuentan en
+    ``descartados``; los de auditoría y los de nivel WARNING o más esperan.
+    """
+
+    def __init__(self, archivo=None, lote=200, intervalo=1.0, max_cola=10000):
+        super().__init__(queue.Queue(maxsize=max_cola))
+        self.destino = _DestinoLotes(archivo, lote=lote, intervalo=intervalo)
+        self.descartados = 0
+        self._listener = None
+        self._pid = None
+        self._inicio_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # El formato se aplica en el hilo del listener, no en el de la solicitud
+        self.destino.setFormatter(fmt)
+
+    def _asegurar_listener(self):
+        # Tras un fork (workers de gunicorn con --preload) el hilo no existe en el hijo
+        if self._pid == os.getpid():
+            return
+        with self._inicio_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._listener = _Escucha(self.queue, self.destino)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Solo se resuelve lo que no puede esperar: el mensaje y la traza
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._asegurar_listener()
+        if getattr(record, "evento", None) == "auditoria" or record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+    def flush(self):
+        """Espera a que se escriba todo lo encolado hasta ahora"""
+        if self._listener is not None and self._pid == os.getpid():
+            self.queue.join()
+        self.destino.flush()
+
+    def close(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+        self._listener = None
+        self._pid = None
+        self.destino.close()
+        super().close()
+
+
+# -------------------------
+# Eventos
+# -------------------------
+def _tasa_muestreo():
+    return getattr(settings, "LOG_MUESTREO_ACCESOS", 1.0)
+
+
+def muestrear():
+    """``True`` si este acceso se registra según ``LOG_MUESTREO_ACCESOS``"""
+    tasa = _tasa_muestreo()
+    return tasa >= 1 or (tasa > 0 and random.random() < tasa)
+
+
+def acceso(logger, mensaje, *args, **datos):
+    """Registro de acceso común: muestreado y nivel INFO"""
+    if logger.isEnabledFor(logging.INFO) and muestrear():
+        logger.info(mensaje, *args, extra={"evento": "acceso", "datos": datos})
+
+
+def auditoria(logger, mensaje, *args, **datos):
+    """Evento de auditoría: nunca se muestrea"""
+    logger.info(mensaje, *args, extra={"evento": "auditoria", "datos": datos})
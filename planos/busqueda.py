@@ -0,0 +1,213 @@
+"""
+Búsqueda de texto completo sobre el texto extraído de los planos.
+
+El índice vive en la tabla ``planos_busqueda`` y depende del motor:
+
+- SQLite: tabla virtual FTS5 (``rowid`` = id del plano), sin distinguir
+  acentos.
+- PostgreSQL: ``tsvector`` con pesos (título A, contenido B) e índice GIN,
+  con ``ON DELETE CASCADE`` hacia el plano.
+
+Con otros motores la búsqueda se limita al título. El índice se actualiza
+al guardar los resultados o el título de un plano (ver ``Plano.save``; la
+carga masiva indexa el título después del ``bulk_create``), la entrada se
+quita al borrarlo (señal ``post_delete`` en ``planos.models``; no hay
+trigger en ``planos_plano``, que SQLite pierde cada vez que una migración
+rehace la tabla) y puede reconstruirse con
+``python manage.py reindexar_busqueda``.
+"""
+
+import re
+from dataclasses import dataclass
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+TABLA = "planos_busqueda"
+# Marcas del fragmento resaltado; se convierten a <mark> después de escapar
+_INICIO, _FIN = "\x02", "\x03"
+CAMPOS_CONTENIDO = ("lugar", "departamento", "inmueble", "descripcion", "nota1", "nota2", "croquis")
+
+_TERMINO = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class ResultadoBusqueda:
+    plano: object
+    rango: float
+    fragmento: str
+
+    @property
+    def fragmento_html(self):
+        return mark_safe(
+            escape(self.fragmento).replace(_INICIO, "<mark>").replace(_FIN, "</mark>")
+        )
+
+
+def _motor(conn=None):
+    return (conn or connection).vendor
+
+
+# -------------------------
+# Esquema
+# -------------------------
+def crear_indice(conn):
+    with conn.cursor() as cursor:
+        if _motor(conn) == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5("
+                "titulo, contenido, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        elif _motor(conn) == "postgresql":
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLA} ("
+                " plano_id integer PRIMARY KEY REFERENCES planos_plano(id) ON DELETE CASCADE,"
+                " titulo text NOT NULL DEFAULT '',"
+                " contenido text NOT NULL DEFAULT '',"
+                " documento tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {TABLA}_documento_gin ON {TABLA} USING gin(documento)"
+            )
+
+
+def eliminar_indice(conn):
+    with conn.cursor() as cursor:
+        if _motor(conn) == "sqlite":
+            # Trigger de borrado de las bases creadas antes de la 0015
+            cursor.execute(f"DROP TRIGGER IF EXISTS {TABLA}_borrado")
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLA}")
+        elif _motor(conn) == "postgresql":
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLA}")
+
+
+# -------------------------
+# Indexación
+# -------------------------
+def contenido_indexable(texto, datos):
+    """
+    Texto extraído (o, si falta, los campos descriptivos de los datos) con
+    los espacios del maquetado del PDF colapsados, para que los fragmentos
+    resaltados sean legibles.
+    """
+    datos = datos if isinstance(datos, dict) else {}
+    texto = texto or datos.get("texto_completo")
+    if not texto:
+        partes = [str(datos.get(campo) or "") for campo in CAMPOS_CONTENIDO]
+        partes += [str(l.get("linderos") or "") for l in datos.get("lados") or [] if isinstance(l, dict)]
+        texto = " ".join(partes)
+    return " ".join(texto.split())
+
+
+def indexar(plano_id, titulo, contenido, conn=None):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if _motor(conn) == "sqlite":
+            cursor.execute(f"DELETE FROM {TABLA} WHERE rowid = %s", [plano_id])
+            cursor.execute(
+                f"INSERT INTO {TABLA} (rowid, titulo, contenido) VALUES (%s, %s, %s)",
+                [plano_id, titulo or "", contenido or ""],
+            )
+        elif _motor(conn) == "postgresql":
+            cursor.execute(
+                f"INSERT INTO {TABLA} (plano_id, titulo, contenido, documento) VALUES ("
+                " %s, %s, %s,"
+                " setweight(to_tsvector('spanish', %s), 'A') || setweight(to_tsvector('spanish', %s), 'B'))"
+                " ON CONFLICT (plano_id) DO UPDATE SET titulo = EXCLUDED.titulo,"
+                " contenido = EXCLUDED.contenido, documento = EXCLUDED.documento",
+                [plano_id, titulo or "", contenido or "", titulo or "", contenido or ""],
+            )
+
+
+def desindexar(plano_id, conn=None):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if _motor(conn) == "sqlite":
+            cursor.execute(f"DELETE FROM {TABLA} WHERE rowid = %s", [plano_id])
+        elif _motor(conn) == "postgresql":
+            # Normalmente ya lo borró el ON DELETE CASCADE
+            cursor.execute(f"DELETE FROM {TABLA} WHERE plano_id = %s", [plano_id])
+
+
+def indexar_plano(plano):
+    indexar(plano.id, plano.titulo, contenido_indexable(plano.texto_extraido, plano.datos_procesados))
+
+
+# -------------------------
+# Consulta
+# -------------------------
+def _consulta_fts5(consulta):
+    """Términos como frases entre comillas (AND implícito); el último admite prefijo"""
+    terminos = _TERMINO.findall(consulta)
+    if not terminos:
+        return None
+    frases = ['"%s"' % t.replace('"', '""') for t in terminos]
+    frases[-1] += "*"
+    return " ".join(frases)
+
+
+def buscar(consulta, limite=20, desplazamiento=0):
+    """
+    Devuelve ``(total, resultados)`` ordenados por relevancia. Los
+    fragmentos traen las coincidencias marcadas (ver ``fragmento_html``).
+    """
+    # Import diferido: models importa este módulo para indexar al guardar
+    from .models import Plano
+
+    consulta = (consulta or "").strip()
+    if not consulta:
+        return 0, []
+    motor = _motor()
+    with connection.cursor() as cursor:
+        if motor == "sqlite":
+            expresion = _consulta_fts5(consulta)
+            if expresion is None:
+                return 0, []
+            cursor.execute(f"SELECT count(*) FROM {TABLA} WHERE {TABLA} MATCH %s", [expresion])
+            total = cursor.fetchone()[0]
+            # bm25 es menor cuanto más relevante
+            cursor.execute(
+                f"SELECT rowid, -bm25({TABLA}, 5.0, 1.0) AS rango, snippet({TABLA}, 1, %s, %s, '…', 24)"
+                f" FROM {TABLA} WHERE {TABLA} MATCH %s ORDER BY rango DESC LIMIT %s OFFSET %s",
+                [_INICIO, _FIN, expresion, limite, desplazamiento],
+            )
+            filas = cursor.fetchall()
+        elif motor == "postgresql":
+            cursor.execute(
+                f"SELECT count(*) FROM {TABLA} WHERE documento @@ websearch_to_tsquery('spanish', %s)",
+                [consulta],
+            )
+            total = cursor.fetchone()[0]
+            # ts_headline es costoso: solo se calcula para las filas de la página
+            cursor.execute(
+                "SELECT r.plano_id, r.rango,"
+                " ts_headline('spanish', r.contenido, websearch_to_tsquery('spanish', %s), %s)"
+                " FROM ("
+                "  SELECT plano_id, contenido, ts_rank_cd(documento, q) AS rango"
+                f"  FROM {TABLA}, websearch_to_tsquery('spanish', %s) q"
+                "  WHERE documento @@ q ORDER BY rango DESC LIMIT %s OFFSET %s"
+                " ) r ORDER BY r.rango DESC",
+                [
+                    consulta,
+                    f"StartSel={_INICIO}, StopSel={_FIN}, MaxWords=30, MinWords=10, MaxFragments=2",
+                    consulta,
+                    limite,
+                    desplazamiento,
+                ],
+            )
+            filas = cursor.fetchall()
+        else:
+            qs = Plano.objects.filter(titulo__icontains=consulta).order_by("-fecha_carga")
+            total = qs.count()
+            filas = [(pid, 0.0, "") for pid in qs.values_list("id", flat=True)[desplazamiento:desplazamiento + limite]]
+
+    planos = Plano.objects.select_related("usuario").only(
+        "id", "titulo", "estado", "fecha_carga", "usuario__username"
+    ).in_bulk([fila[0] for fila in filas])
+    resultados = [
+        ResultadoBusqueda(planos[pid], rango, fragmento or "")
+        for pid, rango, fragmento in filas
+        if pid in planos
+    ]
+    return total, resultados
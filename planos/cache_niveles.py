@@ -0,0 +1,301 @@
+"""
+Caché en dos niveles para toda la aplicación.
+
+- L1: LRU chico en memoria del proceso (``CACHE_L1_MAX`` entradas) con TTL
+  corto (``CACHE_L1_TTL``), para no ir al L2 en lecturas repetidas.
+- L2: un alias de ``CACHES`` compartido por todos los workers: Redis en
+  producción o ``FileBasedCache`` en un directorio local como reemplazo.
+
+Las claves viven en espacios con nombre (``espacio("extraccion")``) y llevan
+la versión del espacio: ``invalidar()`` incrementa la versión en el L2 y todas
+las entradas anteriores dejan de leerse (vencen solas). Los demás procesos
+ven la versión nueva cuando vence su copia en L1, a lo sumo ``CACHE_L1_TTL``
+segundos después.
+
+``obtener_o_calcular`` evita la estampida al vencer una entrada: en el
+proceso, un solo hilo calcula y los demás esperan su resultado; entre
+procesos, quien toma el bloqueo en el L2 (``add`` atómico) calcula y el resto
+espera a que aparezca el valor. El bloqueo vence a los ``CACHE_ESPERA``
+segundos y quien calcula lo renueva mientras tanto, así un cálculo largo (una
+extracción con OCR) lo conserva y uno que muere lo suelta enseguida. Cuánto
+se espera a otro lo fija ``espera``, que debe cubrir lo que puede tardar el
+cálculo.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_FALTA = object()
+
+
+def _l1_ttl():
+    return getattr(settings, "CACHE_L1_TTL", 5.0)
+
+
+class _L1:
+    """LRU con vencimiento por entrada, seguro entre hilos"""
+
+    def __init__(self):
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return _FALTA
+            vence, valor = entrada
+            if vence <= ahora:
+                del self._datos[clave]
+                return _FALTA
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor, ttl):
+        maximo = getattr(settings, "CACHE_L1_MAX", 1000)
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > maximo:
+                self._datos.popitem(last=False)
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+_l1 = _L1()
+
+
+class _Vuelo:
+    """Cálculo en curso de una clave en este proceso"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = _FALTA
+
+
+_vuelos = {}
+_vuelos_lock = threading.Lock()
+
+
+class Espacio:
+    """Claves con un prefijo, TTL y versión comunes"""
+
+    def __init__(self, nombre, ttl=300, alias="default"):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.alias = alias
+        self._stats = dict.fromkeys(("l1", "l2", "fallos", "calculos", "esperas", "errores"), 0)
+        self._stats_lock = threading.Lock()
+
+    # -------------------------
+    # L2 (tolerante a fallos: sin L2 se sigue con L1 y cálculo)
+    # -------------------------
+    @property
+    def l2(self):
+        return caches[self.alias]
+
+    def _contar(self, estadistica):
+        with self._stats_lock:
+            self._stats[estadistica] += 1
+
+    def _l2(self, operacion, *args, **kwargs):
+        try:
+            return getattr(self.l2, operacion)(*args, **kwargs)
+        except Exception as e:
+            self._contar("errores")
+            logger.warning(f"Caché {self.nombre}: L2 no disponible en {operacion} ({e})")
+            return _FALTA if operacion == "get" else None
+
+    # -------------------------
+    # Versión
+    # -------------------------
+    @property
+    def _clave_version(self):
+        return f"{self.nombre}:__version__"
+
+    def version(self):
+        version = _l1.get(self._clave_version)
+        if version is _FALTA:
+            version = self._l2("get", self._clave_version, 1)
+            if version is _FALTA:
+                version = 1
+            _l1.set(self._clave_version, version, _l1_ttl())
+        return version
+
+    def invalidar(self):
+        """Descarta todas las entradas del espacio en todos los procesos"""
+        try:
+            version = self.l2.incr(self._clave_version)
+        except ValueError:
+            # Sin versión guardada se parte de la 1; si otro proceso la creó, se incrementa esa
+            version = 2 if self.l2.add(self._clave_version, 2, None) else self.l2.incr(self._clave_version)
+        _l1.set(self._clave_version, version, _l1_ttl())
+        logger.info(f"Caché {self.nombre}: invalidada (versión {version})")
+        return version
+
+    def clave(self, clave):
+        return f"{self.nombre}:v{self.version()}:{clave}"
+
+    # -------------------------
+    # Lectura y escritura
+    # -------------------------
+    def get(self, clave, default=None):
+        completa = self.clave(clave)
+        valor = _l1.get(completa)
+        if valor is not _FALTA:
+            self._contar("l1")
+            return valor
+        valor = self._l2("get", completa, _FALTA)
+        if valor is not _FALTA:
+            self._contar("l2")
+            _l1.set(completa, valor, min(_l1_ttl(), self.ttl))
+            return valor
+        self._contar("fallos")
+        return default
+
+    def set(self, clave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        completa = self.clave(clave)
+        self._l2("set", completa, valor, ttl)
+        _l1.set(completa, valor, min(_l1_ttl(), ttl))
+
+    def delete(self, clave):
+        completa = self.clave(clave)
+        _l1.delete(completa)
+        self._l2("delete", completa)
+
+    def obtener_o_calcular(self, clave, funcion, ttl=None, espera=None):
+        """
+        Valor de ``clave``; si falta, lo calcula una sola vez con ``funcion()``.
+        ``espera`` es lo más que se aguarda el cálculo de otro hilo o proceso
+        (``CACHE_ESPERA`` por defecto); pasado ese tiempo se calcula aparte.
+        """
+        valor = self.get(clave, _FALTA)
+        if valor is not _FALTA:
+            return valor
+
+        espera = getattr(settings, "CACHE_ESPERA", 10.0) if espera is None else espera
+        completa = self.clave(clave)
+        with _vuelos_lock:
+            vuelo = _vuelos.get(completa)
+            lider = vuelo is None
+            if lider:
+                vuelo = _vuelos[completa] = _Vuelo()
+        if not lider:
+            self._contar("esperas")
+            vuelo.evento.wait(espera)
+            if vuelo.valor is not _FALTA:
+                return vuelo.valor
+            # El cálculo del otro hilo falló o tarda demasiado: se calcula aparte
+            return funcion()
+
+        try:
+            vuelo.valor = self._calcular_compartido(completa, funcion, ttl, espera)
+            return vuelo.valor
+        finally:
+            vuelo.evento.set()
+            with _vuelos_lock:
+                _vuelos.pop(completa, None)
+
+    def _renovar_bloqueo(self, bloqueo, duracion, terminado):
+        while not terminado.wait(duracion / 3):
+            self._l2("touch", bloqueo, duracion)
+
+    def _calcular_compartido(self, completa, funcion, ttl, espera):
+        ttl = self.ttl if ttl is None else ttl
+        duracion = getattr(settings, "CACHE_ESPERA", 10.0)
+        bloqueo = f"{completa}:__calculando__"
+        tomado = self._l2("add", bloqueo, 1, duracion)
+        if tomado is False:
+            # Otro proceso ya lo está calculando: se espera a que publique el valor
+            self._contar("esperas")
+            limite = time.monotonic() + espera
+            pausa = 0.05
+            while tomado is False and time.monotonic() < limite:
+                time.sleep(pausa)
+                valor = self._l2("get", completa, _FALTA)
+                if valor is not _FALTA:
+                    _l1.set(completa, valor, min(_l1_ttl(), ttl))
+                    return valor
+                # Sin valor y sin bloqueo: el otro cálculo falló o su proceso murió
+                tomado = self._l2("add", bloqueo, 1, duracion)
+                pausa = min(pausa * 2, 0.5)
+            if tomado:
+                # El otro pudo publicar justo antes de soltar el bloqueo
+                valor = self._l2("get", completa, _FALTA)
+                if valor is not _FALTA:
+                    self._l2("delete", bloqueo)
+                    _l1.set(completa, valor, min(_l1_ttl(), ttl))
+                    return valor
+
+        terminado = threading.Event()
+        if tomado:
+            threading.Thread(
+                target=self._renovar_bloqueo, args=(bloqueo, duracion, terminado),
+                name=f"bloqueo-{self.nombre}", daemon=True,
+            ).start()
+        try:
+            self._contar("calculos")
+            valor = funcion()
+            self._l2("set", completa, valor, ttl)
+            _l1.set(completa, valor, min(_l1_ttl(), ttl))
+            return valor
+        finally:
+            terminado.set()
+            if tomado:
+                self._l2("delete", bloqueo)
+
+    # -------------------------
+    # Estadísticas
+    # -------------------------
+    def estadisticas(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        consultas = stats["l1"] + stats["l2"] + stats["fallos"]
+        stats["aciertos"] = round((stats["l1"] + stats["l2"]) / consultas, 4) if consultas else None
+        return stats
+
+
+_espacios = {}
+_espacios_lock = threading.Lock()
+
+
+def espacio(nombre, ttl=300, alias="default"):
+    """Espacio ``nombre``; siempre el mismo objeto para el mismo nombre"""
+    with _espacios_lock:
+        if nombre not in _espacios:
+            _espacios[nombre] = Espacio(nombre, ttl=ttl, alias=alias)
+        return _espacios[nombre]
+
+
+def estadisticas():
+    """Aciertos por espacio en este proceso"""
+    with _espacios_lock:
+        espacios = list(_espacios.values())
+    return {e.nombre: e.estadisticas() for e in espacios}
+
+
+def limpiar_l1():
+    _l1.clear()
+
+
+@receiver(setting_changed)
+def _reiniciar_l1(*, setting, **kwargs):
+    if setting == "CACHES" or setting.startswith("CACHE_L1_"):
+        _l1.clear()
@@ -0,0 +1,113 @@
+"""
+Carga masiva de planos.
+
+Recibe muchos PDF sueltos y/o ZIP con PDF, guarda cada archivo en el storage
+por bloques (sin leerlo entero en memoria), crea los ``Plano`` con
+``bulk_create`` y encola un trabajo de procesamiento por plano.
+"""
+
+import logging
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from . import busqueda, cola
+from .models import LoteCarga, Plano
+
+logger = logging.getLogger(__name__)
+
+CABECERA_PDF = b"%PDF-"
+
+
+def _max_bytes():
+    return getattr(settings, "PLANO_MAX_BYTES", 10 * 1024 * 1024)
+
+
+def _es_pdf(archivo):
+    cabecera = archivo.read(len(CABECERA_PDF))
+    archivo.seek(0)
+    return cabecera == CABECERA_PDF
+
+
+def _guardar(nombre, contenido):
+    """Guarda con el storage de ``Plano.archivo_pdf`` y devuelve la ruta"""
+    campo = Plano._meta.get_field("archivo_pdf")
+    destino = campo.generate_filename(None, os.path.basename(nombre))
+    return campo.storage.save(destino, File(contenido, name=os.path.basename(nombre)))
+
+
+def _iter_pdfs(archivos, rechazados):
+    """``(nombre, archivo)`` de cada PDF válido, incluidos los de ZIP"""
+    limite = getattr(settings, "CARGA_MASIVA_MAX_ARCHIVOS", 500)
+    aceptados = 0
+    for subido in archivos:
+        nombre = subido.name
+        if nombre.lower().endswith(".zip"):
+            try:
+                zf = zipfile.ZipFile(subido)
+            except zipfile.BadZipFile:
+                rechazados.append({"archivo": nombre, "motivo": "ZIP inválido"})
+                continue
+            with zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                        continue
+                    etiqueta = f"{nombre}/{info.filename}"
+                    if info.file_size > _max_bytes():
+                        rechazados.append({"archivo": etiqueta, "motivo": "Supera el tamaño máximo"})
+                        continue
+                    if aceptados >= limite:
+                        rechazados.append({"archivo": etiqueta, "motivo": "Supera la cantidad máxima del lote"})
+                        continue
+                    with zf.open(info) as miembro:
+                        if not _es_pdf(miembro):
+                            rechazados.append({"archivo": etiqueta, "motivo": "No es un PDF"})
+                            continue
+                        aceptados += 1
+                        yield info.filename, miembro
+            continue
+
+        if not nombre.lower().endswith(".pdf"):
+            rechazados.append({"archivo": nombre, "motivo": "Debe ser PDF o ZIP"})
+        elif subido.size > _max_bytes():
+            rechazados.append({"archivo": nombre, "motivo": "Supera el tamaño máximo"})
+        elif aceptados >= limite:
+            rechazados.append({"archivo": nombre, "motivo": "Supera la cantidad máxima del lote"})
+        elif not _es_pdf(subido):
+            rechazados.append({"archivo": nombre, "motivo": "No es un PDF"})
+        else:
+            aceptados += 1
+            yield nombre, subido
+
+
+def crear_lote(archivos, usuario=None):
+    """
+    Guarda los PDF, crea los planos y encola su procesamiento.
+    Devuelve ``(lote, trabajos)``; los archivos rechazados quedan en
+    ``lote.rechazados``.
+    """
+    rechazados, planos = [], []
+    try:
+        for nombre, contenido in _iter_pdfs(archivos, rechazados):
+            ruta = _guardar(nombre, contenido)
+            titulo = os.path.splitext(os.path.basename(nombre))[0][:255] or "Plano"
+            planos.append(Plano(titulo=titulo, archivo_pdf=ruta, usuario=usuario, estado="pendiente"))
+
+        with transaction.atomic():
+            lote = LoteCarga.objects.create(usuario=usuario, rechazados=rechazados)
+            planos = Plano.objects.bulk_create(planos)
+            # bulk_create no pasa por Plano.save: el título se indexa acá
+            for plano in planos:
+                busqueda.indexar(plano.id, plano.titulo, "")
+            trabajos = cola.encolar(planos, lote=lote)
+    except Exception:
+        # Sin filas que los referencien, se liberan las referencias ya sumadas
+        for plano in planos:
+            plano.archivo_pdf.storage.delete(plano.archivo_pdf.name)
+        raise
+
+    logger.info(f"Lote {lote.id}: {len(trabajos)} planos encolados, {len(rechazados)} rechazados")
+    return lote, trabajos
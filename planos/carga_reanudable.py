@@ -0,0 +1,271 @@
+"""
+Subidas reanudables de planos grandes (protocolo tipo tus 1.0).
+
+El cliente crea la carga declarando el tamaño total y envía el archivo en
+partes con ``PATCH`` indicando en ``Upload-Offset`` desde dónde escribe; si se
+corta la conexión consulta con ``HEAD`` cuántos bytes llegaron y sigue desde
+ahí. Cada parte se escribe directo en un archivo parcial (nunca entera en
+memoria) mientras se calcula el SHA-256 incremental; al completarse, el
+parcial se mueve a su ubicación final sin volver a leerlo y el plano se
+encola para procesar.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cola
+from .models import CargaReanudable, Plano
+
+logger = logging.getLogger(__name__)
+
+VERSION_TUS = "1.0.0"
+BLOQUE = 1024 * 1024
+CABECERA_PDF = b"%PDF-"
+# Segundos tras los que se libera el bloqueo de un PATCH que nunca terminó
+BLOQUEO_VENCIMIENTO = 300
+
+
+class CargaError(Exception):
+    """Error del protocolo; ``status`` es el código HTTP a responder"""
+
+    status = 400
+
+
+class DesplazamientoInvalido(CargaError):
+    status = 409
+
+
+class CargaOcupada(CargaError):
+    status = 423
+
+
+class ArchivoInvalido(CargaError):
+    status = 415
+
+
+class TamanioExcedido(CargaError):
+    status = 413
+
+
+class ChecksumInvalido(CargaError):
+    # Código de la extensión "checksum" de tus
+    status = 460
+
+
+def max_bytes():
+    return getattr(settings, "CARGA_REANUDABLE_MAX_BYTES", 500 * 1024 * 1024)
+
+
+def directorio_parciales():
+    return getattr(settings, "CARGA_REANUDABLE_DIR", None) or os.path.join(settings.MEDIA_ROOT, ".parciales")
+
+
+def ruta_parcial(carga):
+    return os.path.join(directorio_parciales(), f"{carga.id.hex}.part")
+
+
+def parsear_metadatos(cabecera):
+    """``Upload-Metadata``: pares ``clave valor-base64`` separados por comas"""
+    metadatos = {}
+    for par in (cabecera or "").split(","):
+        partes = par.strip().split(" ", 1)
+        if not partes[0]:
+            continue
+        try:
+            valor = base64.b64decode(partes[1]).decode("utf-8") if len(partes) > 1 else ""
+        except (ValueError, UnicodeDecodeError):
+            raise CargaError(f"Metadato inválido: {partes[0]}")
+        metadatos[partes[0]] = valor
+    return metadatos
+
+
+# -------------------------
+# Estado del hash entre partes
+# -------------------------
+# Los objetos de hashlib no se pueden serializar: se conservan en memoria
+# del proceso junto al desplazamiento que cubren. Si la parte siguiente llega
+# a otro proceso (o tras un reinicio) el hash se reconstruye leyendo el
+# parcial una vez.
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+_HASHES_MAX = 256
+
+
+def _tomar_hash(carga, desplazamiento):
+    with _hashes_lock:
+        guardado = _hashes.pop(carga.id, None)
+    if guardado is not None and guardado[0] == desplazamiento:
+        return guardado[1]
+    if desplazamiento == 0:
+        return hashlib.sha256()
+
+    logger.info(f"Carga {carga.id}: reconstruyendo SHA-256 de {desplazamiento} bytes")
+    h = hashlib.sha256()
+    restante = desplazamiento
+    with open(ruta_parcial(carga), "rb") as f:
+        while restante > 0:
+            bloque = f.read(min(BLOQUE, restante))
+            if not bloque:
+                break
+            h.update(bloque)
+            restante -= len(bloque)
+    return h
+
+
+def _guardar_hash(carga, desplazamiento, h):
+    with _hashes_lock:
+        _hashes[carga.id] = (desplazamiento, h)
+        while len(_hashes) > _HASHES_MAX:
+            _hashes.popitem(last=False)
+
+
+def _olvidar_hash(carga):
+    with _hashes_lock:
+        _hashes.pop(carga.id, None)
+
+
+# -------------------------
+# Protocolo
+# -------------------------
+def crear_carga(usuario, tamanio, metadatos):
+    if tamanio <= 0:
+        raise CargaError("Upload-Length debe ser mayor que cero.")
+    if tamanio > max_bytes():
+        raise TamanioExcedido(f"El archivo supera el máximo de {max_bytes()} bytes.")
+    nombre = os.path.basename(metadatos.get("filename") or "plano.pdf")[:255]
+    if not nombre.lower().endswith(".pdf"):
+        raise ArchivoInvalido("El archivo debe ser un PDF.")
+
+    carga = CargaReanudable.objects.create(
+        usuario=usuario,
+        nombre=nombre,
+        titulo=(metadatos.get("titulo") or os.path.splitext(nombre)[0])[:255],
+        tamanio=tamanio,
+        sha256_esperado=(metadatos.get("sha256") or "").lower()[:64],
+    )
+    os.makedirs(directorio_parciales(), exist_ok=True)
+    open(ruta_parcial(carga), "wb").close()
+    return carga
+
+
+def recibir_parte(carga, desplazamiento, flujo, largo):
+    """
+    Escribe hasta ``largo`` bytes de ``flujo`` a partir de ``desplazamiento``.
+    Si la conexión se corta, lo recibido hasta ese momento queda guardado.
+    Devuelve la carga actualizada (con ``plano`` si se completó).
+    """
+    if carga.plano_id is not None:
+        raise DesplazamientoInvalido("La carga ya está completa.")
+    if desplazamiento + largo > carga.tamanio:
+        raise CargaError("La parte excede el tamaño declarado.")
+
+    ahora = timezone.now()
+    tomada = CargaReanudable.objects.filter(
+        Q(bloqueo__isnull=True) | Q(bloqueo__lt=ahora - timedelta(seconds=BLOQUEO_VENCIMIENTO)),
+        id=carga.id,
+        desplazamiento=desplazamiento,
+        plano__isnull=True,
+    ).update(bloqueo=ahora)
+    if not tomada:
+        carga.refresh_from_db()
+        if carga.desplazamiento != desplazamiento:
+            raise DesplazamientoInvalido(f"Upload-Offset esperado: {carga.desplazamiento}.")
+        raise CargaOcupada("Otra parte de esta carga se está recibiendo.")
+
+    nuevo = desplazamiento
+    try:
+        h = _tomar_hash(carga, desplazamiento)
+        with open(ruta_parcial(carga), "r+b") as f:
+            # Descarta bytes de una escritura anterior que no llegó a registrarse
+            f.seek(desplazamiento)
+            f.truncate()
+            restante = largo
+            try:
+                while restante > 0:
+                    bloque = flujo.read(min(BLOQUE, restante))
+                    if not bloque:
+                        break
+                    f.write(bloque)
+                    h.update(bloque)
+                    nuevo += len(bloque)
+                    restante -= len(bloque)
+            except OSError as e:
+                logger.warning(f"Carga {carga.id}: conexión cortada en {nuevo} bytes ({e})")
+            f.flush()
+            os.fsync(f.fileno())
+
+            if desplazamiento < len(CABECERA_PDF) <= nuevo:
+                f.seek(0)
+                if f.read(len(CABECERA_PDF)) != CABECERA_PDF:
+                    nuevo = 0
+                    f.truncate(0)
+                    raise ArchivoInvalido("El archivo no es un PDF.")
+
+        if nuevo == carga.tamanio:
+            # Se completa con el bloqueo tomado: ningún otro PATCH puede duplicar el plano
+            try:
+                _completar(carga, h.hexdigest())
+            except ChecksumInvalido:
+                nuevo = 0
+                raise
+        else:
+            _guardar_hash(carga, nuevo, h)
+    finally:
+        CargaReanudable.objects.filter(id=carga.id).update(
+            desplazamiento=nuevo, bloqueo=None, fecha_actualizacion=timezone.now()
+        )
+        carga.desplazamiento = nuevo
+    return carga
+
+
+def _completar(carga, digest):
+    if carga.sha256_esperado and digest != carga.sha256_esperado:
+        open(ruta_parcial(carga), "wb").close()
+        raise ChecksumInvalido("El SHA-256 del archivo recibido no coincide.")
+
+    campo = Plano._meta.get_field("archivo_pdf")
+    # El hash ya está calculado: el parcial se incorpora sin volver a leerlo
+    nombre = campo.storage.guardar_local(
+        ruta_parcial(carga), campo.generate_filename(None, carga.nombre), digest
+    )
+
+    with transaction.atomic():
+        plano = Plano.objects.create(
+            titulo=carga.titulo or carga.nombre, archivo_pdf=nombre, usuario=carga.usuario, estado="pendiente"
+        )
+        carga.sha256 = digest
+        carga.plano = plano
+        carga.save(update_fields=["sha256", "plano", "fecha_actualizacion"])
+        cola.encolar([plano])
+    logger.info(f"Carga {carga.id} completa: plano {plano.id}, {carga.tamanio} bytes, sha256 {digest}")
+
+
+def cancelar(carga):
+    _olvidar_hash(carga)
+    try:
+        os.remove(ruta_parcial(carga))
+    except FileNotFoundError:
+        pass
+    carga.delete()
+
+
+def eliminar_vencidas(segundos=None):
+    """Borra las cargas sin completar inactivas hace más de ``segundos``"""
+    segundos = segundos or getattr(settings, "CARGA_REANUDABLE_VENCIMIENTO", 24 * 3600)
+    limite = timezone.now() - timedelta(seconds=segundos)
+    vencidas = CargaReanudable.objects.filter(plano__isnull=True, fecha_actualizacion__lt=limite)
+    total = 0
+    for carga in vencidas.iterator():
+        cancelar(carga)
+        total += 1
+    return total
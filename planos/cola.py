@@ -0,0 +1,209 @@
+"""
+Cola de procesamiento de planos respaldada por la base de datos.
+
+Cada plano a procesar tiene un ``TrabajoProcesamiento``. Los workers
+(``python manage.py procesar_cola``) toman trabajos pendientes con un UPDATE
+condicional, así varios procesos pueden consumir la misma cola sin tomar dos
+veces el mismo trabajo, en SQLite y en PostgreSQL.
+
+En desarrollo (``COLA_EJECUCION_LOCAL``) un hilo del propio proceso web vacía
+la cola apenas se encola algo, sin necesidad de levantar un worker.
+"""
+
+import logging
+import os
+import socket
+import threading
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import aislamiento, perfilado, recursos
+from .models import Plano, TrabajoProcesamiento
+from .services import procesar_pdf
+
+logger = logging.getLogger(__name__)
+
+
+def nombre_worker():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+# -------------------------
+# Encolado
+# -------------------------
+def encolar(planos, lote=None, perfilar=False, usar_cache=True):
+    """
+    Crea los trabajos de ``planos`` (ya guardados) y los devuelve. Sin
+    ``usar_cache`` el PDF se vuelve a leer aunque haya una extracción
+    compartida (reproceso).
+    """
+    trabajos = TrabajoProcesamiento.objects.bulk_create(
+        [
+            TrabajoProcesamiento(plano=plano, lote=lote, perfilar=perfilar, usar_cache=usar_cache)
+            for plano in planos
+        ]
+    )
+    if getattr(settings, "COLA_EJECUCION_LOCAL", False):
+        transaction.on_commit(_iniciar_worker_local)
+    return trabajos
+
+
+# -------------------------
+# Consumo
+# -------------------------
+def tomar_trabajo(worker=None):
+    """Reserva el trabajo pendiente más antiguo; ``None`` si la cola está vacía"""
+    worker = worker or nombre_worker()
+    while True:
+        candidato = (
+            TrabajoProcesamiento.objects.filter(estado=TrabajoProcesamiento.PENDIENTE)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if candidato is None:
+            return None
+        # Si otro worker lo tomó primero, el UPDATE no afecta filas y se prueba el siguiente
+        tomado = TrabajoProcesamiento.objects.filter(
+            id=candidato, estado=TrabajoProcesamiento.PENDIENTE
+        ).update(
+            estado=TrabajoProcesamiento.EN_CURSO,
+            worker=worker[:100],
+            fecha_inicio=timezone.now(),
+            intentos=F("intentos") + 1,
+        )
+        if tomado:
+            return TrabajoProcesamiento.objects.select_related("plano").get(id=candidato)
+
+
+def ejecutar_trabajo(trabajo, perfilar=False):
+    """
+    Procesa el plano del trabajo y registra el resultado. Con ``perfilar`` (o
+    ``trabajo.perfilar``) el procesamiento corre bajo cProfile; la extracción
+    aislada deja un segundo perfil, tomado en el proceso hijo. Si el trabajo
+    se cancela mientras corre (``cancelar``), la extracción se mata y el
+    trabajo queda cancelado.
+    """
+    plano = trabajo.plano
+    perfil = nullcontext()
+    if perfilar or trabajo.perfilar:
+        perfil = perfilado.perfilar(f"trabajo-{trabajo.id}-plano-{plano.id}")
+
+    def cancelado():
+        return TrabajoProcesamiento.objects.filter(id=trabajo.id, estado=TrabajoProcesamiento.CANCELADO).exists()
+
+    try:
+        Plano.objects.filter(id=plano.id).update(estado="procesando", fecha_actualizacion=timezone.now())
+        with perfil:
+            procesar_pdf(plano, usar_cache=trabajo.usar_cache, cancelado=cancelado)
+    except aislamiento.Cancelado:
+        logger.info(f"Trabajo {trabajo.id} (plano {plano.id}) cancelado")
+        trabajo.estado = TrabajoProcesamiento.CANCELADO
+        trabajo.error = ""
+    except Exception as e:
+        logger.error(f"Error procesando plano {plano.id} (trabajo {trabajo.id}): {str(e)}")
+        # Un plano fuera de presupuesto vuelve a fallar: no se reintenta
+        reintentar = not isinstance(e, recursos.LimiteRecursos) and trabajo.intentos < getattr(
+            settings, "COLA_MAX_INTENTOS", 2
+        )
+        Plano.objects.filter(id=plano.id).update(
+            estado="pendiente" if reintentar else "error", fecha_actualizacion=timezone.now()
+        )
+        if reintentar:
+            trabajo.estado = TrabajoProcesamiento.PENDIENTE
+        elif isinstance(e, recursos.TiempoAgotado):
+            trabajo.estado = TrabajoProcesamiento.TIEMPO_AGOTADO
+        else:
+            trabajo.estado = TrabajoProcesamiento.ERROR
+        trabajo.error = str(e)[:2000]
+    else:
+        trabajo.estado = TrabajoProcesamiento.COMPLETADO
+        trabajo.error = ""
+    trabajo.fecha_fin = timezone.now()
+
+    # Una cancelación que llegó al final gana sobre el resultado
+    actualizados = TrabajoProcesamiento.objects.filter(id=trabajo.id).exclude(
+        estado=TrabajoProcesamiento.CANCELADO
+    ).update(estado=trabajo.estado, error=trabajo.error, fecha_fin=trabajo.fecha_fin)
+    if not actualizados:
+        trabajo.estado = TrabajoProcesamiento.CANCELADO
+    if trabajo.estado == TrabajoProcesamiento.CANCELADO:
+        Plano.objects.filter(id=plano.id).update(estado="cancelado", fecha_actualizacion=timezone.now())
+    return trabajo
+
+
+def cancelar(plano):
+    """
+    Cancela los trabajos pendientes o en curso de ``plano``; devuelve cuántos.
+    Los pendientes ya no se toman; en los que están en curso el worker mata
+    la extracción en menos de un segundo (``aislamiento.INTERVALO_ESPERA``)
+    o, si ya estaba generando la memoria, descarta el resultado al terminar.
+    """
+    cancelados = TrabajoProcesamiento.objects.filter(
+        plano=plano, estado__in=TrabajoProcesamiento.ACTIVOS
+    ).update(estado=TrabajoProcesamiento.CANCELADO, fecha_fin=timezone.now())
+    if cancelados:
+        Plano.objects.filter(id=plano.id).update(estado="cancelado", fecha_actualizacion=timezone.now())
+    return cancelados
+
+
+def recuperar_vencidos():
+    """
+    Devuelve a la cola los trabajos en curso hace más de ``COLA_VENCIMIENTO``
+    segundos (el worker que los tenía murió). Devuelve la cantidad.
+    """
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "COLA_VENCIMIENTO", 1800))
+    return TrabajoProcesamiento.objects.filter(
+        estado=TrabajoProcesamiento.EN_CURSO, fecha_inicio__lt=limite
+    ).update(estado=TrabajoProcesamiento.PENDIENTE, worker="")
+
+
+def procesar_pendientes(max_trabajos=None, worker=None, perfilar=False):
+    """Ejecuta trabajos hasta vaciar la cola (o hasta ``max_trabajos``)"""
+    procesados = 0
+    while max_trabajos is None or procesados < max_trabajos:
+        trabajo = tomar_trabajo(worker)
+        if trabajo is None:
+            break
+        ejecutar_trabajo(trabajo, perfilar=perfilar)
+        procesados += 1
+    return procesados
+
+
+# -------------------------
+# Ejecución local (desarrollo)
+# -------------------------
+_hilo_local = None
+_hilo_lock = threading.Lock()
+
+
+def _vaciar_cola_local():
+    global _hilo_local
+    try:
+        while True:
+            procesar_pendientes()
+            # Lo encolado justo antes de terminar no debe quedar sin procesar
+            with _hilo_lock:
+                if not TrabajoProcesamiento.objects.filter(estado=TrabajoProcesamiento.PENDIENTE).exists():
+                    _hilo_local = None
+                    return
+    except Exception:
+        with _hilo_lock:
+            _hilo_local = None
+        raise
+    finally:
+        connections.close_all()
+
+
+def _iniciar_worker_local():
+    global _hilo_local
+    with _hilo_lock:
+        if _hilo_local is not None:
+            return
+        _hilo_local = threading.Thread(target=_vaciar_cola_local, name="cola-local", daemon=True)
+        _hilo_local.start()
@@ -3,9 +3,11 @@ from django.contrib.auth.decorators import user_passes_test
 from functools import wraps
 from django.http import HttpResponseForbidden
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
+from django.conf import settings
 import logging
 
+from . import bitacora, limitador
+
 logger = logging.getLogger('django.security')
 
 def superuser_required(view_func):
@@ -37,9 +39,11 @@ def ip_whitelist_required(allowed_ips=None):
     return decorator
 
 
-def rate_limit(max_requests=10, time_window=60):
+def rate_limit(max_requests=10, time_window=60, methods=None):
     """
-    Decorador para limitar rate de requests
+    Decorador para limitar rate de requests por IP (planos.limitador).
+    Con ``methods`` solo cuentan esos métodos; ``RATE_LIMIT_ENABLED=False``
+    lo desactiva.
     
     Uso:
         @rate_limit(max_requests=5, time_window=60)  # 5 requests por minuto
@@ -49,18 +53,20 @@ def rate_limit(max_requests=10, time_window=60):
     def decorator(view_func):
         @wraps(view_func)
         def wrapped_view(request, *args, **kwargs):
+            if not getattr(settings, 'RATE_LIMIT_ENABLED', True) or (methods and request.method not in methods):
+                return view_func(request, *args, **kwargs)
+
             client_ip = get_client_ip(request)
-            cache_key = f'rate_limit_{view_func.__name__}_{client_ip}'
-            
-            requests_count = cache.get(cache_key, 0)
+            permitida, espera = limitador.permitir(
+                f'{view_func.__module__}.{view_func.__name__}:{client_ip}', max_requests, time_window
+            )
             
-            if requests_count >= max_requests:
+            if not permitida:
                 logger.warning(f"Rate limit excedido para {view_func.__name__} desde IP: {client_ip}")
-                return HttpResponseForbidden(
-                    f"Demasiadas solicitudes. Máximo {max_requests} por {time_window} segundos."
+                return limitador.respuesta_excedida(
+                    f"Demasiadas solicitudes. Máximo {max_requests} por {time_window} segundos.", espera
                 )
             
-            cache.set(cache_key, requests_count + 1, time_window)
             return view_func(request, *args, **kwargs)
         return wrapped_view
     return decorator
@@ -81,20 +87,18 @@ def audit_action(action_type="ACCESS"):
             client_ip = get_client_ip(request)
             username = request.user.username if request.user.is_authenticated else 'Anónimo'
             
-            logger.info(
-                f"AUDITORÍA [{action_type}]: "
-                f"Vista: {view_func.__name__} | "
-                f"Usuario: {username} | "
-                f"IP: {client_ip} | "
-                f"Método: {request.method}"
+            bitacora.auditoria(
+                logger, "AUDITORÍA [%s]: %s", action_type, view_func.__name__,
+                accion=action_type, vista=view_func.__name__, usuario=username,
+                ip=client_ip, metodo=request.method,
             )
             
             response = view_func(request, *args, **kwargs)
             
-            logger.info(
-                f"AUDITORÍA [{action_type}] COMPLETADA: "
-                f"Vista: {view_func.__name__} | "
-                f"Status: {response.status_code}"
+            bitacora.auditoria(
+                logger, "AUDITORÍA [%s] COMPLETADA: %s", action_type, view_func.__name__,
+                accion=action_type, vista=view_func.__name__, usuario=username,
+                status=response.status_code,
             )
             
             return response
@@ -145,13 +149,9 @@ def require_authenticated(view_func):
     @wraps(view_func)
     @login_required
     def wrapped_view(request, *args, **kwargs):
-        client_ip = get_client_ip(request)
-        
-        logger.info(
-            f"Usuario autenticado accediendo: "
-            f"{request.user.username} | "
-            f"IP: {client_ip} | "
-            f"Vista: {view_func.__name__}"
+        bitacora.acceso(
+            logger, "Usuario autenticado accediendo: %s", request.user.username,
+            usuario=request.user.username, ip=get_client_ip(request), vista=view_func.__name__,
         )
         
         return view_func(request, *args, **kwargs)
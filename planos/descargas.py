@@ -0,0 +1,273 @@
+"""
+Entrega de archivos protegidos.
+
+Django decide quién puede bajar qué; la transferencia la hace, si se puede,
+el proxy de adelante (``ARCHIVOS_OFFLOAD``):
+
+- ``nginx``: ``X-Accel-Redirect`` hacia una ubicación ``internal``.
+  ``MEDIA_ROOT`` se publica como ``<ARCHIVOS_ACCEL_PREFIJO>media/`` y la
+  caché local de archivos remotos como ``<ARCHIVOS_ACCEL_PREFIJO>cache/``.
+- ``sendfile``: ``X-Sendfile`` con la ruta absoluta (Apache con
+  mod_xsendfile, lighttpd).
+
+Sin proxy (o si la ruta no está en una ubicación publicada) el archivo sale
+desde Python con ``Accept-Ranges``: un rango simple responde 206, uno fuera
+del archivo 416, y ``If-Range``, ``If-None-Match`` e ``If-Modified-Since``
+se respetan. Con ASGI la lectura va por bloques en un hilo aparte.
+
+Las respuestas generadas al vuelo (ZIP, PDF directo, NDJSON/CSV) usan
+``respuesta_streaming``: bajo ASGI Django juntaría un generador síncrono
+entero en memoria antes de mandar el primer byte.
+"""
+
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from planos.utils.cache_archivos import directorio_cache, ruta_local
+
+BLOQUE_DESCARGA = 256 * 1024
+
+MODOS = ("", "nginx", "sendfile")
+
+# Rango pedido que no se puede servir (416)
+_NO_SATISFACIBLE = object()
+
+
+# -------------------------
+# Lectura por bloques
+# -------------------------
+async def iter_archivo_async(archivo, longitud=None):
+    """Lee el archivo por bloques en un hilo aparte, sin bloquear el event loop"""
+    leer = sync_to_async(archivo.read, thread_sensitive=False)
+    restante = longitud
+    try:
+        while restante is None or restante > 0:
+            bloque = await leer(BLOQUE_DESCARGA if restante is None else min(BLOQUE_DESCARGA, restante))
+            if not bloque:
+                break
+            if restante is not None:
+                restante -= len(bloque)
+            yield bloque
+    finally:
+        await sync_to_async(archivo.close, thread_sensitive=False)()
+
+
+async def iter_async(iterador):
+    """
+    Recorre un iterador síncrono pidiendo cada bloque en un hilo aparte. El
+    hilo es uno solo por respuesta: los ``.iterator()`` de los generadores
+    dejan un cursor abierto en la conexión de ese hilo.
+    """
+    hilo = ThreadPoolExecutor(max_workers=1, thread_name_prefix="streaming")
+    siguiente = sync_to_async(next, thread_sensitive=False, executor=hilo)
+    fin = object()
+
+    def cerrar():
+        try:
+            if hasattr(iterador, "close"):
+                iterador.close()
+        finally:
+            connections.close_all()
+
+    try:
+        while (bloque := await siguiente(iterador, fin)) is not fin:
+            yield bloque
+    finally:
+        await sync_to_async(cerrar, thread_sensitive=False, executor=hilo)()
+        hilo.shutdown(wait=False)
+
+
+def respuesta_streaming(request, iterador, **kwargs):
+    """``StreamingHttpResponse`` que bajo ASGI no junta ``iterador`` en memoria"""
+    if isinstance(request, ASGIRequest):
+        iterador = iter_async(iter(iterador))
+    return StreamingHttpResponse(iterador, **kwargs)
+
+
+def iter_archivo(archivo, longitud):
+    """Hasta ``longitud`` bytes desde la posición actual"""
+    try:
+        while longitud > 0:
+            bloque = archivo.read(min(BLOQUE_DESCARGA, longitud))
+            if not bloque:
+                break
+            longitud -= len(bloque)
+            yield bloque
+    finally:
+        archivo.close()
+
+
+# -------------------------
+# Rangos
+# -------------------------
+def parsear_rango(cabecera, tamanio):
+    """
+    ``(inicio, fin)`` inclusivos para ``Range: bytes=...``, ``None`` si la
+    cabecera no se entiende o pide varios rangos (se responde el archivo
+    completo) y ``_NO_SATISFACIBLE`` si el rango queda fuera del archivo.
+    """
+    unidad, _, especificacion = cabecera.partition("=")
+    if unidad.strip().lower() != "bytes" or "," in especificacion:
+        return None
+    inicio, guion, fin = especificacion.strip().partition("-")
+    if not guion or not (inicio or fin) or not all(parte.isdigit() for parte in (inicio, fin) if parte):
+        return None
+    if not inicio:
+        # Sufijo: los últimos N bytes
+        sufijo = int(fin)
+        if sufijo == 0 or tamanio == 0:
+            return _NO_SATISFACIBLE
+        return max(0, tamanio - sufijo), tamanio - 1
+    inicio = int(inicio)
+    fin = int(fin) if fin else tamanio - 1
+    if inicio >= tamanio:
+        return _NO_SATISFACIBLE
+    if fin < inicio:
+        return None
+    return inicio, min(fin, tamanio - 1)
+
+
+def _if_range_vigente(if_range, etag, ultima):
+    """``If-Range`` coincide con la versión actual (si no, se manda todo)"""
+    if if_range.startswith(("W/", '"')):
+        # Solo vale la comparación fuerte
+        return not if_range.startswith("W/") and if_range == etag
+    return parse_http_date_safe(if_range) == ultima
+
+
+def _rango_pedido(request, etag, ultima, tamanio):
+    cabecera = request.headers.get("Range")
+    if not cabecera or request.method not in ("GET", "HEAD"):
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and not _if_range_vigente(if_range.strip(), etag, ultima):
+        return None
+    return parsear_rango(cabecera, tamanio)
+
+
+# -------------------------
+# Delegación al proxy
+# -------------------------
+def _modo():
+    modo = getattr(settings, "ARCHIVOS_OFFLOAD", "")
+    if modo not in MODOS:
+        raise ImproperlyConfigured(f"ARCHIVOS_OFFLOAD desconocido: {modo!r}")
+    return modo
+
+
+def _ubicaciones():
+    prefijo = getattr(settings, "ARCHIVOS_ACCEL_PREFIJO", "/_protegido/").rstrip("/")
+    return [
+        (str(settings.MEDIA_ROOT), f"{prefijo}/media/"),
+        (directorio_cache(), f"{prefijo}/cache/"),
+    ]
+
+
+def ruta_interna(ruta):
+    """URI interna de nginx para ``ruta``, ``None`` si no está publicada"""
+    ruta = os.path.realpath(ruta)
+    for directorio, prefijo in _ubicaciones():
+        directorio = os.path.realpath(directorio)
+        if os.path.commonpath([ruta, directorio]) == directorio:
+            relativa = os.path.relpath(ruta, directorio).replace(os.sep, "/")
+            return prefijo + quote(relativa)
+    return None
+
+
+def _respuesta_delegada(ruta, content_type):
+    modo = _modo()
+    if modo == "sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = os.path.realpath(ruta)
+        return response
+    if modo == "nginx":
+        interna = ruta_interna(ruta)
+        if interna is not None:
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = interna
+            return response
+    return None
+
+
+# -------------------------
+# Respuestas
+# -------------------------
+def _respuesta_python(request, ruta, content_type, tamanio, rango):
+    archivo = open(ruta, "rb")
+    es_asgi = isinstance(request, ASGIRequest)
+    if rango is None:
+        if es_asgi:
+            response = StreamingHttpResponse(iter_archivo_async(archivo), content_type=content_type)
+            response["Content-Length"] = str(tamanio)
+        else:
+            # Con WSGI se itera en el hilo del worker (y vale wsgi.file_wrapper)
+            response = FileResponse(archivo, content_type=content_type)
+        return response
+
+    inicio, fin = rango
+    longitud = fin - inicio + 1
+    archivo.seek(inicio)
+    iterador = iter_archivo_async(archivo, longitud) if es_asgi else iter_archivo(archivo, longitud)
+    response = StreamingHttpResponse(iterador, status=206, content_type=content_type)
+    response["Content-Length"] = str(longitud)
+    response["Content-Range"] = f"bytes {inicio}-{fin}/{tamanio}"
+    return response
+
+
+def servir_ruta(request, ruta, content_type=None, nombre_descarga=None, etag=None, adjunto=True,
+                cache_control="private, no-cache"):
+    """
+    Respuesta para el archivo local ``ruta``; la autorización ya se verificó.
+    Sin ``etag`` se usa uno a partir de la fecha y el tamaño del archivo.
+    """
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        raise Http404("Archivo no encontrado")
+    content_type = content_type or mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+    ultima = int(estado.st_mtime)
+    etag = etag or quote_etag(f"{estado.st_mtime_ns:x}-{estado.st_size:x}")
+
+    response = get_conditional_response(request, etag=etag, last_modified=ultima)
+    if response is None:
+        response = _respuesta_delegada(ruta, content_type)
+    if response is None:
+        rango = _rango_pedido(request, etag, ultima, estado.st_size)
+        if rango is _NO_SATISFACIBLE:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{estado.st_size}"
+        else:
+            response = _respuesta_python(request, ruta, content_type, estado.st_size, rango)
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(ultima)
+    response["Cache-Control"] = cache_control
+    if response.status_code in (200, 206):
+        nombre = nombre_descarga or os.path.basename(ruta)
+        response["Content-Disposition"] = content_disposition_header(adjunto, nombre)
+    return response
+
+
+def servir_archivo(request, storage, nombre, **kwargs):
+    """
+    ``servir_ruta`` para ``nombre`` de ``storage``. Con un storage remoto se
+    sirve la copia de la caché local (así hay rangos y el proxy la puede
+    leer); la primera descarga la trae completa.
+    """
+    try:
+        ruta = ruta_local(storage, nombre)
+    except FileNotFoundError:
+        raise Http404("Archivo no encontrado")
+    return servir_ruta(request, ruta, **kwargs)
@@ -0,0 +1,314 @@
+"""
+Exportación masiva de planos.
+
+Arma un ZIP con las memorias (DOCX/PDF), los datos extraídos (JSON) y el PDF
+original de cada plano seleccionado. El ZIP se escribe sobre la marcha: cada
+bloque comprimido se entrega apenas está listo, por lo que la memoria usada
+no depende de la cantidad de archivos. Los artefactos que ya existen se
+reutilizan y los faltantes se generan en un pool de hilos.
+
+Los datos extraídos también se exportan como NDJSON o CSV, fila por fila
+desde un ``.iterator()``, para sincronizaciones incrementales.
+"""
+
+import csv
+import json
+import logging
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dt_time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.text import slugify
+
+from .models import Plano
+from .utils.artifact_store import ArtifactStore, memorias_store
+from .utils.cache_archivos import ruta_local
+from .utils.docx_generator import DocxGenerator
+from .utils.pdf_converter import cached_pdf_path
+from .utils.pdf_renderer import PdfMemoriaRenderer
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ("docx", "pdf", "json", "original")
+CHUNK_SIZE = 256 * 1024
+
+memorias_pdf_store = ArtifactStore("outputs/memorias_pdf")
+
+
+# -------------------------
+# Selección
+# -------------------------
+def _inicio_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, dt_time.min))
+
+
+def filtrar_planos(params):
+    """
+    Queryset de planos según filtros de request o de línea de comandos.
+
+    Filtros: ``desde``/``hasta`` (fecha de carga, AAAA-MM-DD), ``estado``,
+    ``departamento``, ``usuario`` (username) e ``ids`` (separados por coma).
+    """
+    qs = Plano.objects.all()
+    desde = parse_date(params.get("desde") or "")
+    hasta = parse_date(params.get("hasta") or "")
+    if desde:
+        qs = qs.filter(fecha_carga__gte=_inicio_dia(desde))
+    if hasta:
+        qs = qs.filter(fecha_carga__lt=_inicio_dia(hasta) + timedelta(days=1))
+    if params.get("estado"):
+        qs = qs.filter(estado=params["estado"])
+    if params.get("departamento"):
+        qs = qs.filter(departamento__icontains=params["departamento"])
+    if params.get("usuario"):
+        qs = qs.filter(usuario__username=params["usuario"])
+    if params.get("ids"):
+        ids = [int(i) for i in str(params["ids"]).split(",") if i.strip().isdigit()]
+        qs = qs.filter(id__in=ids)
+    return qs.order_by("fecha_carga", "id")
+
+
+def parse_formatos(valor):
+    if not valor:
+        return FORMATOS
+    formatos = tuple(f.strip() for f in valor.split(",") if f.strip() in FORMATOS)
+    return formatos or FORMATOS
+
+
+# -------------------------
+# Artefactos por plano
+# -------------------------
+def _memoria_docx(plano):
+    if memorias_store.existe_ruta(plano.memoria_path):
+        return memorias_store.ruta_local(plano.memoria_path)
+    if not plano.datos_procesados:
+        return None
+    return memorias_store.ruta_local(DocxGenerator(plano).generate_memoria())
+
+
+def _memoria_pdf(plano, docx):
+    # Un PDF ya convertido con LibreOffice tiene prioridad
+    if docx:
+        convertido = cached_pdf_path(docx)
+        if os.path.exists(convertido):
+            return convertido
+    if not plano.datos_procesados:
+        return None
+    clave = ArtifactStore.compute_key(
+        plano.datos_procesados, PdfMemoriaRenderer.VERSION, tipo="memoria_pdf"
+    )
+
+    def _escribir(destino):
+        with open(destino, "wb") as f:
+            PdfMemoriaRenderer(plano).render_to(f)
+
+    ruta, _ = memorias_pdf_store.get_or_create(clave, ".pdf", _escribir)
+    return memorias_pdf_store.ruta_local(ruta)
+
+
+def preparar_archivos(plano, formatos=FORMATOS):
+    """
+    Lista de ``(nombre_en_zip, ruta_o_bytes)`` de un plano. Genera los
+    artefactos que falten; no toca la base de datos.
+    """
+    carpeta = f"{plano.id}_{slugify(plano.titulo) or 'plano'}"
+    archivos = []
+    try:
+        docx = _memoria_docx(plano) if {"docx", "pdf"} & set(formatos) else None
+        if "docx" in formatos and docx:
+            archivos.append((f"{carpeta}/memoria.docx", docx))
+        if "pdf" in formatos:
+            pdf = _memoria_pdf(plano, docx)
+            if pdf:
+                archivos.append((f"{carpeta}/memoria.pdf", pdf))
+    except Exception as e:
+        logger.error(f"Error generando artefactos del plano {plano.id}: {str(e)}")
+        archivos.append((f"{carpeta}/ERROR.txt", f"No se pudo generar la memoria: {e}".encode()))
+
+    if "json" in formatos and plano.datos_procesados is not None:
+        datos = json.dumps(plano.datos_procesados, ensure_ascii=False, indent=2, default=str)
+        archivos.append((f"{carpeta}/datos.json", datos.encode("utf-8")))
+    if "original" in formatos and plano.archivo_pdf:
+        storage = plano.archivo_pdf.storage
+        if storage.exists(plano.archivo_pdf.name):
+            archivos.append((f"{carpeta}/original.pdf", ruta_local(storage, plano.archivo_pdf.name)))
+    return archivos
+
+
+# -------------------------
+# ZIP en streaming
+# -------------------------
+class _Sumidero:
+    """Destino de escritura no posicionable: acumula bytes hasta el próximo drenaje"""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, data):
+        self._partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drenar(self):
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _zipinfo(nombre, fuente):
+    if isinstance(fuente, bytes):
+        fecha = time.localtime()[:6]
+        comprimir = zipfile.ZIP_DEFLATED
+    else:
+        fecha = time.localtime(os.path.getmtime(fuente))[:6]
+        # DOCX y PDF ya están comprimidos
+        comprimir = zipfile.ZIP_STORED if fuente.endswith((".docx", ".pdf")) else zipfile.ZIP_DEFLATED
+    info = zipfile.ZipInfo(nombre, date_time=max(fecha, (1980, 1, 1, 0, 0, 0)))
+    info.compress_type = comprimir
+    return info
+
+
+def iter_zip(planos, formatos=FORMATOS, workers=4):
+    """
+    Genera el ZIP en bloques de bytes.
+
+    ``planos`` puede ser un queryset con ``.iterator()``: los artefactos se
+    preparan en paralelo con una ventana acotada de planos por delante.
+    """
+    sumidero = _Sumidero()
+    ventana = max(1, workers) * 2
+    with zipfile.ZipFile(sumidero, "w", allowZip64=True) as zf:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            pendientes = deque()
+            planos_iter = iter(planos)
+
+            def _encolar():
+                while len(pendientes) < ventana:
+                    plano = next(planos_iter, None)
+                    if plano is None:
+                        return
+                    pendientes.append(pool.submit(preparar_archivos, plano, formatos))
+
+            _encolar()
+            while pendientes:
+                archivos = pendientes.popleft().result()
+                _encolar()
+                for nombre, fuente in archivos:
+                    with zf.open(_zipinfo(nombre, fuente), "w", force_zip64=True) as destino:
+                        if isinstance(fuente, bytes):
+                            destino.write(fuente)
+                        else:
+                            with open(fuente, "rb") as origen:
+                                for bloque in iter(lambda: origen.read(CHUNK_SIZE), b""):
+                                    destino.write(bloque)
+                                    datos = sumidero.drenar()
+                                    if datos:
+                                        yield datos
+                    datos = sumidero.drenar()
+                    if datos:
+                        yield datos
+    # Directorio central
+    yield sumidero.drenar()
+
+
+def nombre_zip():
+    return f"planos_{timezone.localtime().strftime('%Y%m%d_%H%M%S')}.zip"
+
+
+# -------------------------
+# Datos en NDJSON / CSV
+# -------------------------
+COLUMNAS_CSV = [
+    "id", "titulo", "estado", "fecha_carga", "fecha_actualizacion", "usuario",
+    "departamento", "lugar", "objeto", "inmueble", "fecha_operaciones",
+    "padrones", "dominios", "propietarios", "cantidad_lados", "cantidad_coordenadas",
+]
+
+
+def planos_para_datos(desde=None, hasta=None):
+    """
+    Planos modificados en ``(desde, hasta]``, en orden de modificación. Con
+    ``hasta`` fijo al inicio de la exportación, lo que cambie mientras se
+    escribe queda para la próxima corrida.
+    """
+    qs = Plano.objects.select_related("resultado", "usuario")
+    if desde:
+        qs = qs.filter(fecha_actualizacion__gt=desde)
+    if hasta:
+        qs = qs.filter(fecha_actualizacion__lte=hasta)
+    return qs.order_by("fecha_actualizacion", "id")
+
+
+def _registro(plano, con_texto=False):
+    datos = plano.datos_procesados
+    if isinstance(datos, dict) and not con_texto:
+        datos = {k: v for k, v in datos.items() if k != "texto_completo"}
+    return {
+        "id": plano.id,
+        "titulo": plano.titulo,
+        "estado": plano.estado,
+        "fecha_carga": plano.fecha_carga.isoformat(),
+        "fecha_actualizacion": plano.fecha_actualizacion.isoformat(),
+        "usuario": plano.usuario.username if plano.usuario else None,
+        "departamento": plano.departamento,
+        "datos": datos,
+    }
+
+
+def iter_ndjson(planos, con_texto=False, chunk_size=500):
+    """Un objeto JSON por línea; ``planos`` se recorre con ``.iterator()``"""
+    for plano in planos.iterator(chunk_size=chunk_size):
+        registro = _registro(plano, con_texto)
+        yield json.dumps(registro, ensure_ascii=False, default=str) + "\n"
+
+
+class _Linea:
+    """Destino de csv.writer que devuelve la línea escrita"""
+
+    def write(self, valor):
+        return valor
+
+
+def _fila_csv(plano):
+    datos = plano.datos_procesados if isinstance(plano.datos_procesados, dict) else {}
+    propietarios = []
+    for p in datos.get("propietarios") or []:
+        if isinstance(p, dict):
+            propietarios.append(" ".join(filter(None, [p.get("nombre"), p.get("dni")])))
+        else:
+            propietarios.append(str(p))
+    dominios = [d.get("matricula", "") if isinstance(d, dict) else str(d) for d in datos.get("dominios") or []]
+    return [
+        plano.id,
+        plano.titulo,
+        plano.estado,
+        plano.fecha_carga.isoformat(),
+        plano.fecha_actualizacion.isoformat(),
+        plano.usuario.username if plano.usuario else "",
+        plano.departamento,
+        datos.get("lugar", ""),
+        datos.get("objeto", ""),
+        datos.get("inmueble", ""),
+        datos.get("fecha_operaciones", ""),
+        "; ".join(map(str, datos.get("padrones") or [])),
+        "; ".join(dominios),
+        "; ".join(propietarios),
+        len(datos.get("lados") or []),
+        len(datos.get("coordenadas") or []),
+    ]
+
+
+def iter_csv(planos, chunk_size=500):
+    """CSV plano con los campos principales; listas separadas por ``;``"""
+    writer = csv.writer(_Linea())
+    # BOM para que Excel detecte UTF-8
+    yield "\ufeff" + writer.writerow(COLUMNAS_CSV)
+    for plano in planos.iterator(chunk_size=chunk_size):
+        yield writer.writerow(_fila_csv(plano))
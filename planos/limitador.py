@@ -0,0 +1,263 @@
+"""
+Límite de solicitudes compartido entre workers.
+
+Ventana deslizante aproximada: cada clave lleva un contador por ventana fija
+(``<clave>:<n>``) que se incrementa con ``incr`` atómico, y la tasa se estima
+como ``previa * (1 - fracción transcurrida) + actual``. Así no hay
+leer-y-escribir (que con solicitudes concurrentes cuenta de menos) y el
+contador vive en un backend compartido por todos los procesos.
+
+Por solicitud se hace a lo sumo un viaje al backend:
+
+- el contador de la ventana anterior ya no cambia, así que se lee una sola
+  vez por proceso y queda en memoria (L1);
+- con Redis el ``INCR``, su vencimiento y la lectura de la ventana anterior
+  van en un mismo pipeline;
+- una clave bloqueada se recuerda en el proceso hasta que la estimación
+  vuelva a permitirla: las solicitudes rechazadas no tocan el backend.
+
+Backends (``RATE_LIMIT_BACKEND``): ``redis`` (``RATE_LIMIT_REDIS_URL``,
+requiere el paquete ``redis``), ``cache`` (un alias de ``CACHES``; atómico
+si el backend de caché lo es, p. ej. ``RedisCache`` o Memcached) y
+``memoria``, contadores en el propio proceso para desarrollo y pruebas.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+logger = logging.getLogger("django.security")
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - dependencia opcional
+    redis = None
+
+# Entradas máximas de cada caché en memoria del proceso
+L1_MAX = 10000
+
+
+class _LRU:
+    """Diccionario acotado con descarte del menos usado, seguro entre hilos"""
+
+    def __init__(self, maximo=L1_MAX):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is not None:
+                self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def pop(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+# -------------------------
+# Backends
+# -------------------------
+class BackendMemoria:
+    """Contadores en memoria del proceso (no se comparten entre workers)"""
+
+    def __init__(self):
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def _purgar(self, ahora):
+        vencidas = [k for k, (_v, vence) in self._contadores.items() if vence <= ahora]
+        for k in vencidas:
+            del self._contadores[k]
+
+    def incrementar(self, clave, ttl, previa=None):
+        ahora = time.monotonic()
+        with self._lock:
+            if len(self._contadores) > L1_MAX:
+                self._purgar(ahora)
+            valor, vence = self._contadores.get(clave, (0, ahora + ttl))
+            if vence <= ahora:
+                valor, vence = 0, ahora + ttl
+            self._contadores[clave] = (valor + 1, vence)
+            anterior = None
+            if previa is not None:
+                anterior, vence_previa = self._contadores.get(previa, (0, ahora))
+                if vence_previa <= ahora:
+                    anterior = 0
+        return valor + 1, anterior
+
+    def reiniciar(self):
+        with self._lock:
+            self._contadores.clear()
+
+
+class BackendCache:
+    """Contadores en un alias de ``CACHES`` con ``incr``/``add``"""
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+
+    def incrementar(self, clave, ttl, previa=None):
+        cache = caches[self.alias]
+        try:
+            valor = cache.incr(clave)
+        except ValueError:
+            # add es atómico: si otro proceso creó la clave antes, se incrementa esa
+            valor = 1 if cache.add(clave, 1, ttl) else cache.incr(clave)
+        anterior = cache.get(previa, 0) if previa is not None else None
+        return valor, anterior
+
+    def reiniciar(self):
+        caches[self.alias].clear()
+
+
+class BackendRedis:
+    """Contadores en Redis: ``INCR`` + ``EXPIRE`` + ``GET`` en un solo pipeline"""
+
+    def __init__(self, url, timeout=0.5):
+        if redis is None:
+            raise ImproperlyConfigured("RATE_LIMIT_BACKEND='redis' requiere el paquete redis (pip install redis)")
+        if not url:
+            raise ImproperlyConfigured("RATE_LIMIT_BACKEND='redis' requiere RATE_LIMIT_REDIS_URL")
+        self.cliente = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    def incrementar(self, clave, ttl, previa=None):
+        pipe = self.cliente.pipeline(transaction=False)
+        pipe.incr(clave)
+        pipe.expire(clave, ttl)
+        if previa is not None:
+            pipe.get(previa)
+        resultado = pipe.execute()
+        anterior = int(resultado[2] or 0) if previa is not None else None
+        return resultado[0], anterior
+
+    def reiniciar(self):
+        self.cliente.flushdb()
+
+
+# -------------------------
+# Limitador
+# -------------------------
+class Limitador:
+    def __init__(self, backend, prefijo="rl"):
+        self.backend = backend
+        self.prefijo = prefijo
+        # Contadores de ventanas ya cerradas: (clave, n) -> total
+        self._previas = _LRU()
+        # Claves rechazadas: (clave, limite, ventana) -> instante hasta el que se rechaza
+        self._bloqueadas = _LRU()
+
+    def permitir(self, clave, limite, ventana):
+        """
+        Cuenta una solicitud para ``clave`` y devuelve ``(permitida, espera)``,
+        con ``espera`` en segundos hasta que vuelva a permitirse (0 si se permite).
+        """
+        ahora = time.time()
+        id_bloqueo = (clave, limite, ventana)
+        hasta = self._bloqueadas.get(id_bloqueo)
+        if hasta is not None:
+            if ahora < hasta:
+                return False, hasta - ahora
+            self._bloqueadas.pop(id_bloqueo)
+
+        n = int(ahora // ventana)
+        base = f"{self.prefijo}:{ventana}:{clave}"
+        previa = self._previas.get((base, n - 1))
+        try:
+            actual, leida = self.backend.incrementar(
+                f"{base}:{n}", int(ventana * 2) + 1, None if previa is not None else f"{base}:{n - 1}"
+            )
+        except Exception as e:
+            # Sin backend no se bloquea a nadie: el límite es una protección, no un requisito
+            logger.warning(f"Limitador: backend no disponible ({e}); se permite la solicitud")
+            return True, 0
+        if previa is None:
+            previa = int(leida or 0)
+            self._previas.set((base, n - 1), previa)
+
+        fraccion = (ahora - n * ventana) / ventana
+        if previa * (1 - fraccion) + actual <= limite:
+            return True, 0
+
+        # Momento en que el peso de la ventana anterior deja lugar; si la actual
+        # ya está llena, hasta que empiece la siguiente
+        if previa and actual <= limite:
+            hasta = n * ventana + ventana * (1 - (limite - actual) / previa)
+        else:
+            hasta = (n + 1) * ventana
+        hasta = max(hasta, ahora)
+        self._bloqueadas.set(id_bloqueo, hasta)
+        return False, hasta - ahora
+
+    def reiniciar(self):
+        self._previas.clear()
+        self._bloqueadas.clear()
+        self.backend.reiniciar()
+
+
+def _crear_limitador():
+    nombre = getattr(settings, "RATE_LIMIT_BACKEND", "memoria")
+    if nombre == "redis":
+        backend = BackendRedis(getattr(settings, "RATE_LIMIT_REDIS_URL", ""))
+    elif nombre == "cache":
+        backend = BackendCache(getattr(settings, "RATE_LIMIT_CACHE", "default"))
+    elif nombre == "memoria":
+        backend = BackendMemoria()
+    else:
+        raise ImproperlyConfigured(f"RATE_LIMIT_BACKEND desconocido: {nombre!r}")
+    return Limitador(backend)
+
+
+_limitador = None
+_limitador_lock = threading.Lock()
+
+
+def limitador():
+    """Limitador del proceso, creado con la configuración actual"""
+    global _limitador
+    if _limitador is None:
+        with _limitador_lock:
+            if _limitador is None:
+                _limitador = _crear_limitador()
+    return _limitador
+
+
+@receiver(setting_changed)
+def _reiniciar_limitador(*, setting, **kwargs):
+    global _limitador
+    if setting.startswith("RATE_LIMIT_"):
+        _limitador = None
+
+
+def permitir(clave, limite, ventana=60):
+    """Atajo de ``limitador().permitir``"""
+    return limitador().permitir(clave, limite, ventana)
+
+
+def respuesta_excedida(mensaje, espera):
+    """429 con ``Retry-After`` en segundos enteros"""
+    respuesta = HttpResponse(mensaje, status=429, content_type="text/plain; charset=utf-8")
+    respuesta["Retry-After"] = str(max(1, math.ceil(espera)))
+    return respuesta
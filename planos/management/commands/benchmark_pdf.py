@@ -0,0 +1,94 @@
+"""
+Compara la memoria en PDF renderizada directamente contra DOCX + conversión
+con LibreOffice, en latencia y pico de memoria (tracemalloc).
+
+Uso:
+    python manage.py benchmark_pdf --coordenadas 1000 10000
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from planos.utils.docx_generator import DocxGenerator
+from planos.utils.pdf_converter import ConversionError, get_converter
+from planos.utils.pdf_renderer import PdfMemoriaRenderer
+
+
+def _plano_sintetico(n):
+    datos = {
+        "departamento": "Capital",
+        "padrones": ["12-345"],
+        "lugar": "La Banda",
+        "propietarios": [{"nombre": "PEREZ JUAN", "dni": "20.123.456", "cuil": "20-20123456-3"}],
+        "superficies": [{"designacion": "Lote 1", "sup_titulo": "1 Has 2 As 3 Cas"}],
+        "lados": [
+            {"vertice": str(i), "lado": f"{i}-{i + 1}", "mide": f"{100 + i * 0.5:.2f}"}
+            for i in range(min(n, 500))
+        ],
+        "coordenadas": [
+            {
+                "punto": f"VERT.{i}",
+                "latitud": "-27°26'21.33563\"",
+                "longitud": "-63°15'07.30983\"",
+                "norte_gk": f"{6965637.114 + i:.3f}",
+                "este_gk": f"{4475082.623 + i:.3f}",
+            }
+            for i in range(n)
+        ],
+        "fecha_operaciones": "10 de marzo de 2025",
+    }
+    return SimpleNamespace(id=f"bench_{n}", datos_procesados=datos)
+
+
+def _medir(funcion):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        funcion()
+    finally:
+        duracion = time.perf_counter() - inicio
+        _actual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return duracion, pico / (1024 * 1024)
+
+
+class Command(BaseCommand):
+    help = "Benchmark de la memoria en PDF: render directo vs. DOCX + LibreOffice"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--coordenadas", type=int, nargs="+", default=[1000, 10000])
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            for n in options["coordenadas"]:
+                plano = _plano_sintetico(n)
+                pdf_path = os.path.join(tmp, f"directo_{n}.pdf")
+                docx_path = os.path.join(tmp, f"memoria_{n}.docx")
+
+                def _directo():
+                    # Simula el envío por streaming: los bloques se descartan al escribirse
+                    with open(pdf_path, "wb") as f:
+                        PdfMemoriaRenderer(plano).render_to(f)
+
+                def _docx():
+                    DocxGenerator(plano).build_document().save(docx_path)
+
+                t_pdf, m_pdf = _medir(_directo)
+                t_docx, m_docx = _medir(_docx)
+                linea = (
+                    f"{n:>7} coordenadas | directo: {t_pdf:7.3f}s {m_pdf:7.1f} MiB"
+                    f" | docx: {t_docx:7.3f}s {m_docx:7.1f} MiB"
+                )
+                try:
+                    inicio = time.perf_counter()
+                    get_converter().convert(docx_path, os.path.join(tmp, f"convertido_{n}.pdf"))
+                    t_conv = time.perf_counter() - inicio
+                    linea += f" | docx+conversión: {t_docx + t_conv:7.3f}s"
+                except ConversionError as e:
+                    linea += f" | conversión no disponible ({e})"
+                self.stdout.write(linea)
@@ -0,0 +1,339 @@
+"""
+Benchmark de punta a punta del circuito carga → memoria.
+
+Recorre un corpus (los PDF de ``media/uploads/planos`` más memorias
+sintéticas renderizadas con ``PdfMemoriaRenderer``) con cada escenario y
+concurrencia pedidos:
+
+- ``servicio``: ``services.procesar_pdf`` directo, sin caché de extracción.
+- ``carga``: POST a ``/panel/upload/`` con el cliente de pruebas de Django.
+- ``api``: POST a ``/api/planos/``.
+
+La carga y la API solo encolan el plano; el benchmark ejecuta el trabajo en
+el mismo hilo, así la latencia sigue siendo la de punta a punta.
+
+Informa latencia p50/p95/p99, planos por minuto y el pico de memoria (RSS)
+de cada etapa, tomado de ``Plano.metricas``, y guarda todo en JSON para
+comparar entre commits. Corre contra una base de prueba temporal y un
+``MEDIA_ROOT`` temporal; los datos reales no se tocan.
+
+Uso:
+    python manage.py benchmark_procesamiento --concurrencia 1 4 --salida bench.json
+    python manage.py benchmark_procesamiento --comparar bench.json --tolerancia 0.2
+"""
+
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from planos import cache_niveles, cola, metricas
+from planos.management.commands.benchmark_pdf import _plano_sintetico
+from planos.models import Plano, TrabajoProcesamiento
+from planos.services import procesar_pdf
+from planos.utils.pdf_renderer import PdfMemoriaRenderer
+
+ESCENARIOS = ("servicio", "carga", "api")
+
+PREFIJO_TITULO = "Benchmark "
+
+# Versión del formato del informe JSON
+VERSION_INFORME = 1
+
+
+def percentil(valores, p):
+    """Percentil ``p`` (0-100) con interpolación lineal; ``None`` sin valores"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicion = (len(ordenados) - 1) * p / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+
+# -------------------------
+# Corpus
+# -------------------------
+def corpus(directorio, sinteticos, coordenadas):
+    """
+    Lista de ``(nombre, bytes)``: los PDF de ``directorio`` (con sus
+    subdirectorios: las cargas se guardan en ``ab/cd/<sha>.pdf``) y los sintéticos
+    """
+    documentos = []
+    for ruta in sorted(glob.glob(os.path.join(directorio, "**", "*.pdf"), recursive=True)):
+        with open(ruta, "rb") as f:
+            documentos.append((os.path.basename(ruta), f.read()))
+    for i in range(sinteticos):
+        # Tamaños crecientes: de pocas coordenadas a ``coordenadas``
+        n = max(1, coordenadas * (i + 1) // sinteticos)
+        buffer = io.BytesIO()
+        PdfMemoriaRenderer(_plano_sintetico(n)).render_to(buffer)
+        documentos.append((f"sintetico_{n}.pdf", buffer.getvalue()))
+    return documentos
+
+
+# -------------------------
+# Escenarios
+# -------------------------
+def _servicio(cliente, titulo, nombre, contenido):
+    plano = Plano.objects.create(
+        titulo=titulo,
+        archivo_pdf=SimpleUploadedFile(nombre, contenido, content_type="application/pdf"),
+    )
+    procesar_pdf(plano, usar_cache=False)
+    return plano.id
+
+
+def _procesar_encolado(plano_id):
+    """Hace de worker para el trabajo del plano recién encolado"""
+    trabajo = TrabajoProcesamiento.objects.select_related("plano").get(plano_id=plano_id)
+    trabajo = cola.ejecutar_trabajo(trabajo)
+    if trabajo.estado != TrabajoProcesamiento.COMPLETADO:
+        raise RuntimeError(f"El trabajo terminó en {trabajo.estado}: {trabajo.error}")
+    return plano_id
+
+
+def _carga(cliente, titulo, nombre, contenido):
+    archivo = SimpleUploadedFile(nombre, contenido, content_type="application/pdf")
+    response = cliente.post(reverse("upload_plano"), {"titulo": titulo, "archivo_pdf": archivo})
+    if response.status_code != 302:
+        raise RuntimeError(f"La carga respondió {response.status_code}")
+    return _procesar_encolado(int(response["Location"].rstrip("/").rsplit("/", 1)[-1]))
+
+
+def _api(cliente, titulo, nombre, contenido):
+    archivo = SimpleUploadedFile(nombre, contenido, content_type="application/pdf")
+    response = cliente.post(reverse("plano-list"), {"titulo": titulo, "archivo_pdf": archivo})
+    if response.status_code != 201:
+        raise RuntimeError(f"La API respondió {response.status_code}: {response.content[:200]!r}")
+    # La respuesta no trae el id; el título es único en la corrida
+    return _procesar_encolado(Plano.objects.get(titulo=titulo).id)
+
+
+_EJECUTORES = {"servicio": _servicio, "carga": _carga, "api": _api}
+
+
+def _resumen(escenario, concurrencia, medidas, errores, duracion):
+    latencias = [m["latencia"] for m in medidas]
+    memoria = {}
+    etapas = {}
+    for m in medidas:
+        metricas = m["metricas"] or {}
+        for clave in ("memoria", "memoria_extraccion"):
+            for etapa, pico in ((metricas.get(clave) or {}).get("etapas_mb") or {}).items():
+                if pico is not None:
+                    memoria[etapa] = max(memoria.get(etapa, 0), pico)
+        for etapa, segundos in (metricas.get("etapas") or {}).items():
+            etapas.setdefault(etapa, []).append(segundos)
+    return {
+        "escenario": escenario,
+        "concurrencia": concurrencia,
+        "planos": len(medidas),
+        "errores": errores,
+        "duracion_s": round(duracion, 3),
+        "planos_por_minuto": round(len(medidas) * 60 / duracion, 2) if duracion else None,
+        "latencia_s": {
+            nombre: None if valor is None else round(valor, 4)
+            for nombre, valor in (
+                ("p50", percentil(latencias, 50)),
+                ("p95", percentil(latencias, 95)),
+                ("p99", percentil(latencias, 99)),
+                ("max", max(latencias, default=None)),
+            )
+        },
+        "etapas_p50_s": {etapa: round(percentil(v, 50), 4) for etapa, v in sorted(etapas.items())},
+        "memoria_pico_mb": dict(sorted(memoria.items())),
+    }
+
+
+def comparar(actual, anterior, tolerancia):
+    """
+    Regresiones de ``actual`` respecto de ``anterior`` (informes JSON): p95
+    más de ``tolerancia`` más lento o rendimiento más de ``tolerancia`` menor,
+    por escenario y concurrencia.
+    """
+    previos = {(r["escenario"], r["concurrencia"]): r for r in anterior["resultados"]}
+    regresiones = []
+    for r in actual["resultados"]:
+        previo = previos.get((r["escenario"], r["concurrencia"]))
+        if previo is None:
+            continue
+        clave = f"{r['escenario']} x{r['concurrencia']}"
+        p95, p95_previo = r["latencia_s"]["p95"], previo["latencia_s"]["p95"]
+        if p95 and p95_previo and p95 > p95_previo * (1 + tolerancia):
+            regresiones.append(f"{clave}: p95 {p95_previo:.3f}s → {p95:.3f}s")
+        ritmo, ritmo_previo = r["planos_por_minuto"], previo["planos_por_minuto"]
+        if ritmo and ritmo_previo and ritmo < ritmo_previo * (1 - tolerancia):
+            regresiones.append(f"{clave}: {ritmo_previo:.1f} → {ritmo:.1f} planos/min")
+    return regresiones
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark de punta a punta: procesar_pdf y las vistas de carga/API con concurrencia"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--escenarios", nargs="+", choices=ESCENARIOS, default=list(ESCENARIOS))
+        parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 4])
+        parser.add_argument(
+            "--corpus",
+            default=os.path.join(settings.MEDIA_ROOT, "uploads", "planos"),
+            help="Directorio con PDF reales (vacío para usar solo sintéticos)",
+        )
+        parser.add_argument("--sinteticos", type=int, default=5, help="Memorias sintéticas a agregar al corpus")
+        parser.add_argument("--coordenadas", type=int, default=500, help="Coordenadas del sintético más grande")
+        parser.add_argument("--repeticiones", type=int, default=1, help="Pasadas del corpus por corrida")
+        parser.add_argument("--salida", help="Archivo JSON para el informe")
+        parser.add_argument("--comparar", help="Informe JSON anterior; falla si hay regresiones")
+        parser.add_argument("--tolerancia", type=float, default=0.2, help="Margen antes de marcar regresión")
+        parser.add_argument(
+            "--base-actual",
+            action="store_true",
+            help="Usa la base configurada en vez de una temporal (los planos creados se borran al final)",
+        )
+
+    def handle(self, *args, **options):
+        documentos = corpus(options["corpus"] or "", options["sinteticos"], options["coordenadas"])
+        if not documentos:
+            raise CommandError("El corpus está vacío")
+        self.stdout.write(
+            f"Corpus: {len(documentos)} PDF, {sum(len(c) for _n, c in documentos) / 1024 ** 2:.1f} MiB"
+        )
+
+        media = tempfile.mkdtemp(prefix="benchmark_media_")
+        base_temporal = not options["base_actual"]
+        nombre_original = connection.settings_dict["NAME"]
+        ajustes = override_settings(
+            MEDIA_ROOT=media, RATE_LIMIT_ENABLED=False, METRICAS_DIR="", COLA_EJECUCION_LOCAL=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        )
+        if base_temporal:
+            if connection.vendor == "sqlite":
+                # En memoria, los hilos no pueden escribir a la vez
+                connection.settings_dict["TEST"]["NAME"] = os.path.join(media, "benchmark.sqlite3")
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        ajustes.enable()
+        try:
+            usuario = User.objects.create_superuser(
+                f"benchmark-{os.getpid()}", f"benchmark-{os.getpid()}@example.com", None
+            )
+            informe = {
+                "version": VERSION_INFORME,
+                "fecha": timezone.now().isoformat(),
+                "commit": _commit(),
+                "python": platform.python_version(),
+                "corpus": {"pdf": len(documentos), "bytes": sum(len(c) for _n, c in documentos)},
+                "ajustes": {
+                    nombre: getattr(settings, nombre, None)
+                    for nombre in ("EXTRACCION_AISLADA", "EXTRACCION_TIMEOUT", "MEMORIA_MAX_TRABAJO_MB", "OCR_DPI")
+                },
+                "resultados": [],
+            }
+            for escenario in options["escenarios"]:
+                for concurrencia in options["concurrencia"]:
+                    resultado = self._correr(
+                        escenario, max(1, concurrencia), documentos * max(1, options["repeticiones"]), usuario
+                    )
+                    informe["resultados"].append(resultado)
+                    self._mostrar(resultado)
+            if not base_temporal:
+                Plano.objects.filter(titulo__startswith=PREFIJO_TITULO).delete()
+                usuario.delete()
+        finally:
+            # Lo medido acá no va al /metrics de producción, ni al salir (atexit)
+            metricas.registro.limpiar()
+            ajustes.disable()
+            if base_temporal:
+                connections.close_all()
+                connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            shutil.rmtree(media, ignore_errors=True)
+
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as f:
+                json.dump(informe, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Informe guardado en {options['salida']}")
+        if options["comparar"]:
+            with open(options["comparar"], encoding="utf-8") as f:
+                anterior = json.load(f)
+            regresiones = comparar(informe, anterior, options["tolerancia"])
+            if regresiones:
+                raise CommandError("Regresiones respecto de {}:\n{}".format(options["comparar"], "\n".join(regresiones)))
+            self.stdout.write(self.style.SUCCESS(f"Sin regresiones respecto de {options['comparar']}"))
+
+    def _correr(self, escenario, concurrencia, documentos, usuario):
+        # Cada corrida empieza con la caché de extracción fría
+        cache_niveles.espacio("extraccion").invalidar()
+        ejecutar = _EJECUTORES[escenario]
+        local = threading.local()
+        medidas = []
+        errores = []
+
+        def tarea(indice_documento):
+            indice, (nombre, contenido) = indice_documento
+            titulo = f"{PREFIJO_TITULO}{escenario}-{concurrencia}-{indice} {nombre}"
+            if not hasattr(local, "cliente"):
+                local.cliente = Client()
+                local.cliente.force_login(usuario)
+            inicio = time.perf_counter()
+            try:
+                plano_id = ejecutar(local.cliente, titulo, nombre, contenido)
+                latencia = time.perf_counter() - inicio
+                metricas = Plano.objects.filter(id=plano_id).values_list("metricas", flat=True).first()
+                return {"nombre": nombre, "latencia": latencia, "metricas": metricas}, None
+            except Exception as e:
+                return None, f"{nombre}: {e}"
+            finally:
+                if concurrencia > 1:
+                    connections.close_all()
+
+        inicio = time.perf_counter()
+        if concurrencia == 1:
+            salidas = [tarea(documento) for documento in enumerate(documentos)]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix="benchmark") as ejecutor:
+                salidas = list(ejecutor.map(tarea, enumerate(documentos)))
+        duracion = time.perf_counter() - inicio
+
+        for medida, error in salidas:
+            if error:
+                errores.append(error)
+            else:
+                medidas.append(medida)
+        for error in errores[:5]:
+            self.stderr.write(f"  {escenario}: {error}")
+        return _resumen(escenario, concurrencia, medidas, len(errores), duracion)
+
+    def _mostrar(self, r):
+        latencia = r["latencia_s"]
+        memoria = ", ".join(f"{etapa} {mb:.0f}" for etapa, mb in r["memoria_pico_mb"].items())
+        self.stdout.write(
+            f"{r['escenario']:>8} x{r['concurrencia']:<3}| {r['planos']:>4} planos ({r['errores']} errores)"
+            f" | p50 {latencia['p50'] or 0:.3f}s p95 {latencia['p95'] or 0:.3f}s p99 {latencia['p99'] or 0:.3f}s"
+            f" | {r['planos_por_minuto'] or 0:.1f} planos/min | pico MiB: {memoria or '-'}"
+        )
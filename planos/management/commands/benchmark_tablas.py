@@ -0,0 +1,73 @@
+"""
+Compara la generación de tablas Word fila por fila (python-docx) contra
+la escritura en bloque de ``add_table_fast``.
+
+Uso:
+    python manage.py benchmark_tablas --filas 1000 10000
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from docx import Document
+
+from planos.utils.docx_tables import add_table_fast
+
+ENCABEZADOS = ["Vértice", "Rumbo", "Lado", "Medida (m)", "Ángulo", "Linderos"]
+
+
+def _filas(n):
+    for i in range(n):
+        yield (str(i), "N 45° E", f"{i}-{i + 1}", f"{100 + i * 0.5:.2f}", "90°", f"Lindero {i}")
+
+
+def _tabla_add_row(doc, filas):
+    """Implementación anterior: ``add_row().cells`` y ``cell.text``"""
+    table = doc.add_table(rows=1, cols=len(ENCABEZADOS))
+    table.style = "Table Grid"
+    hdr = table.rows[0].cells
+    for cell, texto in zip(hdr, ENCABEZADOS):
+        cell.text = texto
+        cell.paragraphs[0].runs[0].bold = True
+    for fila in filas:
+        row = table.add_row().cells
+        for cell, valor in zip(row, fila):
+            cell.text = valor
+    return table
+
+
+def _tabla_rapida(doc, filas):
+    return add_table_fast(doc, ENCABEZADOS, filas)
+
+
+class Command(BaseCommand):
+    help = "Benchmark de escritura de tablas DOCX (add_row vs. XML en bloque)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--filas", type=int, nargs="+", default=[1000, 10000])
+        parser.add_argument("--repeticiones", type=int, default=1)
+        parser.add_argument(
+            "--sin-add-row",
+            action="store_true",
+            help="Omite la implementación fila por fila (lenta con muchas filas)",
+        )
+
+    def _medir(self, funcion, n, repeticiones):
+        mejor = None
+        for _ in range(repeticiones):
+            doc = Document()
+            inicio = time.perf_counter()
+            funcion(doc, _filas(n))
+            duracion = time.perf_counter() - inicio
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return mejor
+
+    def handle(self, *args, **options):
+        repeticiones = max(1, options["repeticiones"])
+        for n in options["filas"]:
+            rapida = self._medir(_tabla_rapida, n, repeticiones)
+            linea = f"{n:>7} filas | bloque: {rapida:8.3f}s"
+            if not options["sin_add_row"]:
+                lenta = self._medir(_tabla_add_row, n, repeticiones)
+                linea += f" | add_row: {lenta:8.3f}s | x{lenta / rapida:.1f}"
+            self.stdout.write(linea)
@@ -0,0 +1,45 @@
+"""
+Exporta a un ZIP las memorias, datos y PDF originales de los planos
+seleccionados, sin cargar el archivo completo en memoria.
+
+Uso:
+    python manage.py exportar_memorias --desde 2025-01-01 --hasta 2025-03-31 \
+        --formatos docx,pdf --salida export.zip
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from planos.exportacion import filtrar_planos, iter_zip, nombre_zip, parse_formatos
+
+
+class Command(BaseCommand):
+    help = "Exporta memorias y PDF originales de planos a un ZIP"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Fecha de carga inicial (AAAA-MM-DD)")
+        parser.add_argument("--hasta", help="Fecha de carga final inclusive (AAAA-MM-DD)")
+        parser.add_argument("--estado")
+        parser.add_argument("--departamento")
+        parser.add_argument("--usuario", help="Username que cargó los planos")
+        parser.add_argument("--ids", help="IDs separados por coma")
+        parser.add_argument("--formatos", help="docx,pdf,json,original (por defecto todos)")
+        parser.add_argument("--workers", type=int, default=getattr(settings, "EXPORTACION_WORKERS", 4))
+        parser.add_argument("--salida", help="Archivo ZIP de destino")
+
+    def handle(self, *args, **options):
+        planos = filtrar_planos(options).select_related("resultado")
+        total = planos.count()
+        salida = options["salida"] or nombre_zip()
+        escritos = 0
+        with open(salida, "wb") as f:
+            for bloque in iter_zip(
+                planos.iterator(chunk_size=200),
+                parse_formatos(options["formatos"]),
+                workers=options["workers"],
+            ):
+                f.write(bloque)
+                escritos += len(bloque)
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} planos exportados a {salida} ({escritos / (1024 * 1024):.1f} MiB)"
+        ))
@@ -0,0 +1,100 @@
+"""
+Elimina artefactos huérfanos de media/outputs.
+
+- Memorias Word que ya no referencia ningún ``Plano.memoria_path``
+  (incluye las antiguas ``Memoria_<id>_<timestamp>.docx``) y sus PDF
+  convertidos.
+- PDF de exportación renderizados para datos que ya no están vigentes.
+- Memorias IA de planos eliminados, y las de planos existentes que no
+  corresponden a sus datos actuales.
+
+Uso:
+    python manage.py gc_artefactos --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+
+from planos.exportacion import memorias_pdf_store
+from planos.models import Plano, PlanoResultado
+from planos.utils.artifact_store import ArtifactStore, memorias_store
+from planos.utils.ia_memoria import clave_docx_ia, clave_texto_ia, memoria_ia_store
+from planos.utils.pdf_converter import docx_for_cached_pdf
+from planos.utils.pdf_renderer import PdfMemoriaRenderer
+
+
+def _referencias_memorias():
+    return set(
+        Plano.objects.exclude(memoria_path__isnull=True)
+        .exclude(memoria_path="")
+        .values_list("memoria_path", flat=True)
+    )
+
+
+def _referencias_pdf():
+    """PDF renderizados directamente que corresponden a los datos actuales"""
+    referencias = set()
+    qs = PlanoResultado.objects.exclude(datos_comprimidos__isnull=True).order_by("plano_id")
+    for resultado in qs.iterator(chunk_size=200):
+        clave = ArtifactStore.compute_key(
+            resultado.datos, PdfMemoriaRenderer.VERSION, tipo="memoria_pdf"
+        )
+        referencias.add(memorias_pdf_store.relative_path(clave, ".pdf"))
+    return referencias
+
+
+def _referencias_ia():
+    """Rutas IA vigentes: texto y DOCX correspondientes a los datos actuales"""
+    referencias = set()
+    qs = PlanoResultado.objects.exclude(datos_comprimidos__isnull=True).order_by("plano_id")
+    for resultado in qs.iterator(chunk_size=200):
+        store = memoria_ia_store(resultado.plano_id)
+        clave_texto = clave_texto_ia(resultado.datos)
+        referencias.add(store.relative_path(clave_texto, ".txt"))
+        texto = store.read_text(clave_texto)
+        if texto is not None:
+            referencias.add(store.relative_path(clave_docx_ia(clave_texto, texto), ".docx"))
+    return referencias
+
+
+class Command(BaseCommand):
+    help = "Elimina memorias y artefactos IA que ya no están referenciados"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Solo lista lo que se eliminaría")
+        parser.add_argument(
+            "--edad-minima",
+            type=int,
+            default=3600,
+            help="Segundos de antigüedad mínima para eliminar (evita borrar artefactos en generación)",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        edad_minima = options["edad_minima"]
+
+        referencias = _referencias_memorias()
+
+        def _memoria_referenciada(ruta):
+            # Los PDF cacheados viven mientras exista su DOCX referenciado
+            if ruta.endswith(".pdf"):
+                ruta = docx_for_cached_pdf(ruta)
+            return ruta in referencias
+
+        eliminados = memorias_store.collect_garbage(
+            _memoria_referenciada, edad_minima=edad_minima, dry_run=dry_run
+        )
+
+        referencias_pdf = _referencias_pdf()
+        eliminados += memorias_pdf_store.collect_garbage(
+            lambda ruta: ruta in referencias_pdf, edad_minima=edad_minima, dry_run=dry_run
+        )
+
+        referencias_ia = _referencias_ia()
+        eliminados += ArtifactStore("outputs/memorias_ia").collect_garbage(
+            lambda ruta: ruta in referencias_ia, edad_minima=edad_minima, dry_run=dry_run
+        )
+
+        for ruta in eliminados:
+            self.stdout.write(f"{'[dry-run] ' if dry_run else ''}{ruta}")
+        verbo = "se eliminarían" if dry_run else "eliminados"
+        self.stdout.write(self.style.SUCCESS(f"{len(eliminados)} artefactos {verbo}"))
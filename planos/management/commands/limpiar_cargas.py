@@ -0,0 +1,22 @@
+"""
+Descarta las subidas reanudables abandonadas y sus archivos parciales.
+
+Uso:
+    python manage.py limpiar_cargas               # inactivas hace más de CARGA_REANUDABLE_VENCIMIENTO
+    python manage.py limpiar_cargas --segundos 3600
+"""
+
+from django.core.management.base import BaseCommand
+
+from planos.carga_reanudable import eliminar_vencidas
+
+
+class Command(BaseCommand):
+    help = "Elimina las cargas por partes incompletas e inactivas"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--segundos", type=int, default=None, help="Antigüedad mínima de inactividad")
+
+    def handle(self, *args, **options):
+        total = eliminar_vencidas(options["segundos"])
+        self.stdout.write(self.style.SUCCESS(f"{total} cargas incompletas eliminadas"))
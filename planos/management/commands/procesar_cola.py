@@ -0,0 +1,76 @@
+"""
+Worker de la cola de procesamiento de planos.
+
+Uso:
+    python manage.py procesar_cola               # corre hasta recibir SIGTERM
+    python manage.py procesar_cola --una-vez     # vacía la cola y termina
+    python manage.py procesar_cola --perfilar    # cada trabajo con cProfile (logs/perfiles)
+
+Tras un trabajo que deja el RSS por encima de ``COLA_RECICLAR_RSS_MB`` el
+worker termina para devolver la memoria; el supervisor lo vuelve a levantar.
+"""
+
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from planos import cola, recursos
+
+
+class Command(BaseCommand):
+    help = "Procesa los planos encolados (carga masiva y reprocesos)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true", help="Vacía la cola y termina")
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=getattr(settings, "COLA_INTERVALO", 2.0),
+            help="Segundos de espera cuando la cola está vacía",
+        )
+        parser.add_argument("--max-trabajos", type=int, default=None, help="Termina tras N trabajos")
+        parser.add_argument("--perfilar", action="store_true", help="Perfila cada trabajo (ver planos.perfilado)")
+
+    def handle(self, *args, **options):
+        self._detener = False
+        signal.signal(signal.SIGTERM, self._al_recibir_senal)
+        signal.signal(signal.SIGINT, self._al_recibir_senal)
+
+        worker = cola.nombre_worker()
+        restantes = options["max_trabajos"]
+        total = 0
+        self.stdout.write(f"Worker {worker} iniciado")
+
+        while not self._detener:
+            close_old_connections()
+            recuperados = cola.recuperar_vencidos()
+            if recuperados:
+                self.stdout.write(self.style.WARNING(f"{recuperados} trabajos vencidos vuelven a la cola"))
+
+            trabajo = cola.tomar_trabajo(worker)
+            if trabajo is None:
+                if options["una_vez"]:
+                    break
+                time.sleep(options["intervalo"])
+                continue
+
+            cola.ejecutar_trabajo(trabajo, perfilar=options["perfilar"])
+            total += 1
+            self.stdout.write(f"Trabajo {trabajo.id} (plano {trabajo.plano_id}): {trabajo.estado}")
+            if recursos.debe_reciclar():
+                rss = recursos.rss_actual() / recursos.MB
+                self.stdout.write(self.style.WARNING(f"RSS de {rss:.0f} MB: el worker termina para reciclarse"))
+                break
+            if restantes is not None:
+                restantes -= 1
+                if restantes <= 0:
+                    break
+
+        self.stdout.write(self.style.SUCCESS(f"{total} trabajos procesados"))
+
+    def _al_recibir_senal(self, signum, frame):
+        # Se termina el trabajo en curso antes de salir
+        self._detener = True
@@ -0,0 +1,39 @@
+"""
+Reconstruye el índice de búsqueda de texto completo.
+
+Uso:
+    python manage.py reindexar_busqueda
+    python manage.py reindexar_busqueda --ids 10,11
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from planos import busqueda
+from planos.models import Plano
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de texto completo de los planos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ids", help="IDs separados por coma (por defecto todos)")
+
+    def handle(self, *args, **options):
+        # También los planos sin procesar, que se buscan por título
+        qs = Plano.objects.select_related("resultado").only(
+            "id", "titulo", "resultado"
+        ).order_by("id")
+        if options["ids"]:
+            qs = qs.filter(id__in=[int(i) for i in options["ids"].split(",") if i.strip().isdigit()])
+        else:
+            # Reconstrucción completa: se descartan también las entradas huérfanas
+            busqueda.eliminar_indice(connection)
+            busqueda.crear_indice(connection)
+
+        total = 0
+        with transaction.atomic():
+            for plano in qs.iterator(chunk_size=200):
+                busqueda.indexar_plano(plano)
+                total += 1
+        self.stdout.write(self.style.SUCCESS(f"{total} planos indexados"))
@@ -0,0 +1,314 @@
+"""
+Métricas del procesamiento en formato de texto de Prometheus.
+
+Cada etapa (descarga del PDF, pdfplumber, OCR, parseo, DOCX, Gemini) se
+mide con ``cronometro(etapa)``: la duración va al histograma
+``agrimensores_etapa_segundos`` y, dentro de ``medir_plano()``, a la
+medición del plano, que ``procesar_pdf`` guarda en ``Plano.metricas``.
+``anotar()`` cuenta páginas, páginas con OCR y bytes del mismo modo.
+
+Los valores viven en memoria de cada proceso. Los workers web y los de la
+cola son procesos distintos: cada uno publica su copia, a lo sumo cada
+``METRICAS_INTERVALO`` segundos, en ``METRICAS_DIR/<proceso>.json``, y
+``/metrics`` suma todas (como el modo multiproceso de prometheus_client).
+Conviene vaciar el directorio al desplegar. Con ``METRICAS_DIR`` vacío solo
+se exponen los valores del proceso que responde.
+"""
+
+import atexit
+import contextvars
+import glob
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import recursos
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BUCKETS_PAGINAS = (1, 2, 5, 10, 20, 50, 100)
+BUCKETS_BYTES = tuple(mb * 1024 * 1024 for mb in (16, 64, 128, 256, 512, 1024, 2048, 4096))
+
+
+def directorio():
+    """Directorio compartido de publicación, ``None`` si está deshabilitado"""
+    valor = getattr(settings, "METRICAS_DIR", None)
+    if valor is None:
+        return os.path.join(tempfile.gettempdir(), "agrimensores_metricas")
+    return valor or None
+
+
+# -------------------------
+# Registro del proceso
+# -------------------------
+class Registro:
+    """Valores de todas las métricas en este proceso"""
+
+    def __init__(self):
+        self.metricas = {}
+        self._lock = threading.Lock()
+        self._reiniciar()
+        atexit.register(self.publicar)
+
+    def _reiniciar(self):
+        # Clave: (nombre, etiquetas ordenadas); valor: número o [conteos por bucket, suma]
+        self._valores = {}
+        self._pid = os.getpid()
+        self._id = f"{self._pid}-{time.time_ns()}"
+        self._publicado = time.monotonic()
+
+    def _asegurar_proceso(self):
+        # Tras un fork el hijo no hereda los valores del padre (ya publicados por él)
+        if self._pid != os.getpid():
+            self._reiniciar()
+
+    def registrar(self, metrica):
+        self.metricas[metrica.nombre] = metrica
+        return metrica
+
+    def sumar(self, nombre, etiquetas, valor):
+        with self._lock:
+            self._asegurar_proceso()
+            self._valores[(nombre, etiquetas)] = self._valores.get((nombre, etiquetas), 0) + valor
+        self._tal_vez_publicar()
+
+    def observar(self, nombre, etiquetas, indice, cantidad_buckets, valor):
+        with self._lock:
+            self._asegurar_proceso()
+            actual = self._valores.get((nombre, etiquetas))
+            if actual is None:
+                actual = self._valores[(nombre, etiquetas)] = [[0] * (cantidad_buckets + 1), 0.0]
+            actual[0][indice] += 1
+            actual[1] += valor
+        self._tal_vez_publicar()
+
+    def instantanea(self):
+        with self._lock:
+            self._asegurar_proceso()
+            return [
+                [nombre, dict(etiquetas), [list(v[0]), v[1]] if isinstance(v, list) else v]
+                for (nombre, etiquetas), v in self._valores.items()
+            ]
+
+    # -------------------------
+    # Publicación entre procesos
+    # -------------------------
+    def _tal_vez_publicar(self):
+        if time.monotonic() - self._publicado >= getattr(settings, "METRICAS_INTERVALO", 1.0):
+            self.publicar()
+
+    def _archivo(self, carpeta):
+        return os.path.join(carpeta, f"{self._id}.json")
+
+    def publicar(self):
+        """Escribe los valores del proceso para que ``/metrics`` los sume"""
+        carpeta = directorio()
+        valores = self.instantanea()
+        self._publicado = time.monotonic()
+        if carpeta is None or not valores:
+            return
+        try:
+            os.makedirs(carpeta, exist_ok=True)
+            temporal = f"{self._archivo(carpeta)}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(valores, f)
+            os.replace(temporal, self._archivo(carpeta))
+        except OSError as e:
+            # Las métricas no pueden frenar el procesamiento
+            logger.warning(f"No se pudieron publicar las métricas: {e}")
+
+    def combinadas(self):
+        """Valores de todos los procesos publicados más los de este"""
+        total = {}
+        fuentes = [self.instantanea()]
+        carpeta = directorio()
+        if carpeta is not None:
+            propio = self._archivo(carpeta)
+            for ruta in glob.glob(os.path.join(carpeta, "*.json")):
+                if ruta == propio:
+                    continue
+                try:
+                    with open(ruta, encoding="utf-8") as f:
+                        fuentes.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        for valores in fuentes:
+            for nombre, etiquetas, valor in valores:
+                clave = (nombre, tuple(sorted(etiquetas.items())))
+                if isinstance(valor, list):
+                    actual = total.setdefault(clave, [[0] * len(valor[0]), 0.0])
+                    actual[0] = [a + b for a, b in zip(actual[0], valor[0])]
+                    actual[1] += valor[1]
+                else:
+                    total[clave] = total.get(clave, 0) + valor
+        return total
+
+    def limpiar(self):
+        with self._lock:
+            self._reiniciar()
+
+
+registro = Registro()
+
+
+# -------------------------
+# Tipos de métrica
+# -------------------------
+def _etiquetas(metrica, valores):
+    if set(valores) != set(metrica.etiquetas):
+        raise ValueError(f"{metrica.nombre} usa las etiquetas {metrica.etiquetas}, no {tuple(valores)}")
+    return tuple(sorted((k, str(v)) for k, v in valores.items()))
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        registro.registrar(self)
+
+    def inc(self, valor=1, **etiquetas):
+        registro.sumar(self.nombre, _etiquetas(self, etiquetas), valor)
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        registro.registrar(self)
+
+    def observar(self, valor, **etiquetas):
+        indice = next((i for i, limite in enumerate(self.buckets) if valor <= limite), len(self.buckets))
+        registro.observar(self.nombre, _etiquetas(self, etiquetas), indice, len(self.buckets), valor)
+
+
+ETAPA_SEGUNDOS = Histograma(
+    "agrimensores_etapa_segundos", "Duración de cada etapa del procesamiento de un plano", ("etapa",)
+)
+PLANOS_PROCESADOS = Contador("agrimensores_planos_procesados_total", "Planos procesados", ("resultado",))
+PLANO_PAGINAS = Histograma("agrimensores_plano_paginas", "Páginas por plano procesado", buckets=BUCKETS_PAGINAS)
+PAGINAS = Contador("agrimensores_paginas_total", "Páginas leídas de los PDF")
+PAGINAS_OCR = Contador("agrimensores_paginas_ocr_total", "Páginas que necesitaron OCR")
+PLANO_MEMORIA = Histograma(
+    "agrimensores_plano_memoria_bytes", "Crecimiento del RSS al procesar un plano", buckets=BUCKETS_BYTES
+)
+BYTES_PDF = Contador("agrimensores_pdf_bytes_total", "Bytes de PDF procesados")
+LLM_LLAMADAS = Contador("agrimensores_llm_llamadas_total", "Llamadas al modelo de lenguaje", ("modelo", "resultado"))
+
+_CONTADORES_PLANO = {"paginas": PAGINAS, "paginas_ocr": PAGINAS_OCR, "bytes": BYTES_PDF}
+
+
+# -------------------------
+# Medición por plano
+# -------------------------
+_medicion = contextvars.ContextVar("medicion_plano", default=None)
+
+
+@contextmanager
+def medir_plano():
+    """Junta etapas y conteos del plano que se procesa en este contexto"""
+    medicion = {"etapas": {}, "paginas": 0, "paginas_ocr": 0, "bytes": 0}
+    token = _medicion.set(medicion)
+    try:
+        yield medicion
+    finally:
+        _medicion.reset(token)
+
+
+@contextmanager
+def cronometro(etapa):
+    """
+    Mide la etapa aunque falle: el tiempo perdido también cuenta. Dentro de
+    ``recursos.medir()`` también queda el pico de memoria de la etapa.
+    """
+    inicio = time.perf_counter()
+    try:
+        with recursos.etapa(etapa):
+            yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        ETAPA_SEGUNDOS.observar(duracion, etapa=etapa)
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion["etapas"][etapa] = round(medicion["etapas"].get(etapa, 0) + duracion, 4)
+
+
+def anotar(clave, cantidad):
+    """Suma ``cantidad`` a ``paginas``, ``paginas_ocr`` o ``bytes``"""
+    _CONTADORES_PLANO[clave].inc(cantidad)
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion[clave] += cantidad
+
+
+def incorporar(otra):
+    """
+    Suma la medición hecha en otro proceso (la extracción aislada) a las
+    métricas de este y a la medición en curso.
+    """
+    medicion = _medicion.get()
+    for etapa, duracion in otra["etapas"].items():
+        ETAPA_SEGUNDOS.observar(duracion, etapa=etapa)
+        if medicion is not None:
+            medicion["etapas"][etapa] = round(medicion["etapas"].get(etapa, 0) + duracion, 4)
+    for clave in _CONTADORES_PLANO:
+        if otra[clave]:
+            anotar(clave, otra[clave])
+    if medicion is not None and otra.get("memoria"):
+        medicion["memoria_extraccion"] = otra["memoria"]
+
+
+# -------------------------
+# Exposición
+# -------------------------
+def _formato_numero(valor):
+    if isinstance(valor, float) and math.isinf(valor):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _formato_etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    partes = []
+    for clave, valor in etiquetas:
+        valor = valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def exponer():
+    """Texto para ``/metrics`` (formato de exposición 0.0.4)"""
+    valores = registro.combinadas()
+    lineas = []
+    for metrica in registro.metricas.values():
+        lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+        lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+        series = sorted((etiquetas, v) for (nombre, etiquetas), v in valores.items() if nombre == metrica.nombre)
+        for etiquetas, valor in series:
+            if metrica.tipo == "counter":
+                lineas.append(f"{metrica.nombre}{_formato_etiquetas(etiquetas)} {_formato_numero(valor)}")
+                continue
+            conteos, suma = valor
+            acumulado = 0
+            for limite, conteo in zip(metrica.buckets + (math.inf,), conteos):
+                acumulado += conteo
+                le = etiquetas + (("le", _formato_numero(float(limite))),)
+                lineas.append(f"{metrica.nombre}_bucket{_formato_etiquetas(le)} {acumulado}")
+            lineas.append(f"{metrica.nombre}_sum{_formato_etiquetas(etiquetas)} {_formato_numero(suma)}")
+            lineas.append(f"{metrica.nombre}_count{_formato_etiquetas(etiquetas)} {acumulado}")
+    return "\n".join(lineas) + "\n"
@@ -2,13 +2,54 @@
 Middleware de seguridad personalizado
 """
 import logging
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import MiddlewareNotUsed
 from django.http import HttpResponseForbidden
-from django.core.cache import cache
 from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import bitacora, limitador, perfilado
 
 logger = logging.getLogger('django.security')
 
 
+class WhiteNoiseAsyncMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise con soporte async.
+
+    ``WhiteNoiseMiddleware`` es solo síncrono: bajo ASGI Django corre toda la
+    cadena que sigue en un único hilo y las vistas async se atienden de a una.
+    Esta variante busca el archivo estático (una consulta en memoria) sin
+    salir del event loop y solo abre el archivo en un hilo.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
+
+
 class SecurityMiddleware:
     """
     Middleware de seguridad personalizado para agrimensores_sde
@@ -18,8 +59,7 @@ class SecurityMiddleware:
         self.get_response = get_response
     
     def __call__(self, request):
-        # Logging de accesos
-        self.log_access(request)
+        inicio = time.monotonic()
         
         # Validar IP si está configurada lista blanca
         if hasattr(settings, 'ALLOWED_IPS'):
@@ -28,15 +68,19 @@ class SecurityMiddleware:
                 return HttpResponseForbidden("Acceso denegado: IP no autorizada")
         
         # Rate limiting básico
-        if not self.check_rate_limit(request):
+        permitida, espera = self.check_rate_limit(request)
+        if not permitida:
             logger.warning(f"Rate limit excedido para IP: {self.get_client_ip(request)}")
-            return HttpResponseForbidden("Demasiadas solicitudes. Intente más tarde.")
+            return limitador.respuesta_excedida("Demasiadas solicitudes. Intente más tarde.", espera)
         
         response = self.get_response(request)
         
         # Agregar headers de seguridad adicionales
         response = self.add_security_headers(response)
         
+        # Logging de accesos (muestreado, se escribe fuera del hilo de la solicitud)
+        self.log_access(request, response, time.monotonic() - inicio)
+        
         return response
     
     def get_client_ip(self, request):
@@ -59,30 +103,21 @@ class SecurityMiddleware:
         return client_ip in allowed_ips
     
     def check_rate_limit(self, request):
-        """Rate limiting simple basado en IP"""
-        if not hasattr(settings, 'RATE_LIMIT_ENABLED') or not settings.RATE_LIMIT_ENABLED:
-            return True
-        
-        client_ip = self.get_client_ip(request)
-        cache_key = f'rate_limit_{client_ip}'
+        """Rate limiting por IP; devuelve ``(permitida, segundos de espera)``"""
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', False):
+            return True, 0
         
         # Límite: 100 requests por minuto
         limit = getattr(settings, 'RATE_LIMIT_PER_MINUTE', 100)
-        
-        requests_count = cache.get(cache_key, 0)
-        
-        if requests_count >= limit:
-            return False
-        
-        cache.set(cache_key, requests_count + 1, 60)  # 60 segundos
-        return True
+        return limitador.permitir(f'ip:{self.get_client_ip(request)}', limit, 60)
     
-    def log_access(self, request):
+    def log_access(self, request, response, duracion):
         """Registrar accesos al sistema"""
-        logger.info(
-            f"Acceso: {request.method} {request.path} | "
-            f"IP: {self.get_client_ip(request)} | "
-            f"Usuario: {request.user if request.user.is_authenticated else 'Anónimo'}"
+        usuario = request.user.username if request.user.is_authenticated else 'Anónimo'
+        bitacora.acceso(
+            logger, "Acceso: %s %s", request.method, request.path,
+            metodo=request.method, ruta=request.path, ip=self.get_client_ip(request),
+            usuario=usuario, status=response.status_code, duracion_ms=round(duracion * 1000, 1),
         )
     
     def add_security_headers(self, response):
@@ -150,7 +185,7 @@ class FileUploadSecurityMiddleware:
                 return False
             
             # Validar tamaño
-            max_size = getattr(settings, 'FILE_UPLOAD_MAX_MEMORY_SIZE', 10485760)
+            max_size = getattr(settings, 'PLANO_MAX_BYTES', 10485760)
             if uploaded_file.size > max_size:
                 logger.warning(f"Archivo demasiado grande: {uploaded_file.size} bytes")
                 return False
@@ -182,11 +217,11 @@ class AuditMiddleware:
     
     def audit_action(self, request, response):
         """Registrar acciones importantes"""
-        logger.info(
-            f"AUDITORÍA: {request.method} {request.path} | "
-            f"Usuario: {request.user.username if request.user.is_authenticated else 'Anónimo'} | "
-            f"IP: {self.get_client_ip(request)} | "
-            f"Status: {response.status_code}"
+        usuario = request.user.username if request.user.is_authenticated else 'Anónimo'
+        bitacora.auditoria(
+            logger, "AUDITORÍA: %s %s", request.method, request.path,
+            metodo=request.method, ruta=request.path, ip=self.get_client_ip(request),
+            usuario=usuario, status=response.status_code,
         )
     
     def get_client_ip(self, request):
@@ -196,4 +231,62 @@ class AuditMiddleware:
             ip = x_forwarded_for.split(',')[0]
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return ip
+
+
+class PerfiladoMiddleware:
+    """
+    Perfila la solicitud con cProfile si un superusuario la marca con
+    ``?perfilar=1`` o ``X-Perfilar: 1`` (ver ``planos.perfilado``). Va
+    después de ``AuthenticationMiddleware``. Sin ``PERFILADO_HABILITADO`` no
+    se instala.
+
+    Bajo ASGI el perfil se toma en el hilo del event loop: incluye también
+    lo que otras solicitudes async ejecuten mientras tanto. Las respuestas en
+    streaming se perfilan hasta que la vista las devuelve.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFILADO_HABILITADO', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def pedido(request):
+        return request.headers.get('X-Perfilar') == '1' or request.GET.get('perfilar') == '1'
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not (self.pedido(request) and request.user.is_superuser):
+            return self.get_response(request)
+        with perfilado.perfilar(f"{request.method} {request.path}") as perfil:
+            response = self.get_response(request)
+        return self._anotar(request, request.user, response, perfil)
+
+    async def __acall__(self, request):
+        if not self.pedido(request):
+            return await self.get_response(request)
+        usuario = await request.auser()
+        if not usuario.is_superuser:
+            return await self.get_response(request)
+        with perfilado.perfilar(f"{request.method} {request.path}") as perfil:
+            response = await self.get_response(request)
+        return self._anotar(request, usuario, response, perfil)
+
+    def _anotar(self, request, usuario, response, perfil):
+        if perfil is None:
+            response['X-Perfil'] = 'ocupado'
+            return response
+        response['X-Perfil'] = os.path.basename(perfil['ruta'] or '')
+        bitacora.auditoria(
+            logger, "Perfil de %s %s", request.method, request.path,
+            metodo=request.method, ruta=request.path, usuario=usuario.username, perfil=perfil['ruta'],
+        )
+        return response
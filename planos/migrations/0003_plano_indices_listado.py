@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 17:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0002_plano_memoria_path_alter_plano_usuario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plano',
+            index=models.Index(fields=['-fecha_carga', '-id'], name='plano_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plano',
+            index=models.Index(fields=['estado', '-fecha_carga', '-id'], name='plano_estado_fecha_id_idx'),
+        ),
+    ]
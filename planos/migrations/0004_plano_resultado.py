@@ -0,0 +1,127 @@
+import json
+import zlib
+
+import django.db.models.deletion
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+# Copia de planos.utils.compresion al momento de esta migración: no importa
+# código vivo, que puede cambiar sin que la migración lo acompañe.
+ALGORITMO_POR_DEFECTO = 'zstd' if zstandard is not None else 'zlib'
+
+
+def comprimir(datos):
+    if ALGORITMO_POR_DEFECTO == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(datos)
+    return zlib.compress(datos, 6)
+
+
+def descomprimir(blob, algoritmo):
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    if algoritmo == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Hay datos comprimidos con zstd pero zstandard no está instalado')
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if algoritmo == 'zlib':
+        return zlib.decompress(blob)
+    raise RuntimeError(f'Algoritmo de compresión desconocido: {algoritmo}')
+
+
+def serializar_json(valor):
+    if valor is None:
+        return None
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':'), cls=DjangoJSONEncoder).encode('utf-8')
+
+
+def mover_resultados(apps, schema_editor):
+    """Comprime texto_extraido/datos_procesados de cada plano en PlanoResultado"""
+    Plano = apps.get_model('planos', 'Plano')
+    PlanoResultado = apps.get_model('planos', 'PlanoResultado')
+
+    qs = (
+        Plano.objects.filter(models.Q(texto_extraido__isnull=False) | models.Q(datos_procesados__isnull=False))
+        .only('id', 'texto_extraido', 'datos_procesados')
+        .order_by('id')
+    )
+    lote = []
+    for plano in qs.iterator(chunk_size=200):
+        texto, datos = plano.texto_extraido, plano.datos_procesados
+        if isinstance(datos, dict):
+            if texto is None:
+                texto = datos.get('texto_completo')
+            departamento = str(datos.get('departamento') or '')[:100]
+            if departamento:
+                Plano.objects.filter(id=plano.id).update(departamento=departamento)
+        con_texto = isinstance(datos, dict) and texto is not None and datos.get('texto_completo') == texto
+        if con_texto:
+            datos = {k: v for k, v in datos.items() if k != 'texto_completo'}
+
+        texto_crudo = None if texto is None else texto.encode('utf-8')
+        datos_crudos = serializar_json(datos)
+        lote.append(PlanoResultado(
+            plano_id=plano.id,
+            compresion=ALGORITMO_POR_DEFECTO,
+            texto_comprimido=None if texto_crudo is None else comprimir(texto_crudo),
+            datos_comprimidos=None if datos_crudos is None else comprimir(datos_crudos),
+            datos_con_texto=con_texto,
+            tamanio_texto=len(texto_crudo or b''),
+            tamanio_datos=len(datos_crudos or b''),
+        ))
+        if len(lote) >= 200:
+            PlanoResultado.objects.bulk_create(lote)
+            lote = []
+    PlanoResultado.objects.bulk_create(lote)
+
+
+def restaurar_resultados(apps, schema_editor):
+    Plano = apps.get_model('planos', 'Plano')
+    PlanoResultado = apps.get_model('planos', 'PlanoResultado')
+
+    for resultado in PlanoResultado.objects.order_by('plano_id').iterator(chunk_size=200):
+        texto = descomprimir(resultado.texto_comprimido, resultado.compresion)
+        texto = None if texto is None else texto.decode('utf-8')
+        datos = descomprimir(resultado.datos_comprimidos, resultado.compresion)
+        datos = None if datos is None else json.loads(datos)
+        if resultado.datos_con_texto and isinstance(datos, dict):
+            datos['texto_completo'] = texto
+        Plano.objects.filter(id=resultado.plano_id).update(texto_extraido=texto, datos_procesados=datos)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0003_plano_indices_listado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plano',
+            name='departamento',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+        migrations.CreateModel(
+            name='PlanoResultado',
+            fields=[
+                ('plano', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resultado', serialize=False, to='planos.plano')),
+                ('compresion', models.CharField(default='zlib', max_length=10)),
+                ('texto_comprimido', models.BinaryField(blank=True, null=True)),
+                ('datos_comprimidos', models.BinaryField(blank=True, null=True)),
+                ('datos_con_texto', models.BooleanField(default=False)),
+                ('tamanio_texto', models.PositiveIntegerField(default=0, help_text='Bytes sin comprimir')),
+                ('tamanio_datos', models.PositiveIntegerField(default=0, help_text='Bytes sin comprimir')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resultado de plano',
+                'verbose_name_plural': 'Resultados de planos',
+            },
+        ),
+        migrations.RunPython(mover_resultados, restaurar_resultados),
+    ]
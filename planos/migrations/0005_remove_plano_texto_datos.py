@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Separada de 0004 para no alterar la tabla en la misma transacción que copia los datos"""
+
+    dependencies = [
+        ('planos', '0004_plano_resultado'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='plano',
+            name='datos_procesados',
+        ),
+        migrations.RemoveField(
+            model_name='plano',
+            name='texto_extraido',
+        ),
+    ]
@@ -0,0 +1,220 @@
+# Generated by Django 5.2 on 2026-10-19 17:09
+
+import json
+import re
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+# Copia de planos.utils.registros y planos.utils.compresion al momento de
+# esta migración: no importa código vivo, que puede cambiar sin que la
+# migración lo acompañe.
+_NO_DIGITOS = re.compile(r"\D+")
+_ESPACIOS = re.compile(r"\s+")
+_VACIOS = {"", "no especificado", "—"}
+
+
+def normalizar_documento(valor):
+    return _NO_DIGITOS.sub("", str(valor or ""))
+
+
+def normalizar_matricula(valor):
+    return _ESPACIOS.sub(" ", str(valor or "")).strip().upper()
+
+
+def normalizar_padron(valor):
+    return _ESPACIOS.sub("", str(valor or "")).upper()
+
+
+def _texto(valor, largo):
+    valor = str(valor if valor is not None else "").strip()
+    return "" if valor.lower() in _VACIOS else valor[:largo]
+
+
+def _numero(valor):
+    try:
+        return float(str(valor).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def extraer_registros(datos):
+    datos = datos if isinstance(datos, dict) else {}
+    registros = {"propietarios": [], "padrones": [], "dominios": [], "lados": [], "coordenadas": []}
+
+    for orden, p in enumerate(datos.get("propietarios") or []):
+        if isinstance(p, dict):
+            nombre, dni, cuil = p.get("nombre"), p.get("dni"), p.get("cuil")
+        else:
+            nombre, dni, cuil = p, "", ""
+        fila = {
+            "orden": orden,
+            "nombre": _texto(nombre, 255),
+            "dni": normalizar_documento(dni)[:20],
+            "cuil": normalizar_documento(cuil)[:20],
+        }
+        if fila["nombre"] or fila["dni"] or fila["cuil"]:
+            registros["propietarios"].append(fila)
+
+    vistos = set()
+    for padron in datos.get("padrones") or []:
+        numero = normalizar_padron(padron)[:50]
+        if numero and numero not in vistos:
+            vistos.add(numero)
+            registros["padrones"].append({"orden": len(vistos) - 1, "numero": numero})
+
+    vistos = set()
+    for d in datos.get("dominios") or []:
+        matricula = normalizar_matricula(d.get("matricula") if isinstance(d, dict) else d)[:100]
+        if matricula and matricula.lower() not in _VACIOS and matricula not in vistos:
+            vistos.add(matricula)
+            registros["dominios"].append({"orden": len(vistos) - 1, "matricula": matricula})
+
+    for orden, lado in enumerate(l for l in datos.get("lados") or [] if isinstance(l, dict)):
+        registros["lados"].append({
+            "orden": orden,
+            "vertice": _texto(lado.get("vertice"), 50),
+            "rumbo": _texto(lado.get("rumbo"), 50),
+            "lado": _texto(lado.get("lado"), 50),
+            "medida": _numero(lado.get("mide")),
+            "angulo": _texto(lado.get("angulo"), 50),
+            "linderos": _texto(lado.get("linderos"), 500),
+        })
+
+    for orden, c in enumerate(c for c in datos.get("coordenadas") or [] if isinstance(c, dict)):
+        registros["coordenadas"].append({
+            "orden": orden,
+            "punto": _texto(c.get("punto"), 50),
+            "latitud": _texto(c.get("latitud"), 50),
+            "longitud": _texto(c.get("longitud"), 50),
+            "norte_gk": _numero(c.get("norte_gk")),
+            "este_gk": _numero(c.get("este_gk")),
+        })
+
+    return registros
+
+
+def descomprimir_json(blob, algoritmo):
+    blob = bytes(blob)
+    if algoritmo == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Hay datos comprimidos con zstd pero zstandard no está instalado")
+        return json.loads(zstandard.ZstdDecompressor().decompress(blob))
+    if algoritmo == "zlib":
+        return json.loads(zlib.decompress(blob))
+    raise RuntimeError(f"Algoritmo de compresión desconocido: {algoritmo}")
+
+
+MODELOS = {
+    "propietarios": "Propietario",
+    "padrones": "Padron",
+    "dominios": "Dominio",
+    "lados": "Lado",
+    "coordenadas": "Coordenada",
+}
+
+
+def poblar_registros(apps, schema_editor):
+    """Completa las tablas normalizadas de los planos ya procesados"""
+    PlanoResultado = apps.get_model('planos', 'PlanoResultado')
+    modelos = {nombre: apps.get_model('planos', modelo) for nombre, modelo in MODELOS.items()}
+
+    qs = PlanoResultado.objects.exclude(datos_comprimidos__isnull=True).only(
+        'plano_id', 'compresion', 'datos_comprimidos'
+    )
+    for resultado in qs.iterator(chunk_size=200):
+        registros = extraer_registros(descomprimir_json(resultado.datos_comprimidos, resultado.compresion))
+        for nombre, modelo in modelos.items():
+            modelo.objects.bulk_create(
+                [modelo(plano_id=resultado.plano_id, **fila) for fila in registros[nombre]],
+                batch_size=500,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0005_remove_plano_texto_datos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Coordenada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orden', models.PositiveIntegerField(default=0)),
+                ('punto', models.CharField(blank=True, max_length=50)),
+                ('latitud', models.CharField(blank=True, max_length=50)),
+                ('longitud', models.CharField(blank=True, max_length=50)),
+                ('norte_gk', models.FloatField(blank=True, null=True)),
+                ('este_gk', models.FloatField(blank=True, null=True)),
+                ('plano', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coordenadas', to='planos.plano')),
+            ],
+            options={
+                'ordering': ['plano', 'orden'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Dominio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orden', models.PositiveSmallIntegerField(default=0)),
+                ('matricula', models.CharField(db_index=True, max_length=100)),
+                ('plano', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dominios', to='planos.plano')),
+            ],
+            options={
+                'ordering': ['plano', 'orden'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Lado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orden', models.PositiveIntegerField(default=0)),
+                ('vertice', models.CharField(blank=True, max_length=50)),
+                ('rumbo', models.CharField(blank=True, max_length=50)),
+                ('lado', models.CharField(blank=True, max_length=50)),
+                ('medida', models.FloatField(blank=True, help_text='Metros', null=True)),
+                ('angulo', models.CharField(blank=True, max_length=50)),
+                ('linderos', models.CharField(blank=True, max_length=500)),
+                ('plano', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lados', to='planos.plano')),
+            ],
+            options={
+                'ordering': ['plano', 'orden'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Padron',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orden', models.PositiveSmallIntegerField(default=0)),
+                ('numero', models.CharField(db_index=True, max_length=50)),
+                ('plano', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='padrones', to='planos.plano')),
+            ],
+            options={
+                'verbose_name_plural': 'Padrones',
+                'ordering': ['plano', 'orden'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Propietario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orden', models.PositiveSmallIntegerField(default=0)),
+                ('nombre', models.CharField(blank=True, max_length=255)),
+                ('dni', models.CharField(blank=True, db_index=True, help_text='Solo dígitos', max_length=20)),
+                ('cuil', models.CharField(blank=True, db_index=True, help_text='Solo dígitos', max_length=20)),
+                ('plano', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='propietarios', to='planos.plano')),
+            ],
+            options={
+                'ordering': ['plano', 'orden'],
+            },
+        ),
+        migrations.RunPython(poblar_registros, migrations.RunPython.noop),
+    ]
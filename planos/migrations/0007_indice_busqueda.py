@@ -0,0 +1,101 @@
+import json
+import zlib
+
+from django.db import migrations
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+# Copia de planos.busqueda y planos.utils.compresion al momento de esta
+# migración: no importa código vivo, que puede cambiar sin que la migración
+# lo acompañe.
+TABLA = 'planos_busqueda'
+CAMPOS_CONTENIDO = ('lugar', 'departamento', 'inmueble', 'descripcion', 'nota1', 'nota2', 'croquis')
+
+
+def descomprimir(blob, algoritmo):
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    if algoritmo == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Hay datos comprimidos con zstd pero zstandard no está instalado')
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if algoritmo == 'zlib':
+        return zlib.decompress(blob)
+    raise RuntimeError(f'Algoritmo de compresión desconocido: {algoritmo}')
+
+
+def contenido_indexable(texto, datos):
+    datos = datos if isinstance(datos, dict) else {}
+    texto = texto or datos.get('texto_completo')
+    if not texto:
+        partes = [str(datos.get(campo) or '') for campo in CAMPOS_CONTENIDO]
+        partes += [str(l.get('linderos') or '') for l in datos.get('lados') or [] if isinstance(l, dict)]
+        texto = ' '.join(partes)
+    return ' '.join(texto.split())
+
+
+def crear_indice(apps, schema_editor):
+    """Índice FTS5 o tsvector/GIN según el motor, con los planos ya procesados"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5("
+            "titulo, contenido, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        insertar = f'INSERT INTO {TABLA} (rowid, titulo, contenido) VALUES (%s, %s, %s)'
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {TABLA} ('
+            ' plano_id integer PRIMARY KEY REFERENCES planos_plano(id) ON DELETE CASCADE,'
+            " titulo text NOT NULL DEFAULT '',"
+            " contenido text NOT NULL DEFAULT '',"
+            ' documento tsvector NOT NULL)'
+        )
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {TABLA}_documento_gin ON {TABLA} USING gin(documento)')
+        insertar = (
+            f'INSERT INTO {TABLA} (plano_id, titulo, contenido, documento) VALUES (%s, %s, %s,'
+            " setweight(to_tsvector('spanish', %s), 'A') || setweight(to_tsvector('spanish', %s), 'B'))"
+        )
+    else:
+        return
+
+    PlanoResultado = apps.get_model('planos', 'PlanoResultado')
+    qs = PlanoResultado.objects.select_related('plano').only(
+        'plano__id', 'plano__titulo', 'compresion', 'texto_comprimido', 'datos_comprimidos'
+    )
+    with schema_editor.connection.cursor() as cursor:
+        for resultado in qs.iterator(chunk_size=200):
+            texto = descomprimir(resultado.texto_comprimido, resultado.compresion)
+            datos = descomprimir(resultado.datos_comprimidos, resultado.compresion)
+            contenido = contenido_indexable(
+                None if texto is None else texto.decode('utf-8'),
+                None if datos is None else json.loads(datos),
+            )
+            titulo = resultado.plano.titulo or ''
+            parametros = [resultado.plano.id, titulo, contenido]
+            if vendor == 'postgresql':
+                parametros += [titulo, contenido]
+            cursor.execute(insertar, parametros)
+
+
+def eliminar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        # Trigger de borrado de las bases creadas antes de la 0015
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {TABLA}_borrado')
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLA}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0006_registros_normalizados'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 17:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0007_indice_busqueda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plano',
+            index=models.Index(fields=['fecha_actualizacion'], name='plano_fecha_act_idx'),
+        ),
+    ]
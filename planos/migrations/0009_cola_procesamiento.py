@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-19 17:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0008_plano_fecha_actualizacion_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoteCarga',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('rechazados', models.JSONField(blank=True, default=list, help_text='Archivos no aceptados y el motivo')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lotes_carga', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Lote de carga',
+                'verbose_name_plural': 'Lotes de carga',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrabajoProcesamiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, help_text='Proceso que tomó el trabajo', max_length=100)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('lote', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='trabajos', to='planos.lotecarga')),
+                ('plano', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos', to='planos.plano')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de procesamiento',
+                'verbose_name_plural': 'Trabajos de procesamiento',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['estado', 'id'], name='trabajo_estado_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-19 17:20
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0009_cola_procesamiento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaReanudable',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre', models.CharField(max_length=255)),
+                ('titulo', models.CharField(blank=True, max_length=255)),
+                ('tamanio', models.BigIntegerField(help_text='Bytes declarados al crear la carga')),
+                ('desplazamiento', models.BigIntegerField(default=0, help_text='Bytes ya recibidos')),
+                ('sha256_esperado', models.CharField(blank=True, max_length=64)),
+                ('sha256', models.CharField(blank=True, help_text='Hash del archivo completo', max_length=64)),
+                ('bloqueo', models.DateTimeField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('plano', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='carga', to='planos.plano')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cargas_reanudables', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Carga reanudable',
+                'verbose_name_plural': 'Cargas reanudables',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
@@ -0,0 +1,131 @@
+# Generated by Django 5.2 on 2026-10-19 17:24
+
+import hashlib
+import os
+import posixpath
+import shutil
+
+import planos.storage
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+# Copia de los helpers de planos.storage al momento de esta migración: no
+# importa código vivo, que puede cambiar sin que la migración lo acompañe.
+# planos.storage queda solo como referencia del storage del campo.
+
+
+def ruta_contenido(directorio, digest, extension):
+    return posixpath.join(directorio, digest[:2], digest[2:4], f'{digest}{extension.lower()}')
+
+
+def es_ruta_contenido(nombre):
+    partes = nombre.split('/')
+    digest = os.path.splitext(partes[-1])[0]
+    return len(partes) >= 3 and len(digest) == 64 and partes[-3] == digest[:2] and partes[-2] == digest[2:4]
+
+
+def hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def direccionar_por_contenido(apps, schema_editor):
+    """
+    Pasa los PDF existentes a ``uploads/planos/ab/cd/<sha256>.pdf``. Los
+    duplicados quedan como un único archivo con varias referencias. Los
+    archivos nuevos se crean como enlaces duros y los originales se borran
+    recién cuando la migración confirma, así un fallo no deja planos
+    apuntando a archivos movidos.
+    """
+    Plano = apps.get_model('planos', 'Plano')
+    ArchivoContenido = apps.get_model('planos', 'ArchivoContenido')
+
+    destinos = {}      # nombre original -> nombre por contenido
+    archivos = {}      # nombre por contenido -> [sha256, tamaño, referencias]
+    originales = set()
+    qs = Plano.objects.exclude(archivo_pdf='').only('id', 'archivo_pdf').order_by('id')
+    for plano in qs.iterator(chunk_size=200):
+        nombre = plano.archivo_pdf.name
+        if nombre not in destinos:
+            origen = os.path.join(settings.MEDIA_ROOT, nombre)
+            if es_ruta_contenido(nombre) or not os.path.exists(origen):
+                destinos[nombre] = nombre
+            else:
+                digest = hash_archivo(origen)
+                nuevo = ruta_contenido(posixpath.dirname(nombre), digest, os.path.splitext(nombre)[1])
+                destino = os.path.join(settings.MEDIA_ROOT, nuevo)
+                if not os.path.exists(destino):
+                    os.makedirs(os.path.dirname(destino), exist_ok=True)
+                    try:
+                        os.link(origen, destino)
+                    except OSError:
+                        shutil.copy2(origen, destino)
+                destinos[nombre] = nuevo
+                originales.add(origen)
+
+        nuevo = destinos[nombre]
+        if nuevo != nombre:
+            Plano.objects.filter(id=plano.id).update(archivo_pdf=nuevo)
+        ruta = os.path.join(settings.MEDIA_ROOT, nuevo)
+        if es_ruta_contenido(nuevo) and os.path.exists(ruta):
+            registro = archivos.setdefault(nuevo, [os.path.splitext(posixpath.basename(nuevo))[0], os.path.getsize(ruta), 0])
+            registro[2] += 1
+
+    ArchivoContenido.objects.bulk_create(
+        [
+            ArchivoContenido(ruta=ruta, sha256=digest, tamanio=tamanio, referencias=referencias)
+            for ruta, (digest, tamanio, referencias) in archivos.items()
+        ],
+        batch_size=500,
+    )
+
+    def borrar_originales():
+        for origen in originales:
+            try:
+                os.remove(origen)
+            except FileNotFoundError:
+                pass
+
+    transaction.on_commit(borrar_originales, using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0010_carga_reanudable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoContenido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ruta', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('tamanio', models.BigIntegerField(default=0)),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archivo por contenido',
+                'verbose_name_plural': 'Archivos por contenido',
+            },
+        ),
+        # Solo cambia el estado: en SQLite un AlterField reconstruye la tabla y
+        # se perdería el trigger del índice de búsqueda (0007)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='plano',
+                    name='archivo_pdf',
+                    field=models.FileField(help_text='Archivo PDF del plano (guardado por SHA-256, ver planos.storage)', storage=planos.storage.almacenamiento_planos, upload_to='uploads/planos/'),
+                ),
+            ],
+        ),
+        # Sin reversa de archivos: las rutas por contenido siguen siendo válidas
+        # para un FileField con el storage por defecto
+        migrations.RunPython(direccionar_por_contenido, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0011_almacenamiento_contenido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plano',
+            name='metricas',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0012_plano_metricas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoprocesamiento',
+            name='perfilar',
+            field=models.BooleanField(default=False, help_text='Ejecutar con cProfile (ver planos.perfilado)'),
+        ),
+    ]
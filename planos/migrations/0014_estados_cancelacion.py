@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0013_trabajo_perfilar'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='plano',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente de Procesamiento'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error'), ('cancelado', 'Cancelado')], default='pendiente', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='trabajoprocesamiento',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completado', 'Completado'), ('error', 'Error'), ('tiempo_agotado', 'Tiempo agotado'), ('cancelado', 'Cancelado')], default='pendiente', max_length=20),
+        ),
+    ]
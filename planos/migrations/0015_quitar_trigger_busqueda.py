@@ -0,0 +1,29 @@
+from django.db import migrations
+
+# El borrado de planos ya quita su entrada del índice desde Python (señal
+# post_delete); el trigger de 0007 se perdía cada vez que SQLite rehacía
+# planos_plano. Autocontenida: no depende de planos.busqueda.
+
+
+def quitar_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TRIGGER IF EXISTS planos_busqueda_borrado')
+
+
+def crear_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE TRIGGER IF NOT EXISTS planos_busqueda_borrado AFTER DELETE ON planos_plano '
+            'BEGIN DELETE FROM planos_busqueda WHERE rowid = old.id; END'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0014_estados_cancelacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(quitar_trigger, crear_trigger),
+    ]
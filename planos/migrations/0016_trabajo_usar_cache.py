@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planos', '0015_quitar_trigger_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoprocesamiento',
+            name='usar_cache',
+            field=models.BooleanField(default=True, help_text='Reutilizar la extracción de un PDF idéntico'),
+        ),
+    ]
@@ -1,6 +1,24 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 
+from .utils.compresion import (
+    ALGORITMO_POR_DEFECTO,
+    comprimir,
+    descomprimir_json,
+    descomprimir_texto,
+    serializar_json,
+)
+from .utils.registros import extraer_registros
+from .busqueda import desindexar, indexar_plano
+from .storage import almacenamiento_planos
+
+# Marca de valor aún no descomprimido
+_SIN_CARGAR = object()
+
 
 class Plano(models.Model):
     """Modelo para almacenar planos de agrimensura cargados"""
@@ -10,6 +28,7 @@ class Plano(models.Model):
         ('procesando', 'Procesando'),
         ('completado', 'Completado'),
         ('error', 'Error'),
+        ('cancelado', 'Cancelado'),
     ]
     
     # Información básica
@@ -17,7 +36,11 @@ class Plano(models.Model):
     descripcion = models.TextField(blank=True, null=True, help_text="Descripción adicional")
     
     # Archivo
-    archivo_pdf = models.FileField(upload_to='uploads/planos/', help_text="Archivo PDF del plano")
+    archivo_pdf = models.FileField(
+        upload_to='uploads/planos/',
+        storage=almacenamiento_planos,
+        help_text="Archivo PDF del plano (guardado por SHA-256, ver planos.storage)",
+    )
     
     # Estado del procesamiento
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
@@ -27,17 +50,402 @@ class Plano(models.Model):
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='planos', null=True, blank=True)
     
-    # Resultados del procesamiento
-    texto_extraido = models.TextField(blank=True, null=True, help_text="Texto extraído del PDF")
-    datos_procesados = models.JSONField(blank=True, null=True, help_text="Datos estructurados extraídos")
+    # Resumen de los resultados para filtrar sin leer PlanoResultado
+    departamento = models.CharField(max_length=100, blank=True, default='', db_index=True)
     
     # Memoria descriptiva generada
     memoria_path = models.CharField(max_length=500, blank=True, null=True, help_text="Ruta de la memoria Word generada")
     
+    # Último procesamiento: segundos por etapa, páginas, páginas con OCR y bytes (ver planos.metricas).
+    metricas = models.JSONField(null=True, blank=True)
+    
     class Meta:
         verbose_name = 'Plano'
         verbose_name_plural = 'Planos'
         ordering = ['-fecha_carga']
+        indexes = [
+            # Paginación por clave del listado, con y sin filtro de estado
+            models.Index(fields=['-fecha_carga', '-id'], name='plano_fecha_id_idx'),
+            models.Index(fields=['estado', '-fecha_carga', '-id'], name='plano_estado_fecha_id_idx'),
+            # Validadores de la API (Max de fecha_actualizacion)
+            models.Index(fields=['fecha_actualizacion'], name='plano_fecha_act_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.titulo} - {self.get_estado_display()}"
\ No newline at end of file
+        return f"{self.titulo} - {self.get_estado_display()}"
+
+    # -------------------------
+    # Resultados del procesamiento (en PlanoResultado)
+    # -------------------------
+    def _resultado_existente(self):
+        try:
+            return self.resultado
+        except PlanoResultado.DoesNotExist:
+            return None
+
+    def _resultado_para_escribir(self):
+        resultado = self._resultado_existente()
+        if resultado is None:
+            resultado = PlanoResultado(plano=self)
+            self.resultado = resultado
+        self._resultado_modificado = True
+        return resultado
+
+    @property
+    def texto_extraido(self):
+        """Texto extraído del PDF"""
+        resultado = self._resultado_existente()
+        return resultado.texto if resultado else None
+
+    @texto_extraido.setter
+    def texto_extraido(self, valor):
+        self._resultado_para_escribir().texto = valor
+
+    @property
+    def datos_procesados(self):
+        """
+        Datos estructurados extraídos.
+
+        Es un dict descomprimido al leerlo, no el valor guardado: modificarlo
+        en el lugar no se persiste ni regenera registros, departamento ni el
+        índice. Para cambiar algo hay que reasignarlo
+        (``plano.datos_procesados = {**plano.datos_procesados, ...}``).
+        """
+        resultado = self._resultado_existente()
+        return resultado.datos if resultado else None
+
+    @datos_procesados.setter
+    def datos_procesados(self, valor):
+        self._resultado_para_escribir().datos = valor
+        departamento = (valor or {}).get("departamento") if isinstance(valor, dict) else None
+        self.departamento = str(departamento or "")[:100]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        plano = super().from_db(db, field_names, values)
+        # Título que tiene el índice de búsqueda (ver _titulo_cambiado)
+        plano._titulo_indexado = plano.__dict__.get("titulo", _SIN_CARGAR)
+        return plano
+
+    def _titulo_cambiado(self, update_fields):
+        """El título a guardar no es el del índice (o el plano es nuevo)"""
+        if update_fields is not None and "titulo" not in update_fields:
+            return False
+        if "titulo" not in self.__dict__:
+            # Diferido y sin tocar
+            return False
+        return self.titulo != getattr(self, "_titulo_indexado", _SIN_CARGAR)
+
+    def save(self, *args, **kwargs):
+        resultado_modificado = getattr(self, "_resultado_modificado", False)
+        if not resultado_modificado and not self._titulo_cambiado(kwargs.get("update_fields")):
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if resultado_modificado:
+                self.resultado.plano = self
+                self.resultado.save()
+                self.guardar_registros()
+            indexar_plano(self)
+        self._resultado_modificado = False
+        self._titulo_indexado = self.titulo
+
+    def guardar_registros(self):
+        """Reemplaza las filas normalizadas con las de los datos actuales"""
+        registros = extraer_registros(self.datos_procesados)
+        for nombre, modelo in REGISTROS.items():
+            modelo.objects.filter(plano=self).delete()
+            modelo.objects.bulk_create(
+                [modelo(plano=self, **fila) for fila in registros[nombre]], batch_size=500
+            )
+
+
+@receiver(post_delete, sender=Plano)
+def _desindexar(sender, instance, **kwargs):
+    """Quita el plano del índice de búsqueda, en la misma transacción del borrado"""
+    desindexar(instance.id)
+
+
+@receiver(post_delete, sender=Plano)
+def _liberar_archivo_pdf(sender, instance, **kwargs):
+    """Resta la referencia al PDF; el archivo se borra si nadie más lo usa"""
+    if instance.archivo_pdf:
+        nombre, storage = instance.archivo_pdf.name, instance.archivo_pdf.storage
+        transaction.on_commit(lambda: storage.delete(nombre))
+
+
+class ArchivoContenido(models.Model):
+    """Archivo guardado por su SHA-256 y cuántos planos lo referencian"""
+
+    ruta = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    tamanio = models.BigIntegerField(default=0)
+    referencias = models.PositiveIntegerField(default=0)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Archivo por contenido'
+        verbose_name_plural = 'Archivos por contenido'
+
+    def __str__(self):
+        return f"{self.ruta} ({self.referencias} ref.)"
+
+
+class PlanoResultado(models.Model):
+    """
+    Texto y datos extraídos de un plano, comprimidos.
+
+    Viven fuera de ``Plano`` para que listados y consultas no arrastren los
+    blobs; se descomprimen recién al leerlos. El texto completo se guarda una
+    sola vez aunque también figure en los datos como ``texto_completo``.
+    """
+
+    plano = models.OneToOneField(Plano, on_delete=models.CASCADE, primary_key=True, related_name='resultado')
+    compresion = models.CharField(max_length=10, default='zlib')
+    texto_comprimido = models.BinaryField(blank=True, null=True)
+    datos_comprimidos = models.BinaryField(blank=True, null=True)
+    # Si los datos tenían 'texto_completo' igual al texto, se quitó al comprimir
+    datos_con_texto = models.BooleanField(default=False)
+    tamanio_texto = models.PositiveIntegerField(default=0, help_text="Bytes sin comprimir")
+    tamanio_datos = models.PositiveIntegerField(default=0, help_text="Bytes sin comprimir")
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Resultado de plano'
+        verbose_name_plural = 'Resultados de planos'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._texto = _SIN_CARGAR
+        self._datos = _SIN_CARGAR
+        self._pendiente = False
+
+    @property
+    def texto(self):
+        if self._texto is _SIN_CARGAR:
+            self._texto = descomprimir_texto(self.texto_comprimido, self.compresion)
+        return self._texto
+
+    @texto.setter
+    def texto(self, valor):
+        # Los datos se materializan antes, porque pueden reinsertar el texto anterior
+        self.datos
+        self._texto = valor
+        self._pendiente = True
+
+    @property
+    def datos(self):
+        # Modificarlo en el lugar no marca el resultado para recomprimir: se reasigna
+        if self._datos is _SIN_CARGAR:
+            datos = descomprimir_json(self.datos_comprimidos, self.compresion)
+            if self.datos_con_texto and isinstance(datos, dict):
+                datos["texto_completo"] = self.texto
+            self._datos = datos
+        return self._datos
+
+    @datos.setter
+    def datos(self, valor):
+        self._datos = valor
+        self._pendiente = True
+
+    def save(self, *args, **kwargs):
+        if self._pendiente:
+            self._comprimir()
+        super().save(*args, **kwargs)
+
+    def _comprimir(self):
+        texto, datos = self.texto, self.datos
+        self.datos_con_texto = (
+            isinstance(datos, dict) and texto is not None and datos.get("texto_completo") == texto
+        )
+        if self.datos_con_texto:
+            datos = {k: v for k, v in datos.items() if k != "texto_completo"}
+        texto_crudo = None if texto is None else texto.encode("utf-8")
+        datos_crudos = serializar_json(datos)
+        self.compresion = ALGORITMO_POR_DEFECTO
+        self.texto_comprimido = None if texto_crudo is None else comprimir(texto_crudo, self.compresion)
+        self.datos_comprimidos = None if datos_crudos is None else comprimir(datos_crudos, self.compresion)
+        self.tamanio_texto = len(texto_crudo or b"")
+        self.tamanio_datos = len(datos_crudos or b"")
+        self._pendiente = False
+
+
+# -------------------------
+# Registros normalizados (se regeneran desde datos_procesados)
+# -------------------------
+class Propietario(models.Model):
+    plano = models.ForeignKey(Plano, on_delete=models.CASCADE, related_name='propietarios')
+    orden = models.PositiveSmallIntegerField(default=0)
+    nombre = models.CharField(max_length=255, blank=True)
+    dni = models.CharField(max_length=20, blank=True, db_index=True, help_text="Solo dígitos")
+    cuil = models.CharField(max_length=20, blank=True, db_index=True, help_text="Solo dígitos")
+
+    class Meta:
+        ordering = ['plano', 'orden']
+
+    def __str__(self):
+        return f"{self.nombre} ({self.dni or self.cuil})"
+
+
+class Padron(models.Model):
+    plano = models.ForeignKey(Plano, on_delete=models.CASCADE, related_name='padrones')
+    orden = models.PositiveSmallIntegerField(default=0)
+    numero = models.CharField(max_length=50, db_index=True)
+
+    class Meta:
+        verbose_name_plural = 'Padrones'
+        ordering = ['plano', 'orden']
+
+    def __str__(self):
+        return self.numero
+
+
+class Dominio(models.Model):
+    plano = models.ForeignKey(Plano, on_delete=models.CASCADE, related_name='dominios')
+    orden = models.PositiveSmallIntegerField(default=0)
+    matricula = models.CharField(max_length=100, db_index=True)
+
+    class Meta:
+        ordering = ['plano', 'orden']
+
+    def __str__(self):
+        return self.matricula
+
+
+class Lado(models.Model):
+    plano = models.ForeignKey(Plano, on_delete=models.CASCADE, related_name='lados')
+    orden = models.PositiveIntegerField(default=0)
+    vertice = models.CharField(max_length=50, blank=True)
+    rumbo = models.CharField(max_length=50, blank=True)
+    lado = models.CharField(max_length=50, blank=True)
+    medida = models.FloatField(null=True, blank=True, help_text="Metros")
+    angulo = models.CharField(max_length=50, blank=True)
+    linderos = models.CharField(max_length=500, blank=True)
+
+    class Meta:
+        ordering = ['plano', 'orden']
+
+    def __str__(self):
+        return f"{self.lado}: {self.medida}"
+
+
+class Coordenada(models.Model):
+    plano = models.ForeignKey(Plano, on_delete=models.CASCADE, related_name='coordenadas')
+    orden = models.PositiveIntegerField(default=0)
+    punto = models.CharField(max_length=50, blank=True)
+    latitud = models.CharField(max_length=50, blank=True)
+    longitud = models.CharField(max_length=50, blank=True)
+    norte_gk = models.FloatField(null=True, blank=True)
+    este_gk = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['plano', 'orden']
+
+    def __str__(self):
+        return self.punto
+
+
+REGISTROS = {
+    "propietarios": Propietario,
+    "padrones": Padron,
+    "dominios": Dominio,
+    "lados": Lado,
+    "coordenadas": Coordenada,
+}
+
+
+
+# -------------------------
+# Cola de procesamiento
+# -------------------------
+class LoteCarga(models.Model):
+    """Conjunto de planos subidos juntos en una carga masiva"""
+
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='lotes_carga')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    rechazados = models.JSONField(default=list, blank=True, help_text="Archivos no aceptados y el motivo")
+
+    class Meta:
+        verbose_name = 'Lote de carga'
+        verbose_name_plural = 'Lotes de carga'
+        ordering = ['-fecha_creacion']
+
+    def __str__(self):
+        return f"Lote {self.id} ({self.fecha_creacion:%d/%m/%Y %H:%M})"
+
+
+class TrabajoProcesamiento(models.Model):
+    """Procesamiento pendiente de un plano; lo ejecuta ``manage.py procesar_cola``"""
+
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    COMPLETADO = 'completado'
+    ERROR = 'error'
+    TIEMPO_AGOTADO = 'tiempo_agotado'
+    CANCELADO = 'cancelado'
+    ESTADO_CHOICES = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_CURSO, 'En curso'),
+        (COMPLETADO, 'Completado'),
+        (ERROR, 'Error'),
+        (TIEMPO_AGOTADO, 'Tiempo agotado'),
+        (CANCELADO, 'Cancelado'),
+    ]
+    ACTIVOS = (PENDIENTE, EN_CURSO)
+
+    plano = models.ForeignKey(Plano, on_delete=models.CASCADE, related_name='trabajos')
+    lote = models.ForeignKey(LoteCarga, on_delete=models.CASCADE, null=True, blank=True, related_name='trabajos')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default=PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, help_text="Proceso que tomó el trabajo")
+    error = models.TextField(blank=True)
+    perfilar = models.BooleanField(default=False, help_text="Ejecutar con cProfile (ver planos.perfilado)")
+    usar_cache = models.BooleanField(default=True, help_text="Reutilizar la extracción de un PDF idéntico")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Trabajo de procesamiento'
+        verbose_name_plural = 'Trabajos de procesamiento'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['estado', 'id'], name='trabajo_estado_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Trabajo {self.id} - plano {self.plano_id} ({self.estado})"
+
+
+class CargaReanudable(models.Model):
+    """
+    Subida de un PDF por partes (protocolo tipo tus). Las partes se escriben
+    directo en ``ruta_parcial`` y ``desplazamiento`` indica cuántos bytes ya
+    están en disco; al completarse se crea el ``Plano``.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cargas_reanudables')
+    nombre = models.CharField(max_length=255)
+    titulo = models.CharField(max_length=255, blank=True)
+    tamanio = models.BigIntegerField(help_text="Bytes declarados al crear la carga")
+    desplazamiento = models.BigIntegerField(default=0, help_text="Bytes ya recibidos")
+    sha256_esperado = models.CharField(max_length=64, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Hash del archivo completo")
+    # Evita que dos PATCH escriban a la vez sobre la misma carga
+    bloqueo = models.DateTimeField(null=True, blank=True)
+    plano = models.OneToOneField(Plano, on_delete=models.SET_NULL, null=True, blank=True, related_name='carga')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Carga reanudable'
+        verbose_name_plural = 'Cargas reanudables'
+        ordering = ['-fecha_creacion']
+
+    def __str__(self):
+        return f"{self.nombre} ({self.desplazamiento}/{self.tamanio})"
+
+    @property
+    def completa(self):
+        return self.desplazamiento >= self.tamanio
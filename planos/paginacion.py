@@ -0,0 +1,21 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PlanoCursorPagination(CursorPagination):
+    """
+    Paginación por cursor sobre ``(fecha_carga, id)``: el costo de una página
+    no depende de su posición y los planos nuevos no desplazan las páginas
+    que un cliente ya recorrió.
+    """
+
+    ordering = ('-fecha_carga', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class IdCursorPagination(CursorPagination):
+    """Lotes y trabajos: del más reciente al más antiguo por ``id``"""
+
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
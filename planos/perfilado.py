@@ -0,0 +1,144 @@
+"""
+Perfilado a pedido con cProfile.
+
+Para reproducir un plano problemático sin hacerlo a mano:
+
+- Solicitudes: un superusuario agrega ``?perfilar=1`` o la cabecera
+  ``X-Perfilar: 1`` (``PerfiladoMiddleware``; requiere
+  ``PERFILADO_HABILITADO``). La respuesta trae ``X-Perfil`` con el archivo.
+- Trabajos de la cola: ``TrabajoProcesamiento.perfilar`` (``POST
+  /api/trabajos/<id>/perfilar/`` reencola el plano así) o
+  ``procesar_cola --perfilar`` para todos los trabajos de un worker.
+
+Cada perfil se guarda en ``PERFILES_DIR`` como ``.prof`` (pstats; se abre
+con ``python -m pstats``, snakeviz o flameprof para un flamegraph) y un
+``.txt`` con las funciones de mayor tiempo acumulado. Se conservan a lo sumo
+``PERFILES_MAX_ARCHIVOS`` perfiles y ``PERFILES_MAX_BYTES`` bytes; los más
+viejos se borran.
+
+La extracción aislada (``planos.aislamiento``) corre en otro proceso, fuera
+del alcance del perfil del padre: si hay un perfil en curso, el hijo perfila
+``extract_data`` en su propio ``.prof`` (``<etiqueta>-extraccion``), cuya
+ruta queda en ``perfil["extraccion"]``.
+
+Hay un perfil a la vez por proceso: si otro está en curso el bloque corre
+sin perfilar. Desactivado no cuesta nada: el middleware ni se instala.
+"""
+
+import contextvars
+import cProfile
+import glob
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+# (etiqueta, resultado) del perfil en curso en este contexto
+_en_curso = contextvars.ContextVar("perfil_en_curso", default=None)
+
+
+def directorio():
+    return getattr(settings, "PERFILES_DIR", None) or os.path.join(settings.LOGS_DIR, "perfiles")
+
+
+def _nombre(etiqueta):
+    etiqueta = re.sub(r"[^A-Za-z0-9_.-]+", "_", etiqueta).strip("_")[:80]
+    return f"{timezone.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}-{etiqueta}"
+
+
+def _guardar(perfil, etiqueta):
+    carpeta = directorio()
+    os.makedirs(carpeta, exist_ok=True)
+    base = os.path.join(carpeta, _nombre(etiqueta))
+    perfil.dump_stats(f"{base}.prof")
+
+    resumen = io.StringIO()
+    pstats.Stats(perfil, stream=resumen).sort_stats("cumulative").print_stats(
+        getattr(settings, "PERFILES_TOP", 40)
+    )
+    with open(f"{base}.txt", "w", encoding="utf-8") as f:
+        f.write(f"{etiqueta}\n{resumen.getvalue()}")
+    return f"{base}.prof"
+
+
+def recortar():
+    """Borra los perfiles más viejos por encima de los límites; devuelve cuántos"""
+    carpeta = directorio()
+    perfiles = []
+    for ruta in glob.glob(os.path.join(carpeta, "*.prof")):
+        try:
+            estado = os.stat(ruta)
+        except FileNotFoundError:
+            continue
+        texto = ruta[:-len(".prof")] + ".txt"
+        tamanio = estado.st_size + (os.path.getsize(texto) if os.path.exists(texto) else 0)
+        perfiles.append((estado.st_mtime, ruta, texto, tamanio))
+    perfiles.sort()
+
+    max_archivos = getattr(settings, "PERFILES_MAX_ARCHIVOS", 50)
+    max_bytes = getattr(settings, "PERFILES_MAX_BYTES", 200 * 1024 ** 2)
+    total = sum(p[3] for p in perfiles)
+    borrados = 0
+    while perfiles and (len(perfiles) > max_archivos or total > max_bytes):
+        _mtime, ruta, texto, tamanio = perfiles.pop(0)
+        for archivo in (ruta, texto):
+            try:
+                os.remove(archivo)
+            except FileNotFoundError:
+                pass
+        total -= tamanio
+        borrados += 1
+    return borrados
+
+
+@contextmanager
+def perfilar(etiqueta):
+    """
+    Perfila el bloque. Produce un dict cuyo ``"ruta"`` queda con el ``.prof``
+    al salir, o ``None`` si ya había otro perfil en curso en el proceso.
+    """
+    if not _lock.acquire(blocking=False):
+        yield None
+        return
+    resultado = {"ruta": None}
+    perfil = cProfile.Profile()
+    token = _en_curso.set((etiqueta, resultado))
+    try:
+        perfil.enable()
+        try:
+            yield resultado
+        finally:
+            _en_curso.reset(token)
+            # También se guarda si el bloque falló: suele ser el caso interesante
+            perfil.disable()
+            try:
+                resultado["ruta"] = _guardar(perfil, etiqueta)
+                recortar()
+                logger.info(f"Perfil de {etiqueta} guardado en {resultado['ruta']}")
+            except OSError as e:
+                logger.warning(f"No se pudo guardar el perfil de {etiqueta}: {e}")
+    finally:
+        _lock.release()
+
+
+def en_curso():
+    """Etiqueta del perfil en curso en este contexto, ``None`` si no hay"""
+    actual = _en_curso.get()
+    return actual[0] if actual else None
+
+
+def anotar(clave, ruta):
+    """Agrega al perfil en curso la ruta de otro perfil (el de un proceso hijo)"""
+    actual = _en_curso.get()
+    if actual is not None:
+        actual[1][clave] = ruta
@@ -0,0 +1,268 @@
+"""
+Presupuesto de memoria y de páginas por trabajo de procesamiento.
+
+Un plano escaneado enorme puede llevar el RSS de un worker a varios GB entre
+``convert_from_path`` y las cachés de pdfplumber, y esa memoria no vuelve al
+sistema. Por eso:
+
+- ``medir()`` envuelve cada procesamiento (``procesar_pdf``): un hilo toma
+  muestras del RSS cada ``MEMORIA_MUESTREO`` segundos y al salir queda el
+  pico, que se guarda en ``Plano.metricas["memoria"]``. Con
+  ``MEMORIA_TRACEMALLOC`` también se mide el pico de memoria de Python.
+- Antes de leer o renderizar se controla el presupuesto: a lo sumo
+  ``PDF_MAX_PAGINAS`` páginas y ``OCR_MAX_PIXELES_PAGINA`` píxeles por página
+  renderizada (se baja la resolución hasta ``OCR_DPI_MIN``).
+- ``verificar()``, entre página y página, corta el trabajo con
+  ``MemoriaExcedida`` si el RSS creció más de ``MEMORIA_MAX_TRABAJO_MB``
+  desde que empezó (o crecería, sumando la página que se va a renderizar).
+- ``procesar_cola`` termina el worker tras un trabajo si el RSS del proceso
+  supera ``COLA_RECICLAR_RSS_MB``; el supervisor (Procfile, systemd) levanta
+  uno nuevo con la memoria limpia.
+
+Sin ``/proc`` (macOS) el RSS es el máximo histórico del proceso
+(``ru_maxrss``); en Windows no hay medición y los controles de memoria no
+actúan.
+"""
+
+import contextvars
+import logging
+import math
+import os
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Bytes por píxel de una página renderizada en RGB
+BYTES_POR_PIXEL = 3
+
+
+class LimiteRecursos(Exception):
+    """El trabajo excede su presupuesto; reintentarlo no cambia el resultado"""
+
+
+class PresupuestoExcedido(LimiteRecursos):
+    """El PDF tiene más páginas o píxeles que los permitidos"""
+
+
+class MemoriaExcedida(LimiteRecursos):
+    """El trabajo superó ``MEMORIA_MAX_TRABAJO_MB``"""
+
+
+class TiempoAgotado(LimiteRecursos):
+    """Una etapa superó su tiempo (``EXTRACCION_TIMEOUT``, ``OCR_TIMEOUT_PAGINA``)"""
+
+
+# -------------------------
+# Lectura del RSS
+# -------------------------
+def _rss_proc():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_actual():
+    """RSS del proceso en bytes, ``None`` si no se puede medir"""
+    try:
+        return _rss_proc()
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo informa en KiB y macOS en bytes
+    return maximo if sys.platform == "darwin" else maximo * 1024
+
+
+def _limite(nombre):
+    mb = getattr(settings, nombre, 0)
+    return int(mb * MB) if mb else None
+
+
+# -------------------------
+# Medición por trabajo
+# -------------------------
+_medidor = contextvars.ContextVar("medidor_memoria", default=None)
+
+
+class Medidor:
+    """Pico de RSS (y opcionalmente de Python) durante un trabajo"""
+
+    def __init__(self, limite=None, intervalo=0.2, python=False):
+        self.limite = limite
+        self.intervalo = intervalo
+        self.python = python
+        self.rss_inicial = None
+        self.rss_pico = None
+        self.python_pico = None
+        # Pico de RSS mientras cada etapa estuvo activa (metricas.cronometro)
+        self.etapas = {}
+        self._activas = set()
+        self._trazando = False
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def muestrear(self):
+        rss = rss_actual()
+        if rss is not None:
+            self.rss_pico = rss if self.rss_pico is None else max(self.rss_pico, rss)
+            # tuple() copia el conjunto sin soltar el GIL: el hilo de muestreo no choca con etapa()
+            for nombre in tuple(self._activas):
+                self.etapas[nombre] = max(self.etapas.get(nombre, 0), rss)
+        return rss
+
+    def _muestrear_periodicamente(self):
+        while not self._detener.wait(self.intervalo):
+            self.muestrear()
+
+    def iniciar(self):
+        self.rss_inicial = self.rss_pico = rss_actual()
+        # tracemalloc es de todo el proceso: si ya lo usa otro (un benchmark) no se toca
+        if self.python and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._trazando = True
+        if self.intervalo and self.rss_inicial is not None:
+            self._hilo = threading.Thread(target=self._muestrear_periodicamente, name="medidor-memoria", daemon=True)
+            self._hilo.start()
+
+    def finalizar(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        self.muestrear()
+        if self._trazando:
+            self.python_pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self._trazando = False
+
+    @property
+    def crecimiento(self):
+        """Crecimiento máximo del RSS sobre el inicial, en bytes"""
+        if self.rss_inicial is None:
+            return None
+        return max(0, self.rss_pico - self.rss_inicial)
+
+    def verificar(self, adicional=0):
+        """
+        Lanza ``MemoriaExcedida`` si el crecimiento del RSS, más ``adicional``
+        bytes que se está por reservar, supera el límite del trabajo.
+        """
+        rss = self.muestrear()
+        if self.limite is None or rss is None:
+            return
+        uso = rss - self.rss_inicial + adicional
+        if uso > self.limite:
+            raise MemoriaExcedida(
+                f"El trabajo necesita {uso / MB:.0f} MB y el límite es {self.limite / MB:.0f} MB"
+            )
+
+    def resumen(self):
+        return {
+            "rss_inicial_mb": _en_mb(self.rss_inicial),
+            "rss_pico_mb": _en_mb(self.rss_pico),
+            "crecimiento_mb": _en_mb(self.crecimiento),
+            "python_pico_mb": _en_mb(self.python_pico),
+            "etapas_mb": {nombre: _en_mb(pico) for nombre, pico in self.etapas.items()},
+        }
+
+
+def _en_mb(valor):
+    return None if valor is None else round(valor / MB, 1)
+
+
+@contextmanager
+def medir():
+    """Mide la memoria del bloque; ``verificar()`` adentro usa este medidor"""
+    medidor = Medidor(
+        limite=_limite("MEMORIA_MAX_TRABAJO_MB"),
+        intervalo=getattr(settings, "MEMORIA_MUESTREO", 0.2),
+        python=getattr(settings, "MEMORIA_TRACEMALLOC", False),
+    )
+    medidor.iniciar()
+    token = _medidor.set(medidor)
+    try:
+        yield medidor
+    finally:
+        _medidor.reset(token)
+        medidor.finalizar()
+
+
+@contextmanager
+def etapa(nombre):
+    """Registra el pico de RSS de la etapa en el medidor en curso, si hay uno"""
+    medidor = _medidor.get()
+    if medidor is None:
+        yield
+        return
+    medidor._activas.add(nombre)
+    medidor.muestrear()
+    try:
+        yield
+    finally:
+        medidor.muestrear()
+        medidor._activas.discard(nombre)
+
+
+def verificar(adicional=0):
+    """Punto de control del trabajo en curso (sin ``medir()`` no hace nada)"""
+    medidor = _medidor.get()
+    if medidor is not None:
+        medidor.verificar(adicional)
+
+
+# -------------------------
+# Presupuesto de páginas
+# -------------------------
+def verificar_paginas(cantidad):
+    maximo = getattr(settings, "PDF_MAX_PAGINAS", 0)
+    if maximo and cantidad > maximo:
+        raise PresupuestoExcedido(f"El PDF tiene {cantidad} páginas y el máximo es {maximo}")
+
+
+def pixeles(ancho, alto, dpi):
+    """Píxeles de una página de ``ancho`` x ``alto`` puntos renderizada a ``dpi``"""
+    return math.ceil(ancho * dpi / 72) * math.ceil(alto * dpi / 72)
+
+
+def dpi_para(ancho, alto):
+    """
+    Resolución de OCR para una página de ``ancho`` x ``alto`` puntos: la de
+    ``OCR_DPI``, o la mayor que entre en ``OCR_MAX_PIXELES_PAGINA``. Lanza
+    ``PresupuestoExcedido`` si ni con ``OCR_DPI_MIN`` entra.
+    """
+    dpi = getattr(settings, "OCR_DPI", 200)
+    maximo = getattr(settings, "OCR_MAX_PIXELES_PAGINA", 0)
+    if not maximo or pixeles(ancho, alto, dpi) <= maximo:
+        return dpi
+    dpi = int(dpi * math.sqrt(maximo / pixeles(ancho, alto, dpi)))
+    while dpi > 0 and pixeles(ancho, alto, dpi) > maximo:
+        dpi -= 1
+    minimo = getattr(settings, "OCR_DPI_MIN", 100)
+    if dpi < minimo:
+        raise PresupuestoExcedido(
+            f"Una página de {ancho / 72 * 25.4:.0f} x {alto / 72 * 25.4:.0f} mm no entra en "
+            f"{maximo} píxeles a {minimo} dpi"
+        )
+    logger.info(f"Página de {ancho:.0f} x {alto:.0f} pt: OCR a {dpi} dpi para no superar {maximo} píxeles")
+    return dpi
+
+
+# -------------------------
+# Reciclado del worker
+# -------------------------
+def debe_reciclar():
+    """El RSS del proceso pasó ``COLA_RECICLAR_RSS_MB`` (conviene reiniciarlo)"""
+    limite = _limite("COLA_RECICLAR_RSS_MB")
+    rss = rss_actual()
+    return limite is not None and rss is not None and rss > limite
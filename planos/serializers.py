@@ -1,13 +1,91 @@
+from django.conf import settings
+from django.db import models
+from django.template.defaultfilters import filesizeformat
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Plano
+from .models import LoteCarga, Plano, Propietario, TrabajoProcesamiento
 
+# Columnas de la base que necesita cada campo calculado del serializer
+_COLUMNAS_RESULTADO = [
+    'resultado__compresion', 'resultado__texto_comprimido',
+    'resultado__datos_comprimidos', 'resultado__datos_con_texto',
+]
+COLUMNAS_POR_CAMPO = {
+    'estado_display': ['estado'],
+    'usuario_username': ['usuario__username'],
+    'archivo_pdf_url': ['archivo_pdf'],
+    'texto_extraido': _COLUMNAS_RESULTADO,
+    'datos_procesados': _COLUMNAS_RESULTADO,
+}
 
-class PlanoSerializer(serializers.ModelSerializer):
+
+def _lista_param(request, nombre):
+    valor = request.query_params.get(nombre, '') if request is not None else ''
+    return {c.strip() for c in valor.split(',') if c.strip()}
+
+
+class CamposDinamicosMixin:
+    """
+    Sparse fieldsets: ``?fields=id,titulo`` limita los campos de la
+    respuesta y ``?exclude=texto_extraido`` los quita.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        for nombre in set(self.fields) - self.campos_pedidos(request, self.Meta.fields):
+            self.fields.pop(nombre)
+
+    @staticmethod
+    def campos_pedidos(request, disponibles):
+        campos = _lista_param(request, 'fields') & set(disponibles) or set(disponibles)
+        return campos - _lista_param(request, 'exclude')
+
+    @classmethod
+    def columnas(cls, request):
+        """Columnas (para ``only()``) y relaciones (para ``select_related()``) necesarias"""
+        columnas, relaciones = {'id'}, set()
+        for campo in cls.campos_pedidos(request, cls.Meta.fields):
+            for columna in COLUMNAS_POR_CAMPO.get(campo, [campo]):
+                columnas.add(columna)
+                if '__' in columna:
+                    relaciones.add(columna.split('__')[0])
+        return sorted(columnas), sorted(relaciones)
+
+
+def url_archivo(archivo, request=None):
+    """
+    URL de ``archivo_media`` para el archivo: toda descarga pasa por la
+    verificación de permisos. ``storage.url()`` no sirve (con S3 es una URL
+    firmada que cualquiera que la lea puede usar).
+    """
+    if not archivo:
+        return None
+    url = reverse('archivo_media', args=[archivo.name])
+    return request.build_absolute_uri(url) if request else url
+
+
+class ArchivoProtegidoField(serializers.FileField):
+    """``FileField`` que publica la URL protegida (``url_archivo``)"""
+
+    def to_representation(self, value):
+        return url_archivo(value, self.context.get('request'))
+
+
+# Los FileField del modelo se publican con ArchivoProtegidoField
+CAMPOS_CON_ARCHIVO_PROTEGIDO = {
+    **serializers.ModelSerializer.serializer_field_mapping,
+    models.FileField: ArchivoProtegidoField,
+}
+
+
+class PlanoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para el modelo Plano"""
     
     estado_display = serializers.CharField(source='get_estado_display', read_only=True)
     usuario_username = serializers.CharField(source='usuario.username', read_only=True)
     archivo_pdf_url = serializers.SerializerMethodField()
+    serializer_field_mapping = CAMPOS_CON_ARCHIVO_PROTEGIDO
     
     class Meta:
         model = Plano
@@ -37,15 +115,10 @@ class PlanoSerializer(serializers.ModelSerializer):
     
     def get_archivo_pdf_url(self, obj):
         """Obtener URL completa del archivo PDF"""
-        if obj.archivo_pdf:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.archivo_pdf.url)
-            return obj.archivo_pdf.url
-        return None
+        return url_archivo(obj.archivo_pdf, self.context.get('request'))
 
 
-class PlanoListSerializer(serializers.ModelSerializer):
+class PlanoListSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer simplificado para listar planos"""
     
     estado_display = serializers.CharField(source='get_estado_display', read_only=True)
@@ -67,6 +140,8 @@ class PlanoListSerializer(serializers.ModelSerializer):
 class PlanoCreateSerializer(serializers.ModelSerializer):
     """Serializer para crear un plano"""
     
+    serializer_field_mapping = CAMPOS_CON_ARCHIVO_PROTEGIDO
+
     class Meta:
         model = Plano
         fields = [
@@ -81,9 +156,12 @@ class PlanoCreateSerializer(serializers.ModelSerializer):
         if not value.name.endswith('.pdf'):
             raise serializers.ValidationError('El archivo debe ser un PDF.')
         
-        # Validar tamaño (10MB máximo)
-        if value.size > 10 * 1024 * 1024:
-            raise serializers.ValidationError('El archivo no debe superar los 10MB.')
+        # Validar tamaño
+        max_bytes = getattr(settings, 'PLANO_MAX_BYTES', 10 * 1024 * 1024)
+        if value.size > max_bytes:
+            raise serializers.ValidationError(
+                f'El archivo no debe superar {filesizeformat(max_bytes)}; use /api/cargas/ para archivos grandes.'
+            )
         
         return value
     
@@ -104,4 +182,60 @@ class PlanoUpdateSerializer(serializers.ModelSerializer):
         fields = [
             'titulo',
             'descripcion',
-        ]
\ No newline at end of file
+        ]
+
+
+class PropietarioSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Propietario
+        fields = ['nombre', 'dni', 'cuil']
+
+
+class RegistrosPlanoSerializer(serializers.ModelSerializer):
+    """Tablas normalizadas de un plano"""
+
+    propietarios = PropietarioSerializer(many=True, read_only=True)
+    padrones = serializers.SlugRelatedField(many=True, read_only=True, slug_field='numero')
+    dominios = serializers.SlugRelatedField(many=True, read_only=True, slug_field='matricula')
+    lados = serializers.SerializerMethodField()
+    coordenadas = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Plano
+        fields = ['id', 'titulo', 'propietarios', 'padrones', 'dominios', 'lados', 'coordenadas']
+
+    def get_lados(self, obj):
+        return list(obj.lados.values('vertice', 'rumbo', 'lado', 'medida', 'angulo', 'linderos'))
+
+    def get_coordenadas(self, obj):
+        return list(obj.coordenadas.values('punto', 'latitud', 'longitud', 'norte_gk', 'este_gk'))
+
+
+class TrabajoSerializer(serializers.ModelSerializer):
+    archivo = serializers.CharField(source='plano.archivo_pdf.name', read_only=True)
+    plano_estado = serializers.CharField(source='plano.estado', read_only=True)
+
+    class Meta:
+        model = TrabajoProcesamiento
+        fields = [
+            'id', 'plano', 'archivo', 'estado', 'plano_estado', 'intentos', 'error', 'perfilar',
+            'fecha_creacion', 'fecha_inicio', 'fecha_fin',
+        ]
+
+
+class LoteCargaSerializer(serializers.ModelSerializer):
+    """Estado de un lote: cantidad de trabajos por estado y el detalle de cada uno"""
+
+    resumen = serializers.SerializerMethodField()
+    trabajos = TrabajoSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = LoteCarga
+        fields = ['id', 'fecha_creacion', 'resumen', 'rechazados', 'trabajos']
+
+    def get_resumen(self, obj):
+        resumen = {estado: 0 for estado, _ in TrabajoProcesamiento.ESTADO_CHOICES}
+        for trabajo in obj.trabajos.all():
+            resumen[trabajo.estado] += 1
+        resumen['total'] = sum(resumen.values())
+        return resumen
@@ -1,23 +1,90 @@
 import os
+
 from django.conf import settings
+
+from . import aislamiento, cache_niveles, metricas, recursos
+from .storage import es_ruta_contenido
+from .utils.cache_archivos import ruta_local
 from .utils.pdf_processor import PDFProcessor
 from .utils.docx_generator import DocxGenerator
 from .models import Plano
 
-def procesar_pdf(plano: Plano):
-    # 1. Procesar el PDF y extraer datos
-    processor = PDFProcessor(plano.archivo_pdf.path)
-    datos = processor.extract_data()
+
+def _extraer(plano, cancelado=None):
+    with metricas.cronometro("descarga"):
+        ruta = ruta_local(plano.archivo_pdf.storage, plano.archivo_pdf.name)
+    metricas.anotar("bytes", os.path.getsize(ruta))
+    # En un proceso aparte, con tiempo límite y cancelable (planos.aislamiento)
+    return aislamiento.extraer(ruta, cancelado=cancelado)
+
+
+def _anotar_memoria(medicion, memoria):
+    medicion["memoria"] = memoria.resumen()
+    crecimientos = [memoria.crecimiento]
+    # Con la extracción aislada el pico suele estar en el proceso hijo
+    extraccion = medicion.get("memoria_extraccion") or {}
+    if extraccion.get("crecimiento_mb") is not None:
+        crecimientos.append(extraccion["crecimiento_mb"] * recursos.MB)
+    crecimientos = [c for c in crecimientos if c is not None]
+    if crecimientos:
+        metricas.PLANO_MEMORIA.observar(max(crecimientos))
+
+
+def procesar_pdf(plano: Plano, usar_cache=True, cancelado=None):
+    """
+    Extrae los datos del PDF y genera la memoria. ``cancelado``, si se pasa,
+    se consulta durante la extracción y antes de generar la memoria; cuando
+    devuelve verdadero se lanza ``aislamiento.Cancelado``.
+    """
+    # Las etapas y el pico de memoria se miden (planos.metricas, planos.recursos)
+    # y quedan en plano.metricas, también si el procesamiento falla
+    with metricas.medir_plano() as medicion:
+        try:
+            with metricas.cronometro("total"), recursos.medir() as memoria:
+                _procesar(plano, usar_cache, cancelado)
+        except Exception:
+            metricas.PLANOS_PROCESADOS.inc(resultado="error")
+            _anotar_memoria(medicion, memoria)
+            Plano.objects.filter(id=plano.id).update(metricas=medicion)
+            raise
+        metricas.PLANOS_PROCESADOS.inc(resultado="ok")
+        _anotar_memoria(medicion, memoria)
+        if medicion["paginas"]:
+            metricas.PLANO_PAGINAS.observar(medicion["paginas"])
+
+    plano.metricas = medicion
+    plano.save(update_fields=["metricas"])
+    return plano
+
+
+def _procesar(plano, usar_cache, cancelado):
+    # 1. Procesar el PDF y extraer datos (con storage remoto, desde la caché local).
+    # Los PDF guardados por contenido se extraen una vez: un duplicado reutiliza
+    # los datos desde la caché compartida (y no suma etapas de extracción).
+    nombre = plano.archivo_pdf.name
+    with metricas.cronometro("extraccion"):
+        if usar_cache and es_ruta_contenido(nombre):
+            extracciones = cache_niveles.espacio("extraccion", ttl=settings.CACHE_EXTRACCION_TTL)
+            digest = os.path.splitext(os.path.basename(nombre))[0]
+            datos = extracciones.obtener_o_calcular(
+                f"{digest}:{PDFProcessor.VERSION}",
+                lambda: _extraer(plano, cancelado),
+                # Quien extrae el mismo PDF puede tardar hasta su timeout (OCR)
+                espera=settings.EXTRACCION_TIMEOUT + settings.CACHE_ESPERA,
+            )
+        else:
+            datos = _extraer(plano, cancelado)
+    if cancelado is not None and cancelado():
+        raise aislamiento.Cancelado("Procesamiento cancelado")
     plano.texto_extraido = datos.get("texto_completo", "")
     plano.datos_procesados = datos
 
     # 2. Generar la memoria descriptiva en Word
     generator = DocxGenerator(plano)
-    memoria_full_path = generator.generate_memoria()  # devuelve la ruta completa
 
-    # 3. Guardar la ruta relativa en el modelo
-    plano.memoria_path = memoria_full_path.replace(str(settings.MEDIA_ROOT) + os.sep, "")
+    # 3. Guardar la ruta del artefacto (relativa al storage "artefactos")
+    with metricas.cronometro("docx"):
+        plano.memoria_path = generator.generate_memoria()
     plano.estado = "completado"
-    plano.save()
-
-    return plano
+    with metricas.cronometro("guardado"):
+        plano.save()
@@ -0,0 +1,419 @@
+"""
+Almacenamiento de archivos: PDF de los planos y artefactos generados.
+
+Backends (se eligen con ``ALMACENAMIENTO`` en settings, ver ``STORAGES``):
+
+- ``local``: disco local bajo ``MEDIA_ROOT``.
+- ``s3``: cualquier almacén compatible con S3 (AWS, MinIO, R2…); requiere
+  ``boto3``.
+- ``objetos_local``: un directorio con la misma semántica que un almacén de
+  objetos (sin rutas locales). Sirve para probar en desarrollo y en los
+  tests que nada dependa de ``FieldFile.path``.
+
+Los PDF de los planos se guardan por contenido: una sola vez con el nombre
+de su SHA-256, repartidos en subdirectorios por los primeros caracteres del
+hash::
+
+    uploads/planos/3f/a2/3fa2…c9.pdf
+
+Subir de nuevo la misma lámina no ocupa más espacio: se suma una referencia
+en ``ArchivoContenido``. ``delete`` resta una y el archivo se borra recién
+cuando ya no lo referencia ningún plano. Con dos niveles de 256
+subdirectorios cada carpeta mantiene pocas entradas aun con millones de
+archivos.
+"""
+
+import hashlib
+import logging
+import os
+import pathlib
+import posixpath
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, Storage, storages
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject, empty
+
+logger = logging.getLogger(__name__)
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - dependencia opcional
+    boto3 = None
+
+BLOQUE = 1024 * 1024
+
+
+def ruta_contenido(directorio, digest, extension):
+    """``directorio/ab/cd/<digest><extension>``"""
+    return posixpath.join(directorio, digest[:2], digest[2:4], f"{digest}{extension.lower()}")
+
+
+def es_ruta_contenido(nombre):
+    partes = nombre.split("/")
+    digest = os.path.splitext(partes[-1])[0]
+    return (
+        len(partes) >= 3
+        and len(digest) == 64
+        and partes[-3] == digest[:2]
+        and partes[-2] == digest[2:4]
+    )
+
+
+def hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(BLOQUE), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+# -------------------------
+# Clientes de almacén de objetos
+# -------------------------
+class ClienteS3:
+    """Operaciones mínimas sobre un bucket compatible con S3"""
+
+    def __init__(self, bucket, endpoint_url=None, region=None, access_key=None, secret_key=None):
+        if boto3 is None:
+            raise ImproperlyConfigured("ALMACENAMIENTO='s3' requiere boto3 (pip install boto3)")
+        if not bucket:
+            raise ImproperlyConfigured("Falta S3_BUCKET")
+        self.bucket = bucket
+        # Los clientes de boto3 se pueden compartir entre hilos
+        self.s3 = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+        )
+
+    def metadatos(self, clave):
+        try:
+            r = self.s3.head_object(Bucket=self.bucket, Key=clave)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return {"tamanio": r["ContentLength"], "modificado": r["LastModified"]}
+
+    def abrir(self, clave):
+        # StreamingBody: se lee del socket a medida que se consume
+        return self.s3.get_object(Bucket=self.bucket, Key=clave)["Body"]
+
+    def subir(self, clave, archivo):
+        # upload_fileobj divide en partes (multipart) los archivos grandes
+        self.s3.upload_fileobj(archivo, self.bucket, clave)
+
+    def borrar(self, clave):
+        self.s3.delete_object(Bucket=self.bucket, Key=clave)
+
+    def listar(self, prefijo):
+        directorios, archivos = [], []
+        paginador = self.s3.get_paginator("list_objects_v2")
+        for pagina in paginador.paginate(Bucket=self.bucket, Prefix=prefijo, Delimiter="/"):
+            directorios += [p["Prefix"][len(prefijo):].rstrip("/") for p in pagina.get("CommonPrefixes", [])]
+            archivos += [o["Key"][len(prefijo):] for o in pagina.get("Contents", [])]
+        return directorios, archivos
+
+    def url(self, clave, expira):
+        return self.s3.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": clave}, ExpiresIn=expira
+        )
+
+
+class ClienteObjetosLocal:
+    """
+    Almacén de objetos sobre un directorio, con la misma interfaz que
+    ``ClienteS3``. Las escrituras son atómicas (temporal + rename) como un
+    PUT, y no expone rutas locales a quien usa el storage.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = str(directorio)
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, *clave.split("/"))
+
+    def metadatos(self, clave):
+        try:
+            st = os.stat(self._ruta(clave))
+        except FileNotFoundError:
+            return None
+        return {
+            "tamanio": st.st_size,
+            "modificado": datetime.fromtimestamp(st.st_mtime, tz=dt_timezone.utc),
+        }
+
+    def abrir(self, clave):
+        return open(self._ruta(clave), "rb")
+
+    def subir(self, clave, archivo):
+        destino = self._ruta(clave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        fd, temporal = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(archivo, f, BLOQUE)
+            os.replace(temporal, destino)
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    def borrar(self, clave):
+        try:
+            os.remove(self._ruta(clave))
+        except FileNotFoundError:
+            pass
+
+    def listar(self, prefijo):
+        directorios, archivos = [], []
+        try:
+            with os.scandir(self._ruta(prefijo.rstrip("/")) if prefijo else self.directorio) as it:
+                for entrada in it:
+                    (directorios if entrada.is_dir() else archivos).append(entrada.name)
+        except FileNotFoundError:
+            pass
+        return directorios, archivos
+
+    def url(self, clave, expira):
+        return pathlib.Path(self._ruta(clave)).as_uri()
+
+
+# -------------------------
+# Storages
+# -------------------------
+@deconstructible(path="planos.storage.AlmacenamientoObjetos")
+class AlmacenamientoObjetos(Storage):
+    """
+    Storage sobre un almacén de objetos (S3 o ``ClienteObjetosLocal``).
+    Las lecturas devuelven el cuerpo en streaming; no hay ``path()``: quien
+    necesite un archivo local usa ``planos.utils.cache_archivos.ruta_local``.
+    Escribir sobre una clave existente la reemplaza.
+    """
+
+    def __init__(self, bucket=None, prefijo="", endpoint_url=None, region=None,
+                 access_key=None, secret_key=None, directorio=None, url_expira=3600):
+        self.prefijo = prefijo.strip("/")
+        self.url_expira = url_expira
+        if directorio:
+            self.cliente = ClienteObjetosLocal(directorio)
+        else:
+            self.cliente = ClienteS3(bucket, endpoint_url, region, access_key, secret_key)
+
+    def _clave(self, name):
+        name = name.replace("\\", "/").lstrip("/")
+        return f"{self.prefijo}/{name}" if self.prefijo else name
+
+    def _open(self, name, mode="rb"):
+        if "w" in mode or "a" in mode or "+" in mode:
+            raise ValueError("Los objetos se escriben con save()")
+        metadatos = self.cliente.metadatos(self._clave(name))
+        if metadatos is None:
+            raise FileNotFoundError(name)
+        archivo = File(self.cliente.abrir(self._clave(name)), name=name)
+        archivo.size = metadatos["tamanio"]
+        return archivo
+
+    def _save(self, name, content):
+        if hasattr(content, "seek"):
+            try:
+                content.seek(0)
+            except (AttributeError, OSError, ValueError):
+                pass
+        self.cliente.subir(self._clave(name), content)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def exists(self, name):
+        return self.cliente.metadatos(self._clave(name)) is not None
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        self.cliente.borrar(self._clave(name))
+
+    def size(self, name):
+        metadatos = self.cliente.metadatos(self._clave(name))
+        if metadatos is None:
+            raise FileNotFoundError(name)
+        return metadatos["tamanio"]
+
+    def get_modified_time(self, name):
+        metadatos = self.cliente.metadatos(self._clave(name))
+        if metadatos is None:
+            raise FileNotFoundError(name)
+        return metadatos["modificado"]
+
+    def listdir(self, path):
+        prefijo = self._clave(path).rstrip("/")
+        return self.cliente.listar(f"{prefijo}/" if prefijo else "")
+
+    def url(self, name):
+        return self.cliente.url(self._clave(name), self.url_expira)
+
+
+class ContenidoMixin:
+    """Deduplica por SHA-256 y cuenta referencias; lo comparten los backends"""
+
+    def _modelo(self):
+        # Diferido: models usa este storage al definir Plano.archivo_pdf
+        return apps.get_model("planos", "ArchivoContenido")
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo sale del contenido; no hace falta buscar uno libre
+        return name
+
+    def _directorio_temporal(self, directorio):
+        """Dónde volcar la subida mientras se hashea (``None``: el temporal del sistema)"""
+        return None
+
+    def _colocar(self, origen, nombre, mover):
+        """Deja ``origen`` en ``nombre`` si ese contenido todavía no está guardado"""
+        raise NotImplementedError
+
+    def _save(self, name, content):
+        directorio = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1]
+
+        if hasattr(content, "temporary_file_path"):
+            # Subida ya volcada a disco por Django: se hashea y se mueve sin copiarla
+            origen = content.temporary_file_path()
+            return self._registrar(
+                origen, directorio, extension, hash_archivo(origen),
+                tamanio=os.path.getsize(origen), mover=True,
+            )
+
+        h = hashlib.sha256()
+        fd, temporal = tempfile.mkstemp(dir=self._directorio_temporal(directorio), suffix=".part")
+        tamanio = 0
+        try:
+            with os.fdopen(fd, "wb") as destino:
+                if hasattr(content, "seek"):
+                    try:
+                        content.seek(0)
+                    except (AttributeError, OSError, ValueError):
+                        pass
+                for bloque in content.chunks(BLOQUE):
+                    h.update(bloque)
+                    destino.write(bloque)
+                    tamanio += len(bloque)
+            return self._registrar(temporal, directorio, extension, h.hexdigest(), tamanio=tamanio)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def guardar_local(self, ruta, nombre, digest):
+        """
+        Incorpora un archivo local ya hasheado (p. ej. una carga por partes)
+        sin volver a leerlo para calcular el hash. Devuelve el nombre guardado.
+        """
+        return self._registrar(
+            ruta, posixpath.dirname(nombre), os.path.splitext(nombre)[1], digest,
+            tamanio=os.path.getsize(ruta), mover=True,
+        )
+
+    def _registrar(self, origen, directorio, extension, digest, tamanio, mover=False):
+        nombre = ruta_contenido(directorio, digest, extension)
+        ArchivoContenido = self._modelo()
+
+        # La referencia y el archivo se actualizan dentro de la misma
+        # transacción que ``delete``: no se borra un archivo recién sumado
+        with transaction.atomic():
+            sumadas = ArchivoContenido.objects.filter(ruta=nombre).update(referencias=F("referencias") + 1)
+            if not sumadas:
+                try:
+                    with transaction.atomic():
+                        ArchivoContenido.objects.create(ruta=nombre, sha256=digest, tamanio=tamanio, referencias=1)
+                except IntegrityError:
+                    ArchivoContenido.objects.filter(ruta=nombre).update(referencias=F("referencias") + 1)
+            self._colocar(origen, nombre, mover)
+        return nombre
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        ArchivoContenido = self._modelo()
+        with transaction.atomic():
+            ArchivoContenido.objects.filter(ruta=name).update(referencias=F("referencias") - 1)
+            borradas, _ = ArchivoContenido.objects.filter(ruta=name, referencias__lte=0).delete()
+            # Archivos sin registro (anteriores a este storage) se borran directamente
+            if borradas or not ArchivoContenido.objects.filter(ruta=name).exists():
+                super().delete(name)
+
+    def referencias(self, name):
+        fila = self._modelo().objects.filter(ruta=name).values_list("referencias", flat=True).first()
+        return fila or 0
+
+
+class AlmacenamientoContenido(ContenidoMixin, FileSystemStorage):
+    """PDF por contenido en disco local"""
+
+    def _directorio_temporal(self, directorio):
+        # Mismo sistema de archivos que el destino: el temporal se renombra
+        os.makedirs(self.path(directorio), exist_ok=True)
+        return self.path(directorio)
+
+    def _colocar(self, origen, nombre, mover):
+        destino = self.path(nombre)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if os.path.exists(destino):
+            logger.info(f"Contenido duplicado, se reutiliza {nombre}")
+            if mover:
+                os.remove(origen)
+            return
+        if mover:
+            file_move_safe(origen, destino, allow_overwrite=True)
+        else:
+            os.replace(origen, destino)
+        if self.file_permissions_mode is not None:
+            os.chmod(destino, self.file_permissions_mode)
+
+
+@deconstructible(path="planos.storage.AlmacenamientoContenidoObjetos")
+class AlmacenamientoContenidoObjetos(ContenidoMixin, AlmacenamientoObjetos):
+    """PDF por contenido en un almacén de objetos (S3 o ``objetos_local``)"""
+
+    def _colocar(self, origen, nombre, mover):
+        if self.exists(nombre):
+            logger.info(f"Contenido duplicado, se reutiliza {nombre}")
+        else:
+            with open(origen, "rb") as f:
+                self.cliente.subir(self._clave(nombre), f)
+        if mover:
+            os.remove(origen)
+
+
+class _AlmacenamientoPlanos(LazyObject):
+    # Como ``default_storage``: se resuelve al usarse y se reinicia si cambia STORAGES
+    def _setup(self):
+        self._wrapped = storages["planos"]
+
+
+_almacenamiento_planos = _AlmacenamientoPlanos()
+
+
+@receiver(setting_changed)
+def _reiniciar_almacenamiento(*, setting, **kwargs):
+    if setting == "STORAGES":
+        _almacenamiento_planos._wrapped = empty
+
+
+def almacenamiento_planos():
+    """Storage de ``Plano.archivo_pdf`` (alias ``planos`` de ``STORAGES``)"""
+    return _almacenamiento_planos
@@ -1,3 +1,1804 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import warnings
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.fields.files import FieldFile
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from docx import Document
+import pdfplumber
+from PIL import Image
+
+from . import (
+    aislamiento, bitacora, busqueda, cache_niveles, cola, descargas, limitador, metricas, perfilado, recursos,
+)
+from .models import (
+    ArchivoContenido, CargaReanudable, Coordenada, Lado, LoteCarga, Plano, PlanoResultado, Propietario,
+    TrabajoProcesamiento,
+)
+from .utils.docx_generator import DocxGenerator
+from .utils.docx_tables import add_table_fast
+from .utils import cache_archivos, pdf_converter
+from .utils.pdf_renderer import PdfMemoriaRenderer
+
+
+DATOS_EJEMPLO = {
+    "departamento": "Capital",
+    "padrones": ["12-345"],
+    "lugar": "La Banda",
+    "propietarios": [{"nombre": "PEREZ JUAN", "dni": "20.123.456", "cuil": "20-20123456-3"}],
+    "dominios": [{"matricula": "MFR 1234"}],
+    "superficies": [{"designacion": "Lote 1", "sup_titulo": "1 Has 2 As 3 Cas"}],
+    "lados": [
+        {"vertice": "1", "lado": "1-2", "mide": "100.00"},
+        {"vertice": "2", "lado": "2-3", "mide": "50.00"},
+    ],
+    "coordenadas": [
+        {"punto": "VERT.1", "latitud": "-27°26'21.3\"", "longitud": "-63°15'07.3\"",
+         "norte_gk": "6965637.114", "este_gk": "4475082.623"},
+    ],
+    "fecha_operaciones": "10 de marzo de 2025",
+    "texto_completo": "PLANO DE MENSURA",
+}
+
+
+class MediaTemporalMixin:
+    """Redirige MEDIA_ROOT a un directorio temporal durante cada test"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self._media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self._media_override.enable()
+
+    def tearDown(self):
+        self._media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+
+class AddTableFastTests(TestCase):
+    def test_mismo_contenido_y_estilo_que_add_row(self):
+        doc = Document()
+        filas = [("1", "a\tb", " x "), ("2", "<&>", "")]
+        table = add_table_fast(doc, ["A", "B", "C"], filas)
+
+        self.assertEqual(len(table.rows), 3)
+        self.assertEqual(table.style.name, "Table Grid")
+        self.assertTrue(table.rows[0].cells[0].paragraphs[0].runs[0].bold)
+        self.assertEqual([c.text for c in table.rows[1].cells], ["1", "a\tb", " x "])
+        self.assertEqual([c.text for c in table.rows[2].cells], ["2", "<&>", ""])
+
+    def test_completa_filas_cortas(self):
+        doc = Document()
+        table = add_table_fast(doc, ["A", "B"], [["solo"]], style=None, bold_header=False)
+        self.assertEqual([c.text for c in table.rows[1].cells], ["solo", ""])
+
+
+class DocxGeneratorTests(MediaTemporalMixin, TestCase):
+    def test_genera_tablas_de_lados_y_coordenadas(self):
+        plano = Plano.objects.create(titulo="Plano test", archivo_pdf="uploads/planos/x.pdf",
+                                     datos_procesados=DATOS_EJEMPLO)
+        ruta = DocxGenerator(plano).generate_memoria()
+
+        doc = Document(f"{self.media_root}/{ruta}")
+        textos = [[c.text for c in row.cells] for t in doc.tables for row in t.rows]
+        self.assertIn(["2", "—", "2-3", "50.00", "—", "—"], textos)
+        self.assertIn(["VERT.1", "-27°26'21.3\"", "-63°15'07.3\"", "6965637.114", "4475082.623"], textos)
+
+
+class ArtifactStoreTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.plano = Plano.objects.create(titulo="Plano test", archivo_pdf="uploads/planos/x.pdf",
+                                          datos_procesados=DATOS_EJEMPLO, estado="completado")
+
+    def test_reutiliza_memoria_si_los_datos_no_cambian(self):
+        ruta = DocxGenerator(self.plano).generate_memoria()
+        mtime = os.path.getmtime(os.path.join(self.media_root, ruta))
+
+        self.assertEqual(DocxGenerator(self.plano).generate_memoria(), ruta)
+        self.assertEqual(os.path.getmtime(os.path.join(self.media_root, ruta)), mtime)
+
+        self.plano.datos_procesados = {**DATOS_EJEMPLO, "lugar": "Otro lugar"}
+        self.assertNotEqual(DocxGenerator(self.plano).generate_memoria(), ruta)
+
+    def test_descarga_con_etag_y_304(self):
+        self.plano.memoria_path = DocxGenerator(self.plano).generate_memoria()
+        self.plano.save()
+        admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(admin)
+        url = reverse("descargar_memoria", args=[self.plano.id])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_gc_elimina_solo_huerfanos(self):
+        self.plano.memoria_path = DocxGenerator(self.plano).generate_memoria()
+        self.plano.save()
+        huerfano = os.path.join(self.media_root, "outputs", "memorias", "Memoria_1_20250101_000000.docx")
+        with open(huerfano, "wb") as f:
+            f.write(b"viejo")
+
+        call_command("gc_artefactos", edad_minima=0, stdout=io.StringIO())
+
+        self.assertFalse(os.path.exists(huerfano))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, self.plano.memoria_path)))
+
+
+class PdfConverterCacheTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.docx = os.path.join(self.media_root, "memoria.docx")
+        with open(self.docx, "wb") as f:
+            f.write(b"contenido docx")
+
+    def _convertir_falso(self, origen, destino):
+        with open(destino, "wb") as f:
+            f.write(b"%PDF-1.4 falso")
+
+    def test_convierte_una_sola_vez_por_contenido(self):
+        pool = mock.Mock()
+        pool.convert.side_effect = self._convertir_falso
+        with mock.patch.object(pdf_converter, "get_converter", return_value=pool):
+            primero = pdf_converter.convert_docx_to_pdf(self.docx)
+            segundo = pdf_converter.convert_docx_to_pdf(self.docx)
+
+        self.assertEqual(primero, segundo)
+        self.assertEqual(pool.convert.call_count, 1)
+        self.assertEqual(pdf_converter.docx_for_cached_pdf(primero), self.docx)
+
+    def test_invalida_cache_si_cambia_el_docx(self):
+        pool = mock.Mock()
+        pool.convert.side_effect = self._convertir_falso
+        with mock.patch.object(pdf_converter, "get_converter", return_value=pool):
+            primero = pdf_converter.convert_docx_to_pdf(self.docx)
+            with open(self.docx, "wb") as f:
+                f.write(b"otro contenido")
+            segundo = pdf_converter.convert_docx_to_pdf(self.docx)
+
+        self.assertNotEqual(primero, segundo)
+        self.assertFalse(os.path.exists(primero))
+        self.assertEqual(pool.convert.call_count, 2)
+
+
+UNOSERVER_FALSO = """
+import argparse, os
+from xmlrpc.server import SimpleXMLRPCServer
+
+parser = argparse.ArgumentParser()
+for opcion in ("--interface", "--port", "--uno-port", "--executable", "--user-installation"):
+    parser.add_argument(opcion)
+args = parser.parse_args()
+servidor = SimpleXMLRPCServer((args.interface, int(args.port)), allow_none=True, logRequests=False)
+
+def convert(inpath, indata, outpath, convert_to, filtername):
+    with open(outpath, "wb") as f:
+        f.write(b"%PDF-1.4 " + str(os.getpid()).encode())
+
+servidor.register_function(convert)
+servidor.serve_forever()
+"""
+
+
+@mock.patch.object(pdf_converter, "uno", None)
+class PdfConverterPoolTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.unoserver = os.path.join(self.media_root, "unoserver")
+        with open(self.unoserver, "w") as f:
+            f.write(f"#!{sys.executable}\n{UNOSERVER_FALSO}")
+        os.chmod(self.unoserver, 0o755)
+        self.docx = os.path.join(self.media_root, "memoria.docx")
+        with open(self.docx, "wb") as f:
+            f.write(b"contenido docx")
+
+    def test_unoserver_persistente_sin_uno(self):
+        pool = pdf_converter.PdfConverterPool(workers=1, timeout=10, soffice="/bin/true", unoserver=self.unoserver)
+        self.addCleanup(pool.close)
+        self.assertEqual(pool.modo, "unoserver")
+
+        salidas = []
+        for i in range(2):
+            destino = os.path.join(self.media_root, f"salida{i}.pdf")
+            pool.convert(self.docx, destino)
+            with open(destino, "rb") as f:
+                salidas.append(f.read())
+        # Las dos conversiones las hizo el mismo proceso, que sigue vivo
+        proceso = pool._workers[0].proceso
+        self.assertEqual(salidas, [b"%PDF-1.4 " + str(proceso.pid).encode()] * 2)
+        self.assertIsNone(proceso.poll())
+
+    def test_sin_conversor_persistente_falla(self):
+        with mock.patch.object(pdf_converter.shutil, "which", return_value=None):
+            with self.assertRaises(pdf_converter.ConversionError):
+                pdf_converter.PdfConverterPool(workers=1, soffice="/bin/true")
+            pool = pdf_converter.PdfConverterPool(workers=1, soffice="/bin/true", permitir_cli=True)
+        self.addCleanup(pool.close)
+        self.assertEqual(pool.modo, "cli")
+
+
+class PdfRendererTests(TestCase):
+    def setUp(self):
+        self.plano = Plano.objects.create(titulo="Plano test", archivo_pdf="uploads/planos/x.pdf",
+                                          datos_procesados=DATOS_EJEMPLO, estado="completado")
+        admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(admin)
+
+    def test_descarga_pdf_directo_en_streaming(self):
+        response = self.client.get(reverse("descargar_memoria_pdf_directo", args=[self.plano.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        contenido = b"".join(response.streaming_content)
+        self.assertTrue(contenido.startswith(b"%PDF-1.4"))
+        self.assertTrue(contenido.rstrip().endswith(b"%%EOF"))
+
+        with pdfplumber.open(io.BytesIO(contenido)) as pdf:
+            texto = "\n".join(page.extract_text() for page in pdf.pages)
+        self.assertIn("MEMORIA DESCRIPTIVA", texto)
+        self.assertIn("PLANILLA DE LADOS", texto)
+        self.assertIn("6965637.114", texto)
+
+
+class ExportacionZipTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, "uploads", "planos"))
+        for i in range(3):
+            nombre = f"uploads/planos/p{i}.pdf"
+            with open(os.path.join(self.media_root, nombre), "wb") as f:
+                f.write(b"%PDF-1.4 original")
+            Plano.objects.create(titulo=f"Plano {i}", archivo_pdf=nombre,
+                                 datos_procesados=DATOS_EJEMPLO, estado="completado")
+        Plano.objects.create(titulo="Pendiente", archivo_pdf="uploads/planos/x.pdf")
+        admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(admin)
+
+    def test_zip_en_streaming_con_filtros(self):
+        response = self.client.get(reverse("exportar_planos"), {"estado": "completado"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        contenido = b"".join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+            self.assertIsNone(zf.testzip())
+            nombres = zf.namelist()
+            self.assertEqual(len(nombres), 12)
+            primero = [n for n in nombres if n.endswith("/original.pdf")][0]
+            self.assertEqual(zf.read(primero), b"%PDF-1.4 original")
+            pdf = [n for n in nombres if n.endswith("/memoria.pdf")][0]
+            self.assertTrue(zf.read(pdf).startswith(b"%PDF-1.4"))
+        self.assertFalse(any(n.startswith(f"{Plano.objects.get(titulo='Pendiente').id}_") for n in nombres))
+
+    def test_comando_reutiliza_artefactos(self):
+        salida = os.path.join(self.media_root, "export.zip")
+        call_command("exportar_memorias", formatos="docx,json", salida=salida, stdout=io.StringIO())
+        memorias = os.path.join(self.media_root, "outputs", "memorias")
+        generados = sorted(os.path.join(r, f) for r, _, fs in os.walk(memorias) for f in fs)
+        mtimes = [os.path.getmtime(r) for r in generados]
+
+        call_command("exportar_memorias", formatos="docx,json", salida=salida, stdout=io.StringIO())
+        self.assertEqual([os.path.getmtime(r) for r in generados], mtimes)
+        with zipfile.ZipFile(salida) as zf:
+            self.assertEqual(len([n for n in zf.namelist() if n.endswith(".docx")]), 3)
+
+
+@override_settings(LISTA_PLANOS_POR_PAGINA=4)
+class ListaPlanosKeysetTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(self.admin)
+        ahora = timezone.now()
+        for i in range(10):
+            plano = Plano.objects.create(titulo=f"Plano {i}", archivo_pdf="uploads/planos/x.pdf",
+                                         usuario=self.admin, estado="completado" if i % 2 else "error")
+            # Dos planos por instante para ejercitar el desempate por id
+            Plano.objects.filter(id=plano.id).update(fecha_carga=ahora - timedelta(minutes=i // 2))
+
+    def _titulos(self, response):
+        return [p.titulo for p in response.context["planos"]]
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        url = reverse("lista_planos")
+        response = self.client.get(url)
+        vistos = self._titulos(response)
+        while response.context["pagina"].hay_siguiente:
+            response = self.client.get(url, {"despues": response.context["pagina"].siguiente})
+            vistos += self._titulos(response)
+        esperado = list(Plano.objects.order_by("-fecha_carga", "-id").values_list("titulo", flat=True))
+        self.assertEqual(vistos, esperado)
+
+        # Volver una página reproduce la anterior
+        anterior = self.client.get(url, {"antes": response.context["pagina"].anterior})
+        self.assertEqual(self._titulos(anterior), esperado[4:8])
+
+    def test_filtra_por_estado_y_no_carga_columnas_pesadas(self):
+        response = self.client.get(reverse("lista_planos"), {"estado": "error"})
+        planos = response.context["planos"]
+        self.assertTrue(all(p.estado == "error" for p in planos))
+        self.assertIn("descripcion", {f.attname for f in Plano._meta.concrete_fields} - planos[0].get_deferred_fields())
+        self.assertNotIn("resultado", planos[0]._state.fields_cache)
+
+    def test_cantidad_de_consultas_constante(self):
+        with CaptureQueriesContext(connection) as pocas:
+            self.client.get(reverse("lista_planos"), {"estado": "error"})
+        with CaptureQueriesContext(connection) as muchas:
+            self.client.get(reverse("lista_planos"))
+        self.assertEqual(len(pocas), len(muchas))
+
+
+class PlanoResultadoTests(TestCase):
+    def test_guarda_comprimido_sin_duplicar_texto(self):
+        texto = "PLANO DE MENSURA " * 500
+        plano = Plano.objects.create(titulo="Plano", archivo_pdf="uploads/planos/x.pdf",
+                                     datos_procesados={**DATOS_EJEMPLO, "texto_completo": texto},
+                                     texto_extraido=texto)
+
+        resultado = PlanoResultado.objects.get(plano=plano)
+        self.assertTrue(resultado.datos_con_texto)
+        self.assertLess(len(resultado.texto_comprimido), resultado.tamanio_texto / 10)
+        self.assertLess(resultado.tamanio_datos, len(texto))
+        self.assertEqual(Plano.objects.get(id=plano.id).departamento, "Capital")
+
+        recargado = Plano.objects.select_related("resultado").get(id=plano.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(recargado.datos_procesados["texto_completo"], texto)
+            self.assertEqual(recargado.texto_extraido, texto)
+            self.assertEqual(recargado.datos_procesados["lados"], DATOS_EJEMPLO["lados"])
+
+    def test_listado_no_lee_resultados(self):
+        Plano.objects.create(titulo="Plano", archivo_pdf="uploads/planos/x.pdf", datos_procesados=DATOS_EJEMPLO)
+        plano = Plano.objects.get()
+        self.assertNotIn("resultado", plano._state.fields_cache)
+        self.assertIsNone(Plano.objects.create(titulo="Otro", archivo_pdf="x.pdf").datos_procesados)
+
+    def test_cambios_en_el_lugar_requieren_reasignar(self):
+        creado = Plano.objects.create(titulo="Plano", archivo_pdf="uploads/planos/x.pdf", datos_procesados=DATOS_EJEMPLO)
+        plano = Plano.objects.get(id=creado.id)
+
+        plano.datos_procesados["departamento"] = "Banda"
+        plano.save()
+        self.assertEqual(Plano.objects.get(id=plano.id).datos_procesados["departamento"], "Capital")
+
+        plano.datos_procesados = {**plano.datos_procesados, "departamento": "Banda"}
+        plano.save()
+        recargado = Plano.objects.get(id=plano.id)
+        self.assertEqual(recargado.datos_procesados["departamento"], "Banda")
+        self.assertEqual(recargado.departamento, "Banda")
+
+
+class RegistrosNormalizadosTests(TestCase):
+    def setUp(self):
+        self.plano = Plano.objects.create(titulo="Plano", archivo_pdf="uploads/planos/x.pdf",
+                                          datos_procesados=DATOS_EJEMPLO, estado="completado")
+        Plano.objects.create(titulo="Otro", archivo_pdf="uploads/planos/y.pdf",
+                             datos_procesados={**DATOS_EJEMPLO, "propietarios": [], "dominios": []})
+
+    def test_guardar_datos_regenera_registros(self):
+        self.assertEqual(Propietario.objects.get(plano=self.plano).dni, "20123456")
+        self.assertEqual(Lado.objects.filter(plano=self.plano).count(), 2)
+        self.assertEqual(Coordenada.objects.get(plano=self.plano).norte_gk, 6965637.114)
+
+        self.plano.datos_procesados = {**DATOS_EJEMPLO, "lados": DATOS_EJEMPLO["lados"][:1]}
+        self.plano.save()
+        self.assertEqual(Lado.objects.filter(plano=self.plano).count(), 1)
+
+    def test_api_busca_por_documento_padron_y_matricula(self):
+        url = reverse("plano-buscar")
+        self.client.force_login(User.objects.create_user("consulta", password="clave-segura-123"))
+        for params in ({"dni": "20.123.456"}, {"cuil": "20-20123456-3"}, {"matricula": "mfr  1234"},
+                       {"padron": "12-345", "dni": "20123456"}):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([p["id"] for p in response.json()["results"]], [self.plano.id])
+
+        self.assertEqual(len(self.client.get(url, {"padron": "12-345"}).json()["results"]), 2)
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_api_busqueda_anonima_rechazada(self):
+        response = self.client.get(reverse("plano-buscar"), {"dni": "20.123.456"})
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_api_registros_de_un_plano(self):
+        url = reverse("plano-registros", args=[self.plano.id])
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+
+        self.client.force_login(User.objects.create_user("consulta", password="clave-segura-123"))
+        response = self.client.get(url)
+        self.assertEqual(response.json()["dominios"], ["MFR 1234"])
+        self.assertEqual(response.json()["lados"][1]["medida"], 50.0)
+
+
+class BusquedaTextoTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(self.admin)
+        self.plano = Plano.objects.create(
+            titulo="Mensura Norte", archivo_pdf="uploads/planos/x.pdf", estado="completado",
+            datos_procesados={**DATOS_EJEMPLO, "texto_completo": "LUGAR: COLONIA EL YACARÉ linda con <Pérez>"},
+        )
+        Plano.objects.create(titulo="Otro", archivo_pdf="uploads/planos/y.pdf", datos_procesados=DATOS_EJEMPLO)
+
+    def test_busca_sin_acentos_y_resalta(self):
+        response = self.client.get(reverse("buscar_planos"), {"q": "perez yacare"})
+        self.assertEqual(response.context["total"], 1)
+        self.assertContains(response, "<mark>Pérez</mark>", html=False)
+        self.assertContains(response, "&lt;")
+
+    def test_reproceso_actualiza_indice_y_borrado_lo_limpia(self):
+        self.plano.datos_procesados = {**DATOS_EJEMPLO, "texto_completo": "CAMPO LOS QUEBRACHOS"}
+        self.plano.save()
+        self.assertEqual(busqueda.buscar("yacare")[0], 0)
+        self.assertEqual(busqueda.buscar("quebra")[0], 1)
+
+        self.plano.delete()
+        self.assertEqual(busqueda.buscar("quebrachos")[0], 0)
+
+    def test_renombrar_reindexa_el_titulo(self):
+        self.assertEqual(busqueda.buscar("Norte")[0], 1)
+        plano = Plano.objects.get(id=self.plano.id)
+        plano.titulo = "Mensura Quimili"
+        plano.save()
+        self.assertEqual(busqueda.buscar("Norte")[0], 0)
+        self.assertEqual(busqueda.buscar("Quimili")[0], 1)
+        self.assertEqual(busqueda.buscar("Yacare")[0], 1)
+
+        plano.titulo = "Mensura Zanjon"
+        plano.save(update_fields=["titulo"])
+        self.assertEqual(busqueda.buscar("Zanjon")[0], 1)
+
+        # Sin procesar también se busca por título
+        Plano.objects.create(titulo="Loteo Clodomira", archivo_pdf="uploads/planos/z.pdf")
+        self.assertEqual(busqueda.buscar("Clodomira")[0], 1)
+        plano = Plano.objects.get(id=plano.id)
+        with self.assertNumQueries(1):
+            plano.save(update_fields=["estado"])
+
+    def test_borrado_masivo_sin_trigger(self):
+        # El índice no depende de un trigger que SQLite pierde al rehacer la tabla
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        Plano.objects.filter(titulo__in=["Mensura Norte", "Otro"]).delete()
+        self.assertEqual(busqueda.buscar("la banda")[0], 0)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {busqueda.TABLA}")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_api_paginada(self):
+        for i in range(12):
+            Plano.objects.create(titulo=f"Plano {i}", archivo_pdf="uploads/planos/x.pdf",
+                                 datos_procesados={**DATOS_EJEMPLO, "texto_completo": "Quebrachos " * (i + 1)})
+        data = self.client.get(reverse("plano-texto"), {"q": "quebrachos"}).json()
+        self.assertEqual(data["count"], 12)
+        self.assertEqual(len(data["results"]), 10)
+        self.assertIn("<mark>", data["results"][0]["fragmento"])
+        self.assertEqual(len(self.client.get(data["next"]).json()["results"]), 2)
+
+    def test_api_anonima_rechazada(self):
+        self.client.logout()
+        response = self.client.get(reverse("plano-texto"), {"q": "20.123.456"})
+        self.assertIn(response.status_code, (401, 403))
+
+
+class PlanoApiTests(TestCase):
+    def setUp(self):
+        for i in range(15):
+            Plano.objects.create(titulo=f"Plano {i}", archivo_pdf="uploads/planos/x.pdf",
+                                 datos_procesados=DATOS_EJEMPLO, estado="completado")
+        self.plano = Plano.objects.first()
+
+    def test_url_del_pdf_pasa_por_la_vista_protegida(self):
+        # Con S3, storage.url() es una URL firmada que no debe llegar a la API
+        firmada = "https://bucket.s3.amazonaws.com/x.pdf?X-Amz-Signature=abc"
+        with mock.patch.object(FieldFile, "url", new_callable=mock.PropertyMock, return_value=firmada):
+            data = self.client.get(reverse("plano-detail", args=[self.plano.id])).json()
+        protegida = "http://testserver" + reverse("archivo_media", args=["uploads/planos/x.pdf"])
+        self.assertEqual(data["archivo_pdf_url"], protegida)
+        self.assertEqual(data["archivo_pdf"], protegida)
+
+    def test_sparse_fieldsets_difieren_columnas(self):
+        url = reverse("plano-detail", args=[self.plano.id])
+        with CaptureQueriesContext(connection) as consultas:
+            data = self.client.get(url, {"fields": "id,titulo,estado_display"}).json()
+        self.assertEqual(set(data), {"id", "titulo", "estado_display"})
+        sql = consultas.captured_queries[-1]["sql"]
+        self.assertNotIn("resultado", sql)
+        self.assertNotIn("descripcion", sql)
+
+        data = self.client.get(url, {"exclude": "texto_extraido"}).json()
+        self.assertNotIn("texto_extraido", data)
+        self.assertEqual(data["datos_procesados"]["lugar"], "La Banda")
+
+    def test_paginacion_por_cursor(self):
+        url = reverse("plano-list")
+        vistos = []
+        while url:
+            data = self.client.get(url, {"page_size": 4, "fields": "id"}).json() if not vistos else \
+                self.client.get(url).json()
+            vistos += [p["id"] for p in data["results"]]
+            url = data["next"]
+        self.assertEqual(vistos, list(Plano.objects.order_by("-fecha_carga", "-id").values_list("id", flat=True)))
+
+    def test_etag_y_last_modified(self):
+        url = reverse("plano-list")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304
+        )
+        # Otra proyección es otra representación
+        self.assertNotEqual(self.client.get(url, {"fields": "id"})["ETag"], etag)
+
+        self.plano.titulo = "Cambiado"
+        self.plano.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        detalle = reverse("plano-detail", args=[self.plano.id])
+        etag = self.client.get(detalle)["ETag"]
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(detalle, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class ExportacionDatosTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Plano.objects.create(titulo=f"Plano {i}", archivo_pdf="uploads/planos/x.pdf",
+                                 datos_procesados=DATOS_EJEMPLO, estado="completado")
+        self.usuario = User.objects.create_user("exportador", password="clave-segura-123")
+        self.client.force_login(self.usuario)
+
+    def _lineas(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode("utf-8").splitlines()
+
+    def test_ndjson_incremental(self):
+        response = self.client.get(reverse("plano-exportar"))
+        registros = [json.loads(linea) for linea in self._lineas(response)]
+        self.assertEqual([r["titulo"] for r in registros], [f"Plano {i}" for i in range(5)])
+        self.assertEqual(registros[0]["datos"]["padrones"], ["12-345"])
+        self.assertNotIn("texto_completo", registros[0]["datos"])
+
+        desde = response["X-Export-Until"]
+        self.assertEqual(self._lineas(self.client.get(reverse("plano-exportar"), {"since": desde})), [])
+
+        plano = Plano.objects.get(titulo="Plano 2")
+        plano.datos_procesados = {**DATOS_EJEMPLO, "lugar": "Otro"}
+        plano.save()
+        lineas = self._lineas(self.client.get(reverse("plano-exportar"), {"since": desde, "texto": "1"}))
+        self.assertEqual(len(lineas), 1)
+        self.assertEqual(json.loads(lineas[0])["datos"]["texto_completo"], "PLANO DE MENSURA")
+
+    def test_csv(self):
+        lineas = self._lineas(self.client.get(reverse("plano-exportar"), {"formato": "csv"}))
+        filas = list(csv.DictReader(io.StringIO("\n".join(lineas).lstrip("\ufeff"))))
+        self.assertEqual(len(filas), 5)
+        self.assertEqual(filas[0]["propietarios"], "PEREZ JUAN 20.123.456")
+        self.assertEqual(filas[0]["cantidad_lados"], "2")
+
+    def test_anonimo_no_exporta(self):
+        self.client.logout()
+        response = self.client.get(reverse("plano-exportar"), {"formato": "csv"})
+        self.assertIn(response.status_code, (401, 403))
+
+
+class ExportacionAsgiTests(MediaTemporalMixin, TransactionTestCase):
+    """Las exportaciones bajo ASGI salen por bloques, sin juntarse en memoria"""
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, "uploads", "planos"))
+        for i in range(3):
+            nombre = f"uploads/planos/p{i}.pdf"
+            with open(os.path.join(self.media_root, nombre), "wb") as f:
+                f.write(b"%PDF-1.4 original")
+            Plano.objects.create(titulo=f"Plano {i}", archivo_pdf=nombre,
+                                 datos_procesados=DATOS_EJEMPLO, estado="completado")
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+
+    async def _contenido(self, url, params):
+        await self.async_client.aforce_login(self.admin)
+        with warnings.catch_warnings(record=True) as avisos:
+            warnings.simplefilter("always")
+            response = await self.async_client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            contenido = b"".join([bloque async for bloque in response.streaming_content])
+        self.assertFalse([a for a in avisos if "synchronous iterators" in str(a.message)])
+        return contenido
+
+    async def test_ndjson_sin_consumir_el_generador(self):
+        contenido = await self._contenido(reverse("plano-exportar"), {})
+        self.assertEqual(len(contenido.decode("utf-8").splitlines()), 3)
+
+    async def test_zip_sin_consumir_el_generador(self):
+        contenido = await self._contenido(reverse("exportar_planos"), {"formatos": "json,original"})
+        with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(len(zf.namelist()), 6)
+
+
+class CargaMasivaTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user("carga", password="x")
+        self.client.force_login(self.usuario)
+
+    def _zip(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            zf.writestr("lote/c.pdf", b"%PDF-1.4 c")
+            zf.writestr("lote/leame.txt", b"ignorado")
+            zf.writestr("lote/falso.pdf", b"no es pdf")
+        return SimpleUploadedFile("planos.zip", buffer.getvalue(), content_type="application/zip")
+
+    def _subir(self):
+        archivos = [
+            SimpleUploadedFile("a.pdf", b"%PDF-1.4 a", content_type="application/pdf"),
+            SimpleUploadedFile("b.pdf", b"%PDF-1.4 b", content_type="application/pdf"),
+            SimpleUploadedFile("notas.txt", b"texto", content_type="text/plain"),
+            self._zip(),
+        ]
+        return self.client.post(reverse("lote-list"), {"archivos": archivos})
+
+    def test_carga_masiva_encola_un_trabajo_por_pdf(self):
+        response = self._subir()
+        self.assertEqual(response.status_code, 202)
+        cuerpo = response.json()
+        self.assertEqual(len(cuerpo["trabajos"]), 3)
+        self.assertEqual(
+            sorted(r["archivo"] for r in cuerpo["rechazados"]),
+            ["notas.txt", "planos.zip/lote/falso.pdf"],
+        )
+        self.assertEqual(
+            sorted(Plano.objects.values_list("titulo", flat=True)), ["a", "b", "c"]
+        )
+        for plano in Plano.objects.all():
+            self.assertEqual(plano.estado, "pendiente")
+            self.assertEqual(plano.usuario, self.usuario)
+            self.assertTrue(plano.archivo_pdf.read().startswith(b"%PDF-"))
+        # bulk_create no pasa por save(): el título se indexa igual
+        self.assertEqual(busqueda.buscar("c")[0], 1)
+
+    def test_worker_procesa_el_lote(self):
+        lote_id = self._subir().json()["lote"]
+
+        def procesar(plano, **kwargs):
+            plano.estado = "completado"
+            plano.save()
+
+        with mock.patch("planos.cola.procesar_pdf", side_effect=procesar):
+            call_command("procesar_cola", una_vez=True, stdout=io.StringIO())
+
+        self.assertFalse(TrabajoProcesamiento.objects.exclude(estado="completado").exists())
+        estado = self.client.get(reverse("lote-detail", args=[lote_id])).json()
+        self.assertEqual(estado["resumen"]["completado"], 3)
+        self.assertEqual(estado["resumen"]["total"], 3)
+        self.assertEqual({t["plano_estado"] for t in estado["trabajos"]}, {"completado"})
+
+    def test_reintento_y_error(self):
+        self._subir()
+        with mock.patch("planos.cola.procesar_pdf", side_effect=RuntimeError("sin texto")):
+            call_command("procesar_cola", una_vez=True, stdout=io.StringIO())
+
+        trabajo = TrabajoProcesamiento.objects.first()
+        self.assertEqual(trabajo.estado, TrabajoProcesamiento.ERROR)
+        self.assertEqual(trabajo.intentos, 2)
+        self.assertEqual(trabajo.plano.estado, "error")
+
+    def test_carga_api_y_reproceso_solo_encolan(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura"))
+        with mock.patch("planos.cola.procesar_pdf") as procesar:
+            response = self.client.post(reverse("upload_plano"), {
+                "titulo": "Panel", "archivo_pdf": SimpleUploadedFile("p.pdf", b"%PDF-1.4 p"),
+            })
+            self.assertEqual(response.status_code, 302)
+            response = self.client.post(reverse("plano-list"), {
+                "titulo": "Api", "archivo_pdf": SimpleUploadedFile("q.pdf", b"%PDF-1.4 q"),
+            })
+            self.assertEqual(response.status_code, 201)
+            procesar.assert_not_called()
+        self.assertEqual(set(Plano.objects.values_list("estado", flat=True)), {"pendiente"})
+        self.assertEqual(TrabajoProcesamiento.objects.filter(usar_cache=True).count(), 2)
+
+        plano = Plano.objects.get(titulo="Panel")
+        TrabajoProcesamiento.objects.update(estado=TrabajoProcesamiento.COMPLETADO)
+        self.client.get(reverse("reprocesar_plano", args=[plano.id]))
+        self.client.get(reverse("reprocesar_plano", args=[plano.id]))
+        trabajo = TrabajoProcesamiento.objects.get(plano=plano, estado=TrabajoProcesamiento.PENDIENTE)
+        with mock.patch("planos.cola.procesar_pdf") as procesar:
+            cola.ejecutar_trabajo(trabajo)
+        self.assertFalse(procesar.call_args.kwargs["usar_cache"])
+
+    def test_lotes_ajenos_no_visibles(self):
+        ajeno = LoteCarga.objects.create(usuario=User.objects.create_user("otro"))
+        self.assertEqual(self.client.get(reverse("lote-detail", args=[ajeno.id])).status_code, 404)
+
+
+class CargaReanudableTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user("tus", password="x")
+        self.client.force_login(self.usuario)
+        self.contenido = b"%PDF-1.4\n" + os.urandom(3 * 1024 * 1024)
+
+    def _metadatos(self, **valores):
+        return ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in valores.items())
+
+    def _crear(self, **metadatos):
+        response = self.client.post(
+            reverse("carga-list"),
+            headers={
+                "Upload-Length": str(len(self.contenido)),
+                "Upload-Metadata": self._metadatos(filename="escaneo A0.pdf", **metadatos),
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        return response["Location"]
+
+    def _parte(self, url, desde, hasta):
+        return self.client.patch(
+            url, self.contenido[desde:hasta], content_type="application/offset+octet-stream",
+            headers={"Upload-Offset": str(desde)},
+        )
+
+    def test_subida_por_partes_con_reanudacion(self):
+        url = self._crear(sha256=hashlib.sha256(self.contenido).hexdigest())
+        mitad = len(self.contenido) // 2
+
+        response = self._parte(url, 0, mitad)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], str(mitad))
+        # Una parte con el desplazamiento equivocado se rechaza
+        self.assertEqual(self._parte(url, 10, mitad).status_code, 409)
+
+        # El cliente retoma desde lo que informa HEAD
+        desplazamiento = int(self.client.head(url)["Upload-Offset"])
+        self.assertEqual(desplazamiento, mitad)
+        response = self._parte(url, desplazamiento, len(self.contenido))
+        self.assertEqual(response.status_code, 204)
+
+        carga = CargaReanudable.objects.get()
+        self.assertEqual(carga.sha256, hashlib.sha256(self.contenido).hexdigest())
+        self.assertEqual(response["X-Plano-Id"], str(carga.plano_id))
+        with carga.plano.archivo_pdf.open("rb") as f:
+            self.assertEqual(f.read(), self.contenido)
+        self.assertEqual(carga.plano.titulo, "escaneo A0")
+        self.assertTrue(TrabajoProcesamiento.objects.filter(plano=carga.plano).exists())
+        self.assertEqual(self.client.get(url).json()["plano"], carga.plano_id)
+
+    def test_hash_se_reconstruye_en_otro_proceso(self):
+        from . import carga_reanudable
+
+        url = self._crear()
+        self._parte(url, 0, 1000)
+        carga_reanudable._hashes.clear()
+        self._parte(url, 1000, len(self.contenido))
+        self.assertEqual(CargaReanudable.objects.get().sha256, hashlib.sha256(self.contenido).hexdigest())
+
+    def test_checksum_y_cabecera_invalidos(self):
+        url = self._crear(sha256="0" * 64)
+        self.assertEqual(self._parte(url, 0, len(self.contenido)).status_code, 460)
+        self.assertEqual(self.client.head(url)["Upload-Offset"], "0")
+        self.assertFalse(Plano.objects.exists())
+
+        self.contenido = b"MZ" + self.contenido
+        url = self._crear()
+        self.assertEqual(self._parte(url, 0, 100).status_code, 415)
+
+    @override_settings(CARGA_REANUDABLE_MAX_BYTES=1024)
+    def test_limite_de_tamanio(self):
+        response = self.client.post(reverse("carga-list"), headers={"Upload-Length": "2048"})
+        self.assertEqual(response.status_code, 413)
+
+
+class AlmacenamientoContenidoTests(MediaTemporalMixin, TestCase):
+    def _plano(self, nombre, contenido):
+        return Plano.objects.create(
+            titulo=nombre, archivo_pdf=SimpleUploadedFile(nombre, contenido, content_type="application/pdf")
+        )
+
+    def test_duplicados_comparten_archivo(self):
+        contenido = b"%PDF-1.4 lamina"
+        digest = hashlib.sha256(contenido).hexdigest()
+        primero = self._plano("cartavio.pdf", contenido)
+        segundo = self._plano("cartavio.pdf", contenido)
+        otro = self._plano("otro.pdf", b"%PDF-1.4 otra lamina")
+
+        nombre = f"uploads/planos/{digest[:2]}/{digest[2:4]}/{digest}.pdf"
+        self.assertEqual(primero.archivo_pdf.name, nombre)
+        self.assertEqual(segundo.archivo_pdf.name, nombre)
+        self.assertNotEqual(otro.archivo_pdf.name, nombre)
+        self.assertEqual(ArchivoContenido.objects.get(ruta=nombre).referencias, 2)
+        ruta = primero.archivo_pdf.path
+        self.assertEqual(len(os.listdir(os.path.dirname(ruta))), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            primero.delete()
+        self.assertTrue(os.path.exists(ruta))
+        self.assertEqual(ArchivoContenido.objects.get(ruta=nombre).referencias, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo.delete()
+        self.assertFalse(os.path.exists(ruta))
+        self.assertFalse(ArchivoContenido.objects.filter(ruta=nombre).exists())
+
+
+class AlmacenamientoObjetosTests(MediaTemporalMixin, TestCase):
+    """Con el almacén de objetos local nada puede depender de rutas bajo MEDIA_ROOT"""
+
+    def setUp(self):
+        super().setUp()
+        self.objetos = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        opciones = {"directorio": self.objetos}
+        self._storages = override_settings(
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+                "planos": {"BACKEND": "planos.storage.AlmacenamientoContenidoObjetos", "OPTIONS": opciones},
+                "artefactos": {"BACKEND": "planos.storage.AlmacenamientoObjetos", "OPTIONS": opciones},
+            },
+            CACHE_ARCHIVOS_DIR=self.cache,
+        )
+        self._storages.enable()
+        admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(admin)
+
+        modelo = Plano.objects.create(titulo="Modelo", archivo_pdf="uploads/planos/x.pdf",
+                                      datos_procesados=DATOS_EJEMPLO)
+        buffer = io.BytesIO()
+        PdfMemoriaRenderer(modelo).render_to(buffer)
+        self.pdf = buffer.getvalue()
+
+    def tearDown(self):
+        self._storages.disable()
+        shutil.rmtree(self.objetos, ignore_errors=True)
+        shutil.rmtree(self.cache, ignore_errors=True)
+        super().tearDown()
+
+    def test_procesamiento_sin_disco_compartido(self):
+        from .services import procesar_pdf
+
+        plano = Plano.objects.create(
+            titulo="Remoto", archivo_pdf=SimpleUploadedFile("remoto.pdf", self.pdf, content_type="application/pdf")
+        )
+        with self.assertRaises(NotImplementedError):
+            plano.archivo_pdf.path
+        self.assertTrue(os.path.exists(os.path.join(self.objetos, *plano.archivo_pdf.name.split("/"))))
+
+        procesar_pdf(plano)
+        plano.refresh_from_db()
+        self.assertEqual(plano.estado, "completado")
+        self.assertIn("6965637.114", plano.texto_extraido)
+        self.assertTrue(os.path.exists(os.path.join(self.objetos, *plano.memoria_path.split("/"))))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "outputs")))
+
+        # La segunda lectura sale de la caché local, sin volver a descargar
+        storage = plano.archivo_pdf.storage
+        ruta = cache_archivos.ruta_local(storage, plano.archivo_pdf.name)
+        self.assertTrue(ruta.startswith(self.cache))
+        with mock.patch.object(storage, "open", side_effect=AssertionError("descarga repetida")):
+            self.assertEqual(cache_archivos.ruta_local(storage, plano.archivo_pdf.name), ruta)
+
+        response = self.client.get(reverse("descargar_memoria", args=[plano.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"PK"))
+
+    def test_recorte_de_cache(self):
+        storage = Plano._meta.get_field("archivo_pdf").storage
+        nombres = [storage.save("uploads/planos/p.pdf", io.BytesIO(self.pdf + bytes([i]))) for i in range(3)]
+        for nombre in nombres:
+            cache_archivos.ruta_local(storage, nombre)
+        self.assertEqual(cache_archivos.recortar(max_bytes=2 * len(self.pdf)), 2)
+        restantes = [f for _, _, fs in os.walk(self.cache) for f in fs]
+        self.assertEqual(len(restantes), 1)
+
+
+class LimitadorTests(TestCase):
+    def setUp(self):
+        self.limitador = limitador.Limitador(limitador.BackendMemoria())
+        reloj = mock.patch("planos.limitador.time")
+        self.time = reloj.start()
+        self.addCleanup(reloj.stop)
+        self.mover_a(6000.0)
+
+    def mover_a(self, instante):
+        self.time.time.return_value = instante
+        self.time.monotonic.return_value = instante
+
+    def test_ventana_deslizante(self):
+        resultados = [self.limitador.permitir("ip:1", 3, 60)[0] for _ in range(4)]
+        self.assertEqual(resultados, [True, True, True, False])
+        # Otra clave no se ve afectada
+        self.assertTrue(self.limitador.permitir("ip:2", 3, 60)[0])
+
+        # A un tercio de la ventana siguiente la anterior pesa 2/3: 4 * 2/3 + 1 > 3
+        self.mover_a(6080.0)
+        permitida, espera = self.limitador.permitir("ip:1", 3, 60)
+        self.assertFalse(permitida)
+        self.assertAlmostEqual(espera, 10.0)
+        # Y cerca del final ya deja lugar
+        self.mover_a(6114.0)
+        permitida, espera = self.limitador.permitir("ip:1", 3, 60)
+        self.assertTrue(permitida)
+        self.assertEqual(espera, 0)
+
+    def test_rechazo_y_ventana_anterior_sin_viajes_al_backend(self):
+        backend = self.limitador.backend
+        with mock.patch.object(backend, "incrementar", wraps=backend.incrementar) as incrementar:
+            for _ in range(5):
+                self.limitador.permitir("ip:1", 2, 60)
+        # Las dos rechazadas posteriores a la primera salen del bloqueo en memoria
+        self.assertEqual(incrementar.call_count, 3)
+        # La ventana anterior se pide solo en la primera solicitud
+        self.assertEqual([c.args[2] is not None for c in incrementar.call_args_list], [True, False, False])
+
+        permitida, espera = self.limitador.permitir("ip:1", 2, 60)
+        self.assertFalse(permitida)
+        self.assertEqual(espera, 60)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_conteo_exacto_con_concurrencia(self):
+        for backend in (limitador.BackendMemoria(), limitador.BackendCache("default")):
+            with self.subTest(backend=type(backend).__name__):
+                backend.reiniciar()
+                limite = limitador.Limitador(backend)
+                permitidas = []
+
+                def cliente():
+                    for _ in range(25):
+                        permitidas.append(limite.permitir("ip:concurrente", 50, 60)[0])
+
+                hilos = [threading.Thread(target=cliente) for _ in range(8)]
+                for hilo in hilos:
+                    hilo.start()
+                for hilo in hilos:
+                    hilo.join()
+                self.assertEqual(permitidas.count(True), 50)
+
+    def test_backend_caido_no_bloquea(self):
+        with mock.patch.object(self.limitador.backend, "incrementar", side_effect=ConnectionError("sin red")):
+            self.assertEqual(self.limitador.permitir("ip:1", 1, 60), (True, 0))
+
+    @override_settings(RATE_LIMIT_BACKEND="memoria", RATE_LIMIT_ENABLED=True, RATE_LIMIT_PER_MINUTE=2)
+    def test_middleware_y_decorador(self):
+        from .decorators import rate_limit
+        from .middleware import SecurityMiddleware
+
+        request = RequestFactory().get("/", REMOTE_ADDR="10.0.0.9")
+        request.user = AnonymousUser()
+        middleware = SecurityMiddleware(lambda r: HttpResponse("ok"))
+        codigos = [middleware(request).status_code for _ in range(3)]
+        self.assertEqual(codigos, [200, 200, 429])
+        self.assertEqual(middleware(request)["Retry-After"], "60")
+
+        vista = rate_limit(max_requests=1, time_window=30)(lambda r: HttpResponse("ok"))
+        self.assertEqual(vista(request).status_code, 200)
+        self.assertEqual(vista(request).status_code, 429)
+
+    @override_settings(RATE_LIMIT_BACKEND="memoria", RATE_LIMIT_ENABLED=True)
+    def test_login_y_carga_limitados(self):
+        from django.conf import settings
+
+        url = reverse("login")
+        datos = {"username": "nadie", "password": "incorrecta"}
+        codigos = [self.client.post(url, datos, REMOTE_ADDR="10.0.0.7").status_code
+                   for _ in range(settings.RATE_LIMIT_LOGIN_PER_MINUTE + 1)]
+        self.assertEqual(codigos, [200] * settings.RATE_LIMIT_LOGIN_PER_MINUTE + [429])
+        self.assertIn("Retry-After", self.client.post(url, datos, REMOTE_ADDR="10.0.0.7"))
+        # Solo cuentan los POST, y por IP
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.7").status_code, 200)
+        self.assertEqual(self.client.post(url, datos, REMOTE_ADDR="10.0.0.8").status_code, 200)
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            self.assertEqual(self.client.post(url, datos, REMOTE_ADDR="10.0.0.7").status_code, 200)
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura"))
+        url = reverse("upload_plano")
+        codigos = [self.client.post(url, {}, REMOTE_ADDR="10.0.0.7").status_code
+                   for _ in range(settings.RATE_LIMIT_UPLOAD_PER_MINUTE + 1)]
+        self.assertEqual(codigos, [200] * settings.RATE_LIMIT_UPLOAD_PER_MINUTE + [429])
+
+
+def _escribir_lotes(archivo, proceso, lotes, lineas):
+    destino = bitacora._DestinoLotes(archivo, lote=lineas, intervalo=60)
+    destino.setFormatter(bitacora.FormateadorJSON())
+    for lote in range(lotes):
+        for i in range(lineas):
+            destino.emit(logging.makeLogRecord({"msg": "x" * 200, "datos": {"p": proceso, "n": lote * lineas + i}}))
+    destino.close()
+
+
+class BitacoraTests(TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, True)
+        self.archivo = os.path.join(self.directorio, "app.log")
+        self.handler = bitacora.ManejadorAsincrono(self.archivo, lote=1000, intervalo=60)
+        self.handler.setFormatter(bitacora.FormateadorJSON())
+        self.addCleanup(self.handler.close)
+        self.logger = logging.getLogger("planos.tests.bitacora")
+        self.logger.addHandler(self.handler)
+        self.logger.propagate = False
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def lineas(self):
+        with open(self.archivo, encoding="utf-8") as f:
+            return [json.loads(linea) for linea in f]
+
+    def test_escritura_en_segundo_plano_y_por_lotes(self):
+        for i in range(5):
+            bitacora.auditoria(self.logger, "Evento %s", i, usuario="ana")
+        # Con lote e intervalo grandes nada llega al disco hasta vaciar
+        self.assertFalse(os.path.exists(self.archivo))
+
+        self.handler.flush()
+        lineas = self.lineas()
+        self.assertEqual([l["mensaje"] for l in lineas], [f"Evento {i}" for i in range(5)])
+        self.assertEqual(lineas[0]["evento"], "auditoria")
+        self.assertEqual(lineas[0]["usuario"], "ana")
+        self.assertEqual(lineas[0]["nivel"], "INFO")
+
+    def test_excepciones_con_traza(self):
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            self.logger.exception("Fallo")
+        self.handler.flush()
+        self.assertIn("ZeroDivisionError", self.lineas()[0]["excepcion"])
+
+    def test_muestreo_solo_de_accesos(self):
+        with override_settings(LOG_MUESTREO_ACCESOS=0):
+            for _ in range(20):
+                bitacora.acceso(self.logger, "Acceso")
+            bitacora.auditoria(self.logger, "Auditoría")
+        with override_settings(LOG_MUESTREO_ACCESOS=1):
+            bitacora.acceso(self.logger, "Acceso")
+        self.handler.flush()
+        self.assertEqual([l["evento"] for l in self.lineas()], ["auditoria", "acceso"])
+
+    def test_un_write_por_lote(self):
+        for i in range(300):
+            self.logger.info("Línea %s %s", i, "x" * 100)
+        with mock.patch("planos.bitacora.os.write", wraps=os.write) as escritura:
+            self.handler.flush()
+        self.assertEqual(escritura.call_count, 1)
+        self.assertEqual(len(self.lineas()), 300)
+
+    def test_procesos_no_mezclan_lineas(self):
+        contexto = multiprocessing.get_context("fork")
+        procesos = [
+            contexto.Process(target=_escribir_lotes, args=(self.archivo, p, 20, 100)) for p in range(4)
+        ]
+        for proceso in procesos:
+            proceso.start()
+        for proceso in procesos:
+            proceso.join(30)
+        # Cada línea es JSON válido y no falta ninguna
+        lineas = self.lineas()
+        self.assertEqual(len(lineas), 4 * 20 * 100)
+        self.assertEqual({(l["p"], l["n"]) for l in lineas}, {(p, n) for p in range(4) for n in range(2000)})
+
+
+class CacheNivelesTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.l2_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.l2_dir, True)
+        caches_override = override_settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": self.l2_dir,
+        }})
+        caches_override.enable()
+        self.addCleanup(caches_override.disable)
+
+    def espacio(self):
+        return cache_niveles.Espacio(self.id().rsplit(".", 1)[-1], ttl=60)
+
+    def test_l1_l2_y_estadisticas(self):
+        espacio = self.espacio()
+        self.assertIsNone(espacio.get("a"))
+        espacio.set("a", {"x": 1})
+        self.assertEqual(espacio.get("a"), {"x": 1})
+        # Otro proceso (sin L1) lo encuentra en el L2 compartido
+        cache_niveles.limpiar_l1()
+        self.assertEqual(espacio.get("a"), {"x": 1})
+        self.assertEqual(espacio.get("a"), {"x": 1})
+
+        stats = espacio.estadisticas()
+        self.assertEqual((stats["l1"], stats["l2"], stats["fallos"]), (2, 1, 1))
+        self.assertEqual(stats["aciertos"], 0.75)
+
+    def test_invalidacion_por_version(self):
+        espacio = self.espacio()
+        espacio.set("a", 1)
+        espacio.set("b", 2)
+        self.assertEqual(espacio.invalidar(), 2)
+        self.assertIsNone(espacio.get("a"))
+        # Los demás procesos ven la versión nueva al vencer su L1
+        cache_niveles.limpiar_l1()
+        self.assertEqual(espacio.version(), 2)
+        self.assertIsNone(espacio.get("b"))
+        espacio.set("a", 3)
+        self.assertEqual(espacio.get("a"), 3)
+
+    def test_un_solo_calculo_entre_hilos(self):
+        espacio = self.espacio()
+        llamadas, resultados = [], []
+
+        def calcular():
+            llamadas.append(1)
+            time.sleep(0.2)
+            return "valor"
+
+        hilos = [
+            threading.Thread(target=lambda: resultados.append(espacio.obtener_o_calcular("k", calcular)))
+            for _ in range(8)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(resultados, ["valor"] * 8)
+
+    def test_espera_calculo_de_otro_proceso(self):
+        espacio = self.espacio()
+        completa = espacio.clave("k")
+        # Otro proceso tomó el bloqueo y publica el valor un momento después
+        espacio.l2.add(f"{completa}:__calculando__", 1, 10)
+        threading.Timer(0.2, lambda: espacio.l2.set(completa, "del otro", 60)).start()
+
+        valor = espacio.obtener_o_calcular("k", lambda: self.fail("no debía calcular"))
+        self.assertEqual(valor, "del otro")
+
+    @override_settings(CACHE_ESPERA=0.3)
+    def test_calculo_largo_conserva_el_bloqueo(self):
+        espacio = self.espacio()
+        completa = espacio.clave("k")
+        llamadas = []
+
+        def calcular():
+            llamadas.append(1)
+            time.sleep(1.2)
+            return "valor"
+
+        # Dos procesos: sin la coordinación entre hilos, solo el bloqueo del L2
+        hilos = [
+            threading.Thread(target=espacio._calcular_compartido, args=(completa, calcular, None, 5))
+            for _ in range(2)
+        ]
+        for hilo in hilos:
+            hilo.start()
+            time.sleep(0.05)
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(llamadas), 1)
+
+    @override_settings(CACHE_ESPERA=0.3)
+    def test_bloqueo_de_un_proceso_muerto_vence(self):
+        espacio = self.espacio()
+        # Un proceso tomó el bloqueo y murió sin renovarlo
+        espacio.l2.add(f"{espacio.clave('k')}:__calculando__", 1, 0.3)
+        inicio = time.monotonic()
+        self.assertEqual(espacio.obtener_o_calcular("k", lambda: 42, espera=30), 42)
+        self.assertLess(time.monotonic() - inicio, 5)
+
+    def test_sin_l2_se_calcula(self):
+        espacio = self.espacio()
+        with mock.patch.object(cache_niveles.Espacio, "l2", new_callable=mock.PropertyMock) as l2:
+            l2.return_value.get.side_effect = ConnectionError("sin red")
+            l2.return_value.add.side_effect = ConnectionError("sin red")
+            l2.return_value.set.side_effect = ConnectionError("sin red")
+            self.assertEqual(espacio.obtener_o_calcular("k", lambda: 42), 42)
+        self.assertGreater(espacio.estadisticas()["errores"], 0)
+
+    @override_settings(EXTRACCION_AISLADA=False)
+    def test_extraccion_compartida_entre_planos_iguales(self):
+        from .services import procesar_pdf
+        from .utils.pdf_processor import PDFProcessor
+
+        modelo = Plano(titulo="Modelo", datos_procesados=DATOS_EJEMPLO)
+        buffer = io.BytesIO()
+        PdfMemoriaRenderer(modelo).render_to(buffer)
+        planos = [
+            Plano.objects.create(titulo=f"P{i}", archivo_pdf=SimpleUploadedFile("p.pdf", buffer.getvalue()))
+            for i in range(2)
+        ]
+        extraer = PDFProcessor.extract_data
+        with mock.patch.object(PDFProcessor, "extract_data", autospec=True, side_effect=extraer) as extract:
+            for plano in planos:
+                procesar_pdf(plano)
+            self.assertEqual(extract.call_count, 1)
+            procesar_pdf(planos[0], usar_cache=False)
+            self.assertEqual(extract.call_count, 2)
+        self.assertEqual(planos[1].datos_procesados, planos[0].datos_procesados)
+
+        admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(admin)
+        espacios = self.client.get(reverse("estadisticas_cache")).json()["espacios"]
+        self.assertGreaterEqual(espacios["extraccion"]["calculos"], 1)
+
+
+class VistasAsyncTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.plano = Plano.objects.create(titulo="Plano test", archivo_pdf="uploads/planos/x.pdf",
+                                          datos_procesados=DATOS_EJEMPLO, estado="completado")
+        self.plano.memoria_path = DocxGenerator(self.plano).generate_memoria()
+        self.plano.save()
+
+    async def test_descarga_en_streaming_y_304(self):
+        await self.async_client.aforce_login(self.admin)
+        url = reverse("descargar_memoria", args=[self.plano.id])
+
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        contenido = b"".join([bloque async for bloque in response.streaming_content])
+        self.assertTrue(contenido.startswith(b"PK"))
+        self.assertEqual(int(response["Content-Length"]), len(contenido))
+
+        response = await self.async_client.get(url, headers={"if-none-match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_gemini_concurrente_sin_bloquear(self):
+        await self.async_client.aforce_login(self.admin)
+
+        async def gemini_lento(datos):
+            await asyncio.sleep(0.3)
+            return "MEMORIA DESCRIPTIVA"
+
+        url = reverse("generar_memoria_preview", args=[self.plano.id])
+        with mock.patch("planos.views.agenerar_memoria_gemini", side_effect=gemini_lento):
+            inicio = time.monotonic()
+            respuestas = await asyncio.gather(*[self.async_client.get(url) for _ in range(10)])
+            duracion = time.monotonic() - inicio
+        self.assertEqual({r.status_code for r in respuestas}, {200})
+        self.assertEqual(respuestas[0].json(), {"memoria": "MEMORIA DESCRIPTIVA"})
+        # Diez esperas de 0,3 s en paralelo, no en serie
+        self.assertLess(duracion, 1.5)
+
+        # La descarga reutiliza el texto guardado: no vuelve a llamar a Gemini
+        with mock.patch("planos.views.agenerar_memoria_gemini", side_effect=AssertionError("otra llamada")):
+            response = await self.async_client.get(reverse("descargar_memoria_gemini", args=[self.plano.id]))
+            self.assertEqual(response.status_code, 200)
+            contenido = b"".join([bloque async for bloque in response.streaming_content])
+        self.assertTrue(contenido.startswith(b"PK"))
+
+    def test_estado_del_plano(self):
+        self.client.force_login(self.admin)
+        url = reverse("estado_plano", args=[self.plano.id])
+        # Con WSGI no se retiene la respuesta aunque se pida espera
+        inicio = time.monotonic()
+        datos = self.client.get(url, {"anterior": "completado", "espera": 20}).json()
+        self.assertLess(time.monotonic() - inicio, 5)
+        self.assertEqual(datos["estado"], "completado")
+        self.assertEqual(self.client.get(reverse("estado_plano", args=[9999])).status_code, 404)
+
+
+class DescargasTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.contenido = bytes(range(256)) * 40
+        os.makedirs(os.path.join(self.media_root, "uploads", "planos"))
+        with open(os.path.join(self.media_root, "uploads", "planos", "p.pdf"), "wb") as f:
+            f.write(self.contenido)
+        self.duenio = User.objects.create_user("duenio", password="clave-segura-123")
+        self.plano = Plano.objects.create(titulo="Plano", archivo_pdf="uploads/planos/p.pdf", usuario=self.duenio)
+        self.url = reverse("archivo_media", args=["uploads/planos/p.pdf"])
+
+    def test_parsear_rango(self):
+        self.assertEqual(descargas.parsear_rango("bytes=0-99", 1000), (0, 99))
+        self.assertEqual(descargas.parsear_rango("bytes=900-", 1000), (900, 999))
+        self.assertEqual(descargas.parsear_rango("bytes=-100", 1000), (900, 999))
+        self.assertEqual(descargas.parsear_rango("bytes=990-2000", 1000), (990, 999))
+        self.assertIs(descargas.parsear_rango("bytes=1000-", 1000), descargas._NO_SATISFACIBLE)
+        for invalido in ("bytes=5-1", "bytes=a-b", "items=0-1", "bytes=0-1,5-9", "bytes=-"):
+            self.assertIsNone(descargas.parsear_rango(invalido, 1000))
+
+    def test_media_solo_para_autorizados(self):
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+        otro = User.objects.create_user("otro", password="clave-segura-123")
+        self.client.force_login(otro)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        self.client.force_login(self.duenio)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.contenido)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertTrue(response["Content-Disposition"].startswith("inline"))
+
+        admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get("/media/uploads/../../settings.py").status_code, 404)
+
+    def test_rangos_y_condicional(self):
+        self.client.force_login(self.duenio)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.contenido)}")
+        self.assertEqual(b"".join(response.streaming_content), self.contenido[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.contenido)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.contenido)}")
+
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # If-Range de otra versión: se manda el archivo completo
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"otra"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    async def test_rango_con_asgi(self):
+        await self.async_client.aforce_login(self.duenio)
+        response = await self.async_client.get(self.url, headers={"range": "bytes=-300"})
+        self.assertEqual(response.status_code, 206)
+        contenido = b"".join([bloque async for bloque in response.streaming_content])
+        self.assertEqual(contenido, self.contenido[-300:])
+
+    def test_delegacion_al_proxy(self):
+        self.client.force_login(self.duenio)
+        with override_settings(ARCHIVOS_OFFLOAD="nginx"):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], "/_protegido/media/uploads/planos/p.pdf")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response.content, b"")
+
+        with override_settings(ARCHIVOS_OFFLOAD="sendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response["X-Sendfile"], os.path.realpath(os.path.join(self.media_root, "uploads", "planos", "p.pdf"))
+        )
+
+        # La memoria generada también se delega, con su ETag de contenido
+        admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(admin)
+        self.plano.datos_procesados = DATOS_EJEMPLO
+        self.plano.estado = "completado"
+        self.plano.memoria_path = DocxGenerator(self.plano).generate_memoria()
+        self.plano.save()
+        with override_settings(ARCHIVOS_OFFLOAD="nginx"):
+            response = self.client.get(reverse("descargar_memoria", args=[self.plano.id]))
+        self.assertEqual(response["X-Accel-Redirect"], f"/_protegido/media/{self.plano.memoria_path}")
+        self.assertIn("Memoria_Plano.docx", response["Content-Disposition"])
+
+
+class MetricasTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self._metricas = override_settings(METRICAS_DIR=self.directorio, METRICAS_TOKEN="secreto")
+        self._metricas.enable()
+        metricas.registro.limpiar()
+
+    def tearDown(self):
+        metricas.registro.limpiar()
+        self._metricas.disable()
+        shutil.rmtree(self.directorio, ignore_errors=True)
+        super().tearDown()
+
+    def _pdf(self):
+        modelo = Plano.objects.create(titulo="Modelo", archivo_pdf="uploads/planos/x.pdf",
+                                      datos_procesados=DATOS_EJEMPLO)
+        buffer = io.BytesIO()
+        PdfMemoriaRenderer(modelo).render_to(buffer)
+        return buffer.getvalue()
+
+    def test_etapas_guardadas_en_el_plano(self):
+        from .services import procesar_pdf
+
+        pdf = self._pdf()
+        plano = Plano.objects.create(
+            titulo="Medido", archivo_pdf=SimpleUploadedFile("medido.pdf", pdf, content_type="application/pdf")
+        )
+        procesar_pdf(plano, usar_cache=False)
+
+        plano.refresh_from_db()
+        self.assertEqual(plano.estado, "completado")
+        self.assertEqual(plano.metricas["bytes"], len(pdf))
+        self.assertGreaterEqual(plano.metricas["paginas"], 1)
+        self.assertEqual(plano.metricas["paginas_ocr"], 0)
+        self.assertLessEqual(
+            {"descarga", "texto", "parseo", "extraccion", "docx", "guardado", "total"}, set(plano.metricas["etapas"])
+        )
+
+        texto = metricas.exponer()
+        self.assertIn("# TYPE agrimensores_etapa_segundos histogram", texto)
+        self.assertIn('agrimensores_etapa_segundos_count{etapa="parseo"} 1', texto)
+        self.assertIn('agrimensores_etapa_segundos_bucket{etapa="texto",le="+Inf"} 1', texto)
+        self.assertIn('agrimensores_planos_procesados_total{resultado="ok"} 1', texto)
+        self.assertIn(f"agrimensores_pdf_bytes_total {len(pdf)}", texto)
+
+    @override_settings(EXTRACCION_AISLADA=True, METRICAS_INTERVALO=0)
+    def test_extraccion_aislada_se_cuenta_una_vez(self):
+        ruta = os.path.join(self.media_root, "aislado.pdf")
+        with open(ruta, "wb") as f:
+            f.write(self._pdf())
+        with metricas.medir_plano() as medicion:
+            aislamiento.extraer(ruta)
+
+        # El hijo no publica: el único archivo es el del padre, con lo que incorporó
+        self.assertEqual(os.listdir(self.directorio), [f"{metricas.registro._id}.json"])
+        texto = metricas.exponer()
+        self.assertIn('agrimensores_etapa_segundos_count{etapa="texto"} 1', texto)
+        self.assertIn(f"agrimensores_paginas_total {medicion['paginas']}", texto)
+        self.assertGreaterEqual(medicion["paginas"], 1)
+
+    def test_suma_los_procesos_publicados(self):
+        metricas.LLM_LLAMADAS.inc(modelo="m", resultado="ok")
+        metricas.ETAPA_SEGUNDOS.observar(0.2, etapa="gemini")
+        # Otro proceso publicó sus valores
+        with open(os.path.join(self.directorio, "999-1.json"), "w") as f:
+            json.dump([
+                ["agrimensores_llm_llamadas_total", {"modelo": "m", "resultado": "ok"}, 2],
+                ["agrimensores_etapa_segundos", {"etapa": "gemini"},
+                 [[0] * 13 + [1], 400.0]],
+            ], f)
+
+        texto = metricas.exponer()
+        self.assertIn('agrimensores_llm_llamadas_total{modelo="m",resultado="ok"} 3', texto)
+        self.assertIn('agrimensores_etapa_segundos_bucket{etapa="gemini",le="0.25"} 1', texto)
+        self.assertIn('agrimensores_etapa_segundos_bucket{etapa="gemini",le="+Inf"} 2', texto)
+        self.assertIn('agrimensores_etapa_segundos_sum{etapa="gemini"} 400.2', texto)
+
+        metricas.registro.publicar()
+        self.assertEqual(len(os.listdir(self.directorio)), 2)
+
+    def test_endpoint_requiere_token_o_superusuario(self):
+        url = reverse("metricas")
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer otro").status_code, 401)
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secreto")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+        admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class PerfiladoTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self._perfilado = override_settings(PERFILADO_HABILITADO=True, PERFILES_DIR=self.directorio)
+        self._perfilado.enable()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+
+    def tearDown(self):
+        self._perfilado.disable()
+        shutil.rmtree(self.directorio, ignore_errors=True)
+        super().tearDown()
+
+    def _perfiles(self):
+        return sorted(f for f in os.listdir(self.directorio) if f.endswith(".prof"))
+
+    def test_deshabilitado_no_se_instala(self):
+        from .middleware import PerfiladoMiddleware
+
+        with override_settings(PERFILADO_HABILITADO=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                PerfiladoMiddleware(lambda request: HttpResponse())
+
+    def test_solicitud_marcada_por_superusuario(self):
+        usuario = User.objects.create_user("comun", password="clave-segura-123")
+        self.client.force_login(usuario)
+        response = self.client.get(reverse("estadisticas_cache"), {"perfilar": "1"})
+        self.assertNotIn("X-Perfil", response)
+        self.assertEqual(self._perfiles(), [])
+
+        self.client.force_login(self.admin)
+        self.assertNotIn("X-Perfil", self.client.get(reverse("estadisticas_cache")))
+        response = self.client.get(reverse("estadisticas_cache"), HTTP_X_PERFILAR="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._perfiles(), [response["X-Perfil"]])
+        ruta = os.path.join(self.directorio, response["X-Perfil"])
+        self.assertGreater(pstats.Stats(ruta).total_calls, 0)
+        with open(ruta[:-len(".prof")] + ".txt", encoding="utf-8") as f:
+            self.assertIn("GET /panel/cache/", f.read())
+
+    async def test_vista_async(self):
+        plano = await Plano.objects.acreate(titulo="Async", archivo_pdf="uploads/planos/x.pdf")
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse("estado_plano", args=[plano.id]), headers={"x-perfilar": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["X-Perfil"].endswith(f"GET_panel_estado_{plano.id}.prof"))
+
+    def test_trabajo_marcado_y_retencion(self):
+        plano = Plano.objects.create(titulo="Lento", archivo_pdf="uploads/planos/x.pdf")
+        trabajo, = cola.encolar([plano])
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse("trabajo-perfilar", args=[trabajo.id]))
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.json()["perfilar"])
+
+        with mock.patch("planos.cola.procesar_pdf"):
+            self.assertEqual(cola.procesar_pendientes(), 2)
+        # Solo el trabajo marcado se perfila
+        self.assertEqual(len(self._perfiles()), 1)
+        self.assertIn(f"plano-{plano.id}", self._perfiles()[0])
+
+        with override_settings(PERFILES_MAX_ARCHIVOS=2):
+            for i in range(3):
+                with perfilado.perfilar(f"bloque-{i}") as perfil:
+                    # Un perfil a la vez: el anidado corre sin perfilar
+                    with perfilado.perfilar("anidado") as anidado:
+                        self.assertIsNone(anidado)
+                self.assertTrue(os.path.exists(perfil["ruta"]))
+        self.assertEqual(len(self._perfiles()), 2)
+        self.assertEqual(len(os.listdir(self.directorio)), 4)
+        self.assertTrue(self._perfiles()[-1].endswith("bloque-2.prof"))
+
+    @override_settings(EXTRACCION_AISLADA=True)
+    def test_trabajo_perfila_la_extraccion_en_el_hijo(self):
+        modelo = Plano.objects.create(titulo="Modelo", archivo_pdf="uploads/planos/x.pdf",
+                                      datos_procesados=DATOS_EJEMPLO)
+        buffer = io.BytesIO()
+        PdfMemoriaRenderer(modelo).render_to(buffer)
+        plano = Plano.objects.create(
+            titulo="Perfilado",
+            archivo_pdf=SimpleUploadedFile("perfilado.pdf", buffer.getvalue(), content_type="application/pdf"),
+        )
+        trabajo, = cola.encolar([plano], perfilar=True)
+
+        cola.procesar_pendientes()
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoProcesamiento.COMPLETADO)
+
+        # El perfil del padre solo ve la espera; el del hijo, la extracción
+        perfiles = self._perfiles()
+        self.assertEqual(len(perfiles), 2)
+        extraccion, = [p for p in perfiles if p.endswith(f"trabajo-{trabajo.id}-plano-{plano.id}-extraccion.prof")]
+        extraccion = os.path.join(self.directorio, extraccion)
+        archivos = {archivo for archivo, _linea, _funcion in pstats.Stats(extraccion).stats}
+        self.assertTrue(any(archivo.endswith(os.path.join("utils", "pdf_processor.py")) for archivo in archivos))
+
+        with perfilado.perfilar("directo") as perfil:
+            aislamiento.extraer(plano.archivo_pdf.path)
+        self.assertTrue(perfil["extraccion"].endswith("directo-extraccion.prof"))
+
+
+class RecursosTests(MediaTemporalMixin, TestCase):
+    def _escaneado(self, paginas=2):
+        """PDF de páginas de 100 x 100 pt sin texto embebido"""
+        imagenes = [Image.new("RGB", (100, 100), "white") for _ in range(paginas)]
+        buffer = io.BytesIO()
+        imagenes[0].save(buffer, "PDF", resolution=72, save_all=True, append_images=imagenes[1:])
+        return SimpleUploadedFile("escaneado.pdf", buffer.getvalue(), content_type="application/pdf")
+
+    def test_resolucion_dentro_del_presupuesto(self):
+        with override_settings(OCR_DPI=200, OCR_DPI_MIN=100, OCR_MAX_PIXELES_PAGINA=60_000_000):
+            self.assertEqual(recursos.dpi_para(595, 842), 200)
+            # Un A0 a 200 dpi son 62 millones de píxeles
+            dpi = recursos.dpi_para(2384, 3370)
+            self.assertLess(dpi, 200)
+            self.assertLessEqual(recursos.pixeles(2384, 3370, dpi), 60_000_000)
+            with override_settings(OCR_MAX_PIXELES_PAGINA=1_000_000):
+                with self.assertRaises(recursos.PresupuestoExcedido):
+                    recursos.dpi_para(2384, 3370)
+
+    @override_settings(EXTRACCION_AISLADA=False)
+    def test_ocr_pagina_por_pagina(self):
+        from .services import procesar_pdf
+
+        plano = Plano.objects.create(titulo="Escaneado", archivo_pdf=self._escaneado())
+        with mock.patch("planos.utils.pdf_processor.convert_from_path",
+                        side_effect=lambda *a, **kw: [Image.new("RGB", (10, 10))]) as convertir, \
+                mock.patch("planos.utils.pdf_processor.pytesseract.image_to_string", return_value="OBJETO: Mensura"):
+            procesar_pdf(plano, usar_cache=False)
+
+        self.assertEqual(
+            [(c.kwargs["first_page"], c.kwargs["last_page"], c.kwargs["dpi"]) for c in convertir.call_args_list],
+            [(1, 1, 200), (2, 2, 200)],
+        )
+        plano.refresh_from_db()
+        self.assertEqual(plano.metricas["paginas_ocr"], 2)
+        self.assertEqual(
+            set(plano.metricas["memoria"]),
+            {"rss_inicial_mb", "rss_pico_mb", "crecimiento_mb", "python_pico_mb", "etapas_mb"},
+        )
+        self.assertIn("ocr", plano.metricas["memoria"]["etapas_mb"])
+        self.assertGreater(plano.metricas["memoria"]["rss_pico_mb"], 0)
+        self.assertIn("agrimensores_plano_memoria_bytes_count", metricas.exponer())
+
+    def test_fuera_de_presupuesto_no_se_reintenta(self):
+        plano = Plano.objects.create(titulo="Largo", archivo_pdf=self._escaneado(paginas=3))
+        trabajo, = cola.encolar([plano])
+        with override_settings(PDF_MAX_PAGINAS=2), \
+                mock.patch("planos.utils.pdf_processor.convert_from_path") as convertir:
+            cola.procesar_pendientes()
+
+        convertir.assert_not_called()
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoProcesamiento.ERROR)
+        self.assertEqual(trabajo.intentos, 1)
+        self.assertIn("3 páginas", trabajo.error)
+        # El pico de memoria queda registrado aunque el plano falle
+        self.assertIn("memoria", Plano.objects.get(id=plano.id).metricas)
+
+    def test_limite_de_memoria_del_trabajo(self):
+        # Fuera de un trabajo medido el punto de control no hace nada
+        recursos.verificar(10 ** 12)
+        with override_settings(MEMORIA_MAX_TRABAJO_MB=64, MEMORIA_MUESTREO=0):
+            with recursos.medir() as medidor:
+                recursos.verificar(10 * recursos.MB)
+                with self.assertRaises(recursos.MemoriaExcedida):
+                    recursos.verificar(100 * recursos.MB)
+        self.assertGreaterEqual(medidor.crecimiento, 0)
+
+    def test_worker_se_recicla(self):
+        planos = [Plano.objects.create(titulo=f"P{i}", archivo_pdf="uploads/planos/x.pdf") for i in range(2)]
+        cola.encolar(planos)
+        salida = io.StringIO()
+        with override_settings(COLA_RECICLAR_RSS_MB=1), mock.patch("planos.cola.procesar_pdf"):
+            call_command("procesar_cola", una_vez=True, stdout=salida)
+
+        self.assertIn("reciclarse", salida.getvalue())
+        self.assertEqual(TrabajoProcesamiento.objects.filter(estado=TrabajoProcesamiento.PENDIENTE).count(), 1)
+
+
+@skipUnless(hasattr(os, "mkfifo"), "requiere FIFOs")
+class AislamientoTests(TestCase):
+    def setUp(self):
+        # Leer un FIFO sin escritor bloquea para siempre, como un PDF que cuelga a pdfplumber
+        self.directorio = tempfile.mkdtemp()
+        self.fifo = os.path.join(self.directorio, "colgado.pdf")
+        os.mkfifo(self.fifo)
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "clave-super-segura")
+
+    def tearDown(self):
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    @override_settings(EXTRACCION_TIMEOUT=1)
+    def test_extraccion_colgada_se_mata(self):
+        inicio = time.monotonic()
+        with self.assertRaises(recursos.TiempoAgotado):
+            aislamiento.extraer(self.fifo)
+        self.assertLess(time.monotonic() - inicio, 10)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_cancelacion_durante_la_extraccion(self):
+        consultas = []
+
+        def cancelado():
+            consultas.append(1)
+            return len(consultas) >= 2
+
+        with self.assertRaises(aislamiento.Cancelado):
+            aislamiento.extraer(self.fifo, cancelado=cancelado)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_estados_de_la_cola(self):
+        plano = Plano.objects.create(titulo="Lento", archivo_pdf="uploads/planos/x.pdf")
+        trabajo, = cola.encolar([plano])
+        with mock.patch("planos.cola.procesar_pdf", side_effect=recursos.TiempoAgotado("superó 1 s")):
+            cola.procesar_pendientes()
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoProcesamiento.TIEMPO_AGOTADO)
+        self.assertEqual(trabajo.intentos, 1)
+        self.assertEqual(Plano.objects.get(id=plano.id).estado, "error")
+
+        # Cancelado mientras corre: el worker lo nota en su próxima consulta
+        def procesar(plano, cancelado, **kwargs):
+            self.assertFalse(cancelado())
+            cola.cancelar(plano)
+            if cancelado():
+                raise aislamiento.Cancelado("Procesamiento cancelado")
+
+        trabajo, = cola.encolar([plano])
+        with mock.patch("planos.cola.procesar_pdf", side_effect=procesar):
+            cola.procesar_pendientes()
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoProcesamiento.CANCELADO)
+        self.assertIsNotNone(trabajo.fecha_fin)
+        self.assertEqual(Plano.objects.get(id=plano.id).estado, "cancelado")
+
+    def test_cancelar_pendiente(self):
+        plano = Plano.objects.create(titulo="En cola", archivo_pdf="uploads/planos/x.pdf")
+        trabajo, = cola.encolar([plano])
+        self.client.force_login(self.admin)
+
+        response = self.client.post(reverse("plano-cancelar", args=[plano.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"estado": "cancelado", "trabajos": 1})
+        self.assertIsNone(cola.tomar_trabajo())
+        self.assertEqual(self.client.post(reverse("plano-cancelar", args=[plano.id])).status_code, 409)
+
+        self.assertEqual(self.client.get(reverse("cancelar_plano", args=[plano.id])).status_code, 405)
+        response = self.client.post(reverse("cancelar_plano", args=[plano.id]))
+        self.assertRedirects(response, reverse("detalle_plano", args=[plano.id]), fetch_redirect_response=False)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoProcesamiento.CANCELADO)
+
+
+class BenchmarkProcesamientoTests(TestCase):
+    def test_percentiles(self):
+        from .management.commands.benchmark_procesamiento import percentil
+
+        self.assertIsNone(percentil([], 50))
+        self.assertEqual(percentil([3.0], 99), 3.0)
+        self.assertEqual(percentil([4, 1, 3, 2], 50), 2.5)
+        self.assertAlmostEqual(percentil(list(range(101)), 95), 95)
+
+    def test_corpus_incluye_subdirectorios(self):
+        from .management.commands.benchmark_procesamiento import corpus
+
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        # Como quedan las cargas guardadas por contenido
+        os.makedirs(os.path.join(directorio, "ab", "cd"))
+        for ruta in (("ab", "cd", "abcd.pdf"), ("suelto.pdf",), ("ab", "notas.txt")):
+            with open(os.path.join(directorio, *ruta), "wb") as f:
+                f.write(b"%PDF-1.4")
+        self.assertEqual([nombre for nombre, _contenido in corpus(directorio, 0, 1)], ["abcd.pdf", "suelto.pdf"])
+
+    @override_settings(EXTRACCION_AISLADA=False)
+    def test_informe_y_regresiones(self):
+        from .management.commands.benchmark_procesamiento import comparar
+
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        salida = os.path.join(directorio, "bench.json")
+        call_command(
+            "benchmark_procesamiento", escenarios=["servicio", "api"], concurrencia=[1], corpus=directorio,
+            sinteticos=2, coordenadas=20, salida=salida, base_actual=True, stdout=io.StringIO(),
+        )
+
+        with open(salida, encoding="utf-8") as f:
+            informe = json.load(f)
+        self.assertEqual([(r["escenario"], r["planos"], r["errores"]) for r in informe["resultados"]],
+                         [("servicio", 2, 0), ("api", 2, 0)])
+        servicio = informe["resultados"][0]
+        self.assertLessEqual(servicio["latencia_s"]["p50"], servicio["latencia_s"]["p99"])
+        self.assertGreater(servicio["planos_por_minuto"], 0)
+        self.assertIn("texto", servicio["memoria_pico_mb"])
+        self.assertIn("extraccion", servicio["etapas_p50_s"])
+        # Los planos del benchmark no quedan en la base
+        self.assertFalse(Plano.objects.exists())
+
+        self.assertEqual(comparar(informe, informe, 0.2), [])
+        anterior = json.loads(json.dumps(informe))
+        anterior["resultados"][0]["latencia_s"]["p95"] = servicio["latencia_s"]["p95"] / 2
+        anterior["resultados"][0]["planos_por_minuto"] = servicio["planos_por_minuto"] * 2
+        self.assertEqual(len(comparar(informe, anterior, 0.2)), 2)
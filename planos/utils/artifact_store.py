@@ -0,0 +1,208 @@
+"""
+Almacén de artefactos direccionado por contenido.
+
+Cada artefacto generado (memoria Word, texto de IA, etc.) se guarda bajo el
+SHA-256 de sus datos de entrada más la versión del generador. Si la clave no
+cambió no hace falta regenerar, y el mismo valor sirve como ETag fuerte.
+
+Los archivos viven en el storage ``artefactos`` (disco local o almacén de
+objetos, ver ``planos.storage``): se generan en un temporal local y recién
+completos se publican.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+
+from .cache_archivos import ruta_en_disco, ruta_local
+
+logger = logging.getLogger(__name__)
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_para(clave):
+    with _locks_guard:
+        return _locks.setdefault(clave, threading.Lock())
+
+
+class ArtifactStore:
+    """Guarda artefactos en ``<base_dir>/<ab>/<clave><ext>`` del storage ``artefactos``"""
+
+    def __init__(self, base_dir="outputs/memorias", storage=None):
+        self.base_dir = base_dir.strip("/")
+        self._storage = storage
+
+    @property
+    def storage(self):
+        # Se resuelve en cada uso: los tests cambian STORAGES/MEDIA_ROOT
+        return self._storage or storages["artefactos"]
+
+    # -------------------------
+    # Claves
+    # -------------------------
+    @staticmethod
+    def compute_key(datos, version, tipo="memoria"):
+        """SHA-256 estable de los datos de entrada + versión del generador"""
+        payload = json.dumps(
+            {"tipo": tipo, "version": version, "datos": datos},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def key_from_path(ruta):
+        """Clave (o identificador estable) a partir de una ruta de artefacto"""
+        return os.path.splitext(os.path.basename(ruta))[0] if ruta else None
+
+    # -------------------------
+    # Rutas
+    # -------------------------
+    def relative_path(self, clave, extension=".docx"):
+        return f"{self.base_dir}/{clave[:2]}/{clave}{extension}"
+
+    @staticmethod
+    def absolute_path(ruta_relativa):
+        """Ruta bajo ``MEDIA_ROOT`` (solo storage local; ver ``ruta_local``)"""
+        return os.path.join(settings.MEDIA_ROOT, *ruta_relativa.split("/"))
+
+    def ruta_local(self, ruta_relativa):
+        """Ruta en disco del artefacto; con un storage remoto, una copia en caché"""
+        return ruta_local(self.storage, ruta_relativa)
+
+    def abrir(self, ruta_relativa):
+        """Archivo abierto para lectura en streaming"""
+        return self.storage.open(ruta_relativa, "rb")
+
+    def exists(self, clave, extension=".docx"):
+        return self.storage.exists(self.relative_path(clave, extension))
+
+    def existe_ruta(self, ruta_relativa):
+        return bool(ruta_relativa) and self.storage.exists(ruta_relativa)
+
+    # -------------------------
+    # Escritura / lectura
+    # -------------------------
+    def save(self, clave, extension, escribir):
+        """
+        Escribe el artefacto de forma atómica.
+
+        ``escribir`` recibe la ruta temporal donde debe volcar el contenido;
+        recién al terminar se publica en el destino final (un rename en
+        disco local, un PUT en un almacén de objetos).
+        """
+        ruta_relativa = self.relative_path(clave, extension)
+        destino = ruta_en_disco(self.storage, ruta_relativa)
+        directorio = os.path.dirname(destino) if destino else None
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        fd, temporal = tempfile.mkstemp(dir=directorio, suffix=".tmp")
+        os.close(fd)
+        try:
+            escribir(temporal)
+            if destino:
+                os.replace(temporal, destino)
+            else:
+                with open(temporal, "rb") as f:
+                    self.storage.save(ruta_relativa, File(f, name=ruta_relativa))
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return ruta_relativa
+
+    def get_or_create(self, clave, extension, escribir):
+        """
+        Devuelve ``(ruta_relativa, generado)``. Solo invoca ``escribir`` si el
+        artefacto todavía no existe para esa clave.
+        """
+        ruta_relativa = self.relative_path(clave, extension)
+        if self.storage.exists(ruta_relativa):
+            return ruta_relativa, False
+        with _lock_para(clave):
+            if self.storage.exists(ruta_relativa):
+                return ruta_relativa, False
+            self.save(clave, extension, escribir)
+        logger.info("Artefacto generado: %s", ruta_relativa)
+        return ruta_relativa, True
+
+    def read_text(self, clave, extension=".txt"):
+        ruta = self.relative_path(clave, extension)
+        try:
+            with self.storage.open(ruta, "rb") as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def save_text(self, clave, texto, extension=".txt"):
+        def _escribir(ruta):
+            with open(ruta, "w", encoding="utf-8") as f:
+                f.write(texto)
+        return self.save(clave, extension, _escribir)
+
+    # -------------------------
+    # Recolección de basura
+    # -------------------------
+    def iter_files(self):
+        """Recorre todos los archivos bajo ``base_dir`` (rutas relativas)"""
+        pendientes = [self.base_dir]
+        while pendientes:
+            directorio = pendientes.pop()
+            try:
+                subdirectorios, archivos = self.storage.listdir(directorio)
+            except FileNotFoundError:
+                continue
+            pendientes += [f"{directorio}/{d}" for d in subdirectorios]
+            for nombre in archivos:
+                yield f"{directorio}/{nombre}"
+
+    def collect_garbage(self, es_referenciado, edad_minima=3600, dry_run=False):
+        """
+        Elimina los archivos que ``es_referenciado(ruta_relativa)`` considera
+        huérfanos y que tienen más de ``edad_minima`` segundos (para no borrar
+        artefactos que se están generando en este momento).
+
+        Returns:
+            list: rutas relativas eliminadas (o que se eliminarían)
+        """
+        limite = time.time() - edad_minima
+        eliminados = []
+        for relativa in list(self.iter_files()):
+            try:
+                if self.storage.get_modified_time(relativa).timestamp() > limite or es_referenciado(relativa):
+                    continue
+                if not dry_run:
+                    self.storage.delete(relativa)
+                eliminados.append(relativa)
+            except FileNotFoundError:
+                continue
+        if not dry_run:
+            self._remove_empty_dirs()
+        return eliminados
+
+    def _remove_empty_dirs(self):
+        # Los almacenes de objetos no tienen directorios
+        raiz = ruta_en_disco(self.storage, self.base_dir)
+        if raiz is None:
+            return
+        for dirpath, dirnames, filenames in os.walk(raiz, topdown=False):
+            if dirpath != raiz and not dirnames and not filenames:
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass
+
+
+memorias_store = ArtifactStore("outputs/memorias")
+memorias_ia_store = ArtifactStore("outputs/memorias_ia")
@@ -0,0 +1,115 @@
+"""
+Caché local de lectura para archivos de un storage remoto.
+
+pdfplumber, LibreOffice y el ZIP de exportación necesitan una ruta en
+disco. Con el storage local se usa la del propio archivo; con un almacén de
+objetos (S3) el archivo se descarga una vez, por bloques, a
+``CACHE_ARCHIVOS_DIR`` y las lecturas siguientes del mismo nodo lo
+reutilizan. Cuando la caché supera ``CACHE_ARCHIVOS_MAX_BYTES`` se borran
+los archivos usados hace más tiempo.
+
+Las entradas se identifican por nombre, sin validar contra el origen: solo
+sirve para nombres inmutables, como los PDF por contenido
+(``uploads/planos/ab/cd/<sha256>.pdf``) y los artefactos de ``ArtifactStore``.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BLOQUE = 1024 * 1024
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_para(clave):
+    with _locks_guard:
+        return _locks.setdefault(clave, threading.Lock())
+
+
+def directorio_cache():
+    return getattr(settings, "CACHE_ARCHIVOS_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "agrimensores_cache"
+    )
+
+
+def ruta_en_disco(storage, nombre):
+    """Ruta del archivo si el storage es un disco local, ``None`` si no"""
+    try:
+        return storage.path(nombre)
+    except NotImplementedError:
+        return None
+
+
+def _ruta_cache(nombre):
+    clave = hashlib.sha256(nombre.encode("utf-8")).hexdigest()
+    # Se conserva la extensión: LibreOffice decide el filtro por ella
+    return os.path.join(directorio_cache(), clave[:2], clave + os.path.splitext(nombre)[1].lower())
+
+
+def ruta_local(storage, nombre):
+    """Ruta local legible de ``nombre``, descargándolo a la caché si hace falta"""
+    ruta = ruta_en_disco(storage, nombre)
+    if ruta is not None:
+        return ruta
+
+    destino = _ruta_cache(nombre)
+    if os.path.exists(destino):
+        # La fecha de modificación ordena el desalojo (menos usado primero)
+        os.utime(destino)
+        return destino
+
+    with _lock_para(destino):
+        if os.path.exists(destino):
+            return destino
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        fd, temporal = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f, storage.open(nombre, "rb") as origen:
+                for bloque in origen.chunks(BLOQUE):
+                    f.write(bloque)
+            os.replace(temporal, destino)
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+    logger.info(f"Caché de archivos: descargado {nombre}")
+    recortar()
+    return destino
+
+
+def recortar(max_bytes=None):
+    """Borra los archivos menos usados hasta quedar por debajo del límite"""
+    max_bytes = max_bytes or getattr(settings, "CACHE_ARCHIVOS_MAX_BYTES", 2 * 1024 ** 3)
+    archivos, total = [], 0
+    for dirpath, _dirnames, filenames in os.walk(directorio_cache()):
+        for nombre in filenames:
+            ruta = os.path.join(dirpath, nombre)
+            try:
+                st = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            archivos.append((st.st_mtime, st.st_size, ruta))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0
+
+    eliminados = 0
+    # Se baja al 90 % para no recortar en cada descarga
+    for _mtime, tamanio, ruta in sorted(archivos):
+        if total <= max_bytes * 0.9:
+            break
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+        total -= tamanio
+        eliminados += 1
+    return eliminados
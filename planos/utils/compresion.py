@@ -0,0 +1,61 @@
+"""
+Compresión de los resultados pesados de la extracción.
+
+Se usa zstd si el paquete ``zstandard`` está instalado y zlib en caso
+contrario. El algoritmo queda registrado junto a cada blob, así que los
+datos escritos con uno se siguen leyendo aunque cambie la instalación.
+"""
+
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+ALGORITMO_POR_DEFECTO = "zstd" if zstandard is not None else "zlib"
+NIVEL_ZLIB = 6
+NIVEL_ZSTD = 10
+
+
+class CompresionError(Exception):
+    """Blob con un algoritmo de compresión no disponible"""
+
+
+def comprimir(datos, algoritmo=ALGORITMO_POR_DEFECTO):
+    if algoritmo == "zstd":
+        if zstandard is None:
+            raise CompresionError("zstandard no está instalado")
+        return zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(datos)
+    if algoritmo == "zlib":
+        return zlib.compress(datos, NIVEL_ZLIB)
+    raise CompresionError(f"Algoritmo de compresión desconocido: {algoritmo}")
+
+
+def descomprimir(blob, algoritmo):
+    blob = bytes(blob)
+    if algoritmo == "zstd":
+        if zstandard is None:
+            raise CompresionError("Hay datos comprimidos con zstd pero zstandard no está instalado")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if algoritmo == "zlib":
+        return zlib.decompress(blob)
+    raise CompresionError(f"Algoritmo de compresión desconocido: {algoritmo}")
+
+
+def descomprimir_texto(blob, algoritmo):
+    return None if blob is None else descomprimir(blob, algoritmo).decode("utf-8")
+
+
+def serializar_json(valor):
+    """JSON compacto en UTF-8, listo para comprimir"""
+    if valor is None:
+        return None
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":"), cls=DjangoJSONEncoder).encode("utf-8")
+
+
+def descomprimir_json(blob, algoritmo):
+    return None if blob is None else json.loads(descomprimir(blob, algoritmo))
@@ -0,0 +1,88 @@
+"""
+Escritura rápida de tablas Word.
+
+python-docx agrega filas con ``table.add_row().cells`` y cada asignación a
+``cell.text`` vuelve a recorrer el XML de la tabla, por lo que un plano con
+cientos de vértices escala de forma cuadrática. Aquí se arma el conjunto de
+filas ``<w:tr>`` como texto XML en una sola pasada y se parsea una única vez
+con lxml, manteniendo el mismo estilo que produce python-docx.
+"""
+
+from xml.sax.saxutils import escape
+
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+_NSDECLS = nsdecls("w")
+
+
+def _run_xml(texto, bold=False):
+    """Devuelve el XML de un ``<w:r>`` equivalente a ``cell.text = texto``"""
+    partes = ["<w:r>"]
+    if bold:
+        partes.append("<w:rPr><w:b/></w:rPr>")
+    texto = "" if texto is None else str(texto)
+    for i, linea in enumerate(texto.split("\n")):
+        if i:
+            partes.append("<w:br/>")
+        for j, fragmento in enumerate(linea.split("\t")):
+            if j:
+                partes.append("<w:tab/>")
+            if not fragmento:
+                continue
+            if fragmento != fragmento.strip():
+                partes.append(f'<w:t xml:space="preserve">{escape(fragmento)}</w:t>')
+            else:
+                partes.append(f"<w:t>{escape(fragmento)}</w:t>")
+    partes.append("</w:r>")
+    return "".join(partes)
+
+
+def _rows_xml(filas, tcpr_xml, bold=False):
+    """Genera el XML de todas las filas como un único string"""
+    partes = []
+    for fila in filas:
+        partes.append("<w:tr>")
+        for tcpr, valor in zip(tcpr_xml, fila):
+            partes.append(f"<w:tc>{tcpr}<w:p>{_run_xml(valor, bold)}</w:p></w:tc>")
+        partes.append("</w:tr>")
+    return "".join(partes)
+
+
+def add_table_fast(doc, encabezados, filas, style="Table Grid", bold_header=True):
+    """
+    Agrega una tabla al documento con encabezado y filas en una sola pasada.
+
+    Args:
+        doc: documento python-docx (o cualquier contenedor con ``add_table``)
+        encabezados: lista con los títulos de columna
+        filas: iterable de secuencias de valores (uno por columna)
+        style: estilo de tabla de Word
+        bold_header: si los títulos van en negrita
+
+    Returns:
+        La tabla python-docx creada
+    """
+    cols = len(encabezados)
+    table = doc.add_table(rows=1, cols=cols)
+    if style:
+        table.style = style
+
+    tbl = table._tbl
+    # Mismo ancho de celda que asigna python-docx a partir de la grilla
+    tcpr_xml = []
+    for col in tbl.tblGrid.gridCol_lst:
+        ancho = col.get(qn("w:w"))
+        tcpr_xml.append(f'<w:tcPr><w:tcW w:type="dxa" w:w="{ancho}"/></w:tcPr>' if ancho else "")
+
+    def _normalizar(fila):
+        valores = list(fila)[:cols]
+        return valores + [""] * (cols - len(valores))
+
+    cuerpo = _rows_xml([encabezados], tcpr_xml, bold=bold_header)
+    cuerpo += _rows_xml((_normalizar(fila) for fila in filas), tcpr_xml)
+    contenedor = parse_xml(f"<w:tbl {_NSDECLS}>{cuerpo}</w:tbl>")
+
+    tbl.remove(tbl.tr_lst[0])
+    tbl.extend(list(contenedor))
+    return table
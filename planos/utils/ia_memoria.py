@@ -1,12 +1,20 @@
 import os
+from contextlib import contextmanager
+
 from dotenv import load_dotenv
 from google import genai
 
+from planos import metricas
+
+from .artifact_store import ArtifactStore
+
 load_dotenv()
 client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+MODELO = "models/gemini-2.5-flash"  # usa el modelo que viste en list_models.py
 
-def generar_memoria_gemini(datos):
-    prompt = f"""
+
+def _prompt(datos):
+    return f"""
     Eres un asistente experto en agrimensura y documentación técnica.
     Tu tarea es redactar una MEMORIA DESCRIPTIVA completa y formal de un plano de mensura y división.
     Usa exclusivamente los datos extraídos del PDF que te paso en formato JSON.
@@ -25,8 +33,50 @@ def generar_memoria_gemini(datos):
     - Finaliza con la fórmula institucional.
     """
 
-    response = client.models.generate_content(
-        model="models/gemini-2.5-flash",  # usa el modelo que viste en list_models.py
-        contents=prompt
-    )
+
+@contextmanager
+def _medir_llamada():
+    resultado = "error"
+    try:
+        with metricas.cronometro("gemini"):
+            yield
+        resultado = "ok"
+    finally:
+        metricas.LLM_LLAMADAS.inc(modelo=MODELO, resultado=resultado)
+
+
+def generar_memoria_gemini(datos):
+    with _medir_llamada():
+        response = client.models.generate_content(model=MODELO, contents=_prompt(datos))
+    return response.text
+
+
+async def agenerar_memoria_gemini(datos):
+    """Igual que ``generar_memoria_gemini`` sin bloquear el event loop (vistas async)"""
+    with _medir_llamada():
+        response = await client.aio.models.generate_content(model=MODELO, contents=_prompt(datos))
     return response.text
+
+
+# -------------------------
+# Caché de memorias generadas por IA
+# -------------------------
+# Incrementar al cambiar el prompt o el formato del DOCX de la memoria IA.
+GEMINI_VERSION = "1"
+
+
+def memoria_ia_store(plano_id):
+    """Almacén de artefactos IA de un plano (texto y DOCX)"""
+    return ArtifactStore(f"outputs/memorias_ia/{plano_id}")
+
+
+def clave_texto_ia(datos):
+    return ArtifactStore.compute_key(datos, GEMINI_VERSION, tipo="memoria_ia")
+
+
+def clave_docx_ia(clave_texto, memoria_texto):
+    return ArtifactStore.compute_key(
+        {"clave_texto": clave_texto, "texto": memoria_texto},
+        GEMINI_VERSION,
+        tipo="memoria_ia_docx",
+    )
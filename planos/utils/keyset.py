@@ -0,0 +1,82 @@
+"""
+Paginación por clave (keyset) sobre ``(fecha_carga, id)``.
+
+En lugar de ``OFFSET`` cada página continúa desde la última fila vista, por
+lo que el costo de una página no depende de cuántas filas la preceden ni del
+total de la tabla (no se ejecuta ningún ``COUNT``). El cursor es opaco para
+el cliente: base64 de ``<fecha ISO>|<id>``.
+"""
+
+import base64
+import binascii
+from dataclasses import dataclass, field
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def codificar_cursor(fecha, pk):
+    valor = f"{fecha.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(valor).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor):
+    """Devuelve ``(fecha, id)`` o ``None`` si el cursor no es válido"""
+    if not cursor:
+        return None
+    try:
+        valor = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        fecha, pk = valor.rsplit("|", 1)
+        fecha = parse_datetime(fecha)
+        return (fecha, int(pk)) if fecha else None
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+@dataclass
+class PaginaKeyset:
+    items: list = field(default_factory=list)
+    siguiente: str = None
+    anterior: str = None
+
+    @property
+    def hay_siguiente(self):
+        return self.siguiente is not None
+
+    @property
+    def hay_anterior(self):
+        return self.anterior is not None
+
+
+def paginar_keyset(qs, despues=None, antes=None, tamanio=50, campo="fecha_carga"):
+    """
+    Página de ``qs`` en orden descendente por ``(campo, id)``.
+
+    ``despues`` avanza hacia filas más antiguas y ``antes`` retrocede hacia
+    más nuevas; ambos son cursores devueltos en una página previa.
+    """
+    clave_despues = decodificar_cursor(despues)
+    clave_antes = None if clave_despues else decodificar_cursor(antes)
+
+    if clave_antes:
+        fecha, pk = clave_antes
+        qs = qs.filter(Q(**{f"{campo}__gt": fecha}) | Q(**{campo: fecha, "id__gt": pk}))
+        filas = list(qs.order_by(campo, "id")[: tamanio + 1])
+        hay_mas = len(filas) > tamanio
+        filas = filas[:tamanio][::-1]
+        hay_previas, hay_siguientes = hay_mas, True
+    else:
+        if clave_despues:
+            fecha, pk = clave_despues
+            qs = qs.filter(Q(**{f"{campo}__lt": fecha}) | Q(**{campo: fecha, "id__lt": pk}))
+        filas = list(qs.order_by(f"-{campo}", "-id")[: tamanio + 1])
+        hay_siguientes = len(filas) > tamanio
+        filas = filas[:tamanio]
+        hay_previas = clave_despues is not None
+
+    pagina = PaginaKeyset(items=filas)
+    if filas and hay_siguientes:
+        pagina.siguiente = codificar_cursor(getattr(filas[-1], campo), filas[-1].id)
+    if filas and hay_previas:
+        pagina.anterior = codificar_cursor(getattr(filas[0], campo), filas[0].id)
+    return pagina
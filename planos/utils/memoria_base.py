@@ -0,0 +1,180 @@
+"""
+Contenido común de la memoria descriptiva.
+
+Normaliza los datos extraídos del plano (cabecera, planillas, referencias)
+para que los distintos formatos de salida (Word, PDF) generen exactamente
+las mismas secciones.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUPERFICIES_HEADERS = ["Designación", "Superficie", "Observaciones"]
+LADOS_HEADERS = ["Vértice", "Rumbo", "Lado", "Medida (m)", "Ángulo", "Linderos"]
+COORDENADAS_HEADERS = ["Punto", "Latitud", "Longitud", "Norte GK", "Este GK"]
+
+NOTA_SUPERFICIES = (
+    "(Nota: Los valores exactos de cada superficie deben transcribirse de la "
+    "Planilla de Superficies del plano)"
+)
+CIERRE = "Con esto se dan por finalizadas las operaciones de mensura y división."
+PIE = "Agrimensores SDE - Santiago del Estero"
+
+
+class MemoriaBase:
+    """Datos de la memoria descriptiva listos para volcar en un documento"""
+
+    def __init__(self, plano):
+        self.plano = plano
+        self.datos = plano.datos_procesados or {}
+        logger.debug("Datos recibidos en %s: %s", type(self).__name__, self.datos)
+
+    # -------------------------
+    # Helpers
+    # -------------------------
+    def _format_dominios(self):
+        dominios = self.datos.get("dominios", [])
+        if not dominios:
+            return "No especificado"
+        return ", ".join(
+            [d.get("matricula", "") if isinstance(d, dict) else str(d) for d in dominios]
+        ) or "No especificado"
+
+    def _format_propietarios(self):
+        propietarios = self.datos.get("propietarios", [])
+        if not propietarios:
+            return "No especificado"
+        nombres = []
+        for p in propietarios:
+            if isinstance(p, dict):
+                nom = p.get("nombre", "").strip()
+                if nom:
+                    nombres.append(nom)
+            else:
+                s = str(p).strip()
+                if s:
+                    nombres.append(s)
+        if not nombres:
+            return "No especificado"
+        return ", ".join(nombres[:3]) + (" entre otros" if len(nombres) > 3 else "")
+
+    def _dedupe_lados(self, lados):
+        """Deduplica lados por (lado, medida) y mantiene el primero"""
+        seen = set()
+        result = []
+        for lado_item in lados or []:
+            if not isinstance(lado_item, dict):
+                continue
+            key = (
+                str(lado_item.get("lado", "")).strip(),
+                str(lado_item.get("mide", "")).strip()
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            result.append(lado_item)
+        return result
+
+    def _normalize_refs(self, referencias):
+        """Normaliza referencias a lista de strings sin duplicados"""
+        if not referencias:
+            return []
+        if isinstance(referencias, str):
+            refs = [r.strip() for r in referencias.split("\n") if r.strip()]
+        elif isinstance(referencias, list):
+            refs = [str(r).strip() for r in referencias if str(r).strip()]
+        else:
+            refs = [str(referencias).strip()]
+        dedup, seen = [], set()
+        for r in refs:
+            if r not in seen:
+                seen.add(r)
+                dedup.append(r)
+        return dedup
+
+    # -------------------------
+    # Secciones
+    # -------------------------
+    def _fecha_operaciones(self):
+        return self.datos.get("fecha_operaciones") or "No especificado"
+
+    def _cabecera(self):
+        """Pares (etiqueta, valor) del encabezado de la memoria"""
+        padrones = ", ".join(self.datos.get("padrones", [])).strip() or "No especificado"
+        campos = [
+            ("DEPARTAMENTO", self.datos.get("departamento", "No especificado")),
+            ("PADRON", padrones),
+            ("LUGAR", self.datos.get("lugar", "No especificado")),
+            ("DOMINIO", self._format_dominios()),
+        ]
+        if self.datos.get("baricentro"):
+            campos.append(("BARICENTRO GEOGRÁFICO", self.datos.get("baricentro")))
+        campos += [
+            ("OBJETO", self.datos.get("objeto", "No especificado")),
+            ("INMUEBLE", self.datos.get("inmueble", "No especificado")),
+            ("TITULAR", self._format_propietarios()),
+            ("FECHA DE OPERACIÓN", self._fecha_operaciones()),
+        ]
+        return [
+            (label, str(value if value not in [None, ""] else "No especificado"))
+            for label, value in campos
+        ]
+
+    def _extracto_titulo(self):
+        medidas_linderos = self.datos.get("medidas_linderos") or "Según plano de mensura."
+        return [
+            f"Dominio: {self._format_dominios()}",
+            f"Inmueble: {self.datos.get('inmueble', 'No especificado')}",
+            f"Medidas y Linderos: {medidas_linderos}",
+        ]
+
+    def _descripcion_operaciones(self):
+        parrafos = []
+        descripcion = (self.datos.get("descripcion") or "").strip()
+        if descripcion:
+            parrafos.append(descripcion)
+        nota1 = (self.datos.get("nota1") or "").strip()
+        nota2 = (self.datos.get("nota2") or "").strip()
+        if nota1:
+            parrafos.append(f"Nota 1: {nota1}")
+        if nota2:
+            parrafos.append(f"Nota 2: {nota2}")
+        return parrafos
+
+    def _superficies_rows(self):
+        filas = []
+        for sup in self.datos.get("superficies", []):
+            if isinstance(sup, dict):
+                st = sup.get("sup_titulo")
+                sm = sup.get("sup_mensura")
+                dif = sup.get("diferencia")
+                partes = [p for p in [st, sm, dif] if p and p != "No especificado"]
+                valor = " / ".join(partes) if partes else "No especificado"
+                filas.append((
+                    sup.get("designacion", "No especificado"),
+                    valor,
+                    sup.get("observaciones", "") or " ",
+                ))
+            else:
+                filas.append(("No especificado", str(sup), " "))
+        if not filas:
+            filas.append(("No especificado",) * 3)
+        return filas
+
+    def _lados_rows(self):
+        lados = self._dedupe_lados(self.datos.get("lados", []))
+        if not lados:
+            return [("No especificado",) * 6]
+        campos = ("vertice", "rumbo", "lado", "mide", "angulo", "linderos")
+        return (
+            [str(lado.get(campo, "")) or "—" for campo in campos]
+            for lado in lados
+        )
+
+    def _coordenadas_rows(self):
+        campos = ("punto", "latitud", "longitud", "norte_gk", "este_gk")
+        return (
+            [str(c.get(campo, "")) or "—" for campo in campos]
+            for c in self.datos.get("coordenadas", [])
+        )
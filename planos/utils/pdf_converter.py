@@ -0,0 +1,418 @@
+"""
+Conversión DOCX → PDF con LibreOffice headless.
+
+Se mantiene un pool de procesos ``soffice`` persistentes (cada uno con su
+propio perfil de usuario), reutilizados entre requests. La cantidad de
+conversiones en espera está acotada y cada conversión tiene un tiempo
+máximo. Los PDF resultantes se guardan junto al DOCX con el hash de su
+contenido en el nombre, por lo que una segunda descarga no convierte nada.
+
+Cada worker habla con su LibreOffice de una de estas formas:
+
+- ``uno``: el puente UNO importable desde este intérprete (``python3-uno``).
+- ``unoserver``: sin UNO en el virtualenv (lo habitual), cada worker lanza
+  un ``unoserver`` (instalado en un Python que sí tenga UNO, ``UNOSERVER_PATH``)
+  que mantiene su ``soffice --accept=...`` vivo, y convierte por XML-RPC.
+- ``cli``: un ``soffice --convert-to`` por conversión. Es lento y solo se usa
+  con ``PDF_CONVERTER_PERMITIR_CLI`` (desarrollo); sin UNO ni unoserver el
+  pool no arranca.
+"""
+
+import atexit
+import glob
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import socket
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import xmlrpc.client
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:  # pragma: no cover - depende de la instalación de LibreOffice
+    uno = None
+
+
+class ConversionError(Exception):
+    """Error al convertir un documento a PDF"""
+
+
+class ConversionTimeout(ConversionError):
+    """La conversión superó el tiempo máximo permitido"""
+
+
+class ConverterBusy(ConversionError):
+    """No hay lugar en la cola del conversor"""
+
+
+def _puerto_libre():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _TransporteConTimeout(xmlrpc.client.Transport):
+    """``Transport`` de XML-RPC con tiempo máximo por llamada"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conexion = super().make_connection(host)
+        conexion.timeout = self.timeout
+        return conexion
+
+
+def _propiedad(nombre, valor):
+    prop = PropertyValue()
+    prop.Name = nombre
+    prop.Value = valor
+    return prop
+
+
+class _OfficeWorker:
+    """
+    Un proceso LibreOffice headless con perfil propio, que queda escuchando
+    en un socket local y se reutiliza entre conversiones (``modo`` ``uno`` o
+    ``unoserver``). En modo ``cli`` no hay proceso persistente.
+    """
+
+    def __init__(self, indice, soffice, modo="uno", unoserver=None):
+        self.indice = indice
+        self.soffice = soffice
+        self.modo = modo
+        self.unoserver = unoserver
+        self.perfil_dir = tempfile.mkdtemp(prefix=f"lo_perfil_{indice}_")
+        self.perfil_uri = "file://" + self.perfil_dir
+        self.proceso = None
+        self.puerto = None
+        self._desktop = None
+
+    # -------------------------
+    # Ciclo de vida
+    # -------------------------
+    def _comando(self):
+        if self.modo == "unoserver":
+            return [
+                self.unoserver,
+                "--interface", "127.0.0.1",
+                "--port", str(self.puerto),
+                "--uno-port", str(_puerto_libre()),
+                "--executable", self.soffice,
+                "--user-installation", self.perfil_dir,
+            ]
+        return [
+            self.soffice,
+            "--headless",
+            "--invisible",
+            "--nologo",
+            "--norestore",
+            "--nodefault",
+            "--nolockcheck",
+            f"-env:UserInstallation={self.perfil_uri}",
+            f"--accept=socket,host=127.0.0.1,port={self.puerto};urp;StarOffice.ComponentContext",
+        ]
+
+    def start(self):
+        if self.modo == "cli":
+            return
+        self.puerto = _puerto_libre()
+        # Sesión propia: al detenerlo cae también el soffice que lanza unoserver
+        self.proceso = subprocess.Popen(
+            self._comando(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        self._desktop = None
+
+    def stop(self):
+        if self.proceso and self.proceso.poll() is None:
+            try:
+                os.killpg(self.proceso.pid, signal.SIGKILL)
+            except (AttributeError, ProcessLookupError, PermissionError):
+                self.proceso.kill()
+            try:
+                self.proceso.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+        self.proceso = None
+        self._desktop = None
+
+    def restart(self):
+        logger.warning("Reiniciando proceso LibreOffice #%s", self.indice)
+        self.stop()
+        self.start()
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.perfil_dir, ignore_errors=True)
+
+    # -------------------------
+    # Conversión
+    # -------------------------
+    def _connect(self, timeout):
+        if self._desktop is not None:
+            return self._desktop
+        if self.proceso is None or self.proceso.poll() is not None:
+            self.start()
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local
+        )
+        limite = time.monotonic() + timeout
+        while True:
+            try:
+                ctx = resolver.resolve(
+                    f"uno:socket,host=127.0.0.1,port={self.puerto};urp;StarOffice.ComponentContext"
+                )
+                break
+            except Exception:
+                if time.monotonic() > limite:
+                    raise ConversionTimeout("LibreOffice no respondió al iniciar")
+                time.sleep(0.2)
+        self._desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        return self._desktop
+
+    def _convert_uno(self, origen, destino, timeout):
+        # Si la conversión se cuelga, el watchdog mata el proceso y la llamada UNO falla
+        vencido = threading.Event()
+
+        def _watchdog():
+            vencido.set()
+            self.stop()
+
+        timer = threading.Timer(timeout, _watchdog)
+        timer.start()
+        try:
+            desktop = self._connect(timeout)
+            doc = desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(os.path.abspath(origen)), "_blank", 0, (_propiedad("Hidden", True),)
+            )
+            try:
+                doc.storeToURL(
+                    uno.systemPathToFileUrl(os.path.abspath(destino)),
+                    (_propiedad("FilterName", "writer_pdf_Export"),),
+                )
+            finally:
+                doc.close(True)
+        except Exception as e:
+            self.restart()
+            if vencido.is_set():
+                raise ConversionTimeout(f"La conversión superó {timeout}s") from e
+            raise ConversionError(str(e)) from e
+        finally:
+            timer.cancel()
+
+    def _convert_unoserver(self, origen, destino, timeout):
+        if self.proceso is None or self.proceso.poll() is not None:
+            self.start()
+        proxy = xmlrpc.client.ServerProxy(
+            f"http://127.0.0.1:{self.puerto}", allow_none=True, transport=_TransporteConTimeout(timeout)
+        )
+        limite = time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    # inpath, indata, outpath, convert_to, filtername
+                    proxy.convert(
+                        os.path.abspath(origen), None, os.path.abspath(destino), "pdf", "writer_pdf_Export"
+                    )
+                    return
+                except ConnectionRefusedError:
+                    # unoserver todavía está levantando LibreOffice
+                    if time.monotonic() > limite or self.proceso.poll() is not None:
+                        raise ConversionTimeout("unoserver no respondió al iniciar")
+                    time.sleep(0.2)
+        except ConversionError:
+            self.restart()
+            raise
+        except (TimeoutError, socket.timeout) as e:
+            self.restart()
+            raise ConversionTimeout(f"La conversión superó {timeout}s") from e
+        except (OSError, xmlrpc.client.Error) as e:
+            self.restart()
+            raise ConversionError(str(e)) from e
+
+    def _convert_cli(self, origen, destino, timeout):
+        salida_dir = tempfile.mkdtemp(prefix="lo_salida_")
+        try:
+            subprocess.run(
+                [
+                    self.soffice,
+                    "--headless",
+                    "--norestore",
+                    "--nolockcheck",
+                    f"-env:UserInstallation={self.perfil_uri}",
+                    "--convert-to",
+                    "pdf",
+                    "--outdir",
+                    salida_dir,
+                    origen,
+                ],
+                check=True,
+                timeout=timeout,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            generado = os.path.join(salida_dir, os.path.splitext(os.path.basename(origen))[0] + ".pdf")
+            if not os.path.exists(generado):
+                raise ConversionError("LibreOffice no generó el PDF")
+            shutil.move(generado, destino)
+        except subprocess.TimeoutExpired as e:
+            raise ConversionTimeout(f"La conversión superó {timeout}s") from e
+        except subprocess.CalledProcessError as e:
+            raise ConversionError(e.stderr.decode(errors="replace").strip() or str(e)) from e
+        finally:
+            shutil.rmtree(salida_dir, ignore_errors=True)
+
+    def convert(self, origen, destino, timeout):
+        if self.modo == "uno":
+            self._convert_uno(origen, destino, timeout)
+        elif self.modo == "unoserver":
+            self._convert_unoserver(origen, destino, timeout)
+        else:
+            self._convert_cli(origen, destino, timeout)
+
+
+class PdfConverterPool:
+    """Pool acotado de procesos LibreOffice reutilizables"""
+
+    def __init__(self, workers=2, timeout=60, max_cola=8, espera_cola=30, soffice=None,
+                 unoserver=None, permitir_cli=False):
+        self.soffice = soffice or shutil.which("soffice") or shutil.which("libreoffice")
+        if not self.soffice:
+            raise ConversionError("LibreOffice (soffice) no está instalado en el servidor")
+        self.unoserver = unoserver or shutil.which("unoserver")
+        if uno is not None:
+            self.modo = "uno"
+        elif self.unoserver:
+            self.modo = "unoserver"
+        elif permitir_cli:
+            self.modo = "cli"
+            logger.warning("Sin UNO ni unoserver: cada conversión lanza un soffice nuevo")
+        else:
+            raise ConversionError(
+                "No hay conversor persistente: instale python3-uno o unoserver "
+                "(o habilite PDF_CONVERTER_PERMITIR_CLI)"
+            )
+        self.timeout = timeout
+        self.espera_cola = espera_cola
+        # Conversiones en curso + en espera; más allá de eso se rechaza
+        self._cupos = threading.BoundedSemaphore(workers + max_cola)
+        self._libres = queue.Queue()
+        self._workers = []
+        for i in range(workers):
+            worker = _OfficeWorker(i, self.soffice, self.modo, self.unoserver)
+            worker.start()
+            self._workers.append(worker)
+            self._libres.put(worker)
+
+    def convert(self, origen, destino):
+        if not self._cupos.acquire(blocking=False):
+            raise ConverterBusy("Demasiadas conversiones en espera")
+        try:
+            try:
+                worker = self._libres.get(timeout=self.espera_cola)
+            except queue.Empty:
+                raise ConverterBusy("No hay conversores libres")
+            try:
+                inicio = time.monotonic()
+                worker.convert(origen, destino, self.timeout)
+                logger.info("PDF convertido en %.2fs: %s", time.monotonic() - inicio, destino)
+            finally:
+                self._libres.put(worker)
+        finally:
+            self._cupos.release()
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_converter():
+    """Pool compartido del proceso, creado en el primer uso"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PdfConverterPool(
+                    workers=getattr(settings, "PDF_CONVERTER_WORKERS", 2),
+                    timeout=getattr(settings, "PDF_CONVERTER_TIMEOUT", 60),
+                    max_cola=getattr(settings, "PDF_CONVERTER_MAX_COLA", 8),
+                    espera_cola=getattr(settings, "PDF_CONVERTER_ESPERA_COLA", 30),
+                    soffice=getattr(settings, "LIBREOFFICE_PATH", None),
+                    unoserver=getattr(settings, "UNOSERVER_PATH", None),
+                    permitir_cli=getattr(settings, "PDF_CONVERTER_PERMITIR_CLI", False),
+                )
+                atexit.register(_pool.close)
+    return _pool
+
+
+# -------------------------
+# Caché de PDFs
+# -------------------------
+def file_sha256(ruta, bloque=1024 * 1024):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for chunk in iter(lambda: f.read(bloque), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cached_pdf_path(docx_path, docx_hash=None):
+    """Ruta del PDF cacheado: ``<docx>.<hash16>.pdf`` junto al DOCX"""
+    docx_hash = docx_hash or file_sha256(docx_path)
+    base = os.path.splitext(docx_path)[0]
+    return f"{base}.{docx_hash[:16]}.pdf"
+
+
+def docx_for_cached_pdf(pdf_path):
+    """Inversa de ``cached_pdf_path``: DOCX del que proviene un PDF cacheado"""
+    base = os.path.splitext(pdf_path)[0]
+    return os.path.splitext(base)[0] + ".docx"
+
+
+def convert_docx_to_pdf(docx_path):
+    """
+    Devuelve la ruta del PDF de ``docx_path``, convirtiendo solo si el
+    contenido del DOCX cambió desde la última conversión.
+    """
+    destino = cached_pdf_path(docx_path)
+    if os.path.exists(destino):
+        return destino
+
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".pdf.tmp")
+    os.close(fd)
+    try:
+        get_converter().convert(docx_path, temporal)
+        os.replace(temporal, destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    # Se descartan conversiones de versiones anteriores del mismo DOCX
+    base = os.path.splitext(docx_path)[0]
+    for viejo in glob.glob(glob.escape(base) + ".*.pdf"):
+        if viejo != destino:
+            try:
+                os.remove(viejo)
+            except OSError:
+                pass
+    return destino
@@ -6,7 +6,11 @@ import pdfplumber
 import re
 import logging
 import pytesseract
+from django.conf import settings
 from pdf2image import convert_from_path
+from pdf2image.exceptions import PDFPopplerTimeoutError
+
+from planos import metricas, recursos
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +18,9 @@ logger = logging.getLogger(__name__)
 class PDFProcessor:
     """Procesa archivos PDF de planos y extrae información relevante"""
 
+    # Incrementar ante cualquier cambio en los datos extraídos (invalida su caché)
+    VERSION = "1"
+
     def __init__(self, pdf_path):
         self.pdf_path = pdf_path
         self.texto_completo = None
@@ -109,27 +116,63 @@ class PDFProcessor:
         """Extrae texto del PDF, usando OCR si es necesario"""
         try:
             texto = ""
-            with pdfplumber.open(self.pdf_path) as pdf:
+            tamanios = []
+            with metricas.cronometro("texto"), pdfplumber.open(self.pdf_path) as pdf:
+                recursos.verificar_paginas(len(pdf.pages))
+                metricas.anotar("paginas", len(pdf.pages))
                 for page in pdf.pages:
+                    tamanios.append((page.width, page.height))
                     page_text = page.extract_text(layout=True)
                     if page_text:
                         page_text = page_text.replace("\xa0", " ")
                         page_text = re.sub(r"[ \t]+", " ", page_text)
                         texto += page_text.strip() + "\n"
+                    # Sin esto pdfplumber retiene los objetos de todas las páginas
+                    page.close()
+                    recursos.verificar()
 
             # Si no se extrajo nada, aplicar OCR
             if not texto.strip():
                 logger.info("No se encontró texto embebido, aplicando OCR...")
-                images = convert_from_path(self.pdf_path)
-                for img in images:
-                    texto += pytesseract.image_to_string(img, lang="spa") + "\n"
+                with metricas.cronometro("ocr"):
+                    # El presupuesto se controla antes de renderizar la primera página
+                    resoluciones = [recursos.dpi_para(ancho, alto) for ancho, alto in tamanios]
+                    metricas.anotar("paginas_ocr", len(resoluciones))
+                    # De a una página: nunca hay más de una imagen en memoria
+                    for numero, ((ancho, alto), dpi) in enumerate(zip(tamanios, resoluciones), start=1):
+                        recursos.verificar(recursos.pixeles(ancho, alto, dpi) * recursos.BYTES_POR_PIXEL)
+                        texto += self._ocr_pagina(numero, dpi)
 
             self.texto_completo = texto
             return texto
+        except recursos.LimiteRecursos:
+            raise
         except Exception as e:
             logger.error(f"Error crítico en PDF/OCR: {str(e)}")
             return ""
 
+    def _ocr_pagina(self, numero, dpi):
+        """OCR de una página; pdftoppm y tesseract se matan a los ``OCR_TIMEOUT_PAGINA`` segundos"""
+        limite = getattr(settings, "OCR_TIMEOUT_PAGINA", 120) or None
+        try:
+            imagenes = convert_from_path(
+                self.pdf_path, dpi=dpi, first_page=numero, last_page=numero, timeout=limite
+            )
+        except PDFPopplerTimeoutError:
+            raise recursos.TiempoAgotado(f"El renderizado de la página {numero} superó {limite} s")
+        texto = ""
+        for img in imagenes:
+            try:
+                texto += pytesseract.image_to_string(img, lang="spa", timeout=limite or 0) + "\n"
+            except RuntimeError as e:
+                # pytesseract informa el vencimiento con un RuntimeError genérico
+                if "timeout" not in str(e).lower():
+                    raise
+                raise recursos.TiempoAgotado(f"El OCR de la página {numero} superó {limite} s")
+            finally:
+                img.close()
+        return texto
+
     def _clean_field(self, text, keywords_to_stop):
         if not text:
             return ""
@@ -145,25 +188,26 @@ class PDFProcessor:
         texto = self.texto_completo or ""
         stop_words = ["PADRON", "LUGAR", "DOMINIO", "OBJETO", "TITULAR", "MINISTERIO"]
 
-        datos = {
-            "objeto": self._clean_field(self.extract_objeto(texto), stop_words),
-            "lugar": self._clean_field(self.extract_lugar(texto), stop_words),
-            "departamento": self._clean_field(self.extract_departamento(texto), stop_words),
-            "propietarios": self.extract_propietarios(texto),
-            "dominios": self.extract_dominios(texto),
-            "padrones": self.extract_padrones(texto),
-            "superficies": self.extract_superficies(texto),
-            "fecha_operaciones": self.extract_fecha(texto),
-            "lados": self.extract_lados_mejorado(texto),
-            "coordenadas": self.extract_coordenadas(texto),
-            "inmueble": self._clean_field(self.extract_inmueble(texto), stop_words),
-            "descripcion": self.extract_descripcion(texto),
-            "croquis": self.extract_croquis(texto),
-            "nota1": self.extract_nota1(texto),
-            "nota2": self.extract_nota2(texto),
-            "referencias": self.extract_referencias(texto),
-            "texto_completo": texto.strip(),
-        }
+        with metricas.cronometro("parseo"):
+            datos = {
+                "objeto": self._clean_field(self.extract_objeto(texto), stop_words),
+                "lugar": self._clean_field(self.extract_lugar(texto), stop_words),
+                "departamento": self._clean_field(self.extract_departamento(texto), stop_words),
+                "propietarios": self.extract_propietarios(texto),
+                "dominios": self.extract_dominios(texto),
+                "padrones": self.extract_padrones(texto),
+                "superficies": self.extract_superficies(texto),
+                "fecha_operaciones": self.extract_fecha(texto),
+                "lados": self.extract_lados_mejorado(texto),
+                "coordenadas": self.extract_coordenadas(texto),
+                "inmueble": self._clean_field(self.extract_inmueble(texto), stop_words),
+                "descripcion": self.extract_descripcion(texto),
+                "croquis": self.extract_croquis(texto),
+                "nota1": self.extract_nota1(texto),
+                "nota2": self.extract_nota2(texto),
+                "referencias": self.extract_referencias(texto),
+                "texto_completo": texto.strip(),
+            }
         logger.debug("Datos procesados: %s", datos)
         return datos
 
@@ -0,0 +1,376 @@
+"""
+Renderizado directo de la memoria descriptiva a PDF.
+
+Genera el PDF sin pasar por Word ni LibreOffice: usa las fuentes estándar
+Times (sin incrustar, métricas de pdfminer) y escribe cada página apenas se
+completa, de modo que la salida se puede enviar en streaming con memoria
+acotada aun con miles de coordenadas.
+"""
+
+import zlib
+from datetime import datetime
+
+from pdfminer.fontmetrics import FONT_METRICS
+
+from .memoria_base import (
+    CIERRE,
+    COORDENADAS_HEADERS,
+    LADOS_HEADERS,
+    NOTA_SUPERFICIES,
+    PIE,
+    SUPERFICIES_HEADERS,
+    MemoriaBase,
+)
+
+# A4 en puntos
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+MARGIN = 56.7  # 2 cm
+
+FONTS = {
+    "F1": "Times-Roman",
+    "F2": "Times-Bold",
+}
+_WIDTHS = {alias: FONT_METRICS[nombre][1] for alias, nombre in FONTS.items()}
+
+
+def text_width(texto, font="F1", size=12):
+    widths = _WIDTHS[font]
+    return sum(widths.get(c, 500) for c in texto) * size / 1000.0
+
+
+def _pdf_string(texto):
+    """Literal de string PDF en WinAnsiEncoding"""
+    data = texto.encode("cp1252", errors="replace")
+    data = data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    data = data.replace(b"\r", b"").replace(b"\n", b" ")
+    return b"(" + data + b")"
+
+
+def wrap_text(texto, ancho, font="F1", size=12):
+    """Parte ``texto`` en líneas que entren en ``ancho`` puntos"""
+    widths = _WIDTHS[font]
+    # Se trabaja en unidades de la fuente (1/1000 del tamaño) para no escalar cada vez
+    limite = ancho * 1000.0 / size
+    espacio = widths.get(" ", 250)
+    lineas = []
+    for parrafo in str(texto).split("\n"):
+        actual, ancho_actual = [], 0
+        for palabra in parrafo.replace("\t", " ").split(" "):
+            ancho_palabra = sum(widths.get(c, 500) for c in palabra)
+            extra = ancho_palabra + (espacio if actual else 0)
+            if ancho_actual + extra <= limite:
+                actual.append(palabra)
+                ancho_actual += extra
+                continue
+            if actual:
+                lineas.append(" ".join(actual))
+            # Palabras más largas que el ancho se cortan por caracteres
+            while ancho_palabra > limite and len(palabra) > 1:
+                acumulado, corte = 0, 0
+                for c in palabra:
+                    w = widths.get(c, 500)
+                    if acumulado + w > limite and corte:
+                        break
+                    acumulado += w
+                    corte += 1
+                lineas.append(palabra[:corte])
+                palabra = palabra[corte:]
+                ancho_palabra -= acumulado
+            actual, ancho_actual = [palabra], ancho_palabra
+        lineas.append(" ".join(actual))
+    return lineas
+
+
+class PdfStreamWriter:
+    """Escritor PDF incremental: cada objeto se emite en cuanto está listo"""
+
+    def __init__(self):
+        self.offset = 0
+        self.xref = {}
+        self._siguiente = 1
+
+    def reserve(self):
+        num = self._siguiente
+        self._siguiente += 1
+        return num
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def header(self):
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def obj(self, num, cuerpo):
+        self.xref[num] = self.offset
+        return self._emit(b"%d 0 obj\n" % num + cuerpo + b"\nendobj\n")
+
+    def stream(self, num, data, comprimir=True):
+        filtro = b""
+        if comprimir:
+            data = zlib.compress(data, 6)
+            filtro = b" /Filter /FlateDecode"
+        cuerpo = b"<< /Length %d%s >>\nstream\n" % (len(data), filtro) + data + b"\nendstream"
+        return self.obj(num, cuerpo)
+
+    def trailer(self, root, info):
+        inicio = self.offset
+        total = self._siguiente
+        partes = [b"xref\n0 %d\n" % total, b"0000000000 65535 f \n"]
+        for num in range(1, total):
+            partes.append(b"%010d 00000 n \n" % self.xref.get(num, 0))
+        partes.append(
+            b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (total, root, info, inicio)
+        )
+        return self._emit(b"".join(partes))
+
+
+class PdfMemoriaRenderer(MemoriaBase):
+    """Renderiza la memoria descriptiva con las mismas secciones que DocxGenerator"""
+
+    # Incrementar ante cualquier cambio en el formato del PDF generado
+    VERSION = "1"
+
+    FONT_SIZE = 12
+    TABLE_FONT_SIZE = 10
+    LEADING = 1.25
+    CELL_PADDING = 3
+
+    def __init__(self, plano):
+        super().__init__(plano)
+        self.writer = PdfStreamWriter()
+        self._pendiente = []
+        self._ops = []
+        self._paginas = []
+        self._y = 0
+        self._pages_num = None
+        self._fonts_num = None
+
+    # -------------------------
+    # Páginas
+    # -------------------------
+    @property
+    def ancho_util(self):
+        return PAGE_WIDTH - 2 * MARGIN
+
+    def _nueva_pagina(self):
+        if self._ops:
+            self._cerrar_pagina()
+        self._ops = []
+        self._y = PAGE_HEIGHT - MARGIN
+
+    def _cerrar_pagina(self):
+        # Pie institucional centrado
+        ancho = text_width(PIE, "F1", 9)
+        self._texto((PAGE_WIDTH - ancho) / 2, MARGIN / 2, PIE, "F1", 9)
+
+        contenido = b"\n".join(self._ops)
+        contenido_num = self.writer.reserve()
+        pagina_num = self.writer.reserve()
+        self._pendiente.append(self.writer.stream(contenido_num, contenido))
+        self._pendiente.append(self.writer.obj(
+            pagina_num,
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] "
+            b"/Resources << /Font %d 0 R >> /Contents %d 0 R >>"
+            % (self._pages_num, PAGE_WIDTH, PAGE_HEIGHT, self._fonts_num, contenido_num),
+        ))
+        self._paginas.append(pagina_num)
+        self._ops = []
+
+    def _espacio(self, alto):
+        """Salta de página si no entran ``alto`` puntos más"""
+        if self._y - alto < MARGIN:
+            self._nueva_pagina()
+
+    def _flush(self):
+        datos = b"".join(self._pendiente)
+        self._pendiente = []
+        return datos
+
+    # -------------------------
+    # Primitivas
+    # -------------------------
+    def _texto(self, x, y, texto, font="F1", size=None):
+        size = size or self.FONT_SIZE
+        self._ops.append(
+            b"BT /%s %d Tf %.2f %.2f Td %s Tj ET" % (font.encode(), size, x, y, _pdf_string(texto))
+        )
+
+    def _rect(self, x, y, w, h):
+        self._ops.append(b"%.2f %.2f %.2f %.2f re S" % (x, y, w, h))
+
+    def _parrafo(self, texto, font="F1", size=None, align="left", sangria=0, espacio_despues=4):
+        size = size or self.FONT_SIZE
+        alto_linea = size * self.LEADING
+        for linea in wrap_text(texto, self.ancho_util - sangria, font, size):
+            self._espacio(alto_linea)
+            self._y -= alto_linea
+            if align == "center":
+                x = MARGIN + (self.ancho_util - text_width(linea, font, size)) / 2
+            elif align == "right":
+                x = PAGE_WIDTH - MARGIN - text_width(linea, font, size)
+            else:
+                x = MARGIN + sangria
+            self._texto(x, self._y + size * 0.25, linea, font, size)
+        self._y -= espacio_despues
+
+    def _etiqueta_valor(self, label, value):
+        """Etiqueta en negrita seguida del valor, con ajuste de línea"""
+        size = self.FONT_SIZE
+        alto_linea = size * self.LEADING
+        prefijo = f"{label}: "
+        ancho_prefijo = text_width(prefijo, "F2", size)
+        lineas = wrap_text(value, self.ancho_util - ancho_prefijo, "F1", size)
+        for i, linea in enumerate(lineas):
+            self._espacio(alto_linea)
+            self._y -= alto_linea
+            base = self._y + size * 0.25
+            if i == 0:
+                self._texto(MARGIN, base, prefijo, "F2", size)
+            self._texto(MARGIN + ancho_prefijo, base, linea, "F1", size)
+        self._y -= 4
+
+    def _titulo_seccion(self, texto):
+        self._parrafo(texto, font="F2", espacio_despues=6)
+
+    def _tabla(self, encabezados, filas):
+        """Tabla con grilla; el encabezado se repite en cada página"""
+        size = self.TABLE_FONT_SIZE
+        alto_linea = size * self.LEADING
+        pad = self.CELL_PADDING
+        ancho_col = self.ancho_util / len(encabezados)
+        ancho_texto = ancho_col - 2 * pad
+
+        def _fila(valores, font):
+            celdas = [wrap_text(v, ancho_texto, font, size) for v in valores]
+            alto = max(len(c) for c in celdas) * alto_linea + 2 * pad
+            return celdas, alto
+
+        hdr_celdas, hdr_alto = _fila(encabezados, "F2")
+
+        def _dibujar(celdas, alto, font):
+            top = self._y
+            for i, lineas in enumerate(celdas):
+                x = MARGIN + i * ancho_col
+                self._rect(x, top - alto, ancho_col, alto)
+                for j, linea in enumerate(lineas):
+                    base = top - pad - (j + 1) * alto_linea + size * 0.25
+                    self._texto(x + pad, base, linea, font, size)
+            self._y -= alto
+
+        self._espacio(hdr_alto * 2)
+        _dibujar(hdr_celdas, hdr_alto, "F2")
+        for fila in filas:
+            celdas, alto = _fila([str(v) for v in fila], "F1")
+            if self._y - alto < MARGIN:
+                self._nueva_pagina()
+                _dibujar(hdr_celdas, hdr_alto, "F2")
+            _dibujar(celdas, alto, "F1")
+            if self._pendiente:
+                yield self._flush()
+        self._y -= 6
+
+    # -------------------------
+    # Documento
+    # -------------------------
+    def iter_pdf(self):
+        """Genera el PDF en bloques de bytes (una o más páginas por bloque)"""
+        w = self.writer
+        catalogo_num = w.reserve()
+        self._pages_num = w.reserve()
+        self._fonts_num = w.reserve()
+        info_num = w.reserve()
+
+        font_nums = {alias: w.reserve() for alias in FONTS}
+        yield w.header()
+        for alias, nombre in FONTS.items():
+            yield w.obj(
+                font_nums[alias],
+                b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>"
+                % nombre.encode(),
+            )
+        yield w.obj(
+            self._fonts_num,
+            b"<< " + b" ".join(b"/%s %d 0 R" % (a.encode(), n) for a, n in font_nums.items()) + b" >>",
+        )
+
+        self._nueva_pagina()
+
+        # Título y fecha de generación
+        self._parrafo("MEMORIA DESCRIPTIVA", font="F2", align="center")
+        self._parrafo(f"Documento generado el {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+
+        # Cabecera
+        for label, value in self._cabecera():
+            self._etiqueta_valor(label, value)
+
+        # Sección 1: Extracto de Título
+        self._titulo_seccion("1. EXTRACTO DE TÍTULO")
+        for linea in self._extracto_titulo():
+            self._parrafo(linea)
+
+        # Sección 2: Descripción de las Operaciones
+        self._titulo_seccion("2. DESCRIPCIÓN DE LAS OPERACIONES")
+        for parrafo in self._descripcion_operaciones():
+            self._parrafo(parrafo)
+        yield self._flush()
+
+        # Sección 3: Planilla de Superficies
+        self._titulo_seccion("3. PLANILLA DE SUPERFICIES")
+        yield from self._tabla(SUPERFICIES_HEADERS, self._superficies_rows())
+        self._parrafo(NOTA_SUPERFICIES)
+
+        # Sección 4: Planilla de Lados
+        self._titulo_seccion("4. PLANILLA DE LADOS")
+        yield from self._tabla(LADOS_HEADERS, self._lados_rows())
+
+        # Sección 5: Croquis y Referencias
+        self._titulo_seccion("5. CROQUIS Y REFERENCIAS")
+        referencias = self._normalize_refs(self.datos.get("referencias"))
+        croquis_text = (self.datos.get("croquis") or "").strip()
+        if referencias:
+            self._parrafo("Referencias:")
+            for ref in referencias:
+                self._parrafo(f"• {ref}", sangria=14)
+        if croquis_text:
+            self._parrafo(croquis_text)
+        yield self._flush()
+
+        # Sección 6: Texto completo (opcional para auditoría)
+        texto_completo = self.datos.get("texto_completo")
+        if texto_completo:
+            self._titulo_seccion("6. TEXTO COMPLETO (EXTRAÍDO DEL PDF)")
+            for linea in texto_completo.split("\n"):
+                self._parrafo(linea, espacio_despues=0)
+                if self._pendiente:
+                    yield self._flush()
+
+        # Sección 7: Coordenadas (si existen)
+        if self.datos.get("coordenadas"):
+            self._titulo_seccion("7. COORDENADAS GEODÉSICAS")
+            yield from self._tabla(COORDENADAS_HEADERS, self._coordenadas_rows())
+
+        # Cierre
+        self._parrafo(CIERRE)
+        self._parrafo(f"Santiago del Estero, {self._fecha_operaciones()}", align="right")
+        self._cerrar_pagina()
+        yield self._flush()
+
+        kids = b" ".join(b"%d 0 R" % n for n in self._paginas)
+        yield w.obj(
+            self._pages_num,
+            b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._paginas)),
+        )
+        yield w.obj(catalogo_num, b"<< /Type /Catalog /Pages %d 0 R >>" % self._pages_num)
+        yield w.obj(
+            info_num,
+            b"<< /Producer (agrimensores_sde) /Title %s >>" % _pdf_string("Memoria Descriptiva"),
+        )
+        yield w.trailer(catalogo_num, info_num)
+
+    def render_to(self, destino):
+        """Escribe el PDF completo en un archivo abierto en modo binario"""
+        for bloque in self.iter_pdf():
+            destino.write(bloque)
@@ -0,0 +1,99 @@
+"""
+Registros normalizados a partir de los datos extraídos de un plano.
+
+Convierte ``datos_procesados`` en filas para las tablas de propietarios,
+padrones, dominios, lados y coordenadas. Los identificadores se normalizan
+igual al guardar y al buscar (DNI/CUIL solo dígitos, matrícula en mayúsculas
+sin espacios repetidos), así una búsqueda es una consulta exacta sobre índice.
+"""
+
+import re
+
+_NO_DIGITOS = re.compile(r"\D+")
+_ESPACIOS = re.compile(r"\s+")
+_VACIOS = {"", "no especificado", "—"}
+
+
+def normalizar_documento(valor):
+    """DNI/CUIL con o sin puntos y guiones → solo dígitos"""
+    return _NO_DIGITOS.sub("", str(valor or ""))
+
+
+def normalizar_matricula(valor):
+    return _ESPACIOS.sub(" ", str(valor or "")).strip().upper()
+
+
+def normalizar_padron(valor):
+    return _ESPACIOS.sub("", str(valor or "")).upper()
+
+
+def _texto(valor, largo):
+    valor = str(valor if valor is not None else "").strip()
+    return "" if valor.lower() in _VACIOS else valor[:largo]
+
+
+def _numero(valor):
+    try:
+        return float(str(valor).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def extraer_registros(datos):
+    """
+    Filas por tabla: ``{"propietarios": [...], "padrones": [...], ...}``.
+    Cada fila es un dict de campos del modelo, sin ``plano``.
+    """
+    datos = datos if isinstance(datos, dict) else {}
+    registros = {"propietarios": [], "padrones": [], "dominios": [], "lados": [], "coordenadas": []}
+
+    for orden, p in enumerate(datos.get("propietarios") or []):
+        if isinstance(p, dict):
+            nombre, dni, cuil = p.get("nombre"), p.get("dni"), p.get("cuil")
+        else:
+            nombre, dni, cuil = p, "", ""
+        fila = {
+            "orden": orden,
+            "nombre": _texto(nombre, 255),
+            "dni": normalizar_documento(dni)[:20],
+            "cuil": normalizar_documento(cuil)[:20],
+        }
+        if fila["nombre"] or fila["dni"] or fila["cuil"]:
+            registros["propietarios"].append(fila)
+
+    vistos = set()
+    for padron in datos.get("padrones") or []:
+        numero = normalizar_padron(padron)[:50]
+        if numero and numero not in vistos:
+            vistos.add(numero)
+            registros["padrones"].append({"orden": len(vistos) - 1, "numero": numero})
+
+    vistos = set()
+    for d in datos.get("dominios") or []:
+        matricula = normalizar_matricula(d.get("matricula") if isinstance(d, dict) else d)[:100]
+        if matricula and matricula.lower() not in _VACIOS and matricula not in vistos:
+            vistos.add(matricula)
+            registros["dominios"].append({"orden": len(vistos) - 1, "matricula": matricula})
+
+    for orden, lado in enumerate(l for l in datos.get("lados") or [] if isinstance(l, dict)):
+        registros["lados"].append({
+            "orden": orden,
+            "vertice": _texto(lado.get("vertice"), 50),
+            "rumbo": _texto(lado.get("rumbo"), 50),
+            "lado": _texto(lado.get("lado"), 50),
+            "medida": _numero(lado.get("mide")),
+            "angulo": _texto(lado.get("angulo"), 50),
+            "linderos": _texto(lado.get("linderos"), 500),
+        })
+
+    for orden, c in enumerate(c for c in datos.get("coordenadas") or [] if isinstance(c, dict)):
+        registros["coordenadas"].append({
+            "orden": orden,
+            "punto": _texto(c.get("punto"), 50),
+            "latitud": _texto(c.get("latitud"), 50),
+            "longitud": _texto(c.get("longitud"), 50),
+            "norte_gk": _numero(c.get("norte_gk")),
+            "este_gk": _numero(c.get("este_gk")),
+        })
+
+    return registros
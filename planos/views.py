@@ -1,26 +1,54 @@
+import asyncio
 import logging
 import os
-from django.shortcuts import render, redirect, get_object_or_404
+import posixpath
+import time
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import FileResponse, Http404
+from django.http import Http404
 from django.contrib.auth import authenticate, login
+from django.contrib.auth.views import redirect_to_login
+from django.core.files.storage import storages
+from django.db import transaction
+from django.db.models import Q
+from django.core.handlers.asgi import ASGIRequest
 from django.conf import settings
-from docx2pdf import convert
-
-from .models import Plano
-from .decorators import superuser_required
-from .services import procesar_pdf
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_POST
+
+from . import cache_niveles, cola, descargas, metricas
+from .models import Plano, TrabajoProcesamiento
+from .decorators import rate_limit, superuser_required
+from .busqueda import buscar
+from .exportacion import filtrar_planos, iter_zip, nombre_zip, parse_formatos
 from django.http import HttpResponse
 
 from django.http import JsonResponse
 from planos.utils.pdf_processor import PDFProcessor
 # generar_memoria
 
-from planos.utils.ia_memoria import generar_memoria_gemini
+from planos.utils.ia_memoria import (
+    clave_docx_ia,
+    agenerar_memoria_gemini,
+    clave_texto_ia,
+    memoria_ia_store,
+)
+from planos.utils.artifact_store import ArtifactStore, memorias_store
+from planos.utils.cache_archivos import ruta_local
+from planos.utils.pdf_converter import ConverterBusy, convert_docx_to_pdf
+from planos.utils.pdf_renderer import PdfMemoriaRenderer
+from planos.utils.docx_tables import add_table_fast
+from planos.utils.keyset import paginar_keyset
 from docx import Document
 
 logger = logging.getLogger(__name__)
 
+@rate_limit(max_requests=settings.RATE_LIMIT_LOGIN_PER_MINUTE, time_window=60, methods=['POST'])
 def login_view(request):
     if request.method == "POST":
         username = request.POST.get("username")
@@ -34,8 +62,11 @@ def login_view(request):
     return render(request, "login.html") 
 
 @superuser_required
+@rate_limit(max_requests=settings.RATE_LIMIT_UPLOAD_PER_MINUTE, time_window=60, methods=['POST'])
 def upload_plano(request):
-    """Vista para subir un plano PDF y procesarlo directamente"""
+    """Vista para subir un plano PDF; el procesamiento lo hace la cola"""
+    # Los planos más grandes se suben por partes (/api/cargas/)
+    max_bytes = getattr(settings, 'PLANO_MAX_BYTES', 10 * 1024 * 1024)
     if request.method == 'POST':
         titulo = request.POST.get('titulo')
         descripcion = request.POST.get('descripcion', '')
@@ -46,47 +77,91 @@ def upload_plano(request):
             messages.error(request, 'El título y el archivo PDF son obligatorios.')
             return render(request, 'planos/upload_plano.html', {
                 'titulo': titulo,
-                'descripcion': descripcion
+                'descripcion': descripcion,
+                'max_bytes': max_bytes,
             })
 
         if not archivo_pdf.name.lower().endswith('.pdf'):
             messages.error(request, 'El archivo debe ser un PDF.')
-            return render(request, 'planos/upload_plano.html')
+            return render(request, 'planos/upload_plano.html', {'max_bytes': max_bytes})
 
-        if archivo_pdf.size > 10 * 1024 * 1024:
-            messages.error(request, 'El archivo no debe superar los 10MB.')
-            return render(request, 'planos/upload_plano.html')
+        if archivo_pdf.size > max_bytes:
+            messages.error(request, f'El archivo no debe superar {filesizeformat(max_bytes)}.')
+            return render(request, 'planos/upload_plano.html', {'max_bytes': max_bytes})
 
         try:
-            plano = Plano.objects.create(
-                titulo=titulo,
-                descripcion=descripcion,
-                archivo_pdf=archivo_pdf,
-                usuario=request.user if request.user.is_authenticated else None,
-                estado='procesando'
-            )
-
-            # Procesar PDF y generar memoria
-            procesar_pdf(plano)
+            # El worker de la cola procesa el PDF y genera la memoria; el
+            # detalle se actualiza solo cuando termina
+            with transaction.atomic():
+                plano = Plano.objects.create(
+                    titulo=titulo,
+                    descripcion=descripcion,
+                    archivo_pdf=archivo_pdf,
+                    usuario=request.user if request.user.is_authenticated else None,
+                    estado='pendiente'
+                )
+                cola.encolar([plano])
 
             messages.success(
                 request,
-                f'¡Plano "{titulo}" procesado exitosamente! La memoria descriptiva está lista.'
+                f'Plano "{titulo}" cargado. La memoria descriptiva se está generando.'
             )
             return redirect('detalle_plano', plano_id=plano.id)
 
         except Exception as e:
             logger.error(f"Error al cargar plano: {str(e)}")
             messages.error(request, f'Error al cargar el plano: {str(e)}')
-            return render(request, 'planos/upload_plano.html')
+            return render(request, 'planos/upload_plano.html', {'max_bytes': max_bytes})
 
-    return render(request, 'planos/upload_plano.html')
+    return render(request, 'planos/upload_plano.html', {'max_bytes': max_bytes})
 
 @superuser_required
 def lista_planos(request):
-    """Vista para listar todos los planos"""
-    planos = Plano.objects.all().order_by('-fecha_carga')
-    return render(request, 'planos/lista_planos.html', {'planos': planos})
+    """Vista para listar los planos, paginada por (fecha_carga, id)"""
+    planos = (
+        filtrar_planos(request.GET)
+        .select_related('usuario')
+        .only('id', 'titulo', 'descripcion', 'estado', 'fecha_carga', 'usuario__username')
+    )
+    pagina = paginar_keyset(
+        planos,
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        tamanio=getattr(settings, 'LISTA_PLANOS_POR_PAGINA', 50),
+    )
+
+    # Los enlaces de paginación conservan los filtros activos
+    filtros = request.GET.copy()
+    for param in ('despues', 'antes'):
+        filtros.pop(param, None)
+
+    return render(request, 'planos/lista_planos.html', {
+        'planos': pagina.items,
+        'pagina': pagina,
+        'filtros': filtros,
+        'filtros_query': filtros.urlencode(),
+        'estados': Plano.ESTADO_CHOICES,
+    })
+
+@superuser_required
+def buscar_planos(request):
+    """Búsqueda de texto completo, ordenada por relevancia"""
+    consulta = request.GET.get('q', '').strip()
+    por_pagina = getattr(settings, 'BUSQUEDA_POR_PAGINA', 20)
+    try:
+        pagina = max(1, int(request.GET.get('pagina', 1)))
+    except ValueError:
+        pagina = 1
+
+    total, resultados = buscar(consulta, limite=por_pagina, desplazamiento=(pagina - 1) * por_pagina)
+    return render(request, 'planos/buscar.html', {
+        'consulta': consulta,
+        'resultados': resultados,
+        'total': total,
+        'pagina': pagina,
+        'pagina_anterior': pagina - 1 if pagina > 1 else None,
+        'pagina_siguiente': pagina + 1 if pagina * por_pagina < total else None,
+    })
 
 @superuser_required
 def detalle_plano(request, plano_id):
@@ -104,68 +179,219 @@ def detalle_plano(request, plano_id):
         }
     )
 
-@superuser_required
-def descargar_memoria(request, plano_id):
-    """Vista para descargar la memoria descriptiva generada en Word"""
-    plano = get_object_or_404(Plano, id=plano_id)
-
+# -------------------------
+# Vistas async (descargas, IA y estado)
+# -------------------------
+# Pasan la mayor parte del tiempo esperando disco, LibreOffice o la API de
+# Gemini: con el perfil ASGI (gunicorn_asgi.py) esas esperas no ocupan un
+# worker y un proceso atiende cientos de solicitudes lentas a la vez. Con WSGI
+# siguen funcionando igual que antes. La transferencia de los archivos la
+# resuelve planos.descargas (proxy con X-Accel-Redirect/X-Sendfile o Python).
+async def _memoria_disponible(request, plano_id, etag_sufijo=""):
+    """
+    ``(plano, etag, respuesta)``: ``respuesta`` no es ``None`` si no hay que
+    seguir (memoria no disponible o 304). El ETag fuerte es la clave de
+    contenido del artefacto.
+    """
+    plano = await aget_object_or_404(Plano, id=plano_id)
     if not plano.memoria_path or plano.estado != 'completado':
         messages.error(request, 'La memoria descriptiva aún no está disponible.')
-        return redirect('detalle_plano', plano_id=plano.id)
+        return plano, None, redirect('detalle_plano', plano_id=plano.id)
 
-    memoria_full_path = os.path.join(settings.MEDIA_ROOT, plano.memoria_path)
-    if not os.path.exists(memoria_full_path):
+    etag = quote_etag(f"{ArtifactStore.key_from_path(plano.memoria_path)}{etag_sufijo}")
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return plano, etag, not_modified
+
+    if not await sync_to_async(memorias_store.existe_ruta, thread_sensitive=False)(plano.memoria_path):
         raise Http404("Archivo no encontrado")
+    return plano, etag, None
+
 
-    response = FileResponse(
-        open(memoria_full_path, 'rb'),
-        content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+@superuser_required
+async def descargar_memoria(request, plano_id):
+    """Vista para descargar la memoria descriptiva generada en Word"""
+    plano, etag, response = await _memoria_disponible(request, plano_id)
+    if response is not None:
+        return response
+
+    return await sync_to_async(descargas.servir_archivo, thread_sensitive=False)(
+        request,
+        memorias_store.storage,
+        plano.memoria_path,
+        content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        nombre_descarga=f"Memoria_{plano.titulo}.docx",
+        etag=etag,
     )
-    response['Content-Disposition'] = f'attachment; filename="Memoria_{plano.titulo}.docx"'
-    return response
 
 
-@superuser_required
-def descargar_memoria_pdf(request, plano_id):
-    """Vista para convertir la memoria Word a PDF y descargarla"""
-    plano = get_object_or_404(Plano, id=plano_id)
+def _convertir_memoria(memoria_path):
+    # LibreOffice necesita el DOCX en disco (copia en caché si el storage es remoto)
+    return convert_docx_to_pdf(memorias_store.ruta_local(memoria_path))
 
-    if not plano.memoria_path or plano.estado != 'completado':
-        messages.error(request, 'La memoria descriptiva aún no está disponible.')
-        return redirect('detalle_plano', plano_id=plano.id)
 
-    memoria_full_path = os.path.join(settings.MEDIA_ROOT, plano.memoria_path)
-    pdf_path = memoria_full_path.replace(".docx", ".pdf")
+@superuser_required
+async def descargar_memoria_pdf(request, plano_id):
+    """Vista para convertir la memoria Word a PDF y descargarla"""
+    plano, etag, response = await _memoria_disponible(request, plano_id, etag_sufijo="-pdf")
+    if response is not None:
+        return response
 
     try:
-        convert(memoria_full_path, pdf_path)
+        pdf_path = await sync_to_async(_convertir_memoria, thread_sensitive=False)(plano.memoria_path)
+    except ConverterBusy as e:
+        logger.warning(f"Conversor PDF ocupado: {str(e)}")
+        messages.error(request, 'El conversor a PDF está ocupado. Intente nuevamente en unos segundos.')
+        return redirect('detalle_plano', plano_id=plano.id)
     except Exception as e:
         logger.error(f"Error convirtiendo a PDF: {str(e)}")
         messages.error(request, f'Error al convertir a PDF: {str(e)}')
         return redirect('detalle_plano', plano_id=plano.id)
 
-    response = FileResponse(open(pdf_path, 'rb'), content_type='application/pdf')
+    return await sync_to_async(descargas.servir_ruta, thread_sensitive=False)(
+        request, pdf_path, content_type='application/pdf', nombre_descarga=f"Memoria_{plano.titulo}.pdf", etag=etag
+    )
+
+
+async def archivo_media(request, ruta):
+    """
+    ``MEDIA_URL`` con autorización: los superusuarios ven todo; los demás,
+    solo el PDF y la memoria de sus propios planos.
+    """
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    ruta = posixpath.normpath(ruta)
+    if ruta.startswith(("/", "../")) or ruta in (".", ".."):
+        raise Http404("Archivo no encontrado")
+    if not usuario.is_superuser:
+        propios = Plano.objects.filter(Q(archivo_pdf=ruta) | Q(memoria_path=ruta), usuario=usuario)
+        if not await propios.aexists():
+            # Igual que un archivo inexistente: no se revela qué hay en el storage
+            raise Http404("Archivo no encontrado")
+
+    storage = storages["artefactos"] if ruta.startswith("outputs/") else Plano._meta.get_field("archivo_pdf").storage
+    return await sync_to_async(descargas.servir_archivo, thread_sensitive=False)(
+        request, storage, ruta, adjunto=False
+    )
+
+
+@superuser_required
+async def estado_plano(request, plano_id):
+    """
+    Estado del plano en JSON para el sondeo de la página de detalle. Con
+    ``anterior=<estado>`` y ``espera=<segundos>`` responde recién cuando el
+    estado cambia o vence la espera (long polling); la espera solo se respeta
+    bajo ASGI, donde no ocupa un worker.
+    """
+    anterior = request.GET.get('anterior')
+    try:
+        espera = max(0.0, min(float(request.GET.get('espera', 0)), settings.ESTADO_ESPERA_MAX))
+    except ValueError:
+        espera = 0.0
+    if not isinstance(request, ASGIRequest):
+        espera = 0.0
+
+    limite = time.monotonic() + espera
+    while True:
+        fila = await Plano.objects.filter(id=plano_id).values('estado', 'fecha_actualizacion').afirst()
+        if fila is None:
+            raise Http404("Plano no encontrado")
+        if fila['estado'] != anterior or time.monotonic() >= limite:
+            break
+        await asyncio.sleep(min(settings.ESTADO_INTERVALO, max(0.0, limite - time.monotonic())))
+
+    return JsonResponse({
+        'id': plano_id,
+        'estado': fila['estado'],
+        'fecha_actualizacion': fila['fecha_actualizacion'].isoformat() if fila['fecha_actualizacion'] else None,
+    })
+
+
+@superuser_required
+def descargar_memoria_pdf_directo(request, plano_id):
+    """Vista para descargar la memoria en PDF renderizada directamente (sin Word)"""
+    plano = get_object_or_404(Plano, id=plano_id)
+
+    if not plano.datos_procesados or plano.estado != 'completado':
+        messages.error(request, 'La memoria descriptiva aún no está disponible.')
+        return redirect('detalle_plano', plano_id=plano.id)
+
+    # El PDF se genera página por página mientras se envía
+    response = descargas.respuesta_streaming(
+        request,
+        PdfMemoriaRenderer(plano).iter_pdf(),
+        content_type='application/pdf',
+    )
     response['Content-Disposition'] = f'attachment; filename="Memoria_{plano.titulo}.pdf"'
     return response
 
 
+@superuser_required
+def exportar_planos(request):
+    """
+    Exporta en un ZIP las memorias, datos y PDF originales de los planos
+    filtrados (``desde``, ``hasta``, ``estado``, ``departamento``, ``usuario``,
+    ``ids``). ``formatos`` limita el contenido: docx,pdf,json,original.
+    """
+    planos = filtrar_planos(request.GET).select_related('resultado')
+    formatos = parse_formatos(request.GET.get('formatos'))
+    workers = getattr(settings, 'EXPORTACION_WORKERS', 4)
+
+    response = descargas.respuesta_streaming(
+        request,
+        iter_zip(planos.iterator(chunk_size=200), formatos, workers=workers),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nombre_zip()}"'
+    return response
+
+
 @superuser_required
 def reprocesar_plano(request, plano_id):
-    """Vista para reprocesar un plano"""
+    """Vista para reprocesar un plano (en la cola)"""
     plano = get_object_or_404(Plano, id=plano_id)
-    try:
-        plano.estado = 'procesando'
-        plano.save()
-        procesar_pdf(plano)
-        messages.success(request, 'Plano reprocesado exitosamente.')
-    except Exception as e:
-        logger.error(f"Error reprocesando plano {plano_id}: {str(e)}")
-        plano.estado = 'error'
-        plano.save()
-        messages.error(request, f'Error al reprocesar: {str(e)}')
+    if plano.trabajos.filter(estado__in=TrabajoProcesamiento.ACTIVOS).exists():
+        messages.info(request, 'El plano ya tiene un procesamiento pendiente o en curso.')
+        return redirect('detalle_plano', plano_id=plano.id)
+    with transaction.atomic():
+        Plano.objects.filter(id=plano.id).update(estado='pendiente', fecha_actualizacion=timezone.now())
+        # Reprocesar vuelve a leer el PDF aunque sus datos estén en caché
+        cola.encolar([plano], usar_cache=False)
+    messages.success(request, 'Plano enviado a reprocesar.')
     return redirect('detalle_plano', plano_id=plano.id)
 
 
+@superuser_required
+@require_POST
+def cancelar_plano(request, plano_id):
+    """Cancela el procesamiento en cola o en curso de un plano"""
+    plano = get_object_or_404(Plano, id=plano_id)
+    if cola.cancelar(plano):
+        messages.success(request, 'Procesamiento cancelado.')
+    else:
+        messages.info(request, 'El plano no tenía procesamiento pendiente ni en curso.')
+    return redirect('detalle_plano', plano_id=plano.id)
+
+
+@superuser_required
+def estadisticas_cache(request):
+    """Aciertos de la caché por espacio (contadores de este proceso)"""
+    return JsonResponse({"proceso": os.getpid(), "espacios": cache_niveles.estadisticas()})
+
+
+def metricas_prometheus(request):
+    """Métricas de todos los procesos para Prometheus (token o superusuario)"""
+    token = settings.METRICAS_TOKEN
+    autorizado = request.user.is_authenticated and request.user.is_superuser
+    if token and not autorizado:
+        autorizado = constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    if not autorizado:
+        return HttpResponse("No autorizado", status=401, content_type="text/plain; charset=utf-8")
+    return HttpResponse(metricas.exponer(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @superuser_required
 def subir_memoria_drive(request, plano_id):
     """Vista para subir la memoria descriptiva a Google Drive (simulado)"""
@@ -176,7 +402,7 @@ def subir_memoria_drive(request, plano_id):
         return redirect('detalle_plano', plano_id=plano.id)
 
     try:
-        memoria_full_path = os.path.join(settings.MEDIA_ROOT, plano.memoria_path)
+        memoria_full_path = memorias_store.ruta_local(plano.memoria_path)
         logger.info(f"Subiendo memoria {memoria_full_path} a Google Drive...")
         # Aquí iría la lógica real de integración con la API de Google Drive
         messages.success(request, 'Memoria subida a Google Drive (simulado).')
@@ -211,26 +437,16 @@ def eliminar_plano(request, plano_id):
 #     memoria_texto = generar_memoria(datos)
 #     return JsonResponse({"memoria": memoria_texto})
 
-@superuser_required
-def generar_memoria_preview(request, plano_id):  # noqa: F811
-    plano = Plano.objects.get(id=plano_id)
-    processor = PDFProcessor(plano.archivo_pdf.path)
-    datos = processor.extract_data()
-
-    memoria_texto = generar_memoria_gemini(datos)
+def _datos_para_ia(plano):
+    """Datos ya extraídos del plano; solo se vuelve a leer el PDF si faltan"""
+    if plano.datos_procesados:
+        return plano.datos_procesados
+    processor = PDFProcessor(ruta_local(plano.archivo_pdf.storage, plano.archivo_pdf.name))
+    return processor.extract_data()
 
-    return JsonResponse({"memoria": memoria_texto})
-
-@superuser_required
-def descargar_memoria_gemini(request, plano_id):
-    plano = Plano.objects.get(id=plano_id)
-    processor = PDFProcessor(plano.archivo_pdf.path)
-    datos = processor.extract_data()
 
-    # Texto narrativo generado por Gemini
-    memoria_texto = generar_memoria_gemini(datos)
-
-    # Crear documento Word
+def _documento_memoria_ia(datos, memoria_texto):
+    """Arma el Word de la memoria generada por IA"""
     doc = Document()
     doc.add_heading("Memoria Descriptiva", level=1)
     doc.add_paragraph(memoria_texto)
@@ -238,49 +454,81 @@ def descargar_memoria_gemini(request, plano_id):
     # Tabla de superficies
     if datos.get("superficies"):
         doc.add_heading("Planilla de Superficies", level=2)
-        table = doc.add_table(rows=1, cols=5)
-        hdr_cells = table.rows[0].cells
-        hdr_cells[0].text = "Lote"
-        hdr_cells[1].text = "Sup. s/Título"
-        hdr_cells[2].text = "Sup. s/Mensura"
-        hdr_cells[3].text = "Diferencia"
-        hdr_cells[4].text = "Observaciones"
-        for sup in datos["superficies"]:
-            row_cells = table.add_row().cells
-            row_cells[0].text = sup.get("designacion", "")
-            row_cells[1].text = sup.get("sup_titulo", "")
-            row_cells[2].text = sup.get("sup_mensura", "")
-            row_cells[3].text = sup.get("diferencia", "")
-            row_cells[4].text = sup.get("observaciones", "")
+        campos = ("designacion", "sup_titulo", "sup_mensura", "diferencia", "observaciones")
+        add_table_fast(
+            doc,
+            ["Lote", "Sup. s/Título", "Sup. s/Mensura", "Diferencia", "Observaciones"],
+            ([sup.get(campo, "") for campo in campos] for sup in datos["superficies"]),
+            style=None,
+            bold_header=False,
+        )
 
     # Tabla de coordenadas
     if datos.get("coordenadas"):
         doc.add_heading("Coordenadas Geodésicas POSGAR 07", level=2)
-        table = doc.add_table(rows=1, cols=6)
-        hdr_cells = table.rows[0].cells
-        hdr_cells[0].text = "Punto"
-        hdr_cells[1].text = "Latitud"
-        hdr_cells[2].text = "Longitud"
-        hdr_cells[3].text = "Norte GK"
-        hdr_cells[4].text = "Este GK"
-        hdr_cells[5].text = "Observación"
-        for c in datos["coordenadas"]:
-            row_cells = table.add_row().cells
-            row_cells[0].text = c.get("punto", "")
-            row_cells[1].text = c.get("latitud", "")
-            row_cells[2].text = c.get("longitud", "")
-            row_cells[3].text = c.get("norte_gk", "")
-            row_cells[4].text = c.get("este_gk", "")
-            row_cells[5].text = c.get("observacion", "")
+        campos = ("punto", "latitud", "longitud", "norte_gk", "este_gk", "observacion")
+        add_table_fast(
+            doc,
+            ["Punto", "Latitud", "Longitud", "Norte GK", "Este GK", "Observación"],
+            ([c.get(campo, "") for campo in campos] for c in datos["coordenadas"]),
+            style=None,
+            bold_header=False,
+        )
 
     # Notas y referencias
     doc.add_heading("Notas y Referencias", level=2)
     doc.add_paragraph(f"Nota 1: {datos.get('nota1', '')}")
     doc.add_paragraph(f"Nota 2: {datos.get('nota2', '')}")
     doc.add_paragraph(f"Referencias: {datos.get('referencias', '')}")
+    return doc
 
-    # Exportar como DOCX
-    response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
-    response["Content-Disposition"] = f'attachment; filename="memoria_{plano_id}.docx"'
-    doc.save(response)
-    return response
+
+@superuser_required
+async def generar_memoria_preview(request, plano_id):  # noqa: F811
+    plano = await aget_object_or_404(Plano, id=plano_id)
+    datos = await sync_to_async(_datos_para_ia)(plano)
+
+    memoria_texto = await agenerar_memoria_gemini(datos)
+
+    # Se guarda la previsualización: "Confirmar y Descargar" usa este mismo texto
+    await sync_to_async(memoria_ia_store(plano.id).save_text, thread_sensitive=False)(
+        clave_texto_ia(datos), memoria_texto
+    )
+
+    return JsonResponse({"memoria": memoria_texto})
+
+
+@superuser_required
+async def descargar_memoria_gemini(request, plano_id):
+    plano = await aget_object_or_404(Plano, id=plano_id)
+    datos = await sync_to_async(_datos_para_ia)(plano)
+    store = memoria_ia_store(plano.id)
+
+    # Texto narrativo generado por Gemini (se reutiliza si ya existe para estos datos)
+    clave_texto = clave_texto_ia(datos)
+    memoria_texto = await sync_to_async(store.read_text, thread_sensitive=False)(clave_texto)
+    if memoria_texto is None:
+        memoria_texto = await agenerar_memoria_gemini(datos)
+        await sync_to_async(store.save_text, thread_sensitive=False)(clave_texto, memoria_texto)
+
+    clave_docx = clave_docx_ia(clave_texto, memoria_texto)
+    etag = quote_etag(clave_docx)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    # Crear documento Word (solo la primera vez)
+    ruta, _generado = await sync_to_async(store.get_or_create, thread_sensitive=False)(
+        clave_docx,
+        ".docx",
+        lambda destino: _documento_memoria_ia(datos, memoria_texto).save(destino),
+    )
+
+    return await sync_to_async(descargas.servir_archivo, thread_sensitive=False)(
+        request,
+        store.storage,
+        ruta,
+        content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        nombre_descarga=f"memoria_{plano_id}.docx",
+        etag=etag,
+    )
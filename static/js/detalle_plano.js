@@ -7,11 +7,9 @@ document.addEventListener("DOMContentLoaded", function() {
   const robot = document.getElementById("robot-progress");
   const bar = document.querySelector(".progress-bar");
 
-  // Auto-refresh si el plano está procesando (p.ej. backend en curso)
-  if (window.planoEstado === "procesando") {
-    setTimeout(function () {
-      location.reload();
-    }, 5000);
+  // Recarga cuando el plano termina de procesarse (lo hace el worker de la cola)
+  if (window.planoEstado === "procesando" || window.planoEstado === "pendiente") {
+    esperarCambioDeEstado(window.planoEstado);
   }
 
   // Listener del botón Generar
@@ -38,6 +36,34 @@ document.addEventListener("DOMContentLoaded", function() {
   }
 });
 
+/**
+ * Sondeo del estado: bajo ASGI el servidor retiene la respuesta hasta que el
+ * estado cambia (long polling); con WSGI responde enseguida y se reintenta.
+ */
+function esperarCambioDeEstado(anterior) {
+  const inicio = Date.now();
+  fetch(`/panel/estado/${planoId}/?anterior=${encodeURIComponent(anterior)}&espera=25`)
+    .then(response => {
+      if (!response.ok) {
+        throw new Error("Respuesta HTTP no OK: " + response.status);
+      }
+      return response.json();
+    })
+    .then(data => {
+      if (data.estado !== anterior) {
+        location.reload();
+        return;
+      }
+      // Sin espera del lado del servidor se sondea cada 5 s, como antes
+      const demora = Math.max(0, 5000 - (Date.now() - inicio));
+      setTimeout(() => esperarCambioDeEstado(anterior), demora);
+    })
+    .catch(error => {
+      console.error("Error consultando el estado del plano:", error);
+      setTimeout(() => esperarCambioDeEstado(anterior), 5000);
+    });
+}
+
 /**
  * Animación en dos fases:
  * - Fase 1: hasta 70% en 100s (1:40)